@@ -17,12 +17,35 @@ import pytest
 import subprocess
 from typing import Generator, Callable
 
-from uno.test.integration import Experiment, Host, Network
+from uno.test.integration import Experiment, ExperimentBackend, Host, Network
 
+# Wall-clock time spent setting up each experiment, by test module and backend
+_SetupTimes: dict[str, dict[str, float]] = {}
 
-@pytest.fixture
-def experiment(experiment_loader: Callable[[], None]) -> Generator[Experiment, None, None]:
-  yield from Experiment.as_fixture(experiment_loader)
+
+@pytest.fixture(params=Experiment.Backends)
+def experiment(
+  request: pytest.FixtureRequest, experiment_loader: Callable[[], None]
+) -> Generator[Experiment, None, None]:
+  backend = request.param
+  if not ExperimentBackend.lookup(backend).available():
+    pytest.skip(f"experiment backend not available: {backend}")
+  for e in Experiment.as_fixture(experiment_loader, backend=backend):
+    if e is not None and e.setup_time is not None:
+      _SetupTimes.setdefault(request.module.__name__, {})[backend] = e.setup_time
+    yield e
+
+
+def pytest_terminal_summary(terminalreporter) -> None:
+  if not _SetupTimes:
+    return
+  terminalreporter.section("experiment setup time (s)")
+  backends = Experiment.Backends
+  width = max(len(m) for m in _SetupTimes)
+  terminalreporter.write_line(" ".join([" " * width, *(f"{b:>8}" for b in backends)]))
+  for module, times in sorted(_SetupTimes.items()):
+    cols = (f"{times[b]:8.1f}" if b in times else f"{'-':>8}" for b in backends)
+    terminalreporter.write_line(" ".join([f"{module:<{width}}", *cols]))
 
 
 @pytest.fixture
@@ -0,0 +1,185 @@
+import base64
+import hashlib
+import json
+import subprocess
+from pathlib import Path
+from typing import Generator
+
+import pytest
+
+from uno.core.exec import Executor, SubprocessExecutor
+from uno.middleware import Condition, Middleware, Participant
+from uno.middleware import middleware
+from uno.registry.database import Database
+from uno.registry.user import User
+from uno.registry.uvn import Uvn
+
+
+UVN_SPEC = {
+  "cells": [
+    {"name": "cell1", "address": "cell1.example.com", "allowed_lans": ["192.168.1.0/24"]},
+    {"name": "cell2", "address": "cell2.example.com", "allowed_lans": ["192.168.2.0/24"]},
+  ]
+}
+
+
+class FlagCondition(Condition):
+  def __init__(self) -> None:
+    self._trigger_value = False
+
+  @property
+  def trigger_value(self) -> bool:
+    return self._trigger_value
+
+  @trigger_value.setter
+  def trigger_value(self, val: bool) -> None:
+    self._trigger_value = val
+
+
+class LocalMiddleware(Middleware):
+  CONDITION = FlagCondition
+  PARTICIPANT = Participant
+
+
+class FakeHost(Executor):
+  """Simulate the host of a cell agent: generate deterministic WireGuard keys,
+  report a single LAN interface, generate empty QR codes, and accept every
+  other network command.
+  File manipulation commands (e.g. openssl, cp, tar) are actually executed."""
+
+  LAN_NIC = "eth0"
+  LAN_ADDRESS = "192.168.1.2"
+  LAN_GW = "192.168.1.1"
+  OSPF_NEIGHBORS = (
+    "Neighbor ID     Pri State           Up Time         Dead Time Address         Interface\n"
+    "10.255.128.1      1 Full/-          1m02s             38.771s 10.255.128.1    uwg-v0:10.255.128.2\n"
+  )
+
+  def __init__(self) -> None:
+    super().__init__()
+    self.real = SubprocessExecutor()
+    self.generated = 0
+
+  def _execute(self, cmd_args, **kwargs) -> subprocess.CompletedProcess:
+    args = list(map(str, cmd_args))
+    result = self._simulate(args, kwargs["input"])
+    if result is None:
+      return self.real.execute(args, **kwargs)
+    if kwargs["output_file"] is not None:
+      kwargs["output_file"].write_bytes(result.stdout)
+    return result
+
+  def _simulate(self, args: list[str], input: bytes | None) -> subprocess.CompletedProcess | None:
+    if args[0] == "wg" and args[1] in ("genkey", "genpsk"):
+      self.generated += 1
+      return self._result(args, self._key(f"{args[1]}-{self.generated}".encode()))
+    elif args[0] == "wg" and args[1] == "pubkey":
+      return self._result(args, self._key(input.strip()))
+    elif args[:3] == ["ip", "-j", "address"]:
+      return self._result(
+        args,
+        json.dumps(
+          [
+            {
+              "ifname": self.LAN_NIC,
+              "operstate": "UP",
+              "link_type": "ether",
+              "addr_info": [{"family": "inet", "local": self.LAN_ADDRESS, "prefixlen": 24}],
+            }
+          ]
+        ),
+      )
+    elif args[:3] == ["ip", "route", "get"]:
+      return self._result(
+        args, f"{args[3]} via {self.LAN_GW} dev {self.LAN_NIC} src {self.LAN_ADDRESS}\n"
+      )
+    elif args[:2] == ["iptables", "-n"]:
+      # No DOCKER-USER chain
+      return self._result(args, "", returncode=1)
+    elif args[0] == "vtysh":
+      return self._result(args, self.OSPF_NEIGHBORS)
+    elif args[0] in ("wg", "ip", "iptables", "iptables-save", "iptables-restore"):
+      return self._result(args, "")
+    elif args[:2] == ["sh", "-c"] and args[2].startswith("qrencode "):
+      # Particle QR codes: create an empty image
+      qr = args[2].split()
+      Path(qr[qr.index("-o") + 1]).write_bytes(b"")
+      return self._result(args, "")
+    elif args[0] in ("chown", "sed", "service") or "/etc/frr/" in args[-1]:
+      return self._result(args, "")
+    return None
+
+  @staticmethod
+  def _key(seed: bytes) -> str:
+    return base64.b64encode(hashlib.sha256(seed).digest()).decode() + "\n"
+
+  @staticmethod
+  def _result(args: list[str], stdout: str, returncode: int = 0) -> subprocess.CompletedProcess:
+    return subprocess.CompletedProcess(args, returncode, stdout=stdout.encode(), stderr=b"")
+
+
+@pytest.fixture(autouse=True)
+def _isolated_metrics(monkeypatch: pytest.MonkeyPatch) -> None:
+  """Give every test its own metrics registry."""
+  from uno.core.metrics import Metrics
+
+  monkeypatch.setattr(Metrics, "_Instance", Metrics())
+
+
+@pytest.fixture
+def db() -> Generator[Database, None, None]:
+  """An empty database, in a temporary directory."""
+  db = Database()
+  yield db
+  db.close()
+
+
+@pytest.fixture
+def uvn(db: Database) -> Uvn:
+  """A UVN without any cell, stored in the `db` database."""
+  owner = db.new(User, {"email": "owner@example.com", "password": "pw", "realm": "test"})
+  return db.new(Uvn, {"name": "test-uvn"}, owner=owner)
+
+
+@pytest.fixture
+def fake_host() -> FakeHost:
+  return FakeHost()
+
+
+@pytest.fixture
+def registry_root(tmp_path: Path, fake_host: FakeHost) -> Path:
+  """Generate a registry without any cell."""
+  from uno.registry.registry import Registry
+
+  root = tmp_path / "registry"
+  with Executor.use(fake_host):
+    registry = Registry.create(
+      name="test-uvn", owner="owner@example.com", password="password", root=root
+    )
+  registry.db.close()
+  return root
+
+
+@pytest.fixture
+def cell_agent_root(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, fake_host: FakeHost) -> Path:
+  """Generate a registry with two cells, and install the package of the first one."""
+  from uno.agent.agent import Agent
+  from uno.agent.systemd_service import SystemdService
+  from uno.registry.registry import Registry
+
+  monkeypatch.setattr(middleware, "_Instance", LocalMiddleware)
+  monkeypatch.setattr(SystemdService, "STATIC_SERVICES_MARKER_DIR", tmp_path / "services")
+  registry_root = tmp_path / "registry"
+  agent_root = tmp_path / "cell1"
+  agent_root.mkdir()
+  with Executor.use(fake_host):
+    registry = Registry.create(
+      name="test-uvn",
+      owner="owner@example.com",
+      password="password",
+      root=registry_root,
+      uvn_spec=UVN_SPEC,
+    )
+    assert registry.deployed
+    Agent.install_package(registry_root / "cells" / "test-uvn__cell1.uvn-agent", agent_root)
+  return agent_root
@@ -0,0 +1,262 @@
+import copy
+import shutil
+from pathlib import Path
+from typing import Callable
+
+import pytest
+
+from uno.agent.agent_config_diff import AgentConfigDiff
+from uno.core.exec import Executor
+
+
+SERVICES = {
+  "uvn-net": True,
+  "routes-monitor": False,
+  "router": True,
+  "uvn-peers-tester": False,
+  "web-ui": True,
+}
+
+
+class RecordingService:
+  """Stand-in for an AgentService, which records its life cycle
+  using the same reload hooks as AgentService.start()/stop()."""
+
+  def __init__(self, svc_class: str, preserve: bool, events: list[tuple[str, str]]) -> None:
+    self.svc_class = svc_class
+    self.PRESERVE_ON_RELOAD = preserve
+    self.events = events
+
+  def start(self, diff: AgentConfigDiff | None = None) -> None:
+    previous = diff.take_over(self) if diff is not None else None
+    self.events.append(("take-over" if previous is not None else "start", self.svc_class))
+
+  def stop(self, diff: AgentConfigDiff | None = None) -> None:
+    if diff is not None and diff.detach(self):
+      return
+    self.events.append(("stop", self.svc_class))
+
+
+def _vpn_config(name: str, privkey: str, peers: list[tuple[str, str]]) -> dict:
+  return {
+    "intf": {
+      "name": name,
+      "privkey": privkey,
+      "address": "10.255.128.2",
+      "netmask": 31,
+      "port": 33000,
+    },
+    "peers": [
+      {"id": i + 1, "pubkey": pubkey, "psk": psk, "address": f"10.255.128.{i + 3}"}
+      for i, (pubkey, psk) in enumerate(peers)
+    ],
+  }
+
+
+def _snapshot() -> dict:
+  return {
+    "deployment": {
+      "peers": {1: {"n": 1, "peers": {2: [0, "10.255.128.2", "10.255.128.3"]}}},
+      "generation_ts": "2024-01-01T00:00:00Z",
+    },
+    "lans": {"local": ["192.168.1.0/24"], "uvn": ["192.168.1.0/24", "192.168.2.0/24"]},
+    "vpn_settings": {"enable_root_vpn": True, "backbone_vpn": {"port": 33000}},
+    "timing": "DEFAULT",
+    "webui": {"httpd_port": 8080, "users": [("owner@example.com", "test", "pw")]},
+    "middleware": {"timing": "DEFAULT", "enable_dds_security": False, "dds_domain": 46},
+    "vpn_interfaces": {
+      "uwg-v0": _vpn_config("uwg-v0", "cell-root-key", [("root-pub", "root-psk")]),
+      "uwg-b0": _vpn_config("uwg-b0", "cell-bb-key", [("peer-pub", "peer-psk")]),
+    },
+  }
+
+
+def _reload(diff: AgentConfigDiff) -> list[tuple[str, str]]:
+  events = []
+  current = [RecordingService(name, preserve, events) for name, preserve in SERVICES.items()]
+  updated = [RecordingService(name, preserve, events) for name, preserve in SERVICES.items()]
+  for svc in reversed(current):
+    svc.stop(diff)
+  for svc in updated:
+    svc.start(diff)
+  assert not diff.preserved
+  return events
+
+
+def _restarted(events: list[tuple[str, str]]) -> set[str]:
+  stopped = {svc for evt, svc in events if evt == "stop"}
+  started = {svc for evt, svc in events if evt == "start"}
+  assert stopped == started
+  return stopped
+
+
+def _update_peer_key(snapshot: dict) -> None:
+  snapshot["vpn_interfaces"]["uwg-b0"]["peers"][0]["pubkey"] = "peer-pub-2"
+
+
+def _update_privkey(snapshot: dict) -> None:
+  snapshot["vpn_interfaces"]["uwg-b0"]["intf"]["privkey"] = "cell-bb-key-2"
+
+
+def _update_deployment(snapshot: dict) -> None:
+  snapshot["deployment"]["peers"][1]["peers"][2][0] = 1
+
+
+def _update_generation_ts(snapshot: dict) -> None:
+  snapshot["deployment"]["generation_ts"] = "2024-01-02T00:00:00Z"
+
+
+def _update_lans(snapshot: dict) -> None:
+  snapshot["lans"]["uvn"].append("192.168.3.0/24")
+
+
+def _update_httpd_port(snapshot: dict) -> None:
+  snapshot["webui"]["httpd_port"] = 8443
+
+
+def _update_dds_domain(snapshot: dict) -> None:
+  snapshot["middleware"]["dds_domain"] = 47
+
+
+def _add_backbone_vpn(snapshot: dict) -> None:
+  snapshot["vpn_interfaces"]["uwg-b1"] = _vpn_config("uwg-b1", "key", [("pub", "psk")])
+
+
+MONITORS = {"routes-monitor", "uvn-peers-tester"}
+
+
+@pytest.mark.parametrize(
+  "update, changed, restarted, updated_vpns",
+  [
+    (None, set(), MONITORS, set()),
+    (_update_peer_key, {"keys"}, MONITORS, {"uwg-b0"}),
+    (_update_privkey, {"keys"}, {*MONITORS, "uvn-net", "router", "web-ui"}, set()),
+    (_update_deployment, {"deployment"}, {*MONITORS, "router"}, set()),
+    # The router's OSPF message digest key is derived from the timestamp
+    (_update_generation_ts, {"deployment"}, {*MONITORS, "router"}, set()),
+    (_update_lans, {"lans"}, {*MONITORS, "uvn-net", "router", "web-ui"}, set()),
+    (_update_httpd_port, {"settings"}, {*MONITORS, "web-ui"}, set()),
+    (_update_dds_domain, {"middleware"}, MONITORS, set()),
+    (_add_backbone_vpn, set(), {*MONITORS, "uvn-net", "router", "web-ui"}, set()),
+  ],
+)
+def test_restarted_services(update, changed, restarted, updated_vpns):
+  current = _snapshot()
+  updated = copy.deepcopy(current)
+  if update is not None:
+    update(updated)
+  diff = AgentConfigDiff(current, updated)
+  assert diff.changed == changed
+  assert diff.updated_vpn_peers == updated_vpns
+
+  events = _reload(diff)
+  assert _restarted(events) == restarted
+  taken_over = {svc for evt, svc in events if evt == "take-over"}
+  assert taken_over == set(SERVICES) - restarted
+
+
+def test_full_restart_without_diff():
+  events = []
+  services = [RecordingService(name, preserve, events) for name, preserve in SERVICES.items()]
+  for svc in services:
+    svc.stop()
+    svc.start()
+  assert _restarted(events) == set(SERVICES)
+
+
+def _record_life_cycle(monkeypatch: pytest.MonkeyPatch, events: list[tuple[str, str]]) -> None:
+  from uno.agent.router import Router
+  from uno.agent.uvn_net import UvnNet
+
+  def _recorded(svc_cls: type, method: str, event: str) -> None:
+    wrapped = getattr(svc_cls, method)
+
+    def _method(self, *args, **kwargs):
+      events.append((event, self.svc_class))
+      return wrapped(self, *args, **kwargs)
+
+    monkeypatch.setattr(svc_cls, method, _method)
+
+  for svc_cls in (UvnNet, Router):
+    _recorded(svc_cls, "_start", "start")
+    _recorded(svc_cls, "_stop", "stop")
+    _recorded(svc_cls, "_take_over_reload", "take-over")
+
+
+def _add_user(registry) -> None:
+  registry.add_user("user@example.com", name="Jane Doe", password="password")
+
+
+def _update_cell_lans(registry) -> None:
+  registry.update_cell(registry.uvn.cells[2], allowed_lans=["192.168.2.0/24", "192.168.3.0/24"])
+
+
+def _redeploy(registry) -> None:
+  registry.redeploy()
+
+
+@pytest.mark.parametrize(
+  "update, changed, restarted",
+  [
+    # Only affects the web UI, but the new configuration also changes
+    # the router's OSPF message digest key
+    (_add_user, {"settings", "deployment"}, {"router"}),
+    (_update_cell_lans, {"lans"}, {"uvn-net", "router"}),
+    (_redeploy, {"deployment"}, {"router"}),
+  ],
+)
+def test_agent_reload(
+  cell_agent_root: Path,
+  fake_host: Executor,
+  monkeypatch: pytest.MonkeyPatch,
+  tmp_path: Path,
+  update: Callable,
+  changed: set[str],
+  restarted: set[str],
+):
+  from uno.agent.agent import Agent
+  from uno.registry.registry import Registry
+
+  events = []
+  _record_life_cycle(monkeypatch, events)
+  registry_root = cell_agent_root.parent / "registry"
+  with Executor.use(fake_host):
+    agent = Agent.open(cell_agent_root)
+    running = [agent.net, agent.router]
+    for svc in running:
+      svc.start()
+    # The backup is saved by `iptables-save`, which is not executed
+    agent.net.iptables_backup.write_text("")
+    before = AgentConfigDiff.snapshot(agent)
+
+    registry = Registry.open(registry_root)
+    update(registry)
+    assert registry.generate_artifacts()
+    registry.db.close()
+    package = registry_root / "cells" / "test-uvn__cell1.uvn-agent"
+    agent._on_agent_config_received(shutil.copy(package, tmp_path / "received"))
+    updated = agent._reload_agent
+    assert updated is not None
+
+    # Same steps as Agent._spin() and the reload of a running agent
+    agent.reload_diff = agent._diff_config(updated)
+    assert agent.reload_diff.current == before
+    assert agent.reload_diff.updated == AgentConfigDiff.snapshot(updated)
+    assert changed <= agent.reload_diff.changed
+    agent.reloading = True
+    events.clear()
+    for svc in reversed(running):
+      svc.stop()
+    reloaded = agent.reload(updated)
+    for svc in (reloaded.net, reloaded.router):
+      svc.start()
+    reloaded.net.iptables_backup.write_text("")
+    assert not reloaded.reload_diff.preserved
+
+    assert _restarted(events) == restarted
+    taken_over = {svc for evt, svc in events if evt == "take-over"}
+    assert taken_over == {"uvn-net", "router"} - restarted
+    for svc in (reloaded.router, reloaded.net):
+      svc.stop(assert_stopped=True)
+    reloaded.db.close()
+    agent.db.close()
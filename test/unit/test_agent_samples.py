@@ -0,0 +1,99 @@
+import ipaddress
+import shutil
+from pathlib import Path
+
+from uno.agent.uvn_peer import UvnPeerStatus
+from uno.agent.uvn_peers_list import UvnPeerListener
+from uno.core.exec import Executor
+from uno.middleware import CellInfo, DataSample, Handle, LanSite, UvnInfo, coalesce_samples
+from uno.registry.topic import UvnTopic
+
+# Size of the synthetic burst of samples delivered to the agent
+BURST = 200
+
+
+class EventsCounter(UvnPeerListener):
+  def __init__(self) -> None:
+    self.online_cells = 0
+
+  def on_event_online_cells(self, new_cells, gone_cells) -> None:
+    self.online_cells += 1
+
+
+def _cell_info(cell: int, ts_start: int, reachable: bool = True) -> CellInfo:
+  site = LanSite(
+    nic="eth0",
+    address=ipaddress.ip_address(f"192.168.{cell}.2"),
+    subnet=ipaddress.ip_network(f"192.168.{cell}.0/24"),
+    gw=ipaddress.ip_address(f"192.168.{cell}.1"),
+  )
+  return CellInfo(
+    uvn="test-uvn",
+    cell=cell,
+    registry_id="0" * 64,
+    routed_networks=(site,),
+    reachable_networks=(site,) if reachable else (),
+    unreachable_networks=() if reachable else (site,),
+    ts_start=ts_start,
+  )
+
+
+def _burst(count: int) -> list[DataSample]:
+  # A single remote agent which republishes its status (e.g. while its LAN flaps)
+  return [
+    DataSample(
+      UvnTopic.CELL_ID,
+      _cell_info(2, ts_start=1700000000 + i, reachable=i % 2 == 0),
+      instance=Handle("cell2"),
+      writer=Handle("cell2-writer"),
+    )
+    for i in range(count)
+  ]
+
+
+def test_coalesce_samples():
+  uvn_info = DataSample(UvnTopic.UVN_ID, UvnInfo("test-uvn", "1"), instance=Handle("registry"))
+  samples = [*_burst(3), uvn_info, DataSample(UvnTopic.CELL_ID, _cell_info(3, 1))]
+  coalesced = coalesce_samples(samples)
+  assert [s.topic for s in coalesced] == [UvnTopic.CELL_ID, UvnTopic.UVN_ID, UvnTopic.CELL_ID]
+  assert coalesced[0] is samples[2]
+  assert coalesced[2].instance is None
+
+
+def _apply(agent_root: Path, batches: list[list[DataSample]]) -> tuple[int, int, dict]:
+  from uno.agent.agent import Agent
+
+  agent = Agent.open(agent_root)
+  # Listeners are only notified once the agent is online
+  agent.peers.update_peer(agent.peers.local, status=UvnPeerStatus.ONLINE)
+  events = EventsCounter()
+  agent.peers.listeners.append(events)
+  with agent.db.count_queries() as queries:
+    for batch in batches:
+      agent.on_data_batch(batch)
+  peer = agent.peers[agent.uvn.cells[2]]
+  state = {
+    "status": peer.status.name,
+    "ts_start": str(peer.ts_start),
+    "routed_networks": sorted(str(lan.nic.subnet) for lan in peer.routed_networks),
+    "known_networks": sorted((str(n.lan.nic.subnet), n.reachable) for n in peer.known_networks),
+    "instance": peer.instance,
+  }
+  return len(queries), events.online_cells, state
+
+
+def test_sample_burst_batched(cell_agent_root: Path, fake_host: Executor, tmp_path: Path):
+  samples = _burst(BURST)
+  batched_root = tmp_path / "cell1-batched"
+  shutil.copytree(cell_agent_root, batched_root, symlinks=True)
+  with Executor.use(fake_host):
+    per_sample_queries, per_sample_events, per_sample_state = _apply(
+      cell_agent_root, [[s] for s in samples]
+    )
+    batched_queries, batched_events, batched_state = _apply(batched_root, [samples])
+
+  assert batched_state == per_sample_state
+  assert batched_state["known_networks"] == [("192.168.2.0/24", False)]
+  assert batched_state["instance"] == Handle("cell2")
+  assert per_sample_events == batched_events == 1
+  assert batched_queries * 10 < per_sample_queries
@@ -0,0 +1,239 @@
+import ipaddress
+import sqlite3
+import time
+from pathlib import Path
+
+import pytest
+
+from uno.core.exec import Executor
+from uno.core.time import Timestamp
+from uno.core.yaml_codec import CODEC as YAML_CODEC
+from uno.registry import column_codec
+from uno.registry.column_codec import CODECS, JSON_CODEC, MSGPACK_CODEC, dump_column, load_column
+from uno.registry.database import Database
+
+# Number of cells in the benchmark's registry
+CELLS = 10
+
+
+@pytest.fixture
+def yaml_columns(monkeypatch: pytest.MonkeyPatch) -> None:
+  """Store structured columns as YAML, like previous versions did."""
+  monkeypatch.setattr(Database, "COLUMN_CODEC", None)
+
+
+@pytest.fixture
+def msgpack_columns(monkeypatch: pytest.MonkeyPatch) -> None:
+  if MSGPACK_CODEC is None:
+    pytest.skip("msgpack not available")
+  monkeypatch.setattr(Database, "COLUMN_CODEC", MSGPACK_CODEC)
+
+
+def _define_cells(root: Path, cells: int) -> None:
+  from uno.registry.registry import Registry
+
+  registry = Registry.open(root)
+  registry.define_uvn(
+    {
+      "cells": [
+        {
+          "name": f"cell{i}",
+          "address": f"cell{i}.example.com",
+          "allowed_lans": [f"192.168.{i}.0/24"],
+        }
+        for i in range(1, cells + 1)
+      ]
+    }
+  )
+  registry.generate_artifacts()
+  registry.db.close()
+
+
+def _rows(root: Path, table: str) -> list[sqlite3.Row]:
+  db = sqlite3.connect(root / Database.DB_NAME)
+  db.row_factory = sqlite3.Row
+  try:
+    return db.execute(f"SELECT * FROM {table}").fetchall()
+  finally:
+    db.close()
+
+
+def _structured_columns(root: Path) -> list[str | bytes]:
+  db = sqlite3.connect(root / Database.DB_NAME)
+  try:
+    tables = [t for (t,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    return [
+      v
+      for t in tables
+      for row in db.execute(f"SELECT * FROM {t}")
+      for v in row
+      if isinstance(v, bytes) or (isinstance(v, str) and "\n" in v)
+    ]
+  finally:
+    db.close()
+
+
+def _strip_generation_ts(val: object) -> object:
+  # Saving an object again updates its generation timestamp
+  if isinstance(val, dict):
+    return {k: _strip_generation_ts(v) for k, v in val.items() if k != "generation_ts"}
+  elif isinstance(val, list):
+    return [_strip_generation_ts(v) for v in val]
+  return val
+
+
+def _migrate(root: Path) -> None:
+  # Save every object again, which encodes it with the current codec
+  from uno.registry.registry import Registry
+
+  registry = Registry.open(root)
+  registry.db.save(registry, dirty=False)
+  registry.db.close()
+
+
+@pytest.mark.parametrize("codec", list(CODECS.values()), ids=list(CODECS))
+def test_column_codec_roundtrip(codec):
+  val = {
+    "peers": {1: {"n": 0, "peers": {2: [0, "10.255.192.3"]}}, 2: {"n": 1, "peers": {}}},
+    "tags": {"b", "a"},
+    "ts": Timestamp.unix(1700000000),
+    "lans": [ipaddress.ip_network("192.168.1.0/24"), ipaddress.ip_address("10.0.0.1")],
+    "period": (5, 30),
+    "ratio": 0.5,
+    "enabled": True,
+    "address": None,
+  }
+  dumped = dump_column(val, codec)
+  assert isinstance(dumped, bytes)
+  assert dumped[:1] == codec.tag
+  assert load_column(dumped) == {
+    **val,
+    "ts": Timestamp.unix(1700000000).format(),
+    "lans": ["192.168.1.0/24", "10.0.0.1"],
+    "period": [5, 30],
+  }
+  # Sets are sorted, so the same value is always encoded the same way
+  assert dump_column({**val, "tags": {"a", "b"}}, codec) == dumped
+
+
+def test_column_codec_fallback():
+  # Values that a codec cannot represent are stored as YAML
+  dumped = dump_column({"ratio": float("nan")}, JSON_CODEC)
+  assert isinstance(dumped, str)
+  assert load_column(dumped)["ratio"] != load_column(dumped)["ratio"]
+  assert load_column(YAML_CODEC.dump({1: ["a"]})) == {1: ["a"]}
+  with pytest.raises(ValueError):
+    load_column(b"Xunknown")
+
+
+@pytest.mark.usefixtures("yaml_columns")
+def test_column_codec_mixed_database(
+  registry_root: Path, monkeypatch: pytest.MonkeyPatch, fake_host: Executor
+):
+  from uno.registry.registry import Registry
+
+  root = registry_root
+  with Executor.use(fake_host):
+    # Create the registry like previous versions did, with YAML columns
+    _define_cells(root, 3)
+    registry = Registry.open(root, readonly=True)
+    expected_cells = {c.name: c.serialize() for c in registry.uvn.cells.values()}
+    registry.db.close()
+    assert all(isinstance(v, str) for v in _structured_columns(root))
+
+    # Rows are converted when they are saved again, each with a different codec
+    updated = {}
+    for i, codec in enumerate(CODECS.values()):
+      monkeypatch.setattr(Database, "COLUMN_CODEC", codec)
+      registry = Registry.open(root)
+      cell = registry.uvn.cells[i + 1]
+      registry.update_cell(cell, allowed_lans=[f"10.{i}.0.0/24"])
+      registry.db.save(cell)
+      registry.db.close()
+      updated[f"cell{i + 1}"] = codec
+
+    registry = Registry.open(root, readonly=True)
+    cells = {c.name: c for c in registry.uvn.cells.values()}
+    for name, cell in cells.items():
+      codec = updated.get(name)
+      lans = [f"10.{cell.id - 1}.0.0/24"] if codec else [f"192.168.{cell.id}.0/24"]
+      assert list(map(str, cell.allowed_lans)) == lans
+      assert _strip_generation_ts(cell.settings.serialize()) == _strip_generation_ts(
+        expected_cells[name]["settings"]
+      )
+    registry.db.close()
+
+  stored = {row["name"]: row["allowed_lans"] for row in _rows(root, "cells")}
+  for name, val in stored.items():
+    codec = updated.get(name)
+    assert isinstance(val, bytes if codec else str)
+    if codec:
+      assert val[:1] == codec.tag
+
+
+@pytest.mark.usefixtures("yaml_columns")
+def test_column_codec_registry_benchmark(
+  registry_root: Path, monkeypatch: pytest.MonkeyPatch, fake_host: Executor
+):
+  from uno.registry.registry import Registry
+
+  root = registry_root
+  with Executor.use(fake_host):
+    _define_cells(root, CELLS)
+
+  def _load() -> dict:
+    registry = Registry.open(root, readonly=True)
+    serialized = registry.serialize()
+    registry.db.close()
+    return serialized
+
+  results = {}
+  decode_time = {}
+  for codec in (None, *CODECS.values()):
+    name = codec.name if codec else "yaml"
+    monkeypatch.setattr(Database, "COLUMN_CODEC", codec)
+    _migrate(root)
+    columns = _structured_columns(root)
+    assert all(isinstance(v, bytes if codec else str) for v in columns)
+
+    start = time.perf_counter()
+    for _ in range(10):
+      for v in columns:
+        load_column(v)
+    decode_time[name] = (time.perf_counter() - start) / 10
+
+    results[name] = _load()
+
+  for name, loaded in results.items():
+    assert _strip_generation_ts(loaded) == _strip_generation_ts(results["yaml"]), name
+    if name != "yaml":
+      assert decode_time[name] < decode_time["yaml"], name
+
+
+@pytest.mark.usefixtures("msgpack_columns")
+def test_column_codec_exported_portable(
+  registry_root: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, fake_host: Executor
+):
+  from uno.registry.registry import Registry
+
+  root = registry_root
+  cell_root = tmp_path / "cell1"
+  with Executor.use(fake_host):
+    _define_cells(root, 2)
+    registry = Registry.open(root)
+    registry.generate_cell_database(registry.uvn.cells[1], root=cell_root).close()
+    registry.db.close()
+  assert any(v[:1] == MSGPACK_CODEC.tag for v in _structured_columns(root) if isinstance(v, bytes))
+
+  # The cell's database is read by an agent without the optional codecs
+  monkeypatch.setattr(column_codec, "_DECODERS", {JSON_CODEC.tag[0]: JSON_CODEC.decode})
+  monkeypatch.setattr(Database, "COLUMN_CODEC", JSON_CODEC)
+  with pytest.raises(ValueError):
+    load_column(dump_column({"a": 1}, MSGPACK_CODEC))
+  exported = {row["name"]: row for row in _rows(cell_root, "cells")}
+  assert sorted(exported) == ["cell1", "cell2"]
+  for name, row in exported.items():
+    assert isinstance(row["allowed_lans"], bytes)
+    assert load_column(row["allowed_lans"]) == [f"192.168.{row['id']}.0/24"]
+  for v in _structured_columns(cell_root):
+    load_column(v)
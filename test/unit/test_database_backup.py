@@ -0,0 +1,76 @@
+import sqlite3
+import threading
+from pathlib import Path
+
+from uno.registry.database import Database
+from uno.registry.user import User
+from uno.registry.uvn import Uvn
+
+WRITER_TRANSACTIONS = 100
+# Seconds to wait for the writer to start
+WRITER_START_TIMEOUT = 30
+
+
+def _writer(
+  db_file: Path, started: threading.Event, stop: threading.Event, written: list[int]
+) -> None:
+  conn = sqlite3.connect(db_file, timeout=10)
+  try:
+    # The backup restarts whenever another connection modifies the database,
+    # so the writer must eventually stop for it to complete
+    while not stop.is_set() and len(written) < WRITER_TRANSACTIONS:
+      with conn:
+        conn.executemany(
+          "INSERT INTO scratch (value) VALUES (?)", [(f"value-{i}" * 8,) for i in range(50)]
+        )
+      written.append(50)
+      started.set()
+  finally:
+    conn.close()
+
+
+def test_backup_with_active_writer(tmp_path: Path):
+  db = Database(tmp_path / "src", create=True)
+  with db._db:
+    db._db.execute("CREATE TABLE scratch (id INTEGER PRIMARY KEY, value TEXT)")
+
+  started = threading.Event()
+  stop = threading.Event()
+  written = []
+  writer = threading.Thread(target=_writer, args=(db.db_file, started, stop, written))
+  writer.start()
+  try:
+    # Wait for the writer to actually start modifying the database
+    assert started.wait(timeout=WRITER_START_TIMEOUT)
+    steps = []
+    backup_file = tmp_path / "backup.db"
+    db.backup(backup_file, pages=1, progress=lambda *a: steps.append(a))
+  finally:
+    stop.set()
+    writer.join()
+
+  assert len(steps) > 0
+  backup = sqlite3.connect(backup_file)
+  try:
+    assert backup.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    assert backup.execute("SELECT count(*) FROM scratch").fetchone()[0] > 0
+  finally:
+    backup.close()
+  db.close()
+
+
+def test_export_tables(tmp_path: Path):
+  db = Database(tmp_path / "src", create=True)
+  owner = db.new(User, {"email": "owner@example.com", "password": "pw", "realm": "test"})
+  db.new(Uvn, {"name": "test-uvn"}, owner=owner)
+
+  exported = {}
+  target = Database(tmp_path / "dst", create=True)
+  db.export_tables(target, [Uvn, User], progress=lambda t, c: exported.__setitem__(t, c))
+
+  assert exported == {"uvns": 1, "users": 1}
+  uvn = next(target.load(Uvn))
+  assert uvn.name == "test-uvn"
+  assert uvn.owner.email == "owner@example.com"
+  db.close()
+  target.close()
@@ -0,0 +1,51 @@
+import gc
+
+import pytest
+
+from uno.registry.database import Database
+from uno.registry.uvn import Uvn
+from uno.registry.cell import Cell
+
+
+def test_delete_evicts_cached_object(db: Database, uvn: Uvn):
+  cell = db.new(Cell, {"name": "cell1", "uvn_id": uvn.id}, owner=uvn.owner)
+  cell_id = cell.id
+  loaded = next(db.load(Cell, id=cell_id))
+  assert loaded is next(db.load(Cell, id=cell_id))
+  db.delete(loaded)
+  assert next(db.load(Cell, id=cell_id), None) is None
+
+
+def test_rollback_evicts_cached_object(db: Database, uvn: Uvn):
+  cell = db.new(Cell, {"name": "cell1", "uvn_id": uvn.id}, owner=uvn.owner)
+  cell = next(db.load(Cell, id=cell.id))
+  with pytest.raises(RuntimeError):
+    with db.transaction() as cursor:
+      cell.address = "cell1.example.com"
+      db.save(cell, cursor=cursor)
+      raise RuntimeError("abort")
+  reloaded = next(db.load(Cell, id=cell.id))
+  assert reloaded is not cell
+  assert reloaded.address is None
+
+
+@pytest.fixture
+def small_cells_cache(monkeypatch: pytest.MonkeyPatch) -> int:
+  monkeypatch.setattr(Cell, "DB_CACHE_SIZE", 8)
+  return 8
+
+
+def test_cache_bounded_under_churn(small_cells_cache: int, db: Database, uvn: Uvn):
+  cell_ids = [
+    db.new(Cell, {"name": f"cell{i}", "uvn_id": uvn.id}, owner=uvn.owner).id for i in range(40)
+  ]
+  for _ in range(3):
+    for cell_id in cell_ids:
+      assert next(db.load(Cell, id=cell_id)).id == cell_id
+  gc.collect()
+
+  stats = db.cache_stats()["cells"]
+  assert stats["retained"] == small_cells_cache
+  assert stats["size"] <= small_cells_cache
+  assert stats["hits"] > 0
+  assert stats["misses"] >= len(cell_ids)
@@ -0,0 +1,77 @@
+import multiprocessing
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import pytest
+
+from uno.registry.database import Database, namedtuple_factory
+from uno.registry.cell import Cell
+
+
+PROCESSES_COUNT = 4
+IDS_PER_PROCESS = 50
+DECODED_ROWS_COUNT = 5000
+
+
+def _allocate_ids(root: Path, count: int, queue: multiprocessing.Queue) -> None:
+  db = Database(root)
+  ids = []
+  for _ in range(count):
+    with db.transaction():
+      ids.append(db.next_id(Cell))
+  db.close()
+  queue.put(ids)
+
+
+@pytest.mark.parametrize("update_returning", [True, False])
+def test_next_id_unique_across_processes(
+  tmp_path: Path, monkeypatch: pytest.MonkeyPatch, update_returning: bool
+):
+  monkeypatch.setattr(Database, "UPDATE_RETURNING", update_returning)
+  Database(tmp_path, create=True).close()
+
+  ctx = multiprocessing.get_context("fork")
+  queue = ctx.Queue()
+  processes = [
+    ctx.Process(target=_allocate_ids, args=(tmp_path, IDS_PER_PROCESS, queue))
+    for _ in range(PROCESSES_COUNT)
+  ]
+  for p in processes:
+    p.start()
+  allocated = [i for _ in processes for i in queue.get(timeout=60)]
+  for p in processes:
+    p.join()
+    assert p.exitcode == 0
+
+  expected_count = PROCESSES_COUNT * IDS_PER_PROCESS
+  assert len(allocated) == expected_count
+  assert sorted(allocated) == list(range(1, expected_count + 1))
+
+
+def test_row_decoding_benchmark():
+  db = Database()
+  cursor = db._db.cursor()
+  cursor.execute(
+    "WITH RECURSIVE seq(id) AS (SELECT 1 UNION ALL SELECT id + 1 FROM seq WHERE id < ?)"
+    " SELECT id, id * 2 AS double, 'row' AS name FROM seq",
+    (DECODED_ROWS_COUNT,),
+  )
+  raw_rows = [tuple(r) for r in cursor.fetchall()]
+
+  # How rows were decoded before, with a new class for every row
+  start = time.perf_counter()
+  fields = tuple(col[0] for col in cursor.description)
+  uncached = [namedtuple("Row", fields)._make(r) for r in raw_rows]
+  uncached_time = time.perf_counter() - start
+
+  start = time.perf_counter()
+  rows = [namedtuple_factory(cursor, r) for r in raw_rows]
+  cached_time = time.perf_counter() - start
+
+  assert len(rows) == DECODED_ROWS_COUNT
+  assert len({type(r) for r in rows}) == 1
+  assert rows[-1].double == DECODED_ROWS_COUNT * 2
+  assert [r._asdict() for r in rows] == [r._asdict() for r in uncached]
+  assert cached_time < uncached_time
+  db.close()
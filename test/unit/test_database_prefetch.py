@@ -0,0 +1,73 @@
+import contextlib
+from typing import Generator
+
+import pytest
+
+from uno.registry.database import Database
+from uno.registry.user import User
+from uno.registry.uvn import Uvn
+from uno.registry.cell import Cell
+
+
+CELLS_COUNTS = [2, 10, 40]
+
+
+@contextlib.contextmanager
+def assert_query_count(db: Database, expected: int) -> Generator[list[str], None, None]:
+  with db.count_queries() as queries:
+    yield queries
+  assert len(queries) == expected, "\n".join(queries)
+
+
+def _populate(cells_count: int) -> Database:
+  db = Database()
+  owner = db.new(User, {"email": "owner@example.com", "password": "pw", "realm": "test"})
+  uvn = db.new(Uvn, {"name": "test-uvn"}, owner=owner)
+  for i in range(cells_count):
+    db.new(Cell, {"name": f"cell{i}", "uvn_id": uvn.id}, owner=owner)
+  db.clear_cache()
+  return db
+
+
+@pytest.mark.parametrize("cells_count", CELLS_COUNTS)
+def test_prefetch_owner(cells_count: int):
+  db = _populate(cells_count)
+  # One query for the cells, one for their owner ids, one for the owners
+  with assert_query_count(db, 3):
+    cells = list(db.load(Cell, prefetch=["owner"]))
+    owners = {c.owner for c in cells}
+  assert len(cells) == cells_count
+  assert [o.email for o in owners] == ["owner@example.com"]
+  db.close()
+
+
+def test_prefetch_owned():
+  query_counts = set()
+  for cells_count in CELLS_COUNTS:
+    db = _populate(cells_count)
+    with db.count_queries() as queries:
+      (owner,) = db.load(User, prefetch=["owned"])
+      assert len(owner.owned_cells) == cells_count
+      assert len(owner.owned_uvns) == 1
+    query_counts.add(len(queries))
+    db.close()
+  assert len(query_counts) == 1
+
+
+def test_prefetch_unknown_relation():
+  db = _populate(1)
+  with pytest.raises(ValueError):
+    list(db.load(Cell, prefetch=["parent"]))
+  db.close()
+
+
+@pytest.mark.parametrize("cells_count", CELLS_COUNTS)
+def test_save_all_resolves_owners_in_batch(cells_count: int):
+  db = _populate(cells_count)
+  cells = list(db.load(Cell))
+  for cell in cells:
+    cell.address = f"{cell.name}.example.com"
+  # One UPDATE per cell, plus two queries to resolve the owners, BEGIN and COMMIT
+  with assert_query_count(db, cells_count + 4):
+    db.save_all(cells)
+  db.close()
@@ -0,0 +1,119 @@
+import io
+import sqlite3
+
+import pytest
+
+from uno.registry import database_profiler
+from uno.registry.database import Database
+from uno.registry.database_profiler import (
+  DatabaseProfiler,
+  ProfiledConnection,
+  statement_template,
+)
+from uno.registry.user import User
+from uno.registry.uvn import Uvn
+from uno.registry.cell import Cell
+
+
+ITEMS_COUNT = 25
+
+
+@pytest.fixture
+def profiler() -> DatabaseProfiler:
+  return DatabaseProfiler(n_plus_one_min_repeat=10)
+
+
+@pytest.fixture
+def conn(profiler: DatabaseProfiler) -> sqlite3.Connection:
+  conn = sqlite3.connect(":memory:", factory=ProfiledConnection)
+  conn.profiler = profiler
+  conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+  conn.executemany(
+    "INSERT INTO items (id, name) VALUES (?, ?)",
+    [(i, f"item-{i}") for i in range(1, ITEMS_COUNT + 1)],
+  )
+  yield conn
+  conn.close()
+
+
+def test_statement_template():
+  assert (
+    statement_template("SELECT *  FROM cells\nWHERE id = 12 AND name = 'foo''s'")
+    == "SELECT * FROM cells WHERE id = ? AND name = ?"
+  )
+  assert (
+    statement_template("SELECT * FROM cells WHERE id IN (?, ?, ?)")
+    == "SELECT * FROM cells WHERE id IN (...)"
+  )
+  assert statement_template("SELECT * FROM t2 WHERE x = 1.5") == "SELECT * FROM t2 WHERE x = ?"
+
+
+def test_n_plus_one_detected(profiler: DatabaseProfiler, conn: sqlite3.Connection):
+  with profiler.operation("load-items"):
+    ids = [row[0] for row in conn.execute("SELECT id FROM items")]
+    for item_id in ids:
+      conn.execute(f"SELECT name FROM items WHERE id = {item_id}").fetchone()
+
+  assert len(profiler.repeated) == 1
+  repeated = profiler.repeated[0]
+  assert repeated.operation == "load-items"
+  assert repeated.template == "SELECT name FROM items WHERE id = ?"
+  assert repeated.count == ITEMS_COUNT
+
+  stats = profiler.statements["SELECT name FROM items WHERE id = ?"]
+  assert stats.count == ITEMS_COUNT
+  assert stats.rows == ITEMS_COUNT
+  assert stats.total_time >= stats.p95_time > 0
+  assert profiler.statements["SELECT id FROM items"].rows == ITEMS_COUNT
+
+  output = io.StringIO()
+  profiler.report(output)
+  assert "Probable N+1 Statement" in output.getvalue()
+  assert "SELECT name FROM items WHERE id = ?" in output.getvalue()
+
+
+def test_batched_query_not_flagged(profiler: DatabaseProfiler, conn: sqlite3.Connection):
+  with profiler.operation("load-items"):
+    ids = [row[0] for row in conn.execute("SELECT id FROM items")]
+    query = f"SELECT name FROM items WHERE id IN ({', '.join('?' for _ in ids)})"
+    assert len(conn.execute(query, ids).fetchall()) == ITEMS_COUNT
+  # Repetitions across different operations are not N+1 patterns
+  for item_id in range(1, ITEMS_COUNT + 1):
+    with profiler.operation(f"load-item-{item_id}"):
+      conn.execute("SELECT name FROM items WHERE id = ?", (item_id,)).fetchone()
+
+  assert profiler.repeated == []
+  assert profiler.statements["SELECT name FROM items WHERE id IN (...)"].rows == ITEMS_COUNT
+
+
+def test_database_profiling(monkeypatch: pytest.MonkeyPatch):
+  profiler = DatabaseProfiler()
+  monkeypatch.setattr(DatabaseProfiler, "_Instance", profiler)
+  db = Database()
+  assert db.profiler is profiler
+  owner = db.new(User, {"email": "owner@example.com", "password": "pw", "realm": "test"})
+  uvn = db.new(Uvn, {"name": "test-uvn"}, owner=owner)
+  cell_ids = [
+    db.new(Cell, {"name": f"cell{i}", "uvn_id": uvn.id}, owner=owner).id
+    for i in range(profiler.n_plus_one_min_repeat)
+  ]
+  db.clear_cache()
+
+  with db.operation("load-cells"):
+    cells = [next(db.load(Cell, id=cell_id)) for cell_id in cell_ids]
+  assert len(cells) == len(cell_ids)
+  assert [r.template for r in profiler.repeated] == [
+    "SELECT * FROM cells WHERE id = ? ORDER BY id ASC"
+  ]
+  db.close()
+
+
+@pytest.mark.parametrize(
+  "value,enabled",
+  [("1", True), ("true", True), ("YES", True), ("0", False), ("false", False), ("", False)],
+)
+def test_profiler_env_var(monkeypatch: pytest.MonkeyPatch, value: str, enabled: bool):
+  monkeypatch.setattr(DatabaseProfiler, "_Instance", None)
+  monkeypatch.setattr(database_profiler.atexit, "register", lambda fn: None)
+  monkeypatch.setenv(DatabaseProfiler.ENV_VAR, value)
+  assert (DatabaseProfiler.current() is not None) == enabled
@@ -0,0 +1,30 @@
+import pytest
+
+from uno.registry.database import Database
+from uno.registry.uvn import Uvn
+from uno.registry.cell import Cell
+
+
+def _cells(db: Database, uvn: Uvn) -> list[str]:
+  return [c.name for c in db.load(Cell, where="uvn_id = ?", params=(uvn.id,))]
+
+
+def test_nested_rollback_keeps_outer_changes(db: Database, uvn: Uvn):
+  with db.transaction():
+    cell1 = db.new(Cell, {"name": "cell1", "uvn_id": uvn.id}, owner=uvn.owner)
+    with pytest.raises(RuntimeError):
+      with db.transaction():
+        db.new(Cell, {"name": "cell2", "uvn_id": uvn.id}, owner=uvn.owner)
+        raise RuntimeError("rollback inner")
+  assert _cells(db, uvn) == [cell1.name]
+
+
+def test_outer_rollback_discards_nested_changes(db: Database, uvn: Uvn):
+  with pytest.raises(RuntimeError):
+    with db.transaction():
+      with db.transaction():
+        db.new(Cell, {"name": "cell1", "uvn_id": uvn.id}, owner=uvn.owner)
+      # The nested transaction was not committed on its own
+      assert db._db.in_transaction
+      raise RuntimeError("rollback outer")
+  assert _cells(db, uvn) == []
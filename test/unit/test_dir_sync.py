@@ -0,0 +1,87 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from uno.core.dir_sync import sync_dir
+
+
+def _tree(root: Path) -> dict[str, str]:
+  return {str(f.relative_to(root)): f.read_text() for f in sorted(root.rglob("*")) if f.is_file()}
+
+
+def _touch(file: Path, content: str, mtime: int | None = None) -> None:
+  file.parent.mkdir(parents=True, exist_ok=True)
+  file.write_text(content)
+  if mtime is not None:
+    os.utime(file, (mtime, mtime))
+
+
+@pytest.mark.parametrize("link", [True, False])
+def test_sync_dir(tmp_path: Path, link: bool):
+  src = tmp_path / "src"
+  dst = tmp_path / "dst"
+  _touch(src / "a.conf", "a")
+  _touch(src / "p1" / "qr.png", "qr1")
+  _touch(src / "p2" / "qr.png", "qr2")
+  _touch(src / "p2" / "p2.conf", "p2")
+
+  result = sync_dir(src, dst, link=link)
+  assert _tree(dst) == _tree(src)
+  assert len(result.updated) == 4
+  assert not result.deleted
+  assert (dst / "a.conf").samefile(src / "a.conf") == link
+  # Nothing changed
+  assert not sync_dir(src, dst, link=link)
+
+  # Additions, modifications, deletions
+  _touch(src / "p3" / "qr.png", "qr3")
+  # Regenerated with the same size, and with a new mtime
+  (src / "p1" / "qr.png").unlink()
+  _touch(src / "p1" / "qr.png", "QR1", mtime=1000)
+  (src / "p2" / "qr.png").unlink()
+  (src / "p2" / "p2.conf").unlink()
+  (src / "p2").rmdir()
+  _touch(dst / "stale" / "stale.txt", "stale")
+
+  result = sync_dir(src, dst, link=link)
+  assert _tree(dst) == _tree(src)
+  assert sorted(result.updated) == [dst / "p1" / "qr.png", dst / "p3" / "qr.png"]
+  assert sorted(result.deleted) == sorted(
+    [
+      dst / "p2" / "qr.png",
+      dst / "p2" / "p2.conf",
+      dst / "p2",
+      dst / "stale" / "stale.txt",
+      dst / "stale",
+    ]
+  )
+  assert not (dst / "p2").exists()
+  assert not sync_dir(src, dst, link=link)
+
+
+def test_sync_dir_unchanged_contents(tmp_path: Path):
+  src = tmp_path / "src"
+  dst = tmp_path / "dst"
+  _touch(src / "plot.png", "plot", mtime=1000)
+  sync_dir(src, dst, link=False)
+
+  # Regenerated with the same contents: the copy isn't rewritten
+  _touch(src / "plot.png", "plot", mtime=2000)
+  dst_ino = (dst / "plot.png").stat().st_ino
+  assert not sync_dir(src, dst, link=False)
+  assert (dst / "plot.png").stat().st_ino == dst_ino
+  assert (dst / "plot.png").stat().st_mtime == 2000
+
+
+def test_sync_dir_linked_in_place(tmp_path: Path):
+  src = tmp_path / "src"
+  dst = tmp_path / "dst"
+  _touch(src / "plot.png", "plot")
+  sync_dir(src, dst)
+  assert (dst / "plot.png").samefile(src / "plot.png")
+
+  # Files written in place are already up to date
+  (src / "plot.png").write_text("new plot")
+  assert not sync_dir(src, dst)
+  assert (dst / "plot.png").read_text() == "new plot"
@@ -0,0 +1,111 @@
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from uno.core.exec import (
+  Executor,
+  RecordedCommand,
+  RecordingExecutor,
+  ReplayError,
+  ReplayExecutor,
+  exec_command,
+)
+
+
+# Commands run by a cell agent to bring up (and tear down) its network services.
+# Set UNO_TEST_RECORD_COMMANDS to regenerate the file after changing them.
+AGENT_COMMANDS = Path(__file__).parent / "data" / "agent_net_commands.json"
+
+
+def _bring_up_and_down(agent_root: Path, host: Executor) -> None:
+  from uno.agent.agent import Agent
+
+  agent = Agent.open(agent_root)
+  assert [lan.nic.name for lan in agent.lans] == [host.LAN_NIC]
+  agent.net.start()
+  agent.router.start()
+  assert agent.router.vtysh(["show ip ospf neighbor"]) == host.OSPF_NEIGHBORS
+  ospf_neighbors = agent.router.ospf_neighbors
+  assert ospf_neighbors.read_text() == host.OSPF_NEIGHBORS
+  # The backup is saved by `iptables-save`, which doesn't run on replay
+  agent.net.iptables_backup.write_text("")
+  agent.router.stop()
+  agent.net.stop()
+
+
+def _record_agent_commands(agent_root: Path, host: Executor) -> None:
+  recorder = RecordingExecutor(host)
+  with Executor.use(recorder):
+    _bring_up_and_down(agent_root, host)
+  tmp_dir = tempfile.gettempdir()
+  for cmd in recorder.commands:
+    # Temporary files and the agent's directory change on every run
+    cmd.args = [RecordedCommand.ANY if a.startswith(tmp_dir) else a for a in cmd.args]
+  AGENT_COMMANDS.parent.mkdir(exist_ok=True)
+  recorder.save(AGENT_COMMANDS)
+
+
+def test_agent_bring_up_replayed(cell_agent_root: Path, fake_host: Executor):
+  if os.environ.get("UNO_TEST_RECORD_COMMANDS"):
+    # Services only run some commands the first time they are started
+    _record_agent_commands(cell_agent_root, fake_host)
+    pytest.skip("commands recorded")
+
+  replay = ReplayExecutor.load(AGENT_COMMANDS)
+  with Executor.use(replay):
+    _bring_up_and_down(cell_agent_root, fake_host)
+
+  # Every recorded command was requested, in the same order
+  assert replay.pending == []
+  assert len(replay.executed) == len(replay.commands)
+  assert replay.executed[:2] == [
+    ["ip", "-j", "address", "show"],
+    ["ip", "route", "get", "192.168.1.0"],
+  ]
+  vpns = [cmd[4] for cmd in replay.executed if cmd[:3] == ["ip", "link", "add"]]
+  assert vpns == ["uwg-v0", "uwg-p1", "uwg-b0"]
+  assert [cmd[:3] for cmd in replay.executed if cmd[0] == "wg"] == [
+    ["wg", "syncconf", vpn] for vpn in vpns
+  ]
+  assert replay.stats["vtysh"].count == 2
+  # `iptables -n -LDOCKER-USER` fails once per forwarded interface
+  assert replay.stats["iptables"].failures == len(vpns) + 1
+  assert replay.stats["iptables"].count == sum(1 for c in replay.executed if c[0] == "iptables")
+
+
+def test_replay_unexpected_command():
+  replay = ReplayExecutor([RecordedCommand(["ip", "link", "show", "*"], stdout=b"up")])
+  with Executor.use(replay):
+    with pytest.raises(ReplayError):
+      exec_command(["ip", "link", "delete", "uwg-b0"])
+    assert exec_command(["ip", "link", "show", "uwg-b0"], capture_output=True).stdout == b"up"
+    with pytest.raises(ReplayError):
+      exec_command(["ip", "link", "show", "uwg-b0"])
+
+
+def test_record_and_replay(tmp_path: Path):
+  output = tmp_path / "output.txt"
+  recorder = RecordingExecutor()
+  with Executor.use(recorder):
+    assert exec_command(["echo", "hello"], capture_output=True).stdout == b"hello\n"
+    exec_command(["sh", "-c", "echo world"], output_file=output)
+    with pytest.raises(subprocess.CalledProcessError):
+      exec_command(["false"])
+    assert exec_command(["false"], noexcept=True).returncode == 1
+  recorded = tmp_path / "commands.json"
+  recorder.save(recorded)
+  assert recorder.stats["false"].failures == 2
+
+  output.unlink()
+  replay = ReplayExecutor.load(recorded)
+  with Executor.use(replay):
+    assert exec_command(["echo", "hello"], capture_output=True).stdout == b"hello\n"
+    exec_command(["sh", "-c", "echo world"], output_file=output)
+    assert output.read_text() == "world\n"
+    with pytest.raises(subprocess.CalledProcessError):
+      exec_command(["false"])
+    assert exec_command(["false"], noexcept=True).returncode == 1
+  assert replay.pending == []
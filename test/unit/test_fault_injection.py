@@ -0,0 +1,296 @@
+import ipaddress
+from pathlib import Path
+
+import pytest
+
+from uno.agent.uvn_peer import UvnPeerStatus
+from uno.core.exec import Executor
+from uno.core.time import Timestamp
+from uno.middleware import (
+  CellInfo,
+  DataSample,
+  Handle,
+  LanSite,
+  Middleware,
+  Participant,
+  ParticipantEventsListener,
+  UvnInfo,
+  middleware,
+)
+from uno.middleware.fault_injection import FaultInjectionMiddleware, FaultPolicy, FaultyParticipant
+from uno.middleware.package_transfer import PackageAssembler, split_package
+from uno.registry.topic import UvnTopic
+
+POLICY = """
+seed: 7
+topics:
+  BACKBONE:
+    drop: 0.3
+    duplicate: 0.3
+    delay: {distribution: uniform, min: 0, max: 3}
+  CELL_ID:
+    drop: 0.3
+    duplicate: 0.5
+    delay: {distribution: exponential, mean: 1}
+    liveliness_lost: 0.2
+    liveliness_duration: 2
+"""
+
+# Packages are split in small chunks, to be delivered in many samples
+CHUNK_SIZE = 512
+
+# Maximum number of (simulated) seconds for the agents to become consistent
+MAX_ROUNDS = 60
+
+
+class FakeClock:
+  def __init__(self) -> None:
+    self.now = 0.0
+
+  def __call__(self) -> float:
+    return self.now
+
+
+class LoopbackParticipant(Participant):
+  """Deliver the samples written by an agent to the other agents
+  in the same process, reliably and in order."""
+
+  BUS: list["LoopbackParticipant"] = []
+
+  def __init__(self, *args, **kwargs) -> None:
+    super().__init__(*args, **kwargs)
+    self.queue: list[DataSample] = []
+    self.writers: dict[UvnTopic, set[Handle]] = {}
+    self.BUS.append(self)
+
+  def receive(self, topic: UvnTopic, data: object, instance: Handle, writer: Handle) -> None:
+    self.queue.append(DataSample(topic, data, instance=instance, writer=writer))
+
+  def write(self, topic: UvnTopic, key: object, data: object) -> None:
+    for participant in self.BUS:
+      if participant is not self and topic in participant.topics["readers"]:
+        participant.receive(
+          topic, data, Handle(f"{self.owner}/{key}"), Handle(f"{self.owner}/{topic.name}")
+        )
+
+  def uvn_info(self, uvn, registry_id: str) -> None:
+    self.write(UvnTopic.UVN_ID, uvn.name, UvnInfo(uvn=uvn.name, registry_id=registry_id))
+
+  def cell_agent_config(self, uvn, cell_id: int, registry_id: str, package: Path) -> None:
+    chunks = split_package(
+      package, uvn=uvn.name, cell=cell_id, registry_id=registry_id, chunk_size=CHUNK_SIZE
+    )
+    for chunk in chunks:
+      self.write(UvnTopic.BACKBONE, (cell_id, chunk.seq), chunk)
+
+  def spin(self) -> bool:
+    samples = self.queue
+    self.queue = []
+    for topic in {s.topic for s in samples}:
+      writers = {s.writer for s in samples if s.topic == topic}
+      if not writers <= self.writers.get(topic, set()):
+        self.writers[topic] = self.writers.get(topic, set()) | writers
+        self.agent.on_remote_writers_status(topic, sorted(self.writers[topic], key=str))
+    if samples:
+      self.agent.on_data_batch(samples)
+    return False
+
+
+@pytest.fixture
+def faulty_middleware(monkeypatch: pytest.MonkeyPatch, cell_agent_root: Path) -> FakeClock:
+  # Reuse the condition of the middleware installed by cell_agent_root
+  loopback = type(
+    "LoopbackMiddleware",
+    (Middleware,),
+    {"CONDITION": middleware._Instance.CONDITION, "PARTICIPANT": LoopbackParticipant},
+  )
+  monkeypatch.setattr(LoopbackParticipant, "BUS", [])
+  monkeypatch.setattr(
+    middleware, "_Instance", FaultInjectionMiddleware.wrap(loopback, FaultPolicy.load(POLICY))
+  )
+  return FakeClock()
+
+
+def _open_agent(root: Path, clock: FakeClock):
+  from uno.agent.agent import Agent
+
+  agent = Agent.open(root)
+  assert isinstance(agent.participant, FaultyParticipant)
+  agent.participant.clock = clock
+  return agent
+
+
+def test_config_delivery_with_faults(
+  faulty_middleware: FakeClock, cell_agent_root: Path, fake_host: Executor
+):
+  from uno.registry.registry import Registry
+
+  clock = faulty_middleware
+  registry_root = cell_agent_root.parent / "registry"
+  with Executor.use(fake_host):
+    registry = Registry.open(registry_root)
+    registry.update_cell(registry.uvn.cells[2], address="cell2-new.example.com")
+    assert registry.generate_artifacts()
+    config_id = registry.config_id
+    registry.db.close()
+
+    registry_agent = _open_agent(registry_root, clock)
+    cell_agent = _open_agent(cell_agent_root, clock)
+    assert cell_agent.config_id != config_id
+    cell_agent.package_assembler = PackageAssembler(
+      cell_agent_root / ".config-transfers", chunk_size=CHUNK_SIZE
+    )
+    cell = cell_agent.owner
+
+    for _ in range(MAX_ROUNDS):
+      # The registry offers the configuration again, e.g. every time the cell reconnects
+      registry_agent._write_agent_configs(target_cells=[cell])
+      cell_agent.participant.spin()
+      clock.now += 1
+      if cell_agent._reload_agent is not None:
+        break
+
+  assert cell_agent._reload_agent is not None
+  assert cell_agent._reload_agent.config_id == config_id
+  stats = cell_agent.participant.stats
+  assert stats["dropped"] > 0
+  assert stats["duplicated"] > 0
+  assert stats["delayed"] > 0
+
+
+def _cell_info(seq: int, reachable: bool) -> CellInfo:
+  site = LanSite(
+    nic="eth0",
+    address=ipaddress.ip_address("192.168.2.2"),
+    subnet=ipaddress.ip_network("192.168.2.0/24"),
+    gw=ipaddress.ip_address("192.168.2.1"),
+  )
+  return CellInfo(
+    uvn="test-uvn",
+    cell=2,
+    registry_id="0" * 64,
+    routed_networks=(site,),
+    reachable_networks=(site,) if reachable else (),
+    unreachable_networks=() if reachable else (site,),
+    ts_start=1700000000 + seq,
+  )
+
+
+def test_peer_status_with_faults(
+  faulty_middleware: FakeClock, cell_agent_root: Path, fake_host: Executor
+):
+  clock = faulty_middleware
+  with Executor.use(fake_host):
+    agent = _open_agent(cell_agent_root, clock)
+    participant = agent.participant
+
+    def _consistent(seq: int) -> bool:
+      peer = agent.peers[agent.uvn.cells[2]]
+      return (
+        peer.status == UvnPeerStatus.ONLINE
+        and peer.ts_start == Timestamp.unix(1700000000 + seq)
+        and [(str(n.lan.nic.subnet), n.reachable) for n in peer.known_networks]
+        == [("192.168.2.0/24", True)]
+      )
+
+    # The remote cell's LAN flaps, then it settles, and its status
+    # is written periodically (e.g. by the peers tester)
+    seq = 0
+    for seq in range(MAX_ROUNDS):
+      participant.inner.receive(
+        UvnTopic.CELL_ID,
+        _cell_info(min(seq, 20), reachable=seq >= 20 or seq % 2 == 0),
+        Handle("cell2/2"),
+        Handle("cell2/CELL_ID"),
+      )
+      participant.spin()
+      clock.now += 1
+      if seq > 20 and _consistent(20):
+        break
+    assert _consistent(20), f"not consistent after {seq} rounds"
+
+  stats = participant.stats
+  assert stats["dropped"] > 0
+  assert stats["duplicated"] > 0
+  assert stats["liveliness_lost"] > 0
+
+
+class RecordingAgent(ParticipantEventsListener):
+  def __init__(self) -> None:
+    self.owner = "cell2"
+    self.events: list[tuple] = []
+
+  def on_remote_writers_status(self, topic: UvnTopic, online_writers: list[Handle]) -> None:
+    self.events.append(("writers", topic.name, tuple(map(str, online_writers))))
+
+  def on_instance_offline(self, topic: UvnTopic, instance: Handle) -> None:
+    self.events.append(("offline", topic.name, str(instance)))
+
+  def on_data_batch(self, samples: list[DataSample]) -> None:
+    self.events.append(("data", tuple(s.data.ts_start for s in samples)))
+
+
+class ScriptedParticipant(Participant):
+  def spin(self) -> bool:
+    return False
+
+
+def _replay(policy: FaultPolicy) -> list[tuple]:
+  agent = RecordingAgent()
+  participant = FaultyParticipant(agent=agent, inner=ScriptedParticipant, policy=policy)
+  clock = FakeClock()
+  participant.clock = clock
+  listener = participant.inner.agent
+  listener.on_remote_writers_status(UvnTopic.CELL_ID, [Handle("cell2/CELL_ID")])
+  for seq in range(50):
+    listener.on_data(
+      UvnTopic.CELL_ID, _cell_info(seq, True), Handle("cell2/2"), Handle("cell2/CELL_ID")
+    )
+    participant.spin()
+    clock.now += 0.5
+  return agent.events
+
+
+def test_fault_policy_replay():
+  policy = FaultPolicy.load(POLICY)
+  events = _replay(policy)
+  assert _replay(FaultPolicy.load(POLICY)) == events
+  assert _replay(policy._replace(seed=8)) != events
+  # Without faults, every sample is delivered in order, as soon as it is received
+  assert _replay(FaultPolicy()) == [
+    ("writers", "CELL_ID", ("cell2/CELL_ID",)),
+    *(("data", (1700000000 + seq,)) for seq in range(50)),
+  ]
+
+
+@pytest.mark.parametrize(
+  "policy",
+  [
+    {"topics": {"CELL_ID": {"drop": 1.5}}},
+    {"topics": {"CELL_ID": {"delay": {"distribution": "normal"}}}},
+    {"topics": {"CELL_ID": {"delay": {"distribution": "uniform", "min": 2, "max": 1}}}},
+    {"topics": {"CELL_ID": {"liveliness_duration": -1}}},
+  ],
+)
+def test_fault_policy_invalid(policy: dict):
+  with pytest.raises(ValueError):
+    FaultPolicy.parse(policy)
+
+
+def test_fault_policy_selected_from_env(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+  plugin = tmp_path / "fault_injection_test_plugin.py"
+  plugin.write_text(
+    "from uno.middleware import Middleware as _Base\n\n\nclass Middleware(_Base):\n  pass\n"
+  )
+  policy_file = tmp_path / "faults.yaml"
+  policy_file.write_text(POLICY)
+  monkeypatch.syspath_prepend(tmp_path)
+  monkeypatch.setattr(middleware, "_Instance", None)
+  monkeypatch.setenv("UNO_MIDDLEWARE", plugin.stem)
+  monkeypatch.setenv("UNO_MIDDLEWARE_FAULTS", str(policy_file))
+
+  selected = Middleware.selected()
+  assert issubclass(selected, FaultInjectionMiddleware)
+  assert selected.INNER.__module__ == plugin.stem
+  assert selected.POLICY == FaultPolicy.load(POLICY)
+  assert selected.POLICY.topics[UvnTopic.BACKBONE].delay.max == 3
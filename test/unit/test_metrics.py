@@ -0,0 +1,102 @@
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from uno.agent.agent_metrics import AgentMetrics
+from uno.core.metrics import Metrics
+from uno.core.time import Timestamp
+from uno.registry.database import Database
+
+
+@pytest.fixture
+def metrics(monkeypatch: pytest.MonkeyPatch) -> Metrics:
+  metrics = Metrics()
+  monkeypatch.setattr(Metrics, "_Instance", metrics)
+  return metrics
+
+
+def _parse(output: Path) -> dict[str, object]:
+  parser = pytest.importorskip("prometheus_client.parser")
+  return {f.name: f for f in parser.text_string_to_metric_families(output.read_text())}
+
+
+def _vpn_peer_stats(recv: int, send: int, handshake: Timestamp) -> dict:
+  return {"transfer": {"recv": recv, "send": send}, "last_handshake": str(handshake)}
+
+
+def test_agent_metrics_text_format(metrics: Metrics, tmp_path: Path):
+  agent_metrics = AgentMetrics()
+  now = Timestamp.now()
+  vpn = SimpleNamespace(config=SimpleNamespace(intf=SimpleNamespace(name="uwg-b0")))
+  agent_metrics.update_vpn_stats(
+    vpn,
+    SimpleNamespace(name="cell2"),
+    _vpn_peer_stats(1024, 2048, Timestamp(now._ts - timedelta(seconds=30))),
+    now=now,
+  )
+  agent_metrics.update_vpn_stats(
+    vpn, SimpleNamespace(name="cell3"), _vpn_peer_stats(0, 148, Timestamp.unix(0)), now=now
+  )
+  agent_metrics.lan_reachable.set(1, peer="cell2", lan="192.168.2.0/24")
+  agent_metrics.lan_probe_time.observe(0.2, peer="cell2", lan="192.168.2.0/24")
+  agent_metrics.samples.inc(topic="CELL_ID")
+  agent_metrics.samples.inc(topic="CELL_ID")
+  agent_metrics.samples.inc(topic="BACKBONE")
+  agent_metrics.spin_time.observe(0.003)
+  agent_metrics.routes.set(12)
+  db = Database()
+  with db.transaction():
+    db._db.execute("SELECT 1")
+  db.close()
+
+  output = tmp_path / "metrics.txt"
+  metrics.write(output)
+  families = _parse(output)
+
+  assert families["uno_wireguard_received_bytes"].type == "counter"
+  assert {(s.labels["peer"], s.value) for s in families["uno_wireguard_sent_bytes"].samples} == {
+    ("cell2", 2048),
+    ("cell3", 148),
+  }
+  (handshake_age,) = families["uno_wireguard_handshake_age_seconds"].samples
+  assert handshake_age.labels == {"interface": "uwg-b0", "peer": "cell2"}
+  assert handshake_age.value == pytest.approx(30, abs=1)
+
+  assert [(s.labels, s.value) for s in families["uno_lan_reachable"].samples] == [
+    ({"peer": "cell2", "lan": "192.168.2.0/24"}, 1)
+  ]
+  probe = {s.name: s for s in families["uno_lan_probe_seconds"].samples if "le" not in s.labels}
+  assert probe["uno_lan_probe_seconds_count"].value == 1
+  assert probe["uno_lan_probe_seconds_sum"].value == pytest.approx(0.2)
+  buckets = {
+    s.labels["le"]: s.value
+    for s in families["uno_lan_probe_seconds"].samples
+    if s.name.endswith("_bucket")
+  }
+  assert buckets["0.1"] == 0 and buckets["0.25"] == 1 and buckets["+Inf"] == 1
+
+  assert {s.labels["topic"]: s.value for s in families["uno_samples_received"].samples} == {
+    "BACKBONE": 1,
+    "CELL_ID": 2,
+  }
+  assert families["uno_agent_spin_seconds"].type == "histogram"
+  assert families["uno_routes"].samples[0].value == 12
+  db_ops = {
+    s.labels["operation"] for s in families["uno_db_operation_seconds"].samples if "le" in s.labels
+  }
+  assert "transaction" in db_ops
+
+
+def test_metric_labels_validated(metrics: Metrics):
+  counter = metrics.counter("uno_test_total", "A test counter.", ["peer"])
+  with pytest.raises(ValueError):
+    counter.inc(other="x")
+  with pytest.raises(ValueError):
+    counter.inc(-1, peer="x")
+  with pytest.raises(TypeError):
+    metrics.gauge("uno_test_total", "Same name, different type.")
+  assert metrics.counter("uno_test_total", "A test counter.", ["peer"]) is counter
+  counter.inc(peer='a "quoted"\nvalue')
+  assert 'uno_test_total{peer="a \\"quoted\\"\\nvalue"} 1' in metrics.render()
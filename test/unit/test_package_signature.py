@@ -0,0 +1,140 @@
+import shutil
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from uno.core.exec import Executor
+from uno.registry.package_signature import (
+  InvalidPackage,
+  PackageManifest,
+  PackageSigner,
+  verify_package,
+)
+
+PACKAGE = "test-uvn__cell1.uvn-agent"
+
+
+def _unpack(package: Path, output_dir: Path) -> list[Path]:
+  with tarfile.open(package) as archive:
+    archive.extractall(output_dir, filter="data")
+    return [output_dir / m.name for m in archive.getmembers() if m.isfile()]
+
+
+def _repack(package: Path, base_dir: Path, files: list[Path]) -> Path:
+  with tarfile.open(package, "w:xz") as archive:
+    for f in files:
+      archive.add(f, arcname=str(f.relative_to(base_dir)))
+  return package
+
+
+def _regenerate(registry_root: Path) -> Path:
+  # Generate a new version of the cell's package
+  from uno.registry.registry import Registry
+
+  registry = Registry.open(registry_root)
+  registry.update_cell(registry.uvn.cells[2], address="cell2-new.example.com")
+  assert registry.generate_artifacts()
+  registry.db.close()
+  return registry_root / "cells" / PACKAGE
+
+
+def test_package_signed(cell_agent_root: Path, fake_host: Executor, tmp_path: Path):
+  package = cell_agent_root.parent / "registry" / "cells" / PACKAGE
+  with Executor.use(fake_host):
+    manifest = verify_package(package)
+    assert manifest == PackageManifest.installed(cell_agent_root)
+    assert manifest.uvn == "test-uvn"
+    assert manifest.owner == ["cells", 1]
+    assert "id.yaml" in manifest.files
+    # The signer's private key is never exported
+    assert not (cell_agent_root / "package-signer").exists()
+    # The same package can be installed again
+    assert verify_package(package, trusted=cell_agent_root) == manifest
+
+
+@pytest.mark.parametrize("tamper", ["modify", "add", "remove"])
+def test_package_tampered(cell_agent_root: Path, fake_host: Executor, tmp_path: Path, tamper: str):
+  from uno.agent.agent import Agent
+
+  package = cell_agent_root.parent / "registry" / "cells" / PACKAGE
+  contents = tmp_path / "contents"
+  files = _unpack(package, contents)
+  if tamper == "modify":
+    (contents / "id.yaml").write_text((contents / "id.yaml").read_text() + "# modified\n")
+  elif tamper == "add":
+    extra = contents / ".id-import" / "extra.pem"
+    extra.write_text("extra")
+    files.append(extra)
+  else:
+    files.remove(contents / "id.yaml")
+  tampered = _repack(tmp_path / PACKAGE, contents, files)
+
+  install_root = tmp_path / "install"
+  install_root.mkdir()
+  with Executor.use(fake_host), pytest.raises(InvalidPackage):
+    Agent.install_package(tampered, install_root)
+  # Nothing was extracted
+  assert list(install_root.iterdir()) == []
+
+
+def test_package_wrong_signer(cell_agent_root: Path, fake_host: Executor, tmp_path: Path):
+  from uno.agent.agent import Agent
+
+  package = cell_agent_root.parent / "registry" / "cells" / PACKAGE
+  contents = tmp_path / "contents"
+  files = _unpack(package, contents)
+  signed = {contents / f for f in (PackageManifest.SIGNATURE, PackageManifest.SIGNER)}
+  manifest = PackageManifest.load((contents / PackageManifest.FILENAME).read_text())
+  with Executor.use(fake_host):
+    signer = PackageSigner(tmp_path / "signer")
+    signer.init()
+    # Claim a newer generation than the installed one
+    signer.serial_file.write_text(str(manifest.serial + 1))
+    forged_files = [
+      *signer.sign(
+        contents,
+        [f for f in files if f.name != PackageManifest.FILENAME and f not in signed],
+        uvn=manifest.uvn,
+        owner=manifest.owner,
+        config_id=manifest.config_id,
+      ),
+      *(f for f in files if f.name != PackageManifest.FILENAME and f not in signed),
+    ]
+    forged = _repack(tmp_path / PACKAGE, contents, forged_files)
+    # The package is consistent, but not signed by the agent's registry
+    assert verify_package(forged).serial == manifest.serial + 1
+    with pytest.raises(InvalidPackage, match="invalid signature"):
+      verify_package(forged, trusted=cell_agent_root)
+
+    agent = Agent.open(cell_agent_root)
+    agent._on_agent_config_received(shutil.copy(forged, tmp_path / "received"))
+    assert agent._reload_agent is None
+    agent.db.close()
+
+
+def test_package_rollback(cell_agent_root: Path, fake_host: Executor, tmp_path: Path):
+  from uno.agent.agent import Agent
+
+  registry_root = cell_agent_root.parent / "registry"
+  old_package = shutil.copy(registry_root / "cells" / PACKAGE, tmp_path / "old.uvn-agent")
+  with Executor.use(fake_host):
+    new_package = _regenerate(registry_root)
+    new_manifest = verify_package(new_package, trusted=cell_agent_root)
+    assert new_manifest.serial == PackageManifest.installed(cell_agent_root).serial + 1
+
+    # The cell agent receives the new configuration, and then the old one again
+    agent = Agent.open(cell_agent_root)
+    agent._on_agent_config_received(shutil.copy(new_package, tmp_path / "received"))
+    assert agent._reload_agent is not None
+    agent._reload_agent.db.close()
+    agent._reload_agent = None
+    new_root = tmp_path / "new"
+    new_root.mkdir()
+    Agent.install_package(new_package, new_root).db.close()
+    with pytest.raises(InvalidPackage, match="older"):
+      verify_package(old_package, trusted=new_root)
+    with pytest.raises(InvalidPackage, match="older"):
+      Agent.install_package(old_package, new_root)
+    assert PackageManifest.installed(new_root) == new_manifest
+    agent.db.close()
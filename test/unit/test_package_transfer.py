@@ -0,0 +1,102 @@
+import os
+import random
+from pathlib import Path
+
+import pytest
+
+from uno.middleware import AgentConfigChunk
+from uno.middleware.package_transfer import PackageAssembler, split_package
+
+CHUNK_SIZE = 1024
+
+
+class LoopbackTransport:
+  """Deliver chunks to an assembler in-process, simulating a lossy network
+  which reorders, duplicates, and drops samples."""
+
+  def __init__(self, assembler: PackageAssembler, seed: int = 0) -> None:
+    self.assembler = assembler
+    self.random = random.Random(seed)
+    self.received: list[Path] = []
+
+  def deliver(self, chunks: list[AgentConfigChunk], drop: set[int] = frozenset()) -> None:
+    chunks = [c for c in chunks if c.seq not in drop]
+    chunks = chunks + self.random.sample(chunks, len(chunks) // 3)
+    self.random.shuffle(chunks)
+    for chunk in chunks:
+      package = self.assembler.receive(chunk)
+      if package is not None:
+        self.received.append(package)
+
+
+@pytest.fixture
+def package(tmp_path: Path) -> Path:
+  package = tmp_path / "cell1.uvn-agent"
+  # Not a multiple of the chunk size
+  package.write_bytes(os.urandom(CHUNK_SIZE * 20 + 100))
+  return package
+
+
+def _chunks(package: Path, registry_id: str = "a" * 64) -> list[AgentConfigChunk]:
+  return list(split_package(package, "test-uvn", 1, registry_id, chunk_size=CHUNK_SIZE))
+
+
+def test_split_package(package: Path):
+  chunks = _chunks(package)
+  assert [c.seq for c in chunks] == list(range(21))
+  assert {c.count for c in chunks} == {21}
+  assert len(chunks[-1].data) == 100
+  assert b"".join(c.data for c in chunks) == package.read_bytes()
+
+
+def test_reassembly_out_of_order_with_duplicates(package: Path, tmp_path: Path):
+  transport = LoopbackTransport(PackageAssembler(tmp_path / "rx", chunk_size=CHUNK_SIZE))
+  transport.deliver(_chunks(package))
+  (received,) = transport.received
+  assert received.read_bytes() == package.read_bytes()
+  # Late duplicates don't restart the transfer
+  transport.deliver(_chunks(package))
+  assert len(transport.received) == 1
+  assert list((tmp_path / "rx").glob("*.part")) == []
+
+
+def test_reassembly_resumed_after_missing_chunks(package: Path, tmp_path: Path):
+  chunks = _chunks(package)
+  assembler = PackageAssembler(tmp_path / "rx", chunk_size=CHUNK_SIZE)
+  LoopbackTransport(assembler).deliver(chunks, drop={0, 7, 20})
+  assert assembler.transfers[chunks[0].digest].missing == [0, 7, 20]
+
+  # The agent restarts, and the missing chunks are received afterwards
+  restarted = PackageAssembler(tmp_path / "rx", chunk_size=CHUNK_SIZE)
+  transport = LoopbackTransport(restarted)
+  transport.deliver([chunks[7]])
+  assert restarted.transfers[chunks[0].digest].missing == [0, 20]
+  transport.deliver([chunks[0], chunks[20]])
+  (received,) = transport.received
+  assert received.read_bytes() == package.read_bytes()
+
+
+def test_reassembly_rejects_corrupted_chunks(package: Path, tmp_path: Path):
+  chunks = _chunks(package)
+  assembler = PackageAssembler(tmp_path / "rx", chunk_size=CHUNK_SIZE)
+  transport = LoopbackTransport(assembler)
+  corrupted = chunks[3]._replace(data=bytes(CHUNK_SIZE))
+  transport.deliver([corrupted, *chunks[:3], *chunks[4:]])
+  assert transport.received == []
+  # The corrupted transfer was discarded, so it can be received again
+  transport.deliver(chunks)
+  (received,) = transport.received
+  assert received.read_bytes() == package.read_bytes()
+
+
+def test_newer_package_supersedes_incomplete_transfers(package: Path, tmp_path: Path):
+  assembler = PackageAssembler(tmp_path / "rx", chunk_size=CHUNK_SIZE)
+  transport = LoopbackTransport(assembler)
+  digests = []
+  for i in range(3):
+    package.write_bytes(os.urandom(CHUNK_SIZE * 4))
+    chunks = _chunks(package)
+    digests.append(chunks[0].digest)
+    transport.deliver(chunks, drop={0})
+  assert sorted(f.stem for f in (tmp_path / "rx").glob("*.part")) == sorted(digests[1:])
+  assert assembler.receive(chunks[0]).read_bytes() == package.read_bytes()
@@ -0,0 +1,146 @@
+from pathlib import Path
+
+import pytest
+
+from uno.cli.cli_helpers import cli_parser
+from uno.cli.uno.parser import uno_parser
+from uno.core import ask
+from uno.core.exec import Executor
+from uno.registry.package_signature import PackageManifest, verify_package
+from uno.registry.registry import Registry
+from uno.registry.registry_history import RowChange, merge_changes
+
+
+@pytest.fixture
+def uvn_root(cell_agent_root: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+  monkeypatch.setattr(ask, "QUERY_ASSUME_YES", True)
+  return cell_agent_root.parent / "registry"
+
+
+def _run(root: Path, *argv: str) -> None:
+  args = cli_parser(uno_parser).parse_args([*argv, "--root", str(root)])
+  args.argv = list(argv)
+  args.cmd(args)
+
+
+def _artifacts(root: Path) -> dict[str, tuple[str, dict[str, str]]]:
+  # Restored packages are signed again, with a new serial
+  return {
+    str(f.relative_to(root)): (manifest.config_id, manifest.files)
+    for d in ("cells", "particles")
+    for f in sorted((root / d).rglob("*"))
+    if f.is_file()
+    for manifest in [verify_package(f)]
+  }
+
+
+def test_merge_changes():
+  changes = merge_changes(
+    [
+      RowChange("cells", (1,), None, {"name": "a", "address": "x"}),
+      RowChange("cells", (1,), {"address": "x"}, {"address": "y"}),
+      RowChange("cells", (2,), {"name": "b"}, {"name": "c"}),
+      RowChange("cells", (2,), {"name": "c"}, {"name": "b"}),
+      RowChange("cells", (3,), None, {"name": "d"}),
+      RowChange("cells", (3,), {"name": "d"}, None),
+      RowChange("cells", (4,), {"name": "e", "address": "z"}, None),
+      RowChange("cells", (4,), None, {"name": "e", "address": "w"}),
+    ]
+  )
+  assert changes == [
+    RowChange("cells", (1,), None, {"name": "a", "address": "y"}),
+    RowChange("cells", (4,), {"address": "z"}, {"address": "w"}),
+  ]
+
+
+def test_rollback_redeploy(uvn_root: Path, fake_host: Executor):
+  deployed = _artifacts(uvn_root)
+  assert deployed
+  with Executor.use(fake_host):
+    _run(uvn_root, "redeploy", "--strategy", "full-mesh")
+    assert _artifacts(uvn_root) != deployed
+    _run(uvn_root, "history", "restore", "1")
+  assert _artifacts(uvn_root) == deployed
+
+  registry = Registry.open(uvn_root)
+  generations = registry.history.generations()
+  assert [g.command for g in generations] == [
+    "define uvn test-uvn",
+    "redeploy --strategy full-mesh",
+    "history restore 1",
+  ]
+  assert registry.config_id == generations[0].config_id == generations[2].config_id
+  assert registry.uvn.settings.deployment.strategy.name == "CROSSED"
+  # The redeploy changed the deployment settings and dropped the backbone keys
+  redeploy = registry.history.diff(1, 2)
+  assert ("uvns", "settings") in {(c.table, f[0]) for c in redeploy for f in c.fields()}
+  assert any(c.table == "asymm_keys" and c.new is None for c in redeploy)
+  # The restore reverted all of them
+  assert registry.history.diff(1, 3) == []
+  assert registry.history.diff(2, 3) == registry.history.diff(2, 1)
+
+
+def test_restore_older_package(uvn_root: Path, cell_agent_root: Path, fake_host: Executor):
+  from uno.agent.agent import Agent
+
+  package = uvn_root / "cells" / "test-uvn__cell1.uvn-agent"
+  with Executor.use(fake_host):
+    _run(uvn_root, "redeploy", "--strategy", "full-mesh")
+    Agent.install_package(package, cell_agent_root).db.close()
+    installed = PackageManifest.installed(cell_agent_root)
+
+    # The agent accepts the package of the restored generation
+    _run(uvn_root, "history", "restore", "1")
+    restored = verify_package(package, trusted=cell_agent_root)
+    assert restored.serial > installed.serial
+    # The archived copy was left untouched
+    archived = verify_package(uvn_root / "generations" / "1" / "cells" / package.name)
+    assert archived.files == restored.files
+    assert archived.serial < installed.serial
+    assert restored.config_id == Registry.open(uvn_root).history.generations()[0].config_id
+    Agent.install_package(package, cell_agent_root).db.close()
+  assert PackageManifest.installed(cell_agent_root) == restored
+
+
+def test_retention(uvn_root: Path, fake_host: Executor):
+  with Executor.use(fake_host):
+    _run(
+      uvn_root, "config", "uvn", "--update", "--history-generations", "3", "--history-archives", "2"
+    )
+    for i in range(3, 6):
+      _run(
+        uvn_root,
+        "define",
+        "cell",
+        f"cell{i}",
+        "--address",
+        f"cell{i}.example.com",
+        "--network",
+        f"192.168.{i}.0/24",
+      )
+    registry = Registry.open(uvn_root)
+    generations = registry.history.generations()
+    assert [g.id for g in generations] == [3, 4, 5]
+    assert [g.archived for g in generations] == [False, True, True]
+    assert sorted(p.name for p in (uvn_root / "generations").iterdir()) == ["4", "5"]
+
+    # Restoring a generation which was not archived generates the artifacts again
+    registry.db.close()
+    _run(uvn_root, "history", "restore", "3")
+  registry = Registry.open(uvn_root)
+  assert sorted(c.name for c in registry.uvn.cells.values()) == ["cell1", "cell2", "cell3"]
+  assert sorted(f.name for f in (uvn_root / "cells").iterdir()) == [
+    f"test-uvn__cell{i}.uvn-agent" for i in (1, 2, 3)
+  ]
+  with pytest.raises(ValueError):
+    registry.history.diff(1, 3)
+
+
+def test_diff_without_history(uvn_root: Path, capfd: pytest.CaptureFixture):
+  # Registries created by previous versions have no history
+  registry = Registry.open(uvn_root)
+  registry.db._db.executescript("DROP TABLE generation_changes; DROP TABLE generations;")
+  registry.db.close()
+  with pytest.raises(SystemExit):
+    _run(uvn_root, "history", "diff", "1")
+  assert "no generations recorded" in capfd.readouterr().err
@@ -0,0 +1,101 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Generator
+
+import pytest
+
+from uno.cli.cli_helpers import cli_parser
+from uno.cli.uno.parser import uno_parser
+from uno.cli.uno.registry_server import RegistryClient, RegistryServer
+from uno.core.exec import Executor
+from uno.registry.registry import Registry
+
+CELLS = 4
+
+
+@pytest.fixture
+def server(registry_root: Path, fake_host: Executor) -> Generator[RegistryServer, None, None]:
+  with Executor.use(fake_host):
+    server = RegistryServer(registry_root, parser=lambda: cli_parser(uno_parser))
+  thread = threading.Thread(target=server.serve_forever)
+  thread.start()
+  yield server
+  server.shutdown()
+  thread.join()
+  server.server_close()
+
+
+def _request(root: Path, *argv: str) -> str:
+  client = RegistryClient.connect(root)
+  assert client is not None
+  with client:
+    return client.request(list(argv), cwd=root)
+
+
+def test_no_daemon(registry_root: Path):
+  assert RegistryClient.connect(registry_root) is None
+
+
+def test_concurrent_clients(server: RegistryServer, registry_root: Path):
+  def _define(i: int) -> str:
+    return _request(
+      registry_root,
+      "define",
+      "cell",
+      f"cell{i}",
+      "--address",
+      f"cell{i}.example.com",
+      "--network",
+      f"192.168.{i}.0/24",
+    )
+
+  def _query(i: int) -> str:
+    return _request(registry_root, "config", "uvn", "--query", "uvn.name", "--json")
+
+  with ThreadPoolExecutor(max_workers=CELLS * 2) as pool:
+    defines = [pool.submit(_define, i) for i in range(1, CELLS + 1)]
+    queries = [pool.submit(_query, i) for i in range(CELLS)]
+    assert [f.result() for f in defines] == [""] * CELLS
+    assert {f.result().strip() for f in queries} == {'"test-uvn"'}
+
+  # The daemon's view is consistent with the database
+  cells = _request(registry_root, "config", "uvn", "--query", "uvn.cells", "--json")
+  assert cells.count('"name"') == CELLS
+  registry = Registry.open(registry_root)
+  assert sorted(c.name for c in registry.uvn.cells.values()) == [
+    f"cell{i}" for i in range(1, CELLS + 1)
+  ]
+  registry.db.close()
+
+
+def test_failed_command(server: RegistryServer, registry_root: Path):
+  with pytest.raises(RuntimeError, match="registry daemon failed"):
+    _request(registry_root, "config", "cell", "unknown")
+  with pytest.raises(RuntimeError, match="not a registry command"):
+    _request(registry_root, "sync")
+  # Questions are answered "no", unless --yes is specified
+  _request(registry_root, "define", "cell", "cell1", "--address", "cell1.example.com")
+  with pytest.raises(RuntimeError, match="aborted"):
+    _request(registry_root, "delete", "cell", "cell1")
+  _request(registry_root, "delete", "cell", "cell1", "--yes")
+  assert "cell1" not in _request(registry_root, "config", "uvn", "--query", "uvn.cells")
+
+
+def test_external_changes(server: RegistryServer, registry_root: Path, fake_host: Executor):
+  _request(registry_root, "define", "cell", "cell1", "--address", "cell1.example.com")
+
+  # The cell is changed without the daemon (e.g. with --no-daemon)
+  with Executor.use(fake_host):
+    registry = Registry.open(registry_root)
+    registry.update_cell(registry.load_cell("cell1"), address="cell1.example.org")
+    registry.generate_artifacts()
+    registry.db.close()
+
+  # The daemon doesn't overwrite the change with its stale copy of the cell
+  _request(registry_root, "config", "cell", "cell1", "--update", "--network", "192.168.1.0/24")
+  registry = Registry.open(registry_root)
+  cell = registry.load_cell("cell1")
+  assert cell.address == "cell1.example.org"
+  assert list(map(str, cell.allowed_lans)) == ["192.168.1.0/24"]
+  registry.db.close()
@@ -0,0 +1,177 @@
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+
+from uno.core.exec import Executor
+from uno.registry.registry import Registry
+from uno.registry.registry_spec import SpecError, load_spec
+
+# Number of particles imported by the benchmark
+PARTICLES = 20
+
+SPEC = """\
+users:
+- email: alice@example.com
+  password: alice
+  config:
+    name: Alice
+cells:
+- name: cell1
+  owner: alice@example.com
+  address: cell1.example.com
+  allowed_lans:
+  - 192.168.1.0/24
+- name: cell2
+  address: cell2.example.com
+particles:
+- name: p1
+  owner: alice@example.com
+- name: p2
+"""
+
+INVALID_SPEC = """\
+users:
+- email: owner@example.com
+  password: pw
+- email: bob@example.com
+cells:
+- name: cell1
+- name: cell3
+  address: cell1.example.com
+  allowed_lans: [192.168.1.128/25]
+- name: cell4
+  owner: carol@example.com
+  allowed_lans: [192.168.300.0/24]
+- name: cell5
+  address: cell5.example.com
+  allowed_lans: [10.0.0.0/16]
+- name: cell6
+  address: cell6.example.com
+  allowed_lans: [10.0.1.0/24]
+particles:
+- name: p1
+- name: p3
+- name: p3
+- name: p4
+  colour: red
+"""
+
+
+def _write(tmp_path: Path, name: str, text: str) -> Path:
+  spec = tmp_path / name
+  spec.write_text(text)
+  return spec
+
+
+def test_define_from_yaml(registry_root: Path, fake_host: Executor, tmp_path: Path):
+  entries = load_spec(_write(tmp_path, "spec.yaml", SPEC))
+  assert [(e.kind, e.line) for e in entries] == [
+    ("users", 2),
+    ("cells", 7),
+    ("cells", 12),
+    ("particles", 15),
+    ("particles", 17),
+  ]
+  with Executor.use(fake_host):
+    registry = Registry.open(registry_root)
+    registry.define_entities(entries)
+    registry.generate_artifacts()
+  alice = registry.load_user("alice@example.com")
+  assert alice.name == "Alice"
+  cell1 = registry.load_cell("cell1")
+  assert cell1.owner == alice
+  assert [str(n) for n in cell1.allowed_lans] == ["192.168.1.0/24"]
+  assert registry.load_cell("cell2").owner == registry.uvn.owner
+  assert registry.load_particle("p1").owner == alice
+  assert registry.load_particle("p2").owner == registry.uvn.owner
+
+
+def test_define_from_csv(registry_root: Path, fake_host: Executor, tmp_path: Path):
+  spec = _write(
+    tmp_path,
+    "spec.csv",
+    "kind,name,email,password,owner,address,allowed_lans\n"
+    "user,Alice,alice@example.com,alice,,,\n"
+    "cell,cell1,,,alice@example.com,cell1.example.com,192.168.1.0/24 10.0.0.0/8\n"
+    "particle,p1,,,alice@example.com,,\n",
+  )
+  entries = load_spec(spec)
+  assert [(e.kind, e.line) for e in entries] == [("users", 2), ("cells", 3), ("particles", 4)]
+  with Executor.use(fake_host):
+    registry = Registry.open(registry_root)
+    registry.define_entities(entries)
+  assert sorted(str(n) for n in registry.load_cell("cell1").allowed_lans) == [
+    "10.0.0.0/8",
+    "192.168.1.0/24",
+  ]
+  assert registry.load_particle("p1").owner.name == "Alice"
+
+
+def test_report_private_cell_errors(registry_root: Path, fake_host: Executor, tmp_path: Path):
+  spec = _write(tmp_path, "private.yaml", "cells:\n- name: cell1\n")
+  with Executor.use(fake_host):
+    registry = Registry.open(registry_root)
+  with pytest.raises(SpecError) as e:
+    registry.define_entities(load_spec(spec), source=str(spec))
+  # Same checks as when adding a single cell
+  with pytest.raises(ValueError) as single:
+    registry.add_cell(name="cell1")
+  assert e.value.errors == [(2, single.value.args[0])]
+  assert not registry.uvn.all_cells
+
+
+def test_report_all_errors(registry_root: Path, fake_host: Executor, tmp_path: Path):
+  with Executor.use(fake_host):
+    registry = Registry.open(registry_root)
+    registry.define_entities(load_spec(_write(tmp_path, "spec.yaml", SPEC)))
+    registry.generate_artifacts()
+
+  spec = _write(tmp_path, "invalid.yaml", INVALID_SPEC)
+  with pytest.raises(SpecError) as e:
+    registry.define_entities(load_spec(spec), source=str(spec))
+  assert [line for line, _ in e.value.errors] == [2, 4, 6, 7, 7, 10, 10, 13, 16, 20, 22, 23]
+  errors = str(e.value)
+  assert f"{spec}:7: address already in use: cell1.example.com" in errors
+  assert (
+    f"{spec}:7: network 192.168.1.128/25 of cell3 clashes with 192.168.1.0/24 of cell1" in errors
+  )
+  assert f"{spec}:13: network 10.0.0.0/16 of cell5 clashes with 10.0.1.0/24 of cell6" in errors
+  assert f"{spec}:10: unknown owner: carol@example.com" in errors
+  # Nothing was added
+  assert sorted(u.email for u in registry.users.values()) == [
+    "alice@example.com",
+    "owner@example.com",
+  ]
+  assert sorted(c.name for c in registry.uvn.all_cells.values()) == ["cell1", "cell2"]
+
+
+def test_bulk_define_benchmark(registry_root: Path, fake_host: Executor, tmp_path: Path):
+  bulk_root = tmp_path / "registry-bulk"
+  # Both registries start from the same state
+  shutil.copytree(registry_root, bulk_root)
+  spec = _write(
+    tmp_path,
+    "particles.yaml",
+    "particles:\n" + "".join(f"- name: particle{i}\n" for i in range(PARTICLES)),
+  )
+
+  with Executor.use(fake_host):
+    # Same as invoking "uno define particle" once for every particle
+    start = time.perf_counter()
+    for i in range(PARTICLES):
+      registry = Registry.open(registry_root)
+      registry.add_particle(name=f"particle{i}")
+      registry.generate_artifacts()
+      registry.db.close()
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    registry = Registry.open(bulk_root)
+    registry.define_entities(load_spec(spec))
+    registry.generate_artifacts()
+    bulk = time.perf_counter() - start
+
+  assert len(registry.uvn.particles) == PARTICLES
+  assert bulk < single
@@ -0,0 +1,190 @@
+import argparse
+import base64
+import os
+import shutil
+import sqlite3
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from uno.core import ask
+from uno.core.exec import Executor
+from uno.registry.database import Database
+from uno.registry.secret_box import InvalidMasterKey, MasterKey, MissingMasterKey, SecretBox
+from uno.registry.wg_key import WireGuardKeyPair, WireGuardPsk
+
+# Number of cells in the registry whose keys are loaded
+CELLS = 10
+
+
+def _master_key() -> str:
+  return base64.b64encode(os.urandom(32)).decode()
+
+
+@pytest.fixture
+def master_key(monkeypatch: pytest.MonkeyPatch) -> str:
+  key = _master_key()
+  monkeypatch.setenv(MasterKey.ENV_VAR, key)
+  return key
+
+
+def _secrets(root: Path) -> dict[tuple[str, int], str]:
+  db = Database(root)
+  try:
+    return {
+      **{("asymm_keys", k.id): k.private for k in db.load(WireGuardKeyPair) if k.private},
+      **{("symm_keys", k.id): k.value for k in db.load(WireGuardPsk)},
+    }
+  finally:
+    db.close()
+
+
+def _stored(root: Path, query: str) -> list:
+  db = sqlite3.connect(root / Database.DB_NAME)
+  try:
+    return [v for (v,) in db.execute(query)]
+  finally:
+    db.close()
+
+
+def _stored_secrets(root: Path) -> list:
+  return [
+    *_stored(root, "SELECT private FROM asymm_keys WHERE private IS NOT NULL"),
+    *_stored(root, "SELECT value FROM symm_keys"),
+  ]
+
+
+def _encrypt(root: Path) -> None:
+  from uno.cli.uno.cmd_registry import secrets_encrypt
+
+  secrets_encrypt(argparse.Namespace(root=root))
+
+
+def test_secrets_encrypt(
+  cell_agent_root: Path, fake_host: Executor, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+):
+  from uno.agent.agent import Agent
+  from uno.registry.registry import Registry
+
+  monkeypatch.setattr(ask, "QUERY_ASSUME_YES", True)
+  registry_root = cell_agent_root.parent / "registry"
+  expected = _secrets(registry_root)
+  assert expected
+  assert all(isinstance(v, str) for v in _stored_secrets(registry_root))
+
+  monkeypatch.setenv(MasterKey.ENV_VAR, _master_key())
+  _encrypt(registry_root)
+  stored = _stored_secrets(registry_root)
+  assert len(stored) == len(expected)
+  assert all(SecretBox.encrypted(v) for v in stored)
+  assert _secrets(registry_root) == expected
+  # The history doesn't keep the plaintext values either
+  history = _stored(
+    registry_root, "SELECT coalesce(old, '') || coalesce(new, '') FROM generation_changes"
+  )
+  assert not any(v in h for v in expected.values() for h in history)
+  with pytest.raises(ValueError):
+    _encrypt(registry_root)
+
+  # New keys are encrypted too
+  with Executor.use(fake_host):
+    registry = Registry.open(registry_root)
+    registry.rekey_uvn(root_vpn=True)
+    assert registry.generate_artifacts()
+    registry.db.close()
+  rekeyed = _secrets(registry_root)
+  assert rekeyed != expected
+  assert all(SecretBox.encrypted(v) for v in _stored_secrets(registry_root))
+
+  # Packages contain the plaintext keys, which agents encrypt with their own master key
+  package = registry_root / "cells" / "test-uvn__cell1.uvn-agent"
+  with tarfile.open(package) as archive:
+    archive.extract(Database.DB_NAME, tmp_path / "package", filter="data")
+  package_secrets = _stored_secrets(tmp_path / "package")
+  assert package_secrets
+  assert set(package_secrets) <= set(rekeyed.values())
+
+  monkeypatch.setenv(MasterKey.ENV_VAR, _master_key())
+  _encrypt(cell_agent_root)
+  with Executor.use(fake_host):
+    agent = Agent.open(cell_agent_root)
+    agent._on_agent_config_received(shutil.copy(package, tmp_path / "received"))
+    agent = agent.reload(agent._reload_agent)
+    agent.db.close()
+  assert all(SecretBox.encrypted(v) for v in _stored_secrets(cell_agent_root))
+  assert set(package_secrets) <= set(_secrets(cell_agent_root).values())
+
+
+def test_secrets_encrypted_on_install(master_key: str, cell_agent_root: Path):
+  # The registry and the agent were created with a master key configured
+  registry_root = cell_agent_root.parent / "registry"
+  registry_secrets = _secrets(registry_root)
+  agent_secrets = _secrets(cell_agent_root)
+  assert agent_secrets
+  assert set(agent_secrets.values()) <= set(registry_secrets.values())
+  for root, secrets in ((registry_root, registry_secrets), (cell_agent_root, agent_secrets)):
+    assert all(SecretBox.encrypted(v) for v in _stored_secrets(root))
+    db_file = (root / Database.DB_NAME).read_bytes()
+    assert not any(v.encode() in db_file for v in secrets.values())
+
+
+def test_secrets_wrong_master_key(
+  registry_root: Path, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+):
+  monkeypatch.setenv(MasterKey.ENV_VAR, _master_key())
+  _encrypt(registry_root)
+
+  monkeypatch.setenv(MasterKey.ENV_VAR, _master_key())
+  with pytest.raises(InvalidMasterKey):
+    Database(registry_root)
+  monkeypatch.delenv(MasterKey.ENV_VAR)
+  monkeypatch.setattr(MasterKey, "KEYRING_KEY", "uno-test-missing-key")
+  with pytest.raises(MissingMasterKey):
+    Database(registry_root)
+  with pytest.raises(ValueError):
+    MasterKey.parse(base64.b64encode(b"too short"))
+
+
+def test_secrets_rotate(registry_root: Path, monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+  from uno.cli.uno.cmd_registry import secrets_rotate
+
+  old_key = _master_key()
+  monkeypatch.setenv(MasterKey.ENV_VAR, old_key)
+  _encrypt(registry_root)
+  expected = _secrets(registry_root)
+  stored = _stored_secrets(registry_root)
+
+  new_key_file = tmp_path / "master.key"
+  new_key_file.write_text(_master_key() + "\n")
+  secrets_rotate(argparse.Namespace(root=registry_root, new_key=new_key_file))
+  # Only the database's key is encrypted again
+  assert _stored_secrets(registry_root) == stored
+
+  with pytest.raises(InvalidMasterKey):
+    Database(registry_root)
+  monkeypatch.delenv(MasterKey.ENV_VAR)
+  monkeypatch.setenv(MasterKey.FILE_VAR, str(new_key_file))
+  assert _secrets(registry_root) == expected
+
+
+def test_secrets_load(registry_root: Path, monkeypatch: pytest.MonkeyPatch, fake_host: Executor):
+  from uno.registry.registry import Registry
+
+  with Executor.use(fake_host):
+    registry = Registry.open(registry_root)
+    registry.define_uvn(
+      {
+        "cells": [
+          {"name": f"cell{i}", "address": f"cell{i}.example.com"} for i in range(1, CELLS + 1)
+        ]
+      }
+    )
+    registry.generate_artifacts()
+    registry.db.close()
+
+  plain = _secrets(registry_root)
+  assert plain
+  monkeypatch.setenv(MasterKey.ENV_VAR, _master_key())
+  _encrypt(registry_root)
+  assert _secrets(registry_root) == plain
@@ -0,0 +1,134 @@
+from pathlib import Path
+
+import pytest
+
+from uno.agent.uvn_peer import UvnPeerStatus
+from uno.core.exec import Executor
+from uno.test.simulation import Simulation
+
+# Four cells, fully meshed by the default deployment strategy
+CELLS = 4
+# Cells of the largest UVN simulated by the tests. The cost of a scenario
+# grows quickly with the UVN, since every cell sends its status to every
+# other one, whenever it changes (e.g. ~3s with 10 cells, ~35s with 20).
+SCALE_CELLS = 10
+
+
+def _define_cells(root: Path, fake_host: Executor, cells: int) -> None:
+  from uno.registry.registry import Registry
+
+  with Executor.use(fake_host):
+    registry = Registry.open(root)
+    registry.define_uvn(
+      {
+        "cells": [
+          {
+            "name": f"cell{i}",
+            "address": f"cell{i}.example.com",
+            "allowed_lans": [f"192.168.{i}.0/24"],
+          }
+          for i in range(1, cells + 1)
+        ]
+      }
+    )
+    registry.generate_artifacts()
+  assert registry.deployed
+  registry.db.close()
+
+
+@pytest.fixture
+def simulation(registry_root: Path, tmp_path: Path, fake_host: Executor) -> Simulation:
+  _define_cells(registry_root, fake_host, CELLS)
+  with Simulation(registry_root, tmp_path / "sim", seed=1) as sim:
+    yield sim
+
+
+def _start_uvn(sim: Simulation) -> None:
+  sim.start(sim.registry)
+  sim.run(5)
+  for cell in sim.cells:
+    sim.start(cell)
+    sim.run(1)
+  report = sim.run_until_consistent(300)
+  assert report.reached
+
+
+def test_registry_first_startup(simulation: Simulation) -> None:
+  sim = simulation
+  sim.start(sim.registry)
+  report = sim.run(30)
+  assert not sim.consistent
+  assert report.messages == {}
+
+  for cell in sim.cells:
+    sim.start(cell)
+    sim.run(1)
+  report = sim.run_until_consistent(300)
+  assert report.reached
+  assert report.elapsed < 60
+  # Every cell received the UVN's info and its configuration, without losses
+  assert sim.messages["UVN_ID"] == len(sim.cells)
+  assert sim.messages["BACKBONE"] >= len(sim.cells)
+  assert sim.messages["CELL_ID"] > 0
+  assert sim.deliveries == sum(sim.messages.values())
+  # Cells eventually share the registry's view of the UVN
+  report = sim.run(60, until=lambda: all(c.agent.peers.status_fully_routed_uvn for c in sim.cells))
+  assert report.reached
+
+
+def test_cell_churn(simulation: Simulation) -> None:
+  sim = simulation
+  _start_uvn(sim)
+
+  cell = sim.cells[-1]
+  sim.stop(cell, graceful=False)
+  report = sim.run(120, until=lambda: not sim.consistent)
+  assert report.reached
+  # The registry detects that the cell is gone once its lease expires
+  sim.run(sim.timing.participant_liveliness_lease_duration)
+  assert cell.id not in sim.registry.matched
+  assert sim.registry.agent.peers[cell.id].status == UvnPeerStatus.OFFLINE
+
+  sim.start(cell)
+  report = sim.run_until_consistent(300)
+  assert report.reached
+  # The restarted cell receives the UVN's info again
+  assert report.messages["UVN_ID"] == 1
+
+
+def test_backbone_partition(simulation: Simulation) -> None:
+  sim = simulation
+  _start_uvn(sim)
+
+  failed = sim.partition(sim.cells[:2])
+  assert len(failed) == 4
+  report = sim.run(120, until=lambda: not sim.registry.agent.peers.status_fully_routed_uvn)
+  assert report.reached
+  # Cells are still connected to the registry
+  assert sim.registry.agent.peers.status_consistent_config_uvn
+
+  sim.heal()
+  report = sim.run_until_consistent(300)
+  assert report.reached
+  assert all(link.up for link in sim.network.links.values())
+
+
+def test_uvn_scale(registry_root: Path, tmp_path: Path, fake_host: Executor) -> None:
+  _define_cells(registry_root, fake_host, SCALE_CELLS)
+  with Simulation(registry_root, tmp_path / "sim", seed=1) as sim:
+    _start_uvn(sim)
+    # Every agent discovered every other one
+    nodes = set(sim.nodes)
+    assert all(n.matched == nodes - {n.id} for n in sim.nodes.values())
+    assert all(c.agent.peers.status_consistent_config_uvn for c in sim.cells)
+
+    # Only the pairs of a failed cell expire
+    failed = sim.cells[-1]
+    sim.stop(failed, graceful=False)
+    report = sim.run(
+      sim.timing.participant_liveliness_lease_duration * 2,
+      until=lambda: all(failed.id not in n.matched for n in sim.nodes.values()),
+    )
+    assert report.reached
+    assert all(n.matched == nodes - {n.id, failed.id} for n in sim.nodes.values() if n != failed)
+    assert sim.registry.agent.peers[failed.id].status == UvnPeerStatus.OFFLINE
@@ -0,0 +1,90 @@
+from pathlib import Path
+
+from uno.core.exec import Executor
+from uno.core.time import Timestamp
+
+SAMPLES = 4
+# Updates received by the agent in every period
+UPDATES = 4
+# Periods recorded, i.e. the rings are filled a few times
+PERIODS = SAMPLES * 4
+# Recorded history, one month
+SPAN = 30 * 86400
+RESOLUTION = SPAN // PERIODS
+
+
+def _count(agent, table: str) -> int:
+  (count,) = agent.db._db.execute(f"SELECT COUNT(*) AS count FROM {table}").fetchone()
+  return count
+
+
+def _pragma(agent, pragma: str) -> int:
+  (val,) = agent.db._db.execute(f"PRAGMA {pragma}").fetchone()
+  return val
+
+
+def test_status_history_bounded(cell_agent_root: Path, fake_host: Executor):
+  from uno.agent.agent import Agent
+
+  with Executor.use(fake_host):
+    agent = Agent.open(cell_agent_root)
+    agent.uvn.settings.status_history.configure(resolution=RESOLUTION, samples=SAMPLES)
+    history = agent.status_history
+    assert _pragma(agent, "auto_vacuum") == 2
+
+    peers = [p for p in agent.peers if p != agent.peers.local]
+    assert peers
+    lans = sorted(agent.lans, key=lambda lan: str(lan.nic.subnet))
+    assert lans
+    start = Timestamp.now().from_epoch() // RESOLUTION * RESOLUTION
+    db_file = agent.db.root / agent.db.DB_NAME
+    full_size = None
+    transferred = 0
+    for i in range(PERIODS * UPDATES):
+      transferred += 1024
+      agent.peers.update_peers(
+        (
+          peer,
+          {
+            "vpn_interfaces": {
+              agent.root_vpn: {
+                "online": i % 3 != 0,
+                "transfer": {"recv": transferred, "send": transferred * 2},
+              }
+            },
+            # One LAN is flapping
+            "known_networks": {lan: j > 0 or i % 2 == 0 for j, lan in enumerate(lans)},
+          },
+        )
+        for peer in peers
+      )
+      ts = Timestamp.unix(start + i * RESOLUTION // UPDATES)
+      history.spin_once(agent.peers, ts=ts)
+      history.spin_once(agent.peers, ts=ts)
+      if i == SAMPLES * UPDATES * 2:
+        full_size = db_file.stat().st_size
+
+    # Only the latest status of every interface (and LAN) is kept
+    assert _count(agent, "peers_vpn_status") == len(peers)
+    assert _count(agent, "peers_lan_status") == len(peers) * len(lans)
+    # And a fixed number of samples
+    assert _count(agent, "peers_vpn_samples") == len(peers) * SAMPLES
+    assert _count(agent, "peers_lan_samples") == len(peers) * len(lans) * SAMPLES
+    # The rings rolled over during the whole month, and only hold the first
+    # update of each of the last periods, one per slot
+    last_periods = range(PERIODS - SAMPLES, PERIODS)
+    samples = history.vpn_samples(peers[0], agent.root_vpn.config.intf.name)
+    assert [s.ts for s in samples] == [
+      Timestamp.unix(start + p * RESOLUTION).format() for p in last_periods
+    ]
+    assert [s.recv for s in samples] == [1024 * (p * UPDATES + 1) for p in last_periods]
+    assert samples[-1].recv == transferred - 1024 * (UPDATES - 1)
+    (slots,) = agent.db._db.execute(
+      "SELECT COUNT(DISTINCT slot) AS slots FROM peers_vpn_samples WHERE peer = ?", (peers[0].id,)
+    ).fetchone()
+    assert slots == SAMPLES
+
+    # The database stopped growing once the rings were full
+    assert history.vacuum() == 0
+    assert db_file.stat().st_size <= full_size
+    agent.db.close()
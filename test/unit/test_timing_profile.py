@@ -0,0 +1,99 @@
+import pytest
+
+from uno.registry.database import Database
+from uno.registry.database_object import ValidationError
+from uno.registry.timing_profile import PRESETS, TimingPreset, TimingProfile, scale_timing
+from uno.registry.uvn import Uvn
+
+
+def _reload(db: Database, uvn: Uvn) -> Uvn:
+  db.clear_cache()
+  return next(db.load(Uvn, id=uvn.id))
+
+
+def _parameters(profile: TimingProfile) -> dict:
+  serialized = profile.serialize()
+  return {k: v for k, v in serialized.items() if k not in ("generation_ts", "init_ts")}
+
+
+def test_default_profile(uvn: Uvn):
+  assert uvn.settings.timing_profile.preset == TimingPreset.DEFAULT
+  assert uvn.timing == PRESETS[TimingPreset.DEFAULT]
+
+
+def test_profile_round_trip(db: Database, uvn: Uvn):
+  uvn.settings.configure(
+    timing_profile={
+      "preset": "auto",
+      "rtt": 80,
+      "ospf_hello_interval": 3,
+      "initial_participant_announcement_period": [2, 10],
+    }
+  )
+  db.save(uvn)
+  serialized = _parameters(uvn.settings.timing_profile)
+  assert serialized == {
+    "preset": "auto",
+    "rtt": 80.0,
+    "ospf_hello_interval": 3,
+    "initial_participant_announcement_period": [2, 10],
+  }
+  loaded = _reload(db, uvn)
+  assert loaded is not uvn
+  assert _parameters(loaded.settings.timing_profile) == serialized
+  assert loaded.timing == uvn.timing
+  assert loaded.timing.ospf_hello_interval == 3
+  assert loaded.timing.initial_participant_announcement_period == (2, 10)
+
+
+def test_profile_from_preset_name(db: Database, uvn: Uvn):
+  # Previous versions stored the name of the preset
+  uvn.settings.configure(timing_profile="fast")
+  db.save(uvn)
+  loaded = _reload(db, uvn)
+  assert loaded.settings.timing_profile.preset == TimingPreset.FAST
+  assert loaded.timing == PRESETS[TimingPreset.FAST]
+
+
+@pytest.mark.parametrize(
+  "config",
+  [
+    {"ospf_hello_interval": 60},
+    {"participant_liveliness_assert_period": 0},
+    {"participant_liveliness_assert_period": 90},
+    {"initial_participant_announcement_period": [10, 5]},
+    {"initial_participant_announcement_period": [1, 2, 3]},
+    {"rtt": -1},
+    {"preset": "slow"},
+  ],
+)
+def test_profile_validation(uvn: Uvn, config: dict):
+  with pytest.raises((ValidationError, ValueError, KeyError)):
+    uvn.settings.configure(timing_profile=config)
+
+
+def test_auto_scaling():
+  fast = PRESETS[TimingPreset.FAST]
+  default = PRESETS[TimingPreset.DEFAULT]
+  # A small lab uses the FAST timers, a large WAN deployment the DEFAULT ones
+  assert scale_timing(3, 1) == fast
+  assert scale_timing(150, 100)[:-3] == default[:-3]
+  assert scale_timing(1000, 500) == default
+
+  previous = fast
+  for cells in (3, 6, 12, 24, 48):
+    params = scale_timing(cells, 20)
+    params.validate()
+    for val, prev, low, high in zip(params, previous, fast, default):
+      assert prev <= val
+      assert min(low, high) <= val <= max(low, high)
+    previous = params
+  assert fast.ospf_dead_interval < previous.ospf_dead_interval < default.ospf_dead_interval
+  assert scale_timing(12, 20) < scale_timing(12, 80)
+
+
+def test_auto_profile_uses_cell_count(uvn: Uvn):
+  uvn.settings.configure(timing_profile={"preset": "auto", "rtt": 100})
+  profile = uvn.settings.timing_profile
+  assert profile.resolve(cells=3) < profile.resolve(cells=150)
+  assert uvn.timing == profile.resolve(cells=0)
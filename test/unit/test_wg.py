@@ -0,0 +1,314 @@
+import ipaddress
+import subprocess
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+
+from uno.core import wg
+from uno.core.ip import ResolverCache
+from uno.core.time import Timestamp
+from uno.core.wg import (
+  WireGuardConfig,
+  WireGuardInterface,
+  WireGuardInterfaceConfig,
+  WireGuardInterfacePeerConfig,
+  WireGuardKeyRotation,
+)
+
+
+INTF = "uwg-b0"
+
+
+class FakeWg:
+  """Stand-in for the `wg` and `ip` executables: it records every command,
+  and keeps track of the peers configured with `wg syncconf`."""
+
+  def __init__(self) -> None:
+    self.commands: list[list[str]] = []
+    self.peers: dict[str, dict[str, list[str]]] = {}
+    self.handshakes: dict[str, int] = {}
+    self.endpoints: dict[str, str] = {}
+    # Peers whose endpoint can't be updated
+    self.failing: set[str] = set()
+
+  def __call__(self, cmd: list, **kwargs) -> subprocess.CompletedProcess:
+    cmd = list(map(str, cmd))
+    self.commands.append(cmd)
+    stdout = ""
+    if cmd[:2] == ["wg", "syncconf"]:
+      self.peers[cmd[2]] = self._parse_config(Path(cmd[3]).read_text())
+    elif cmd[:2] == ["wg", "show"] and cmd[3] == "latest-handshakes":
+      stdout = "".join(
+        f"{pubkey}\t{self.handshakes.get(pubkey, 0)}\n" for pubkey in self.peers[cmd[2]]
+      )
+    elif cmd[:2] == ["wg", "show"] and cmd[3] == "endpoints":
+      stdout = "".join(
+        f"{pubkey}\t{self.endpoints.get(pubkey, '(none)')}\n" for pubkey in self.peers[cmd[2]]
+      )
+    elif cmd[:2] == ["wg", "set"] and cmd[5] == "endpoint":
+      if cmd[4] in self.failing:
+        return subprocess.CompletedProcess(cmd, 1, stdout=b"", stderr=b"Operation not permitted")
+      self.endpoints[cmd[4]] = cmd[6]
+    return subprocess.CompletedProcess(cmd, 0, stdout=stdout.encode(), stderr=b"")
+
+  @staticmethod
+  def _parse_config(config: str) -> dict[str, list[str]]:
+    peers = {}
+    allowed = None
+    for line in config.splitlines():
+      key, _, value = (t.strip() for t in line.partition("="))
+      if key == "[Peer]":
+        allowed = []
+      elif key == "PublicKey":
+        peers[value] = allowed
+      elif key == "AllowedIPs":
+        allowed.extend(value.split(","))
+    return peers
+
+  def wg_commands(self) -> list[str]:
+    return [cmd[1] for cmd in self.commands if cmd[0] == "wg"]
+
+
+@pytest.fixture
+def fake_wg(monkeypatch: pytest.MonkeyPatch) -> FakeWg:
+  fake = FakeWg()
+  monkeypatch.setattr(wg, "exec_command", fake)
+  return fake
+
+
+def _config(peers: list[tuple[int, str, str]]) -> WireGuardConfig:
+  return WireGuardConfig(
+    intf=WireGuardInterfaceConfig(
+      name=INTF,
+      privkey="local-privkey",
+      address=ipaddress.ip_address("10.255.192.1"),
+      netmask=24,
+      port=33000,
+    ),
+    peers=[
+      WireGuardInterfacePeerConfig(
+        id=peer_id,
+        pubkey=pubkey,
+        psk=psk,
+        address=f"10.255.192.{peer_id + 1}",
+        allowed=[f"10.255.192.{peer_id + 1}/32"],
+        endpoint=f"peer{peer_id}.example.com:33000",
+      )
+      for peer_id, pubkey, psk in peers
+    ],
+  )
+
+
+def _allow_lan(config: WireGuardConfig, peer_i: int) -> WireGuardConfig:
+  config.peers[peer_i].allowed = sorted([*config.peers[peer_i].allowed, "192.168.1.0/24"])
+  return config
+
+
+def test_render_config():
+  vpn = WireGuardInterface(_config([(1, "pub-1", "psk-1"), (2, "pub-2", "psk-2")]))
+  rendered = vpn.render_config()
+  assert "PrivateKey = local-privkey" in rendered
+  assert "ListenPort = 33000" in rendered
+  assert rendered.count("[Peer]") == 2
+  assert "PublicKey = pub-2" in rendered
+  assert "PresharedKey = psk-2" in rendered
+  assert "AllowedIPs = 10.255.192.3/32" in rendered
+  assert "Endpoint = peer1.example.com:33000" in rendered
+
+
+def test_bring_up_single_syncconf(fake_wg: FakeWg, tmp_path: Path):
+  vpn = WireGuardInterface(_config([(1, "pub-1", "psk-1"), (2, "pub-2", "psk-2")]))
+  vpn.bring_up(root=tmp_path)
+  assert fake_wg.wg_commands() == ["syncconf"]
+  assert fake_wg.peers[INTF] == {
+    "pub-1": ["10.255.192.2/32"],
+    "pub-2": ["10.255.192.3/32"],
+  }
+
+  updated = WireGuardInterface(
+    _allow_lan(_config([(1, "pub-1", "psk-1"), (2, "pub-2", "psk-2")]), 0)
+  )
+  updated.update_peers(previous=vpn, root=tmp_path)
+  assert fake_wg.wg_commands() == ["syncconf", "syncconf"]
+  assert fake_wg.peers[INTF]["pub-1"] == ["10.255.192.2/32", "192.168.1.0/24"]
+
+
+def test_key_rotation(fake_wg: FakeWg, tmp_path: Path):
+  current = WireGuardInterface(_config([(1, "pub-1", "psk-1"), (2, "pub-2", "psk-2")]))
+  current.bring_up(root=tmp_path)
+  bring_up_commands = len(fake_wg.commands)
+
+  # Rotate the key of peer 1, and only the psk of peer 2
+  updated = WireGuardInterface(_config([(1, "pub-1b", "psk-1b"), (2, "pub-2", "psk-2b")]))
+  start = Timestamp.now()
+  updated.update_peers(previous=current, root=tmp_path, overlap=60)
+  rotation = updated.rotations[1]
+  assert list(updated.rotations) == [1]
+  assert rotation.state == WireGuardKeyRotation.State.STAGED
+  # The new key is staged without allowed IPs, the old one keeps the traffic
+  assert fake_wg.peers[INTF] == {
+    "pub-1": ["10.255.192.2/32"],
+    "pub-1b": [],
+    "pub-2": ["10.255.192.3/32"],
+  }
+  assert updated._map_peer_ids({k: k for k in fake_wg.peers[INTF]}) == {
+    "peers": {1: "pub-1", 2: "pub-2"},
+    "unknown_peers": {},
+  }
+
+  # Nothing changes until a handshake is detected on the new key
+  updated.update_rotations(root=tmp_path, now=start)
+  assert rotation.state == WireGuardKeyRotation.State.STAGED
+  assert fake_wg.wg_commands().count("syncconf") == 2
+
+  fake_wg.handshakes["pub-1b"] = start.from_epoch()
+  updated.update_rotations(root=tmp_path, now=start)
+  assert rotation.state == WireGuardKeyRotation.State.PROMOTED
+  assert fake_wg.peers[INTF] == {
+    "pub-1b": ["10.255.192.2/32"],
+    "pub-1": [],
+    "pub-2": ["10.255.192.3/32"],
+  }
+
+  # The old key is retired once the overlap window expires
+  updated.update_rotations(root=tmp_path, now=Timestamp(start._ts + timedelta(seconds=30)))
+  assert rotation.state == WireGuardKeyRotation.State.PROMOTED
+  updated.update_rotations(root=tmp_path, now=Timestamp(start._ts + timedelta(seconds=60)))
+  assert rotation.state == WireGuardKeyRotation.State.RETIRED
+  assert updated.rotations == {}
+  assert fake_wg.peers[INTF] == {
+    "pub-1b": ["10.255.192.2/32"],
+    "pub-2": ["10.255.192.3/32"],
+  }
+  # The interface was never brought down
+  assert all(cmd[0] == "wg" for cmd in fake_wg.commands[bring_up_commands:])
+
+
+def test_allowed_ips_during_rotation(fake_wg: FakeWg, tmp_path: Path):
+  current = WireGuardInterface(_config([(1, "pub-1", "psk-1")]))
+  current.bring_up(root=tmp_path)
+  staged = WireGuardInterface(_config([(1, "pub-1b", "psk-1b")]))
+  start = Timestamp.now()
+  staged.update_peers(previous=current, root=tmp_path, overlap=60)
+  rotation = staged.rotations[1]
+
+  # Changes are applied to the key which currently carries the traffic
+  updated = WireGuardInterface(_allow_lan(_config([(1, "pub-1b", "psk-1b")]), 0))
+  updated.update_peers(previous=staged, root=tmp_path)
+  assert updated.rotations == {1: rotation}
+  assert fake_wg.peers[INTF] == {
+    "pub-1": ["10.255.192.2/32", "192.168.1.0/24"],
+    "pub-1b": [],
+  }
+
+  # And they are not lost once the new key is promoted
+  fake_wg.handshakes["pub-1b"] = start.from_epoch()
+  updated.update_rotations(root=tmp_path, now=start)
+  assert rotation.state == WireGuardKeyRotation.State.PROMOTED
+  assert fake_wg.peers[INTF] == {
+    "pub-1b": ["10.255.192.2/32", "192.168.1.0/24"],
+    "pub-1": [],
+  }
+  reverted = WireGuardInterface(_config([(1, "pub-1b", "psk-1b")]))
+  reverted.update_peers(previous=updated, root=tmp_path)
+  assert fake_wg.peers[INTF] == {
+    "pub-1b": ["10.255.192.2/32"],
+    "pub-1": [],
+  }
+
+
+class FakeClock:
+  def __init__(self) -> None:
+    self.now = 0.0
+
+  def __call__(self) -> float:
+    return self.now
+
+
+class FakeResolver:
+  def __init__(self, answers: dict[str, str]) -> None:
+    self.answers = dict(answers)
+    self.queries: list[str] = []
+
+  def __call__(self, hostname: str) -> ipaddress.IPv4Address:
+    self.queries.append(hostname)
+    return ipaddress.IPv4Address(self.answers[hostname])
+
+
+def test_resolver_cache():
+  clock = FakeClock()
+  resolver = FakeResolver({"peer1.example.com": "192.0.2.1"})
+  cache = ResolverCache(resolver, ttl=60, negative_ttl=10, clock=clock)
+  assert cache.lookup("peer1.example.com") == ipaddress.IPv4Address("192.0.2.1")
+  resolver.answers["peer1.example.com"] = "192.0.2.11"
+  clock.now = 59
+  assert cache.lookup("peer1.example.com") == ipaddress.IPv4Address("192.0.2.1")
+  clock.now = 60
+  assert cache.lookup("peer1.example.com") == ipaddress.IPv4Address("192.0.2.11")
+  assert resolver.queries == ["peer1.example.com"] * 2
+
+  # Failures are cached too, for a shorter time
+  assert cache.lookup("missing.example.com") is None
+  clock.now = 69
+  assert cache.lookup("missing.example.com") is None
+  resolver.answers["missing.example.com"] = "192.0.2.3"
+  clock.now = 70
+  assert cache.lookup("missing.example.com") == ipaddress.IPv4Address("192.0.2.3")
+  assert resolver.queries.count("missing.example.com") == 2
+
+
+def test_update_endpoints(fake_wg: FakeWg, tmp_path: Path):
+  clock = FakeClock()
+  resolver = FakeResolver({"peer1.example.com": "192.0.2.1", "peer2.example.com": "192.0.2.2"})
+  cache = ResolverCache(resolver, ttl=60, negative_ttl=10, clock=clock)
+  vpn = WireGuardInterface(_config([(1, "pub-1", "psk-1"), (2, "pub-2", "psk-2")]))
+  vpn.bring_up(root=tmp_path)
+  # The endpoints resolved by WireGuard when the configuration was applied
+  fake_wg.endpoints = {"pub-1": "192.0.2.1:33000", "pub-2": "192.0.2.2:33000"}
+
+  assert not vpn.update_endpoints(resolv_cache=cache)
+  assert "set" not in fake_wg.wg_commands()
+
+  # peer1's address changes, but it is only detected once the cache expires
+  resolver.answers["peer1.example.com"] = "198.51.100.1"
+  clock.now = 30
+  assert not vpn.update_endpoints(resolv_cache=cache)
+  clock.now = 60
+  assert vpn.update_endpoints(resolv_cache=cache)
+  assert fake_wg.endpoints == {"pub-1": "198.51.100.1:33000", "pub-2": "192.0.2.2:33000"}
+  assert fake_wg.wg_commands().count("set") == 1
+  assert fake_wg.wg_commands().count("show") == 1
+
+  # peer2's hostname stops resolving: its last address is kept
+  del resolver.answers["peer2.example.com"]
+  clock.now = 120
+  assert not vpn.update_endpoints(resolv_cache=cache)
+  assert fake_wg.endpoints["pub-2"] == "192.0.2.2:33000"
+  resolver.answers["peer2.example.com"] = "198.51.100.2"
+  clock.now = 130
+  assert vpn.update_endpoints(resolv_cache=cache)
+  assert fake_wg.endpoints == {"pub-1": "198.51.100.1:33000", "pub-2": "198.51.100.2:33000"}
+  assert fake_wg.wg_commands().count("set") == 2
+
+
+def test_update_endpoints_failed(fake_wg: FakeWg, tmp_path: Path):
+  clock = FakeClock()
+  resolver = FakeResolver({"peer1.example.com": "198.51.100.1", "peer2.example.com": "192.0.2.2"})
+  cache = ResolverCache(resolver, ttl=60, negative_ttl=10, clock=clock)
+  vpn = WireGuardInterface(_config([(1, "pub-1", "psk-1"), (2, "pub-2", "psk-2")]))
+  vpn.bring_up(root=tmp_path)
+  fake_wg.endpoints = {"pub-1": "192.0.2.1:33000", "pub-2": "192.0.2.2:33000"}
+
+  # The update fails: the previous endpoint is kept, without raising an error
+  fake_wg.failing.add("pub-1")
+  assert not vpn.update_endpoints(resolv_cache=cache)
+  assert fake_wg.endpoints == {"pub-1": "192.0.2.1:33000", "pub-2": "192.0.2.2:33000"}
+  assert fake_wg.wg_commands().count("set") == 1
+
+  # And it is tried again on the next update
+  fake_wg.failing.clear()
+  assert vpn.update_endpoints(resolv_cache=cache)
+  assert fake_wg.endpoints == {"pub-1": "198.51.100.1:33000", "pub-2": "192.0.2.2:33000"}
+  assert fake_wg.wg_commands().count("set") == 2
+  assert not vpn.update_endpoints(resolv_cache=cache)
@@ -0,0 +1,87 @@
+import ipaddress
+import time
+from pathlib import Path
+
+import pytest
+
+from uno.core.time import Timestamp
+from uno.core.yaml_codec import LIBYAML_CODEC, PYTHON_CODEC
+from uno.registry import registry_spec
+from uno.registry.registry_spec import load_spec
+
+# Number of cells in the benchmark's spec
+CELLS = 200
+
+requires_libyaml = pytest.mark.skipif(LIBYAML_CODEC is None, reason="libyaml not available")
+
+
+def _uvn_spec(cells: int) -> dict:
+  return {
+    "users": [
+      {"email": f"user{i}@example.com", "password": f"pw{i}", "config": {"name": f"User {i}"}}
+      for i in range(cells // 10)
+    ],
+    "cells": [
+      {
+        "name": f"cell{i}",
+        "owner": f"user{i % (cells // 10)}@example.com",
+        "address": f"cell{i}.example.com",
+        "allowed_lans": [f"10.{i // 256}.{i % 256}.0/24"],
+        "settings": {"enable_particles_vpn": i % 2 == 0, "location": f"Site #{i}: 'main'"},
+      }
+      for i in range(1, cells + 1)
+    ],
+  }
+
+
+def test_yaml_codec_custom_types():
+  val = {
+    "ts": Timestamp.unix(1700000000),
+    "address": ipaddress.ip_address("10.0.0.1"),
+    "subnet": ipaddress.ip_network("10.0.0.0/24"),
+    "path": Path("/tmp/uvn"),
+    "peers": (1, "10.255.128.1"),
+  }
+  assert PYTHON_CODEC.load(PYTHON_CODEC.dump(val)) == {
+    "ts": Timestamp.unix(1700000000).format(),
+    "address": "10.0.0.1",
+    "subnet": "10.0.0.0/24",
+    "path": "/tmp/uvn",
+    "peers": [1, "10.255.128.1"],
+  }
+
+
+@requires_libyaml
+def test_yaml_codec_libyaml_identical(registry_root: Path):
+  from uno.registry.registry import Registry
+
+  registry = Registry.open(registry_root, readonly=True)
+  for val in (
+    _uvn_spec(CELLS),
+    registry.serialize(),
+    registry.uvn.serialize(),
+    {"ts": Timestamp.now(), "lans": [ipaddress.ip_network("192.168.1.0/24")], "s": "a" * 200},
+  ):
+    dumped = PYTHON_CODEC.dump(val)
+    assert LIBYAML_CODEC.dump(val) == dumped
+    assert LIBYAML_CODEC.load(dumped) == PYTHON_CODEC.load(dumped)
+  registry.db.close()
+
+
+@requires_libyaml
+def test_yaml_codec_spec_benchmark(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+  spec_file = tmp_path / "uvn.yaml"
+  spec_file.write_text(PYTHON_CODEC.dump(_uvn_spec(CELLS)))
+
+  results = {}
+  elapsed = {}
+  for codec in (PYTHON_CODEC, LIBYAML_CODEC):
+    monkeypatch.setattr(registry_spec, "CODEC", codec)
+    start = time.perf_counter()
+    results[codec.libyaml] = load_spec(spec_file)
+    elapsed[codec.libyaml] = time.perf_counter() - start
+
+  # Same entries, reported on the same lines
+  assert results[True] == results[False]
+  assert len(results[True]) == CELLS + CELLS // 10
+  assert elapsed[True] < elapsed[False]
@@ -33,7 +33,14 @@ from ..middleware import (
   Condition,
   Middleware,
   Participant,
+  DataSample,
+  LanSite,
+  UvnInfo,
+  CellInfo,
+  AgentConfigChunk,
+  coalesce_samples,
 )
+from ..middleware.package_transfer import PackageAssembler
 
 from ..registry.uvn import Uvn
 from ..registry.cell import Cell
@@ -43,6 +50,7 @@ from ..registry.deployment import P2pLinksMap
 from ..registry.id_db import IdentityDatabase
 from ..registry.versioned import disabled_if, error_if, max_rate
 from ..registry.package import Packager
+from ..registry.package_signature import verify_package
 from ..registry.registry import Registry
 from ..registry.database_object import OwnableDatabaseObject, DatabaseObjectOwner, inject_db_cursor
 from ..registry.agent_config import AgentConfig
@@ -57,6 +65,7 @@ from ..core.ip import (
 )
 
 from .uvn_peers_list import UvnPeersList, UvnPeerListener
+from .peers_status_history import PeersStatusHistory
 from .uvn_peer import UvnPeer, UvnPeerStatus, LanStatus, VpnInterfaceStatus
 from .graph import backbone_deployment_graph, cell_agent_status_plot
 
@@ -69,6 +78,8 @@ from .routes_monitor import RoutesMonitor, RoutesMonitorListener
 from .agent_service import AgentService
 from .runnable import Runnable
 from .agent_static_service import AgentStaticService
+from .agent_config_diff import AgentConfigDiff
+from .agent_metrics import AgentMetrics
 
 
 class AgentReload(Exception):
@@ -183,10 +194,21 @@ class Agent(
     return agent
 
   @classmethod
-  def install_package(cls, package: Path, root: Path, exclude: list[str] | None = None) -> "Agent":
+  def install_package(
+    cls,
+    package: Path,
+    root: Path,
+    exclude: list[str] | None = None,
+    trusted: Path | None = None,
+  ) -> "Agent":
+    # Verify the package against the agent already installed (if any),
+    # before extracting anything
+    verify_package(package, trusted=trusted or root)
     Packager.extract_cell_agent_package(package, root, exclude=exclude)
     Middleware.selected().configure_extracted_cell_agent_package(root)
     agent = cls._assert_agent(root)
+    # Packages contain plaintext keys
+    agent.db.assert_secrets()
     agent._finish_import_id_db_keys()
     cls.log.warning("bootstrap completed: {}@{} [{}]", agent.owner, agent.uvn, agent.root)
     return agent
@@ -252,6 +274,7 @@ class Agent(
     )
     if agent is not None:
       new_agent._finish_import_id_db_keys()
+    new_agent.reload_diff = self.reload_diff
     new_agent.log.warning("loaded new configuration: {}", new_agent.registry_id)
     return new_agent
 
@@ -259,6 +282,7 @@ class Agent(
     self._reload_agent = None
     self._reload_package = None
     self.reloading = False
+    self.reload_diff: AgentConfigDiff | None = None
     super().__init__(**properties)
 
   def load_nested(self) -> None:
@@ -310,6 +334,17 @@ class Agent(
   def particles_dir(self) -> Path:
     return self.root / "particles"
 
+  @cached_property
+  def package_assembler(self) -> PackageAssembler:
+    # Packages are received in chunks, which are stored on disk until complete
+    return PackageAssembler(self.root / ".config-transfers")
+
+  @cached_property
+  def status_history(self) -> PeersStatusHistory:
+    history = PeersStatusHistory(self.db, lambda: self.uvn.settings.status_history)
+    history.initialize()
+    return history
+
   @property
   def uvn_backbone_plot(self) -> Path:
     plot = self.root / "uvn-backbone.png"
@@ -470,6 +505,10 @@ class Agent(
     # self.vpn_stats_update_ts = now
     # return result
 
+  @cached_property
+  def metrics(self) -> AgentMetrics:
+    return AgentMetrics()
+
   @cached_property
   def participant(self) -> Participant:
     return Middleware.selected().participant(self)
@@ -628,6 +667,14 @@ class Agent(
 
   @contextlib.contextmanager
   def _on_started(self) -> Generator["Agent", None, None]:
+    if self.reload_diff is not None:
+      # Stop any service that was preserved but not taken over
+      for svc in self.reload_diff.preserved.values():
+        svc.log.warning("service not taken over after reload")
+        svc.agent.reloading = False
+        svc.stop(assert_stopped=True)
+      self.reload_diff.preserved.clear()
+      self.reload_diff = None
     self.peers.online(
       registry_id=self.registry_id, routed_networks=self.lans, ts_start=self.init_ts
     )
@@ -740,38 +787,51 @@ class Agent(
     spin_start = Timestamp.now()
     self.log.debug("starting to spin on {}", spin_start)
     while True:
-      done = self.participant.spin()
-      if done:
-        self.log.debug("done spinning")
-        break
+      with self.db.operation("spin"), self.metrics.spin_time.time():
+        done = self.participant.spin()
+        if done:
+          self.log.debug("done spinning")
+          break
 
-      spin_time = Timestamp.now()
-      spin_length = int(spin_time.subtract(spin_start).total_seconds())
-      timedout = max_spin_time is not None and spin_length >= max_spin_time
-      if timedout:
-        self.log.debug("time out after {} sec", max_spin_time)
-        # If there is an exit condition, throw an error, since we
-        # didn't reach it.
-        if until:
-          raise AgentTimedout("timed out", max_spin_time)
-        # Otherwise terminate
-        break
+        spin_time = Timestamp.now()
+        spin_length = int(spin_time.subtract(spin_start).total_seconds())
+        timedout = max_spin_time is not None and spin_length >= max_spin_time
+        if timedout:
+          self.log.debug("time out after {} sec", max_spin_time)
+          # If there is an exit condition, throw an error, since we
+          # didn't reach it.
+          if until:
+            raise AgentTimedout("timed out", max_spin_time)
+          # Otherwise terminate
+          break
 
-      # Test custom exit condition after event processing
-      if until and until():
-        self.log.debug("exit condition reached")
-        break
+        # Test custom exit condition after event processing
+        if until and until():
+          self.log.debug("exit condition reached")
+          break
+
+        self._update_peer_vpn_stats()
+        self.status_history.spin_once(self.peers)
 
-      self._update_peer_vpn_stats()
+        for svc in self.services:
+          svc.spin_once()
 
-      for svc in self.services:
-        svc.spin_once()
+        if self._reload_agent:
+          new_agent = self._reload_agent
+          self._reload_agent = None
+          self.reload_diff = self._diff_config(new_agent)
+          self.reloading = True
+          raise AgentReload(new_agent)
 
-      if self._reload_agent:
-        new_agent = self._reload_agent
-        self._reload_agent = None
-        self.reloading = True
-        raise AgentReload(new_agent)
+  def _diff_config(self, new_agent: "Agent") -> AgentConfigDiff | None:
+    try:
+      diff = AgentConfigDiff.compare(self, new_agent)
+    except Exception as e:
+      self.log.error("failed to compare configurations, all services will be restarted")
+      self.log.exception(e)
+      return None
+    self.log.warning("configuration changes: {}", diff)
+    return diff
 
   @max_rate(2)
   def _update_peer_vpn_stats(self) -> None:
@@ -781,6 +841,7 @@ class Agent(
         peer = self.lookup_vpn_peer(vpn, peer_id)
         peer_result = peers[peer] = peers.get(peer, {})
         peer_result[vpn] = peer_stats
+        self.metrics.update_vpn_stats(vpn, peer, peer_stats)
 
     for peer, vpn_stats in peers.items():
       online = next(iter(vpn_stats.values()))["online"]
@@ -843,17 +904,41 @@ class Agent(
       self.peers.update_peer(peer, status=UvnPeerStatus.OFFLINE)
 
   def on_data(
-    self, topic: UvnTopic, data: dict, instance: Handle | None = None, writer: Handle | None = None
+    self,
+    topic: UvnTopic,
+    data: UvnInfo | CellInfo | AgentConfigChunk,
+    instance: Handle | None = None,
+    writer: Handle | None = None,
   ) -> None:
-    if topic == UvnTopic.CELL_ID:
-      self._on_reader_data_cell_info(data, instance, writer)
-    elif topic == UvnTopic.UVN_ID:
-      self._on_reader_data_uvn_info(data, instance, writer)
-    elif topic == UvnTopic.BACKBONE:
-      if data["registry_id"] == self.config_id:
-        self.log.debug("ignoring current configuration: {}", self.config_id)
+    self.on_data_batch([DataSample(topic, data, instance=instance, writer=writer)])
+
+  def on_data_batch(self, samples: list[DataSample]) -> None:
+    for sample in samples:
+      self.metrics.samples.inc(topic=sample.topic.name)
+    # Only the latest state of every peer matters, older samples are superseded
+    samples = coalesce_samples(samples)
+    updates = []
+    for sample in samples:
+      if sample.topic == UvnTopic.CELL_ID:
+        update = self._on_reader_data_cell_info(sample.data, sample.instance, sample.writer)
+      elif sample.topic == UvnTopic.UVN_ID:
+        update = self._on_reader_data_uvn_info(sample.data, sample.instance, sample.writer)
       else:
-        self._on_agent_config_received(data["package"])
+        continue
+      if update is not None:
+        updates.append(update)
+    if updates:
+      self.peers.update_peers(updates)
+    for sample in samples:
+      if sample.topic != UvnTopic.BACKBONE:
+        continue
+      chunk = sample.data
+      if chunk.registry_id == self.config_id:
+        self.log.debug("ignoring current configuration: {}", self.config_id)
+        continue
+      package = self.package_assembler.receive(chunk)
+      if package is not None:
+        self._on_agent_config_received(package)
 
   def on_condition_active(self, condition: Condition) -> None:
     svc = next((s for s in self.services if s.updated_condition == condition), None)
@@ -861,62 +946,67 @@ class Agent(
       svc.process_updates()
 
   def _on_reader_data_cell_info(
-    self, data: dict, instance: Handle | None = None, writer: Handle | None = None
-  ) -> None:
-    peer_uvn = data["uvn"]
-    if peer_uvn != self.uvn.name:
-      self.log.debug(
-        "ignoring update from foreign agent: uvn={}, cell={}", data["uvn"], data["cell"]
-      )
-      return
+    self, data: CellInfo, instance: Handle | None = None, writer: Handle | None = None
+  ) -> tuple[UvnPeer, dict] | None:
+    if data.uvn != self.uvn.name:
+      self.log.debug("ignoring update from foreign agent: uvn={}, cell={}", data.uvn, data.cell)
+      return None
 
-    peer_cell_id = data["cell"]
-    peer_cell = self.uvn.cells.get(peer_cell_id)
+    peer_cell = self.uvn.cells.get(data.cell)
     if peer_cell is None:
       # Ignore sample from unknown cell
-      self.log.warning(
-        "ignoring update from unknown agent: uvn={}, cell={}", data["uvn"], data["cell"]
-      )
-      return
+      self.log.warning("ignoring update from unknown agent: uvn={}, cell={}", data.uvn, data.cell)
+      return None
 
     self.log.info("cell info UPDATE: {}", peer_cell)
-    peer = self.peers[peer_cell]
-    self.peers.update_peer(
-      peer,
-      registry_id=data["registry_id"],
-      status=UvnPeerStatus.ONLINE,
-      routed_networks=data["routed_networks"],
-      known_networks=data["known_networks"],
-      instance=instance,
-      writer=writer,
-      ts_start=data["ts_start"],
+
+    def _lan_status(site: LanSite, reachable: bool) -> tuple[LanDescriptor, bool]:
+      return (self.new_child(LanDescriptor, site.serialize(), save=False), reachable)
+
+    known_networks = dict(
+      (
+        *(_lan_status(s, False) for s in data.unreachable_networks),
+        *(_lan_status(s, True) for s in data.reachable_networks),
+      )
+    )
+    return (
+      self.peers[peer_cell],
+      {
+        "registry_id": data.registry_id,
+        "status": UvnPeerStatus.ONLINE,
+        "routed_networks": [s.serialize() for s in data.routed_networks],
+        "known_networks": known_networks,
+        "instance": instance,
+        "writer": writer,
+        "ts_start": data.ts_start,
+      },
     )
 
   def _on_reader_data_uvn_info(
-    self, data: dict, instance: Handle | None = None, writer: Handle | None = None
-  ) -> UvnPeer | None:
-    peer_uvn = data["uvn"]
-    if peer_uvn != self.uvn.name:
-      self.log.warning("ignoring update for foreign UVN: uvn={}", data["uvn"])
+    self, data: UvnInfo, instance: Handle | None = None, writer: Handle | None = None
+  ) -> tuple[UvnPeer, dict] | None:
+    if data.uvn != self.uvn.name:
+      self.log.warning("ignoring update for foreign UVN: uvn={}", data.uvn)
       return None
 
     self.log.info("uvn info UPDATE: {}", self.uvn)
-    self.peers.update_peer(
+    return (
       self.peers.registry,
-      status=UvnPeerStatus.ONLINE,
-      # uvn=self.uvn,
-      registry_id=data["registry_id"],
-      instance=instance,
-      writer=writer,
+      {
+        "status": UvnPeerStatus.ONLINE,
+        # "uvn": self.uvn,
+        "registry_id": data.registry_id,
+        "instance": instance,
+        "writer": writer,
+      },
     )
 
-  def _on_agent_config_received(self, package: bytes) -> None:
+  def _on_agent_config_received(self, package: Path) -> None:
     try:
-      # Cache received data to file and trigger handling
+      # Move the received package to a temporary file and trigger handling
       tmp_file_h = tempfile.NamedTemporaryFile()
       tmp_file = Path(tmp_file_h.name)
-      with tmp_file.open("wb") as output:
-        output.write(package)
+      shutil.move(package, tmp_file)
       # decoded_package_h = tempfile.NamedTemporaryFile()
       # decoded_package = Path(decoded_package_h.name)
 
@@ -931,7 +1021,7 @@ class Agent(
       tmp_dir = Path(tmp_dir_h.name)
 
       self.log.info("extracting received package: {}", cell_package)
-      updated_agent = Agent.install_package(cell_package, tmp_dir)
+      updated_agent = Agent.install_package(cell_package, tmp_dir, trusted=self.root)
       updated_agent._reload_package = cell_package_h
     except Exception as e:
       self.log.error("failed to load updated agent")
@@ -0,0 +1,212 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from typing import TYPE_CHECKING, Protocol
+
+from ..registry.cell import Cell
+from ..registry.versioned import strip_serialized_fields
+from ..core.log import Logger
+
+if TYPE_CHECKING:
+  from .agent import Agent
+
+
+log = Logger.sublogger("agent-reload")
+
+
+class ReloadableService(Protocol):
+  PRESERVE_ON_RELOAD: bool
+  svc_class: str
+
+
+def _strip_timestamps(serialized: dict | None) -> dict | None:
+  if serialized is None:
+    return None
+  return strip_serialized_fields(serialized, {"generation_ts": None, "init_ts": None})
+
+
+class AgentConfigDiff:
+  """Differences between the configuration of a running agent,
+  and the one of the agent that is about to replace it.
+
+  The diff is used to perform a "differential" reload of the agent:
+  services which are not affected by the new configuration (and which
+  support it, see AgentService.PRESERVE_ON_RELOAD) are left running
+  by the current agent, and taken over by the new one. WireGuard
+  interfaces whose peers changed, but which otherwise survive the
+  reload, are updated in place.
+
+  The middleware participant is always restarted, since it announces
+  the agent's configuration id to the other agents.
+  """
+
+  # Sections of the configuration snapshot which, when changed,
+  # require one or more services to be restarted.
+  RESTARTED_SERVICES = {
+    "deployment": ("router",),
+    "lans": ("uvn-net", "router", "web-ui"),
+    "vpn_settings": ("uvn-net", "router"),
+    "timing": ("router",),
+    "webui": ("web-ui",),
+    "middleware": (),
+  }
+
+  # Services which must be restarted when another service is restarted
+  DEPENDENT_SERVICES = {
+    "uvn-net": ("router", "web-ui"),
+  }
+
+  # Aspects of the configuration reported by the diff, and the
+  # snapshot sections that they are computed from.
+  ASPECTS = {
+    "deployment": ("deployment",),
+    "lans": ("lans",),
+    "settings": ("vpn_settings", "timing", "webui"),
+    "middleware": ("middleware",),
+  }
+
+  def __init__(self, current: dict, updated: dict) -> None:
+    self.current = current
+    self.updated = updated
+    self.changed_sections = {
+      section for section in self.RESTARTED_SERVICES if current.get(section) != updated.get(section)
+    }
+    self.changed_vpns: set[str] = set()
+    self.updated_vpn_peers: set[str] = set()
+    self.keys = False
+    self._diff_vpn_interfaces(
+      current.get("vpn_interfaces") or {}, updated.get("vpn_interfaces") or {}
+    )
+    self.restarted_services = self._restarted_services()
+    # Services left running by the current agent,
+    # waiting to be taken over by the new one.
+    self.preserved: dict[str, ReloadableService] = {}
+
+  def __str__(self) -> str:
+    return (
+      f"{self.__class__.__qualname__}(changed={sorted(self.changed)}, "
+      f"restarted={sorted(self.restarted_services)}, "
+      f"updated_vpns={sorted(self.updated_vpn_peers)})"
+    )
+
+  @classmethod
+  def compare(cls, current: "Agent", updated: "Agent") -> "AgentConfigDiff":
+    return cls(cls.snapshot(current), cls.snapshot(updated))
+
+  @classmethod
+  def snapshot(cls, agent: "Agent") -> dict:
+    settings = agent.uvn.settings
+    return {
+      # The router derives its OSPF message digest key from the
+      # deployment's generation timestamp, so the timestamp is kept.
+      "deployment": {
+        **_strip_timestamps(agent.deployment.serialize()),
+        "generation_ts": agent.deployment.generation_ts.format(),
+      }
+      if agent.deployment is not None
+      else None,
+      "lans": {
+        "local": sorted(map(str, agent.allowed_lans)),
+        "uvn": sorted(str(lan) for cell in agent.uvn.cells.values() for lan in cell.allowed_lans),
+      },
+      "vpn_settings": _strip_timestamps(
+        {
+          "enable_root_vpn": settings.enable_root_vpn,
+          "enable_particles_vpn": settings.enable_particles_vpn,
+          "root_vpn": settings.root_vpn.serialize(),
+          "particles_vpn": settings.particles_vpn.serialize(),
+          "backbone_vpn": settings.backbone_vpn.serialize(),
+        }
+      ),
+      "timing": agent.uvn.timing._asdict(),
+      "webui": {
+        "httpd_port": agent.owner.settings.httpd_port if isinstance(agent.owner, Cell) else None,
+        "users": sorted(
+          (u.email, u.realm, u.password) for u in agent.registry.active_users.values()
+        ),
+      },
+      "middleware": {
+        "timing": agent.uvn.timing._asdict(),
+        "enable_dds_security": settings.enable_dds_security,
+        "dds_domain": settings.dds_domain,
+      },
+      "vpn_interfaces": {
+        vpn.config.intf.name: _strip_timestamps(vpn.config.serialize())
+        for vpn in agent.vpn_interfaces
+      },
+    }
+
+  @property
+  def changed(self) -> set[str]:
+    changed = {
+      aspect
+      for aspect, sections in self.ASPECTS.items()
+      if self.changed_sections.intersection(sections)
+    }
+    if self.keys:
+      changed.add("keys")
+    return changed
+
+  def _diff_vpn_interfaces(self, current: dict[str, dict], updated: dict[str, dict]) -> None:
+    def _keys(config: dict) -> tuple[str, set[tuple[str, str]]]:
+      return (
+        config["intf"].get("privkey"),
+        {(p["pubkey"], p.get("psk")) for p in config.get("peers", [])},
+      )
+
+    for name in current.keys() | updated.keys():
+      cur_config = current.get(name)
+      upd_config = updated.get(name)
+      if cur_config is None or upd_config is None:
+        self.changed_vpns.add(name)
+        continue
+      if _keys(cur_config) != _keys(upd_config):
+        self.keys = True
+      if {**cur_config, "peers": None} != {**upd_config, "peers": None}:
+        self.changed_vpns.add(name)
+      elif cur_config.get("peers") != upd_config.get("peers"):
+        self.updated_vpn_peers.add(name)
+
+  def _restarted_services(self) -> set[str]:
+    restarted = {
+      svc for section in self.changed_sections for svc in self.RESTARTED_SERVICES[section]
+    }
+    if self.changed_vpns:
+      restarted.add("uvn-net")
+    for svc in list(restarted):
+      restarted.update(self.DEPENDENT_SERVICES.get(svc, ()))
+    return restarted
+
+  def preserves(self, svc: ReloadableService) -> bool:
+    return svc.PRESERVE_ON_RELOAD and svc.svc_class not in self.restarted_services
+
+  def detach(self, svc: ReloadableService) -> bool:
+    """Called by a service of the current agent while it is being stopped.
+    Return True if the service should be left running, so that the
+    new agent can take it over."""
+    if not self.preserves(svc):
+      return False
+    self.preserved[svc.svc_class] = svc
+    log.activity("preserving service across reload: {}", svc.svc_class)
+    return True
+
+  def take_over(self, svc: ReloadableService) -> ReloadableService | None:
+    """Called by a service of the new agent while it is being started.
+    Return the running instance that the service should take over,
+    if any."""
+    previous = self.preserved.pop(svc.svc_class, None)
+    if previous is not None:
+      log.activity("taking over service after reload: {}", svc.svc_class)
+    return previous
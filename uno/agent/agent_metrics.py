@@ -0,0 +1,92 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from typing import TYPE_CHECKING, Mapping
+
+from ..core.metrics import Metrics
+from ..core.time import Timestamp
+
+if TYPE_CHECKING:
+  from .uvn_peer import UvnPeer
+  from ..core.wg import WireGuardInterface
+
+
+class AgentMetrics:
+  """The runtime metrics collected by an agent and its services.
+
+  Metrics are stored in a process-wide registry (see Metrics.current()),
+  so that they survive the reloads of the agent."""
+
+  PROBE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+  def __init__(self, metrics: Metrics | None = None) -> None:
+    self.metrics = metrics or Metrics.current()
+    self.vpn_rx = self.metrics.counter(
+      "uno_wireguard_received_bytes_total",
+      "Bytes received from a WireGuard peer.",
+      ["interface", "peer"],
+    )
+    self.vpn_tx = self.metrics.counter(
+      "uno_wireguard_sent_bytes_total",
+      "Bytes sent to a WireGuard peer.",
+      ["interface", "peer"],
+    )
+    self.vpn_handshake_age = self.metrics.gauge(
+      "uno_wireguard_handshake_age_seconds",
+      "Seconds since the latest handshake with a WireGuard peer.",
+      ["interface", "peer"],
+    )
+    self.lan_reachable = self.metrics.gauge(
+      "uno_lan_reachable",
+      "Whether a remote LAN answered the latest probe (1) or not (0).",
+      ["peer", "lan"],
+    )
+    self.lan_probe_time = self.metrics.histogram(
+      "uno_lan_probe_seconds",
+      "Duration of the probes sent to remote LANs.",
+      ["peer", "lan"],
+      buckets=self.PROBE_BUCKETS,
+    )
+    self.samples = self.metrics.counter(
+      "uno_samples_received_total",
+      "Samples received by the agent, by topic.",
+      ["topic"],
+    )
+    self.spin_time = self.metrics.histogram(
+      "uno_agent_spin_seconds",
+      "Duration of the iterations of the agent's event loop.",
+    )
+    self.routes = self.metrics.gauge(
+      "uno_routes",
+      "Number of entries in the local kernel routing table.",
+    )
+
+  def update_vpn_stats(
+    self,
+    vpn: "WireGuardInterface",
+    peer: "UvnPeer",
+    peer_stats: Mapping[str, object],
+    now: Timestamp | None = None,
+  ) -> None:
+    now = now or Timestamp.now()
+    labels = {"interface": vpn.config.intf.name, "peer": peer.name}
+    self.vpn_rx.set(peer_stats["transfer"]["recv"], **labels)
+    self.vpn_tx.set(peer_stats["transfer"]["send"], **labels)
+    handshake = Timestamp.parse(peer_stats["last_handshake"])
+    if handshake.from_epoch() > 0:
+      self.vpn_handshake_age.set(max(0, now.subtract(handshake).total_seconds()), **labels)
+    else:
+      # No handshake yet
+      self.vpn_handshake_age.remove(**labels)
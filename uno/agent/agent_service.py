@@ -53,6 +53,10 @@ class AgentService(Runnable):
 
   STATIC_SERVICE = None
 
+  # Whether a running instance of the service can be taken over by the
+  # agent created by a differential reload (see AgentConfigDiff).
+  PRESERVE_ON_RELOAD = False
+
   def __init__(self, **properties) -> None:
     super().__init__(**properties)
     self.updated_condition = Middleware.selected().condition()
@@ -120,6 +124,10 @@ class AgentService(Runnable):
 
   @disabled_if("runnable", neg=True)
   def start(self) -> None:
+    if self.agent.reload_diff is not None:
+      previous = self.agent.reload_diff.take_over(self)
+      if previous is not None:
+        return self._take_over_reload(previous)
     if self.static is not None and self.static.active:
       return self.take_over_static()
     super().start()
@@ -127,6 +135,14 @@ class AgentService(Runnable):
       self.static.write_marker()
 
   def stop(self, assert_stopped: bool = False) -> None:
+    if (
+      self.agent.reloading
+      and self.agent.reload_diff is not None
+      and self.agent.reload_diff.detach(self)
+    ):
+      # Leave service running for the reloaded agent
+      return
+
     delegate_static = (
       not assert_stopped
       and not self.agent.reloading
@@ -172,3 +188,6 @@ class AgentService(Runnable):
 
   def _take_over_static(self) -> None:
     pass
+
+  def _take_over_reload(self, previous: "AgentService") -> None:
+    pass
@@ -1,13 +1,14 @@
 from typing import Iterable, TYPE_CHECKING
 from pathlib import Path
 import shutil
-import yaml
 
 from ..registry.deployment import P2pLinksMap
 from ..registry.cell import Cell
 from ..registry.lan_descriptor import LanDescriptor
 from ..core.time import Timestamp
+from ..core.yaml_codec import yaml_dump
 from ..core.wg import WireGuardInterface
+from ..core.dir_sync import sync_dir, sync_file
 from .uvn_peers_list import UvnPeersList
 from .uvn_peers_tester import UvnPeersTester
 from .router import Router
@@ -62,12 +63,13 @@ def _index_html(
 ) -> None:
   log.trace("regenerating agent status...")
 
-  # Copy particle configurations if they exist
+  # Copy particle configurations if they exist, only updating the files
+  # which changed since the last refresh
+  particles_dir_www = www_root / "particles"
   if particles_dir and particles_dir.is_dir():
-    particles_dir_www = www_root / "particles"
-    if particles_dir_www.is_dir():
-      shutil.rmtree(particles_dir_www)
-    shutil.copytree(particles_dir, particles_dir_www)
+    sync_dir(particles_dir, particles_dir_www)
+  elif particles_dir_www.is_dir():
+    shutil.rmtree(particles_dir_www)
 
   # if router:
   #   router.ospf_summary()
@@ -86,14 +88,14 @@ def _index_html(
 
   if uvn_status_plot and uvn_status_plot.is_file():
     www_status_plot = www_root / uvn_status_plot.name
-    shutil.copy2(uvn_status_plot, www_status_plot)
+    sync_file(uvn_status_plot, www_status_plot)
     www_status_plot = www_status_plot.relative_to(www_root)
   else:
     www_status_plot = None
 
   if uvn_backbone_plot and uvn_backbone_plot.is_file():
     www_backbone_plot = www_root / uvn_backbone_plot.name
-    shutil.copy2(uvn_backbone_plot, www_backbone_plot)
+    sync_file(uvn_backbone_plot, www_backbone_plot)
     www_backbone_plot = www_backbone_plot.relative_to(www_root)
   else:
     www_backbone_plot = None
@@ -127,7 +129,7 @@ def _index_html(
       # "ospf_routes": ospf_routes.relative_to(www_root),
       "ts_start": ts_start.format() if ts_start else None,
       "uvn": peers.uvn,
-      "uvn_settings": yaml.safe_dump(peers.uvn.settings.serialize()),
+      "uvn_settings": yaml_dump(peers.uvn.settings.serialize()),
       "vpn_stats": vpn_stats
       or {
         "interfaces": {},
@@ -0,0 +1,170 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from importlib.resources import files, as_file
+from typing import Callable, Iterable, NamedTuple
+
+from ..core.log import Logger
+from ..core.time import Timestamp
+from ..data import database as db_data
+from ..registry.database import Database
+from ..registry.uvn_settings import StatusHistorySettings
+from .uvn_peer import UvnPeer
+
+log = Logger.sublogger("status-history")
+
+
+class VpnSample(NamedTuple):
+  ts: str
+  online: bool
+  recv: int
+  send: int
+
+
+class PeersStatusHistory:
+  """Keep a downsampled history of the status of an agent's peers.
+
+  The status tables (peers_vpn_status, peers_lan_status) only contain the
+  latest status of every VPN interface and LAN of a peer, which is updated
+  continuously. Once per period (see StatusHistorySettings), the current
+  status is copied to ring tables, which hold a fixed number of samples
+  for every interface and LAN.
+
+  Every period also drops expired samples and the status of peers which no
+  longer exist, and the pages freed by deleted rows are then returned to the
+  filesystem a few at a time, so that the database file doesn't grow (nor
+  fragment) over time."""
+
+  # Pages released by every vacuum step
+  VACUUM_PAGES = 64
+
+  def __init__(self, db: Database, settings: Callable[[], StatusHistorySettings]) -> None:
+    self.db = db
+    self.settings = settings
+    self._period = None
+    self._vacuum_pending = False
+
+  @property
+  def initialized(self) -> bool:
+    return (
+      self.db._db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'peers_vpn_samples'"
+      ).fetchone()
+      is not None
+    )
+
+  def initialize(self) -> None:
+    (auto_vacuum,) = self.db._db.execute("PRAGMA auto_vacuum").fetchone()
+    if auto_vacuum != 2:
+      # Databases created by previous versions must be rebuilt once to enable
+      # incremental vacuuming (which must be enabled before creating any table)
+      log.warning("enabling incremental vacuum: {}", self.db)
+      self.db._db.commit()
+      self.db._db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+      self.db._db.execute("VACUUM")
+    if self.initialized:
+      return
+    with as_file(files(db_data).joinpath("initialize_status_history.sql")) as sql:
+      self.db._db.executescript(sql.read_text())
+
+  def period(self, ts: Timestamp) -> int:
+    return ts.from_epoch() // self.settings().resolution
+
+  def record(self, peers: Iterable[UvnPeer], ts: Timestamp | None = None) -> bool:
+    """Record the current status of the peers, unless it was already
+    recorded during the current period."""
+    if ts is None:
+      ts = Timestamp.now()
+    period = self.period(ts)
+    if period == self._period:
+      return False
+    self._period = period
+    settings = self.settings()
+    slot = period % settings.samples
+    ts_str = ts.format()
+    expired = Timestamp.unix(ts.from_epoch() - settings.resolution * settings.samples).format()
+    peers = list(peers)
+    with self.db.transaction() as cursor:
+      cursor.executemany(
+        "INSERT OR REPLACE INTO peers_vpn_samples"
+        " (peer, intf, slot, ts, online, recv, send) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+          (
+            peer.id,
+            status.intf,
+            slot,
+            ts_str,
+            status.online,
+            status.transfer["recv"],
+            status.transfer["send"],
+          )
+          for peer in peers
+          for status in peer.vpn_interfaces
+        ],
+      )
+      cursor.executemany(
+        "INSERT OR REPLACE INTO peers_lan_samples"
+        " (peer, lan, slot, ts, reachable) VALUES (?, ?, ?, ?, ?)",
+        [
+          (peer.id, str(net.lan.nic.subnet), slot, ts_str, net.reachable)
+          for peer in peers
+          for net in peer.known_networks
+        ],
+      )
+      # Samples of interfaces (and LANs) which were not updated for a whole ring
+      deleted = 0
+      for table in ("peers_vpn_samples", "peers_lan_samples"):
+        deleted += cursor.execute(f"DELETE FROM {table} WHERE ts <= ?", (expired,)).rowcount
+      # Status of peers which are no longer part of the UVN
+      for table in (
+        "peers_vpn_status",
+        "peers_lan_status",
+        "peers_vpn_samples",
+        "peers_lan_samples",
+      ):
+        deleted += cursor.execute(
+          f"DELETE FROM {table} WHERE peer NOT IN (SELECT id FROM peers)"
+        ).rowcount
+    if deleted:
+      log.activity("deleted {} expired status records", deleted)
+    self._vacuum_pending = True
+    return True
+
+  def vacuum(self, pages: int | None = None) -> int:
+    """Release some of the database's free pages, and return how many
+    are still free."""
+    (free_pages,) = self.db._db.execute("PRAGMA freelist_count").fetchone()
+    if free_pages > 0:
+      self.db._db.execute(f"PRAGMA incremental_vacuum({pages or self.VACUUM_PAGES})")
+      self.db._db.commit()
+      (free_pages,) = self.db._db.execute("PRAGMA freelist_count").fetchone()
+    self._vacuum_pending = free_pages > 0
+    return free_pages
+
+  def spin_once(self, peers: Iterable[UvnPeer], ts: Timestamp | None = None) -> None:
+    """Perform (a bounded amount of) maintenance, meant to be called
+    on every iteration of the agent's main loop."""
+    if not self.record(peers, ts=ts) and self._vacuum_pending:
+      self.vacuum()
+
+  def vpn_samples(self, peer: UvnPeer, intf: str) -> list[VpnSample]:
+    return [
+      VpnSample(row.ts, bool(row.online), row.recv, row.send)
+      for row in self.db._db.execute(
+        "SELECT ts, online, recv, send FROM peers_vpn_samples"
+        " WHERE peer = ? AND intf = ? ORDER BY ts",
+        (peer.id, intf),
+      )
+    ]
@@ -30,6 +30,8 @@ class Router(AgentService):
   FRR_CONF = "/etc/frr/frr.conf"
 
   STATIC_SERVICE = "router"
+  # frr keeps running with the same configuration
+  PRESERVE_ON_RELOAD = True
 
   # def __init__(self, **properties) -> None:
   #   self.__init__(**properties)
@@ -61,7 +63,7 @@ class Router(AgentService):
     static_routes = []
     ctx = {
       "bgp_as": self.agent.owner.id,
-      "timing": self.agent.uvn.settings.timing_profile,
+      "timing": self.agent.uvn.timing,
       "message_digest_key": f"{self.agent.uvn.name}-{self.agent.deployment.generation_ts}",
       "hostname": self.agent.owner.address,
       "root": _frr_serialize_vpn(self.agent.root_vpn),
@@ -71,6 +71,7 @@ class RoutesMonitor(AgentService):
 
   def poll_routes(self) -> tuple[set[str], set[str]]:
     current_routes = ipv4_list_routes()
+    self.agent.metrics.routes.set(len(current_routes))
     prev_routes = self._read_routes()
     new_routes = current_routes - prev_routes
     gone_routes = prev_routes - current_routes
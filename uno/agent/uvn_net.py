@@ -19,10 +19,15 @@ from pathlib import Path
 from ..core.exec import exec_command
 from ..core.wg import WireGuardInterface
 from .agent_service import AgentService
+from .triggerable import Triggerrable
 
 
-class UvnNet(AgentService):
+class UvnNet(AgentService, Triggerrable):
   STATIC_SERVICE = "net"
+  PRESERVE_ON_RELOAD = True
+  # Resolving the hostname of the peers might block for a while, so their
+  # endpoints are refreshed periodically by a separate thread
+  max_trigger_delay = 30
 
   def __init__(self, **properties) -> None:
     super().__init__(**properties)
@@ -33,10 +38,40 @@ class UvnNet(AgentService):
     return self.root / "iptables_backup.rules"
 
   def _take_over_static(self) -> None:
-    self._start(noop=True)
+    self._start_net(noop=True)
+    self.start_trigger_thread()
+
+  def _take_over_reload(self, previous: "UvnNet") -> None:
+    previous.stop_trigger_thread()
+    self._iptables_rules = previous._iptables_rules
+    previous_vpns = {vpn.config.intf.name: vpn for vpn in previous.agent.vpn_interfaces}
+    for vpn in self.agent.vpn_interfaces:
+      vpn.start(noop=True)
+      previous_vpn = previous_vpns.get(vpn.config.intf.name)
+      if previous_vpn is not None:
+        vpn.rotations = dict(previous_vpn.rotations)
+      if vpn.config.intf.name in self.agent.reload_diff.updated_vpn_peers:
+        vpn.update_peers(previous=previous_vpn, root=self.root)
+    self.start_trigger_thread()
+
+  def _spin_once(self) -> None:
+    for vpn in self.agent.vpn_interfaces:
+      # Complete any pending key rotation
+      vpn.update_rotations(root=self.root)
+
+  def _handle_trigger(self) -> None:
+    # Follow peers whose hostname resolves to a new address
+    for vpn in self.agent.vpn_interfaces:
+      if not self._service_active:
+        break
+      try:
+        vpn.update_endpoints()
+      except Exception as e:
+        self.log.error("failed to update endpoints: {}", vpn)
+        self.log.exception(e)
 
   def _detect_docker_iptables(self) -> bool:
-    return exec_command(["iptables", "-n", "-L" "DOCKER-USER"], noexcept=True).returncode == 0
+    return exec_command(["iptables", "-n", "-LDOCKER-USER"], noexcept=True).returncode == 0
 
   def _iptables_save(self) -> None:
     exec_command(["iptables-save", "-f", self.iptables_backup])
@@ -55,7 +90,14 @@ class UvnNet(AgentService):
     exec_command(["iptables-restore", self.iptables_backup])
     self.iptables_backup.unlink()
 
-  def _start(self, noop: bool = False) -> None:
+  def _start(self) -> None:
+    self._start_net()
+    self.start_trigger_thread()
+
+  def _start_static(self) -> None:
+    self._start_net()
+
+  def _start_net(self, noop: bool = False) -> None:
     if not noop:
       exec_command(
         ["echo 1 > /proc/sys/net/ipv4/ip_forward"],
@@ -96,6 +138,7 @@ class UvnNet(AgentService):
         self._vpn_masquerade(vpn, noop=noop)
 
   def _stop(self, assert_stopped: bool) -> None:
+    self.stop_trigger_thread()
     for vpn in self.agent.vpn_interfaces:
       try:
         vpn.stop(assert_stopped=assert_stopped)
@@ -115,7 +158,7 @@ class UvnNet(AgentService):
         self.log.exception(e)
     else:
       if assert_stopped and not self._iptables_rules:
-        self._start(noop=True)
+        self._start_net(noop=True)
       for rule_id, rules in list(self._iptables_rules.items()):
         for rule in reversed(rules or []):
           try:
@@ -321,6 +321,15 @@ class UvnPeersList(Versioned):
       peer.configure(**updated_fields)
     self._process_updates()
 
+  def update_peers(self, updates: Iterable[tuple[UvnPeer, dict]]) -> None:
+    """Apply a batch of updates to multiple peers and notify listeners once.
+
+    All changes are stored in a single database transaction."""
+    with self.db.transaction():
+      for peer, updated_fields in updates:
+        peer.configure(**updated_fields)
+      self._process_updates()
+
   def configure(self, **properties) -> set[str]:
     configured = super().configure(**properties)
     if configured:
@@ -45,7 +45,7 @@ class UvnPeersTester(AgentService, Triggerrable):
 
   @property
   def max_trigger_delay(self) -> int:
-    return self.agent.uvn.settings.timing_profile.tester_max_delay
+    return self.agent.uvn.timing.tester_max_delay
 
   @property
   def tested_peers(self) -> Iterable[UvnPeer]:
@@ -87,7 +87,10 @@ class UvnPeersTester(AgentService, Triggerrable):
       log.debug(f"[LAN] testing {len(peer.routed_networks)} LANs for peer {peer}")
       for lan in peer.routed_networks:
         # status = self[(peer, lan)]
-        pinged = self._ping_test(peer, lan)
+        labels = {"peer": peer.name, "lan": str(lan.nic.subnet)}
+        with self.agent.metrics.lan_probe_time.time(**labels):
+          pinged = self._ping_test(peer, lan)
+        self.agent.metrics.lan_reachable.set(1 if pinged else 0, **labels)
         # Cache current route to the lan's gateway
         lan.next_hop = ipv4_get_route(lan.gw)
         if pinged:
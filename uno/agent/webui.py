@@ -30,6 +30,7 @@ class WebUi(AgentService):
     "views",
   ]
   INITIAL_VIEWS = views
+  PRESERVE_ON_RELOAD = True
 
   def __init__(self, **properties):
     self._last_update_ts = None
@@ -49,7 +50,7 @@ class WebUi(AgentService):
 
   @property
   def min_update_delay(self) -> int:
-    return self.agent.uvn.settings.timing_profile.status_min_delay
+    return self.agent.uvn.timing.status_min_delay
 
   @cached_property
   def doc_root(self) -> Path:
@@ -57,6 +58,11 @@ class WebUi(AgentService):
     self.mkdir(doc_root)
     return doc_root
 
+  @cached_property
+  def metrics_file(self) -> Path:
+    # Served by lighttpd as text/plain (Prometheus text format)
+    return self.doc_root / "metrics.txt"
+
   def _spin_once(self) -> None:
     if (
       not self._update_ui
@@ -66,6 +72,7 @@ class WebUi(AgentService):
     ):
       return
     self.views.index_html(self.agent, self.doc_root)
+    self.agent.metrics.metrics.write(self.metrics_file)
     self._last_update_ts = Timestamp.now()
     self._update_ui = False
 
@@ -98,6 +105,10 @@ class WebUi(AgentService):
     )
     self._lighttpd.start()
 
+  def _take_over_reload(self, previous: "WebUi") -> None:
+    self._lighttpd = previous._lighttpd
+    previous._lighttpd = None
+
   def _stop(self, assert_stopped: bool) -> None:
     if self._lighttpd is None:
       return
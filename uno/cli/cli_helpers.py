@@ -16,10 +16,12 @@
 from pathlib import Path
 from typing import Callable
 import argparse
+import sys
 from operator import attrgetter
 
 from uno.core.log import Logger
 from uno.core.ask import ask_assume_no, ask_assume_yes
+from uno.registry.database_profiler import DatabaseProfiler
 
 
 class SortingHelpFormatter(argparse.HelpFormatter):
@@ -59,17 +61,30 @@ def cli_parser_args_common(
   parser.add_argument(
     "-q", "--quiet", action="count", default=False, help="Suppress all logger output."
   )
+  parser.add_argument(
+    "--profile-db",
+    action="store_true",
+    default=False,
+    help="Profile database queries and print a summary on exit "
+    f"(same as setting {DatabaseProfiler.ENV_VAR}).",
+  )
+  parser.add_argument(
+    "--no-daemon",
+    action="store_true",
+    default=False,
+    help="Execute the command in-process, even if a registry daemon is running.",
+  )
   opts = parser.add_argument_group("User Interaction Options")
   opts.add_argument(
     "-y",
     "--yes",
-    help="Do not prompt the user with questions, and always assume " "'yes' is the answer.",
+    help="Do not prompt the user with questions, and always assume 'yes' is the answer.",
     action="store_true",
     default=False,
   )
   opts.add_argument(
     "--no",
-    help="Do not prompt the user with questions, and always assume " "'no' is the answer.",
+    help="Do not prompt the user with questions, and always assume 'no' is the answer.",
     action="store_true",
     default=False,
   )
@@ -96,14 +111,24 @@ def cli_command(
   return command
 
 
-def cli_command_main(
+def cli_parser(
   define_parser: Callable[[argparse._SubParsersAction], None], version: str | None = None
-):
+) -> argparse.ArgumentParser:
   parser = argparse.ArgumentParser(formatter_class=SortingHelpFormatter)
   if version is not None:
     parser.add_argument("--version", action="version", version=version)
   define_parser(parser)
-  args = parser.parse_args()
+  return parser
+
+
+def cli_command_main(
+  define_parser: Callable[[argparse._SubParsersAction], None], version: str | None = None
+):
+  parser = cli_parser(define_parser, version=version)
+  argv = sys.argv[1:]
+  args = parser.parse_args(argv)
+  # Keep the original arguments, so that the command may be forwarded
+  args.argv = argv
 
   cmd = getattr(args, "cmd", None)
   if cmd is None:
@@ -122,6 +147,9 @@ def cli_command_main(
   if no:
     ask_assume_no()
 
+  if getattr(args, "profile_db", False):
+    DatabaseProfiler.enable()
+
   try:
     cmd(args)
   except KeyboardInterrupt:
@@ -129,6 +157,4 @@ def cli_command_main(
   except Exception as e:
     Logger.error("exception detected")
     Logger.exception(e)
-    import sys
-
     sys.exit(1)
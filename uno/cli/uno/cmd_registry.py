@@ -15,11 +15,23 @@
 ###############################################################################
 from typing import Callable
 import argparse
-import yaml
+import difflib
+import json
+import sys
 
+from uno.registry.column_codec import load_column
+from uno.registry.database import Database
 from uno.registry.registry import Registry
+from uno.registry.registry_history import RegistryHistory, RowChange
+from uno.registry.secret_box import MasterKey, MissingMasterKey
+from uno.registry.registry_spec import load_spec
 from uno.registry.versioned import Versioned
 from uno.core.log import Logger
+from uno.core.ask import ask_yes_no
+from uno.core.yaml_codec import yaml_dump, yaml_load
+
+from ..cli_helpers import cli_parser
+from .registry_server import RegistryClient, RegistryServer, run_registry_action
 
 
 def _get_collection_element(collection: list | dict, index_expr: str):
@@ -60,7 +72,7 @@ def _get_collection_element(collection: list | dict, index_expr: str):
           assert index_component[0] != "]"
           index_component = "[" + index_component
 
-        value_index = yaml.safe_load(index_component)
+        value_index = yaml_load(index_component)
         if isinstance(value_index, list):
           value_index = tuple(value_index)
 
@@ -151,16 +163,130 @@ def registry_action(
   action: Callable[[argparse.Namespace, Registry], None],
 ) -> Callable[[argparse.Namespace], None]:
   def _wrapped(args: argparse.Namespace) -> None:
+    argv = getattr(args, "argv", None)
+    if argv is not None and not getattr(args, "no_daemon", False):
+      # Forward the command to the registry daemon, if one is running
+      client = RegistryClient.connect(args.root)
+      if client is not None:
+        with client:
+          print(client.request(argv), end="")
+        return
     registry = Registry.open(args.root)
-    # generate = action(args, registry)
-    action(args, registry)
+    run_registry_action(action, args, registry)
+
+  _wrapped.registry_action = action
+  return _wrapped
 
-    if registry.dirty:
-      _ = registry.generate_artifacts()
+
+def registry_serve(args: argparse.Namespace) -> None:
+  from .parser import uno_parser
+
+  server = RegistryServer(args.root, parser=lambda: cli_parser(uno_parser))
+  try:
+    server.serve_forever()
+  finally:
+    server.server_close()
+
+
+def _history_value(column: str, val: object) -> str:
+  # Don't print secrets (e.g. private keys, password hashes) unless debugging
+  if val is not None and not Logger.DEBUG and any(s in column for s in ("key", "password")):
+    return "<hidden>"
+  return json.dumps(val)
+
+
+def _print_history_change(change: RowChange) -> None:
+  row = f"{change.table}{list(change.key)}"
+  if change.old is None:
+    print(f"+ {row}")
+  elif change.new is None:
+    print(f"- {row}")
+  for column, old, new in change.fields():
+    # Show binary values (see Database.COLUMN_CODEC) like those stored as YAML
+    old, new = (yaml_dump(load_column(v)) if isinstance(v, bytes) else v for v in (old, new))
+    if change.old is None:
+      print(f"    {column}: {_history_value(column, new)}")
+    elif change.new is None:
+      print(f"    {column}: {_history_value(column, old)}")
+    elif isinstance(old, str) and isinstance(new, str) and "\n" in old + new:
+      # Nested objects are stored as YAML, only show the lines that changed
+      print(f"~ {row}.{column}:")
+      for line in difflib.unified_diff(old.splitlines(), new.splitlines(), n=0, lineterm=""):
+        if not line.startswith(("---", "+++", "@@")):
+          print(f"    {line}")
     else:
-      registry.log.info("unchanged")
+      print(f"~ {row}.{column}: {_history_value(column, old)} -> {_history_value(column, new)}")
+
+
+def registry_history_list(args: argparse.Namespace) -> None:
+  registry = Registry.open(args.root, readonly=True)
+  for generation in registry.history.generations():
+    print(
+      f"{generation.id:>5}  {generation.ts}  {generation.changes:>5} changes"
+      f"  {'archived' if generation.archived else '        '}  {generation.command}"
+    )
+
+
+def registry_history_diff(args: argparse.Namespace) -> None:
+  registry = Registry.open(args.root, readonly=True)
+  target = args.target
+  if target is None:
+    generations = registry.history.generations()
+    if not generations:
+      registry.log.error("no generations recorded in the history of {}", registry.uvn)
+      sys.exit(1)
+    target = generations[-1].id
+  for change in registry.history.diff(args.base, target):
+    _print_history_change(change)
+
+
+def registry_history_restore(args: argparse.Namespace) -> None:
+  client = RegistryClient.connect(args.root)
+  if client is not None:
+    with client:
+      # The daemon would keep using the objects it loaded before the restore
+      raise RuntimeError("the registry daemon must be stopped before restoring a generation")
+  registry = Registry.open(args.root)
+  generation = next((g for g in registry.history.generations() if g.id == args.generation), None)
+  if generation is None:
+    raise ValueError("unknown generation", args.generation)
+  ask_yes_no(f"revert all changes after generation {generation.id} ({generation.command})?")
+  argv = getattr(args, "argv", None)
+  with registry.history.record(" ".join(argv) if argv else f"history restore {generation.id}"):
+    registry.history.restore(generation.id)
+    registry = Registry.open(args.root, db=registry.db)
+    if generation.archived:
+      registry.resign_artifacts()
+    else:
+      registry.log.warning("artifacts not archived, generating them again: {}", generation.id)
+      registry.generate_artifacts(force=True)
+
+
+def _open_secrets_db(args: argparse.Namespace) -> Database:
+  client = RegistryClient.connect(args.root)
+  if client is not None:
+    with client:
+      # The daemon would keep using the key of the database it opened
+      raise RuntimeError("the registry daemon must be stopped before changing the secrets key")
+  return Database(args.root)
+
+
+def secrets_encrypt(args: argparse.Namespace) -> None:
+  # Works on both registry and agent directories
+  db = _open_secrets_db(args)
+  master_key = MasterKey.load()
+  if master_key is None:
+    raise MissingMasterKey("no master key configured")
+  history = RegistryHistory(db, args.root)
+  with db.transaction() as cursor:
+    db.encrypt_secrets(master_key, cursor=cursor)
+    if history.initialized:
+      history.encrypt_secrets(cursor)
 
-  return _wrapped
+
+def secrets_rotate(args: argparse.Namespace) -> None:
+  db = _open_secrets_db(args)
+  db.rotate_master_key(MasterKey.load_file(args.new_key))
 
 
 def registry_define_uvn(args: argparse.Namespace) -> None:
@@ -256,6 +382,13 @@ def registry_unban_cell(args: argparse.Namespace, registry: Registry) -> bool:
   return True
 
 
+@registry_action
+def registry_define_spec(args: argparse.Namespace, registry: Registry) -> bool:
+  entries = load_spec(args.spec)
+  registry.define_entities(entries, source=str(args.spec))
+  return True
+
+
 @registry_action
 def registry_define_particle(args: argparse.Namespace, registry: Registry) -> bool:
   owner = registry.load_user(args.owner) if args.owner else None
@@ -17,9 +17,10 @@ import argparse
 import ipaddress
 from pathlib import Path
 
-from uno.registry.timing_profile import TimingProfile
+from uno.registry.timing_profile import TimingPreset
 from uno.registry.deployment_strategy import DeploymentStrategyKind
 from uno.registry.cloud import CloudProvider
+from uno.registry.secret_box import MasterKey
 from uno.core.data import yaml_load_inline
 
 from ..cli_helpers import cli_command_group, cli_command
@@ -27,6 +28,7 @@ from .cmd_registry import (
   registry_define_uvn,
   registry_define_cell,
   registry_define_particle,
+  registry_define_spec,
   registry_config_uvn,
   registry_config_cell,
   registry_config_particle,
@@ -50,6 +52,12 @@ from .cmd_registry import (
   registry_notify_particle,
   registry_notify_user,
   registry_notify_uvn,
+  registry_serve,
+  registry_history_list,
+  registry_history_diff,
+  registry_history_restore,
+  secrets_encrypt,
+  secrets_rotate,
 )
 from .cmd_agent import (
   agent_sync,
@@ -92,9 +100,11 @@ def _parser_args_registry(parser: argparse._SubParsersAction):
 
   parser.add_argument(
     "--timing-profile",
+    metavar="PROFILE",
     default=None,
-    choices=[v.name.lower().replace("_", "-") for v in TimingProfile],
-    help="Timing profile to use.",
+    help="Timing profile to use: either a preset"
+    f" ({', '.join(v.name.lower().replace('_', '-') for v in TimingPreset)}),"
+    " or a YAML file or an inline string with a preset and custom timing parameters.",
   )
 
   parser.add_argument("--disable-root-vpn", help="", default=False, action="store_true")
@@ -152,6 +162,38 @@ def _parser_args_registry(parser: argparse._SubParsersAction):
     action="store_true",
   )
 
+  parser.add_argument(
+    "--history-generations",
+    metavar="N",
+    help="Number of generations kept in the registry's history.",
+    default=None,
+    type=int,
+  )
+
+  parser.add_argument(
+    "--history-archives",
+    metavar="N",
+    help="Number of generations whose artifacts are archived and can be restored unmodified.",
+    default=None,
+    type=int,
+  )
+
+  parser.add_argument(
+    "--status-history-resolution",
+    metavar="SECONDS",
+    help="Interval between the samples of the peers status recorded by every agent.",
+    default=None,
+    type=int,
+  )
+
+  parser.add_argument(
+    "--status-history-samples",
+    metavar="N",
+    help="Number of samples of the peers status kept by every agent.",
+    default=None,
+    type=int,
+  )
+
 
 def _parser_args_print(parser):
   parser.add_argument(
@@ -354,7 +396,9 @@ def _config_args_registry(args: argparse.Namespace) -> dict | None:
     "uvn": {
       "address": getattr(args, "address", None),
       "settings": {
-        "timing_profile": getattr(args, "timing_profile", None),
+        "timing_profile": yaml_load_inline(args.timing_profile)
+        if getattr(args, "timing_profile", None)
+        else None,
         "enable_particles_vpn": False if getattr(args, "disable_particles_vpn", False) else None,
         "enable_root_vpn": False if getattr(args, "disable_root_vpn", False) else None,
         "enable_dds_security": True if getattr(args, "enable_dds_security", False) else None,
@@ -363,6 +407,14 @@ def _config_args_registry(args: argparse.Namespace) -> dict | None:
           "strategy": getattr(args, "strategy", None),
           "strategy_args": getattr(args, "strategy_args", None),
         },
+        "history": {
+          "max_generations": getattr(args, "history_generations", None),
+          "max_archives": getattr(args, "history_archives", None),
+        },
+        "status_history": {
+          "resolution": getattr(args, "status_history_resolution", None),
+          "samples": getattr(args, "status_history_samples", None),
+        },
         "root_vpn": {
           "port": getattr(args, "root_vpn_pull_port", None),
           "peer_port": getattr(args, "root_vpn_push_port", None),
@@ -507,6 +559,24 @@ def uno_parser(parser: argparse.ArgumentParser):
   _parser_args_particle(cmd_define_particle)
   _parser_args_print(cmd_define_particle)
 
+  #############################################################################
+  # uno define spec ...
+  #############################################################################
+  cmd_define_spec = cli_command(
+    grp_define,
+    "spec",
+    cmd=registry_define_spec,
+    help="Add multiple users, cells, and particles to the UVN.",
+  )
+
+  cmd_define_spec.add_argument(
+    "spec",
+    type=Path,
+    help="A YAML file (with the same format accepted by 'define uvn --spec'),"
+    " or a CSV file (with columns: kind, name, email, password, owner, address, allowed_lans)"
+    " listing the elements to add.",
+  )
+
   #############################################################################
   # uno define user ...
   #############################################################################
@@ -596,6 +666,90 @@ def uno_parser(parser: argparse.ArgumentParser):
 
   _parser_args_deployment(cmd_redeploy)
 
+  #############################################################################
+  # uno history ...
+  #############################################################################
+  grp_history = cli_command_group(
+    subparsers,
+    "history",
+    title="UVN history",
+    help="Inspect the changes made by every registry command, and revert them.",
+  )
+
+  cli_command(
+    grp_history,
+    "list",
+    cmd=registry_history_list,
+    help="List the recorded generations of the UVN registry.",
+  )
+
+  cmd_history_diff = cli_command(
+    grp_history,
+    "diff",
+    cmd=registry_history_diff,
+    help="Show the changes between two generations of the UVN registry.",
+  )
+
+  cmd_history_diff.add_argument("base", type=int, help="The generation to compare.")
+
+  cmd_history_diff.add_argument(
+    "target",
+    type=int,
+    nargs="?",
+    default=None,
+    help="The generation to compare against (default: the latest one).",
+  )
+
+  cmd_history_restore = cli_command(
+    grp_history,
+    "restore",
+    cmd=registry_history_restore,
+    help="Revert the UVN registry to the state left by a previous generation.",
+  )
+
+  cmd_history_restore.add_argument("generation", type=int, help="The generation to restore.")
+
+  #############################################################################
+  # uno secrets ...
+  #############################################################################
+  grp_secrets = cli_command_group(
+    subparsers,
+    "secrets",
+    title="Database secrets",
+    help="Encrypt the private keys stored in a registry's (or an agent's) database"
+    f" with a master key (read from {MasterKey.ENV_VAR}, the file specified by"
+    f" {MasterKey.FILE_VAR}, or the kernel keyring).",
+  )
+
+  cli_command(
+    grp_secrets,
+    "encrypt",
+    cmd=secrets_encrypt,
+    help="Encrypt the private keys of an existing database in place.",
+  )
+
+  cmd_secrets_rotate = cli_command(
+    grp_secrets,
+    "rotate",
+    cmd=secrets_rotate,
+    help="Encrypt the database's secrets key with a new master key.",
+  )
+
+  cmd_secrets_rotate.add_argument(
+    "new_key", metavar="KEY_FILE", type=Path, help="File containing the new master key."
+  )
+
+  #############################################################################
+  # uno serve ...
+  #############################################################################
+  cli_command(
+    subparsers,
+    "serve",
+    cmd=registry_serve,
+    help="Keep the UVN registry loaded in memory, and execute registry commands"
+    " forwarded by other invocations of uno.",
+  )
+
   #############################################################################
   # uno sync ...
   #############################################################################
@@ -0,0 +1,237 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from concurrent.futures import Future
+from contextlib import contextmanager, redirect_stdout
+from pathlib import Path
+from typing import Callable, Generator
+import argparse
+import contextvars
+import io
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+
+from uno.core import ask
+from uno.core.log import Logger
+from uno.registry.registry import Registry
+
+log = Logger.sublogger("registry-server")
+
+SOCKET_NAME = "registry.sock"
+
+
+def registry_socket(root: Path) -> Path:
+  return root / SOCKET_NAME
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+  server: "RegistryServer"
+
+  def handle(self) -> None:
+    line = self.rfile.readline()
+    if not line:
+      # The client only checked whether the daemon is running
+      return
+    try:
+      request = json.loads(line)
+      argv = [str(a) for a in request["argv"]]
+      cwd = Path(request["cwd"])
+    except Exception as e:
+      response = {"error": f"invalid request: {e}"}
+    else:
+      response = self.server.submit(argv, cwd).result()
+    self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class RegistryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  """Keep a Registry loaded in memory, and execute the CLI commands forwarded
+  by RegistryClient on it.
+
+  Clients are served concurrently, but their commands are queued and executed
+  one at a time by a single worker thread, in the order in which they were
+  received, since the Registry's object graph is not thread-safe.
+
+  The database might still be modified by other processes (e.g. commands
+  run with --no-daemon), so the Registry is loaded again before executing
+  a command if its database changed since the previous one."""
+
+  daemon_threads = True
+
+  def __init__(self, root: Path, parser: Callable[[], argparse.ArgumentParser]) -> None:
+    self.root = root.resolve()
+    self.socket_path = registry_socket(self.root)
+    self.parser = parser
+    self.registry: Registry | None = None
+    self._data_version: int | None = None
+    self.requests: queue.Queue[tuple[list[str], Path, Future] | None] = queue.Queue()
+    client = RegistryClient.connect(self.root)
+    if client is not None:
+      with client:
+        raise RuntimeError(f"registry daemon already running: {self.socket_path}")
+    self.socket_path.unlink(missing_ok=True)
+    super().__init__(str(self.socket_path), _RequestHandler)
+    self.socket_path.chmod(0o600)
+    # Commands are executed with the context (e.g. the Executor) of the caller
+    self.worker = threading.Thread(
+      target=contextvars.copy_context().run, args=(self._process_requests,)
+    )
+    self.worker.start()
+    log.info("listening for registry commands: {}", self.socket_path)
+
+  def submit(self, argv: list[str], cwd: Path) -> Future:
+    result = Future()
+    self.requests.put((argv, cwd, result))
+    return result
+
+  def server_close(self) -> None:
+    super().server_close()
+    self.requests.put(None)
+    self.worker.join()
+    self.socket_path.unlink(missing_ok=True)
+    if self.registry is not None:
+      self.registry.db.close()
+      self.registry = None
+
+  def _process_requests(self) -> None:
+    while True:
+      request = self.requests.get()
+      if request is None:
+        break
+      argv, cwd, result = request
+      result.set_result(self._execute(argv, cwd))
+
+  def _execute(self, argv: list[str], cwd: Path) -> dict:
+    output = io.StringIO()
+    prev_cwd = Path.cwd()
+    try:
+      os.chdir(cwd)
+      try:
+        # Built after changing directory, since --root defaults to it
+        args = self.parser().parse_args(argv)
+      except SystemExit:
+        raise ValueError(f"invalid command: {' '.join(argv)}")
+      action = getattr(args.cmd, "registry_action", None)
+      if action is None:
+        raise ValueError(f"not a registry command: {' '.join(argv)}")
+      elif args.root.resolve() != self.root:
+        raise ValueError(f"registry daemon serves a different directory: {self.root}")
+      registry = self._load_registry()
+      log.activity("executing: {}", " ".join(argv))
+      # Questions can't be asked to a remote user, so they must be answered with --yes
+      with redirect_stdout(output), _assume_answer(yes=args.yes):
+        run_registry_action(action, args, registry)
+      self._data_version = self._read_data_version()
+      return {"output": output.getvalue()}
+    except Exception as e:
+      log.error("failed to execute: {}", " ".join(argv))
+      log.exception(e)
+      # The loaded objects might have been left in an inconsistent
+      # state, so reload them from the database on the next command.
+      if self.registry is not None:
+        self.registry.db.close()
+        self.registry = None
+      return {"output": output.getvalue(), "error": f"{e.__class__.__name__}: {e}"}
+    finally:
+      os.chdir(prev_cwd)
+
+  def _read_data_version(self) -> int:
+    # Changed by every transaction committed by other connections
+    (data_version,) = self.registry.db._db.execute("PRAGMA data_version").fetchone()
+    return data_version
+
+  def _load_registry(self) -> Registry:
+    if self.registry is not None and self._read_data_version() != self._data_version:
+      log.warning("registry modified by another process, reloading it: {}", self.root)
+      self.registry.db.close()
+      self.registry = None
+    if self.registry is None:
+      self.registry = Registry.open(self.root)
+      self._data_version = self._read_data_version()
+    return self.registry
+
+
+@contextmanager
+def _assume_answer(yes: bool) -> Generator[None, None, None]:
+  prev = (ask.QUERY_ASSUME_YES, ask.QUERY_ASSUME_NO)
+  ask.ask_assume_yes(yes)
+  ask.ask_assume_no(not yes)
+  try:
+    yield
+  finally:
+    ask.ask_assume_yes(prev[0])
+    ask.ask_assume_no(prev[1])
+
+
+class RegistryClient:
+  """Forward CLI commands to the RegistryServer of a directory."""
+
+  def __init__(self, sock: socket.socket) -> None:
+    self.sock = sock
+
+  @classmethod
+  def connect(cls, root: Path) -> "RegistryClient | None":
+    """Connect to the registry daemon, or return None if it's not running."""
+    sock_path = registry_socket(root)
+    if not sock_path.is_socket():
+      return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      sock.connect(str(sock_path))
+    except OSError as e:
+      # Stale socket left by a daemon which was killed
+      log.debug("registry daemon not available: {}, {}", sock_path, e)
+      sock.close()
+      return None
+    return cls(sock)
+
+  def __enter__(self) -> "RegistryClient":
+    return self
+
+  def __exit__(self, *exc) -> None:
+    self.sock.close()
+
+  def request(self, argv: list[str], cwd: Path | None = None) -> str:
+    """Execute a command and return its output."""
+    request = {"argv": argv, "cwd": str(cwd or Path.cwd())}
+    self.sock.sendall(json.dumps(request).encode() + b"\n")
+    with self.sock.makefile("rb") as input:
+      response = input.readline()
+    if not response:
+      raise RuntimeError("registry daemon closed the connection")
+    response = json.loads(response)
+    error = response.get("error")
+    if error is not None:
+      raise RuntimeError(f"registry daemon failed to execute command: {error}")
+    return response["output"]
+
+
+def run_registry_action(
+  action: Callable[[argparse.Namespace, Registry], None],
+  args: argparse.Namespace,
+  registry: Registry,
+) -> None:
+  argv = getattr(args, "argv", None)
+  command = " ".join(argv) if argv else action.__name__
+  with registry.db.operation(action.__name__), registry.history.record(command):
+    action(args, registry)
+
+    if registry.dirty:
+      _ = registry.generate_artifacts()
+    else:
+      registry.log.info("unchanged")
@@ -13,21 +13,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 ###############################################################################
-import yaml
 import copy
 from pathlib import Path
 
+from .yaml_codec import yaml_load
+
 
 def yaml_load_inline(val: str | Path) -> dict:
   # Try to interpret the string as a Path
   yml_val = val
   args_file = Path(val)
-  if args_file.is_file():
+  try:
+    is_file = args_file.is_file()
+  except OSError:
+    # e.g. an inline value longer than the maximum file name
+    is_file = False
+  if is_file:
     yml_val = args_file.read_text()
   # Interpret the string as inline YAML
   if not isinstance(yml_val, str):
     raise ValueError("failed to load yaml", val)
-  return yaml.safe_load(yml_val)
+  return yaml_load(yml_val)
 
 
 def apply_defaults(values: dict, defaults: dict) -> dict:
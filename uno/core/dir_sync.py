@@ -0,0 +1,126 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from pathlib import Path
+from typing import NamedTuple
+import errno
+import hashlib
+import os
+import shutil
+
+from .log import Logger
+
+log = Logger.sublogger("sync")
+
+
+class SyncResult(NamedTuple):
+  updated: list[Path]
+  deleted: list[Path]
+
+  def __bool__(self) -> bool:
+    return bool(self.updated or self.deleted)
+
+
+def _digest(file: Path) -> str:
+  digest = hashlib.sha256()
+  with file.open("rb") as input:
+    while chunk := input.read(65536):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def _same_file(src: Path, src_stat: os.stat_result, dst: Path, dst_stat: os.stat_result) -> bool:
+  if (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino):
+    return True
+  if src_stat.st_size != dst_stat.st_size:
+    return False
+  if src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+    return True
+  # Same size but different mtime: the file might have been regenerated
+  # with the same contents (e.g. a plot of an unchanged status)
+  return _digest(src) == _digest(dst)
+
+
+def sync_file(src: Path, dst: Path, link: bool = True) -> bool:
+  """Make dst a copy of src, unless it already is one, and return whether
+  dst was updated.
+
+  If link is True, dst is created as a hard link of src, so that future
+  changes to src (if written in place) don't require any update. Files are
+  copied instead if they are on different filesystems."""
+  src_stat = src.stat()
+  try:
+    dst_stat = dst.stat()
+  except FileNotFoundError:
+    dst_stat = None
+  if dst_stat is not None and _same_file(src, src_stat, dst, dst_stat):
+    if link or dst_stat.st_mtime_ns == src_stat.st_mtime_ns:
+      return False
+    # Same contents, only refresh the mtime to skip the hash next time
+    shutil.copystat(src, dst)
+    return False
+  dst.parent.mkdir(parents=True, exist_ok=True)
+  # Never modify dst in place, since it might be a link to an older src
+  tmp = dst.parent / f".{dst.name}.tmp"
+  tmp.unlink(missing_ok=True)
+  if link:
+    try:
+      os.link(src, tmp)
+    except OSError as e:
+      if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+        raise
+      shutil.copy2(src, tmp)
+  else:
+    shutil.copy2(src, tmp)
+  tmp.replace(dst)
+  return True
+
+
+def sync_dir(src: Path, dst: Path, link: bool = True) -> SyncResult:
+  """Make dst a copy of the src directory, only updating the files which
+  changed, and deleting the ones which no longer exist in src."""
+  updated = []
+  expected = set()
+  for src_dir, dirs, files in os.walk(src):
+    src_dir = Path(src_dir)
+    dst_dir = dst / src_dir.relative_to(src)
+    expected.add(dst_dir)
+    for f in files:
+      dst_file = dst_dir / f
+      expected.add(dst_file)
+      if sync_file(src_dir / f, dst_file, link=link):
+        updated.append(dst_file)
+  dst.mkdir(parents=True, exist_ok=True)
+
+  deleted = []
+  for dst_dir, dirs, files in os.walk(dst, topdown=False):
+    dst_dir = Path(dst_dir)
+    for f in files:
+      dst_file = dst_dir / f
+      if dst_file not in expected:
+        dst_file.unlink()
+        deleted.append(dst_file)
+    for d in dirs:
+      dst_subdir = dst_dir / d
+      if dst_subdir in expected:
+        continue
+      if dst_subdir.is_symlink():
+        dst_subdir.unlink()
+      else:
+        dst_subdir.rmdir()
+      deleted.append(dst_subdir)
+  if updated or deleted:
+    log.debug("synchronized {}: {} updated, {} deleted", dst, len(updated), len(deleted))
+  return SyncResult(updated, deleted)
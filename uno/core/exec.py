@@ -13,10 +13,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 ###############################################################################
+import contextlib
+import contextvars
+import json
 import os
 import subprocess
+import time
 from pathlib import Path
-from typing import Sequence, Union
+from typing import Generator, Sequence, Union
 import sys
 
 from .log import Logger
@@ -39,6 +43,344 @@ def _debug_log(fmt: str, *args):
   return print(fmt.format(*args), file=sys.stderr)
 
 
+def command_name(cmd_args: Sequence[str]) -> str:
+  """Return the name of the executable invoked by a command
+  (the first word of the command line, for shell commands)."""
+  if not cmd_args:
+    return ""
+  name = str(cmd_args[0]).split()[0] if str(cmd_args[0]).strip() else ""
+  if name == "sudo" and len(cmd_args) > 1:
+    return command_name(cmd_args[1:])
+  return Path(name).name
+
+
+class CommandStats:
+  def __init__(self, command: str) -> None:
+    self.command = command
+    self.count = 0
+    self.failures = 0
+    self.total_time = 0.0
+
+  @property
+  def avg_time(self) -> float:
+    return self.total_time / self.count if self.count else 0.0
+
+
+class Executor:
+  """Run the commands requested with exec_command().
+
+  The executor used by exec_command() can be replaced for the whole
+  process with Executor.install(), or for the current context (e.g.
+  a single test, or a thread) with Executor.use().
+
+  Every executor collects timing statistics for each executable.
+  """
+
+  _Default: "Executor | None" = None
+  _Current: contextvars.ContextVar["Executor | None"] = contextvars.ContextVar(
+    "executor", default=None
+  )
+
+  def __init__(self) -> None:
+    self.stats: dict[str, CommandStats] = {}
+
+  @classmethod
+  def current(cls) -> "Executor":
+    executor = cls._Current.get()
+    if executor is not None:
+      return executor
+    if cls._Default is None:
+      cls._Default = SubprocessExecutor()
+    return cls._Default
+
+  @classmethod
+  def install(cls, executor: "Executor | None") -> "Executor | None":
+    """Set the executor used by default in every context,
+    and return the one previously installed."""
+    previous = cls._Default
+    cls._Default = executor
+    return previous
+
+  @classmethod
+  @contextlib.contextmanager
+  def use(cls, executor: "Executor") -> Generator["Executor", None, None]:
+    token = cls._Current.set(executor)
+    try:
+      yield executor
+    finally:
+      cls._Current.reset(token)
+
+  def execute(
+    self,
+    cmd_args: list[str],
+    shell: bool = False,
+    cwd: Path | None = None,
+    check: bool = True,
+    capture_output: bool = False,
+    output_file: Path | None = None,
+    debug: bool = False,
+    input: bytes | None = None,
+  ) -> subprocess.CompletedProcess:
+    stats = self.stats.get(command_name(cmd_args))
+    if stats is None:
+      stats = self.stats[command_name(cmd_args)] = CommandStats(command_name(cmd_args))
+    start = time.perf_counter()
+    failed = True
+    try:
+      result = self._execute(
+        cmd_args,
+        shell=shell,
+        cwd=cwd,
+        check=check,
+        capture_output=capture_output,
+        output_file=output_file,
+        debug=debug,
+        input=input,
+      )
+      failed = result.returncode != 0
+      return result
+    finally:
+      stats.count += 1
+      stats.total_time += time.perf_counter() - start
+      if failed:
+        stats.failures += 1
+
+  def _execute(
+    self,
+    cmd_args: list[str],
+    shell: bool,
+    cwd: Path | None,
+    check: bool,
+    capture_output: bool,
+    output_file: Path | None,
+    debug: bool,
+    input: bytes | None,
+  ) -> subprocess.CompletedProcess:
+    raise NotImplementedError()
+
+  def report(self, output=None) -> None:
+    from tabulate import tabulate
+
+    output = output or sys.stderr
+    stats = sorted(self.stats.values(), key=lambda s: s.total_time, reverse=True)
+    print(
+      tabulate(
+        [
+          [s.command, s.count, s.failures, f"{s.total_time:.3f}", f"{s.avg_time * 1000:.1f}"]
+          for s in stats
+        ],
+        headers=["Command", "Count", "Failures", "Total (s)", "Avg (ms)"],
+        tablefmt="rounded_outline",
+      ),
+      file=output,
+    )
+
+
+class SubprocessExecutor(Executor):
+  """Run commands as child processes (the default executor)."""
+
+  def _execute(
+    self,
+    cmd_args: list[str],
+    shell: bool,
+    cwd: Path | None,
+    check: bool,
+    capture_output: bool,
+    output_file: Path | None,
+    debug: bool,
+    input: bytes | None,
+  ) -> subprocess.CompletedProcess:
+    run_args = {
+      "shell": shell,
+    }
+    if cwd is not None:
+      run_args["cwd"] = cwd
+    if input is not None:
+      run_args["input"] = input
+
+    if output_file is not None:
+      output_file.parent.mkdir(exist_ok=True, parents=True)
+      with output_file.open("w") as outfile:
+        return subprocess.run(cmd_args, stdout=outfile, stderr=outfile, check=check, **run_args)
+
+    if capture_output:
+      stdout = subprocess.PIPE
+      stderr = subprocess.PIPE
+    elif debug:
+      stdout = sys.stderr
+      stderr = sys.stderr
+    else:
+      stdout = subprocess.DEVNULL
+      stderr = subprocess.DEVNULL
+
+    return subprocess.run(cmd_args, stdout=stdout, stderr=stderr, check=check, **run_args)
+
+
+class RecordedCommand:
+  # Argument which matches any value during replay
+  ANY = "*"
+
+  def __init__(
+    self,
+    args: Sequence[str],
+    returncode: int = 0,
+    stdout: bytes | None = None,
+    stderr: bytes | None = None,
+  ) -> None:
+    self.args = list(map(str, args))
+    self.returncode = returncode
+    self.stdout = stdout
+    self.stderr = stderr
+
+  def __str__(self) -> str:
+    return " ".join(self.args)
+
+  def matches(self, cmd_args: Sequence[str]) -> bool:
+    return len(self.args) == len(cmd_args) and all(
+      expected == self.ANY or expected == str(actual)
+      for expected, actual in zip(self.args, cmd_args)
+    )
+
+  def serialize(self) -> dict:
+    serialized = {
+      "args": self.args,
+      "returncode": self.returncode,
+      "stdout": self.stdout.decode() if self.stdout else None,
+      "stderr": self.stderr.decode() if self.stderr else None,
+    }
+    if not serialized["returncode"]:
+      del serialized["returncode"]
+    if serialized["stdout"] is None:
+      del serialized["stdout"]
+    if serialized["stderr"] is None:
+      del serialized["stderr"]
+    return serialized
+
+  @staticmethod
+  def deserialize(serialized: dict) -> "RecordedCommand":
+    stdout = serialized.get("stdout")
+    stderr = serialized.get("stderr")
+    return RecordedCommand(
+      args=serialized["args"],
+      returncode=serialized.get("returncode", 0),
+      stdout=stdout.encode() if stdout is not None else None,
+      stderr=stderr.encode() if stderr is not None else None,
+    )
+
+  @staticmethod
+  def save(commands: Sequence["RecordedCommand"], output: Path) -> None:
+    output.write_text(json.dumps([c.serialize() for c in commands], indent=2) + "\n")
+
+  @staticmethod
+  def load(input: Path) -> list["RecordedCommand"]:
+    return [RecordedCommand.deserialize(c) for c in json.loads(input.read_text())]
+
+
+class RecordingExecutor(Executor):
+  """Run commands with another executor, and record each
+  one of them along with its result."""
+
+  def __init__(self, executor: Executor | None = None) -> None:
+    super().__init__()
+    self.executor = executor or SubprocessExecutor()
+    self.commands: list[RecordedCommand] = []
+
+  def _execute(
+    self,
+    cmd_args: list[str],
+    shell: bool,
+    cwd: Path | None,
+    check: bool,
+    capture_output: bool,
+    output_file: Path | None,
+    debug: bool,
+    input: bytes | None,
+  ) -> subprocess.CompletedProcess:
+    recorded = RecordedCommand(cmd_args)
+    self.commands.append(recorded)
+    try:
+      result = self.executor.execute(
+        cmd_args,
+        shell=shell,
+        cwd=cwd,
+        check=check,
+        capture_output=capture_output,
+        output_file=output_file,
+        debug=debug,
+        input=input,
+      )
+    except subprocess.CalledProcessError as e:
+      recorded.returncode = e.returncode
+      recorded.stdout = e.stdout
+      recorded.stderr = e.stderr
+      raise
+    recorded.returncode = result.returncode
+    if output_file is not None and output_file.is_file():
+      recorded.stdout = output_file.read_bytes()
+    else:
+      recorded.stdout = result.stdout if isinstance(result.stdout, bytes) else None
+      recorded.stderr = result.stderr if isinstance(result.stderr, bytes) else None
+    return result
+
+  def save(self, output: Path) -> None:
+    RecordedCommand.save(self.commands, output)
+
+
+class ReplayError(Exception):
+  pass
+
+
+class ReplayExecutor(Executor):
+  """Serve the results of previously recorded commands, without running
+  them. Commands must be requested in the same order as they were recorded."""
+
+  def __init__(self, commands: Sequence[RecordedCommand]) -> None:
+    super().__init__()
+    self.commands = list(commands)
+    self.executed: list[list[str]] = []
+
+  @classmethod
+  def load(cls, input: Path) -> "ReplayExecutor":
+    return cls(RecordedCommand.load(input))
+
+  @property
+  def pending(self) -> list[RecordedCommand]:
+    return self.commands[len(self.executed) :]
+
+  def _execute(
+    self,
+    cmd_args: list[str],
+    shell: bool,
+    cwd: Path | None,
+    check: bool,
+    capture_output: bool,
+    output_file: Path | None,
+    debug: bool,
+    input: bytes | None,
+  ) -> subprocess.CompletedProcess:
+    cmd_args = list(map(str, cmd_args))
+    pending = self.pending
+    if not pending:
+      raise ReplayError("unexpected command", " ".join(cmd_args))
+    recorded = pending[0]
+    if not recorded.matches(cmd_args):
+      raise ReplayError("unexpected command", " ".join(cmd_args), str(recorded))
+    self.executed.append(cmd_args)
+    if check and recorded.returncode != 0:
+      raise subprocess.CalledProcessError(
+        recorded.returncode, cmd_args, recorded.stdout, recorded.stderr
+      )
+    if output_file is not None:
+      output_file.parent.mkdir(exist_ok=True, parents=True)
+      output_file.write_bytes(recorded.stdout or b"")
+    return subprocess.CompletedProcess(
+      cmd_args,
+      recorded.returncode,
+      stdout=recorded.stdout if capture_output else None,
+      stderr=recorded.stderr if capture_output else None,
+    )
+
+
 def exec_command(
   cmd_args: Sequence[Union[str, Path]],
   fail_msg: str | None = None,
@@ -49,6 +391,7 @@ def exec_command(
   output_file: Path | None = None,
   capture_output: bool = False,
   debug: bool = False,
+  input: bytes | None = None,
 ):
   if root and os.geteuid() != 0:
     cmd_args = ["sudo", *cmd_args]
@@ -56,37 +399,22 @@ def exec_command(
   debug = debug or log.DEBUG
   logger = log.trace if not debug else _debug_log
 
-  run_args = {
-    "shell": shell,
-  }
-
   if cwd is not None:
-    run_args["cwd"] = cwd
     logger("+ cd {}", cwd)
 
   logger("+ " + " ".join(["{}"] * len(cmd_args)), *cmd_args)
 
   try:
-    if output_file is not None:
-      output_file.parent.mkdir(exist_ok=True, parents=True)
-      with output_file.open("w") as outfile:
-        result = subprocess.run(
-          cmd_args, stdout=outfile, stderr=outfile, check=not noexcept, **run_args
-        )
-    else:
-      if capture_output:
-        stdout = subprocess.PIPE
-        stderr = subprocess.PIPE
-      elif debug:
-        stdout = sys.stderr
-        stderr = sys.stderr
-      else:
-        stdout = subprocess.DEVNULL
-        stderr = subprocess.DEVNULL
-
-      result = subprocess.run(
-        cmd_args, stdout=stdout, stderr=stderr, check=not noexcept, **run_args
-      )
+    result = Executor.current().execute(
+      cmd_args,
+      shell=shell,
+      cwd=cwd,
+      check=not noexcept,
+      capture_output=capture_output,
+      output_file=output_file,
+      debug=debug,
+      input=input,
+    )
   except subprocess.CalledProcessError as e:
     log.command(cmd_args, e.returncode, e.stdout, e.stderr)
     raise
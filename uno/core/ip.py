@@ -13,12 +13,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 ###############################################################################
-from typing import Sequence, Mapping
+from typing import Callable, Sequence, Mapping
 import ipaddress
 import socket
 from .exec import exec_command
 import json
 import re
+import threading
+import time
 
 from .log import Logger
 
@@ -265,27 +267,91 @@ def ipv4_gethostbyname(hostname):
   return socket.gethostbyname(hostname)
 
 
-def ipv4_nsresolve(hostname):
-  from sh import awk, grep, nslookup
+class ResolverCache:
+  """A thread-safe cache of name resolutions.
+
+  Successful resolutions are cached for `ttl` seconds, and failed ones
+  for `negative_ttl` seconds, so that a name which doesn't resolve
+  doesn't cause a (possibly slow) lookup every time it is requested.
+  The standard library doesn't expose the TTL of DNS records, so the
+  same TTL is used for every entry."""
+
+  def __init__(
+    self,
+    resolve: Callable[[object], object],
+    ttl: float = 300,
+    negative_ttl: float = 30,
+    clock: Callable[[], float] = time.monotonic,
+  ) -> None:
+    self.resolve = resolve
+    self.ttl = ttl
+    self.negative_ttl = negative_ttl
+    self.clock = clock
+    self._entries: dict[object, tuple[object | None, float]] = {}
+    self._lock = threading.Lock()
+
+  def lookup(self, key: object) -> object | None:
+    now = self.clock()
+    with self._lock:
+      cached = self._entries.get(key)
+    if cached is not None and cached[1] > now:
+      return cached[0]
+    # Resolve without holding the lock, so that other lookups
+    # are not blocked by a slow one.
+    try:
+      value = self.resolve(key)
+    except Exception as e:
+      log.debug("failed to resolve {}: {}", key, e)
+      value = None
+    expires = now + (self.ttl if value is not None else self.negative_ttl)
+    with self._lock:
+      self._entries[key] = (value, expires)
+    return value
+
+  def clear(self) -> None:
+    with self._lock:
+      self._entries.clear()
 
-  return str(
-    awk(grep(grep(nslookup(hostname), "-A", "1", "^Name:\thost.org8"), "^Address"), "{print $2;}")
-  ).strip()
+
+def ipv4_nsresolve(hostname: str) -> ipaddress.IPv4Address:
+  addresses = socket.getaddrinfo(hostname, None, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+  return ipaddress.IPv4Address(addresses[0][4][0])
 
 
 def ipv4_nslookup(ip):
   ip = ipaddress.ip_address(ip)
-  from sh import awk, cut, nslookup, rev
-
-  # nslookup ${ip} | cut -d= -f2- | awk '{print $1;}' | rev | cut -d. -f2- | rev
-  hostname = str(
-    rev(cut(rev(awk(cut(nslookup(str(ip)), "-d=", "-f2-"), "{print $1;}")), "-d.", "-f2-"))
-  ).strip()
+  try:
+    hostname, _, _ = socket.gethostbyaddr(str(ip))
+  except (socket.herror, socket.gaierror):
+    raise StopIteration()
   if hostname:
     return hostname
   raise StopIteration()
 
 
+def _reverse_lookup(ip: ipaddress.IPv4Address) -> str | None:
+  try:
+    return ipv4_nslookup(ip)
+  except StopIteration:
+    return None
+
+
+hostname_cache = ResolverCache(ipv4_nsresolve)
+address_cache = ResolverCache(_reverse_lookup)
+
+
+def ipv4_resolve_hostname(
+  hostname: str, resolv_cache: ResolverCache | None = None
+) -> ipaddress.IPv4Address | None:
+  try:
+    return ipaddress.IPv4Address(hostname)
+  except ValueError:
+    pass
+  if resolv_cache is None:
+    resolv_cache = hostname_cache
+  return resolv_cache.lookup(hostname)
+
+
 def ipv4_list_routes(oneline=True, resolve=True, split=True) -> set[str]:
   if not oneline:
     cmd = ["ip", "route"]
@@ -298,30 +364,21 @@ def ipv4_list_routes(oneline=True, resolve=True, split=True) -> set[str]:
   return results
 
 
-def ipv4_resolve_address(ip, ns=None, cache=True, resolv_cache={}):
+def ipv4_resolve_address(ip, ns=None, cache=True, resolv_cache: ResolverCache | None = None):
   try:
     i_ip = ipaddress.ip_address(ip)
   except Exception:
     return ip
-  if cache:
-    hostname = resolv_cache.get(i_ip)
-    if hostname:
-      return hostname
   if ns:
     try:
-      hostname = ns.nslookup(i_ip)
-      if cache:
-        resolv_cache[i_ip] = hostname
-      return hostname
+      return ns.nslookup(i_ip)
     except StopIteration:
       pass
-  try:
-    hostname = ipv4_nslookup(i_ip)
-    if cache:
-      resolv_cache[i_ip] = hostname
-    return hostname
-  except Exception:
-    return ip
+  if not cache:
+    return _reverse_lookup(i_ip) or ip
+  if resolv_cache is None:
+    resolv_cache = address_cache
+  return resolv_cache.lookup(i_ip) or ip
 
 
 def ipv4_resolve_text(text, ns=None, cache=True):
@@ -333,9 +390,8 @@ def ipv4_resolve_text(text, ns=None, cache=True):
     return text
   # filter out network addresses
   ips = set(map(lambda i: i.strip(), filter(lambda i: i.find("/") < 0, ips)))
-  resolved = {}
   for ip in ips:
-    hostname = ipv4_resolve_address(ip, ns=ns, cache=cache, resolv_cache=resolved)
+    hostname = ipv4_resolve_address(ip, ns=ns, cache=cache)
     if hostname == ip:
       hostname = "unknown"
     text = re.sub(f"{ip}([^/0-9])", f'"{hostname}" <{ip}>\\1', text)
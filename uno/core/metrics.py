@@ -0,0 +1,258 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from pathlib import Path
+from typing import Generator, Iterable
+import contextlib
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+
+
+_METRIC_NAME = re.compile(r"^[a-zA-Z_:][a-zA-Z0-9_:]*$")
+_LABEL_NAME = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+
+
+def _format_value(value: float) -> str:
+  if math.isinf(value):
+    return "+Inf" if value > 0 else "-Inf"
+  elif math.isnan(value):
+    return "NaN"
+  elif float(value).is_integer():
+    return str(int(value))
+  return repr(float(value))
+
+
+def _escape_label_value(value: str) -> str:
+  return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+  labels = ",".join(f'{n}="{_escape_label_value(v)}"' for n, v in zip(names, values))
+  return f"{{{labels}}}" if labels else ""
+
+
+class Metric:
+  TYPE: str = None
+
+  def __init__(self, name: str, help: str, labels: Iterable[str] = ()) -> None:
+    if not _METRIC_NAME.match(name):
+      raise ValueError("invalid metric name", name)
+    self.name = name
+    self.help = help
+    self.label_names = tuple(labels)
+    for label in self.label_names:
+      if not _LABEL_NAME.match(label) or label.startswith("__"):
+        raise ValueError("invalid label name", name, label)
+    self._values: dict[tuple[str, ...], object] = {}
+    self._lock = threading.Lock()
+
+  def _key(self, labels: dict[str, object]) -> tuple[str, ...]:
+    if set(labels) != set(self.label_names):
+      raise ValueError("invalid labels", self.name, sorted(labels))
+    return tuple(str(labels[n]) for n in self.label_names)
+
+  def remove(self, **labels) -> None:
+    with self._lock:
+      self._values.pop(self._key(labels), None)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._values.clear()
+
+  def samples(self) -> Generator[tuple[str, str, float], None, None]:
+    with self._lock:
+      values = sorted(self._values.items())
+    for key, value in values:
+      yield (self.name, _format_labels(self.label_names, key), value)
+
+  def render(self) -> str:
+    help = self.help.replace("\\", "\\\\").replace("\n", "\\n")
+    lines = [
+      f"# HELP {self.name} {help}",
+      f"# TYPE {self.name} {self.TYPE}",
+      *(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples()),
+    ]
+    return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+  TYPE = "counter"
+
+  def inc(self, amount: float = 1, **labels) -> None:
+    if amount < 0:
+      raise ValueError("counters can only be incremented", self.name, amount)
+    key = self._key(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+  def set(self, value: float, **labels) -> None:
+    """Mirror a counter maintained by an external source (e.g. the
+    kernel's interface statistics)."""
+    key = self._key(labels)
+    with self._lock:
+      self._values[key] = value
+
+  def value(self, **labels) -> float:
+    with self._lock:
+      return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+  TYPE = "gauge"
+
+  def set(self, value: float, **labels) -> None:
+    key = self._key(labels)
+    with self._lock:
+      self._values[key] = value
+
+  def inc(self, amount: float = 1, **labels) -> None:
+    key = self._key(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+  def value(self, **labels) -> float | None:
+    with self._lock:
+      return self._values.get(self._key(labels))
+
+
+class _HistogramValue:
+  def __init__(self, buckets: tuple[float, ...]) -> None:
+    self.counts = [0] * len(buckets)
+    self.sum = 0.0
+    self.count = 0
+
+
+class Histogram(Metric):
+  TYPE = "histogram"
+  DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+  def __init__(
+    self,
+    name: str,
+    help: str,
+    labels: Iterable[str] = (),
+    buckets: Iterable[float] | None = None,
+  ) -> None:
+    super().__init__(name, help, labels)
+    if "le" in self.label_names:
+      raise ValueError("invalid label name", name, "le")
+    buckets = sorted(float(b) for b in (buckets or self.DEFAULT_BUCKETS))
+    if not buckets or buckets[-1] != math.inf:
+      buckets.append(math.inf)
+    self.buckets = tuple(buckets)
+
+  def observe(self, value: float, **labels) -> None:
+    key = self._key(labels)
+    with self._lock:
+      hist = self._values.get(key)
+      if hist is None:
+        hist = self._values[key] = _HistogramValue(self.buckets)
+      for i, bound in enumerate(self.buckets):
+        if value <= bound:
+          hist.counts[i] += 1
+      hist.sum += value
+      hist.count += 1
+
+  @contextlib.contextmanager
+  def time(self, **labels) -> Generator[None, None, None]:
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(time.perf_counter() - start, **labels)
+
+  def count(self, **labels) -> int:
+    with self._lock:
+      hist = self._values.get(self._key(labels))
+      return hist.count if hist is not None else 0
+
+  def samples(self) -> Generator[tuple[str, str, float], None, None]:
+    with self._lock:
+      values = sorted(
+        (key, (list(hist.counts), hist.sum, hist.count)) for key, hist in self._values.items()
+      )
+    for key, (counts, total, count) in values:
+      for bound, bucket_count in zip(self.buckets, counts):
+        yield (
+          f"{self.name}_bucket",
+          _format_labels((*self.label_names, "le"), (*key, _format_value(bound))),
+          bucket_count,
+        )
+      labels = _format_labels(self.label_names, key)
+      yield (f"{self.name}_sum", labels, total)
+      yield (f"{self.name}_count", labels, count)
+
+
+class Metrics:
+  """A registry of the metrics collected by the current process, which can
+  be exported in the Prometheus text exposition format."""
+
+  _Instance: "Metrics | None" = None
+
+  def __init__(self) -> None:
+    self.metrics: dict[str, Metric] = {}
+    self._lock = threading.Lock()
+
+  @classmethod
+  def current(cls) -> "Metrics":
+    if cls._Instance is None:
+      cls._Instance = Metrics()
+    return cls._Instance
+
+  def _register(self, metric_cls: type[Metric], name: str, *args, **kwargs) -> Metric:
+    with self._lock:
+      metric = self.metrics.get(name)
+      if metric is None:
+        metric = self.metrics[name] = metric_cls(name, *args, **kwargs)
+      elif not isinstance(metric, metric_cls):
+        raise TypeError("metric already registered with a different type", name, metric.TYPE)
+      return metric
+
+  def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+    return self._register(Counter, name, help, labels)
+
+  def gauge(self, name: str, help: str, labels: Iterable[str] = ()) -> Gauge:
+    return self._register(Gauge, name, help, labels)
+
+  def histogram(
+    self,
+    name: str,
+    help: str,
+    labels: Iterable[str] = (),
+    buckets: Iterable[float] | None = None,
+  ) -> Histogram:
+    return self._register(Histogram, name, help, labels, buckets=buckets)
+
+  def render(self) -> str:
+    with self._lock:
+      metrics = sorted(self.metrics.values(), key=lambda m: m.name)
+    return "".join(m.render() for m in metrics)
+
+  def write(self, output: Path) -> None:
+    # Replace the file atomically, so that it's never served partially written
+    output.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=output.parent, prefix=f".{output.name}.")
+    try:
+      with os.fdopen(fd, "w") as tmp_output:
+        tmp_output.write(self.render())
+      os.chmod(tmp_file, 0o644)
+      os.replace(tmp_file, output)
+    except Exception:
+      os.unlink(tmp_file)
+      raise
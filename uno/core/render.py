@@ -21,6 +21,7 @@ import markdown
 import jinja2
 
 from .time import Timestamp
+from .yaml_codec import yaml_dump
 import ipaddress
 
 from .log import Logger
@@ -89,12 +90,10 @@ def _filter_ip_default_route(addr: str):
 
 
 def _filter_yaml(val: object) -> str:
-  import yaml
-
   serializer = getattr(val, "serialize", None)
   if serializer:
     val = serializer()
-  return yaml.safe_dump(val)
+  return yaml_dump(val)
 
 
 def _filter_format_hash(val: str) -> str:
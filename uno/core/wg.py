@@ -13,17 +13,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 ###############################################################################
-import subprocess
 import ipaddress
 from tempfile import NamedTemporaryFile
 from pathlib import Path
 from typing import Iterable, Mapping, Sequence
+from enum import Enum
 
 
 from .exec import exec_command
 from .time import Timestamp
 from .render import Templates
-from .ip import ip_nic_is_up, ip_nic_exists
+from .ip import ip_nic_is_up, ip_nic_exists, ipv4_resolve_hostname, ResolverCache
 from .log import Logger
 
 log = Logger.sublogger("wg")
@@ -52,7 +52,7 @@ def genkeypair() -> tuple[str, str]:
 
 
 def genkeyprivate() -> str:
-  prc_result = subprocess.run(["wg", "genkey"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  prc_result = exec_command(["wg", "genkey"], capture_output=True, noexcept=True)
   if prc_result.returncode != 0:
     raise WireGuardError(f"failed to generate private key: {prc_result.stderr.decode('utf-8')}")
   privkey = prc_result.stdout.decode("utf-8").strip()
@@ -62,10 +62,10 @@ def genkeyprivate() -> str:
 
 
 def genkeypublic(private_key) -> str:
-  prc_result = subprocess.run(
+  prc_result = exec_command(
     ["wg", "pubkey"],
-    stdout=subprocess.PIPE,
-    stderr=subprocess.PIPE,
+    capture_output=True,
+    noexcept=True,
     input=private_key.encode("utf-8"),
   )
   if prc_result.returncode != 0:
@@ -77,7 +77,7 @@ def genkeypublic(private_key) -> str:
 
 
 def genkeypreshared() -> str:
-  prc_result = subprocess.run(["wg", "genpsk"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  prc_result = exec_command(["wg", "genpsk"], capture_output=True, noexcept=True)
   if prc_result.returncode != 0:
     raise WireGuardError(f"failed to generate preshared key: {prc_result.stderr.decode('utf-8')}")
   psk = prc_result.stdout.decode("utf-8").strip()
@@ -266,12 +266,102 @@ class WireGuardConfig:
     )
 
 
+class WireGuardKeyRotation:
+  """Replace the public key (and preshared key) of a peer without
+  interrupting its tunnel.
+
+  The new key is first STAGED as a second peer entry, without any allowed
+  IPs, while the previous entry keeps carrying traffic (for the allowed IPs
+  of the current configuration). Once a handshake is detected on the new
+  entry, the allowed IPs are moved to it and the rotation is PROMOTED.
+  The previous entry is kept (without allowed IPs) for an overlap window,
+  and then RETIRED.
+  """
+
+  class State(Enum):
+    STAGED = 0
+    PROMOTED = 1
+    RETIRED = 2
+
+  DEFAULT_OVERLAP = 120
+
+  def __init__(
+    self,
+    previous: WireGuardInterfacePeerConfig,
+    current: WireGuardInterfacePeerConfig,
+    overlap: int | None = None,
+    now: Timestamp | None = None,
+  ) -> None:
+    assert previous.id == current.id
+    assert previous.pubkey != current.pubkey
+    self.previous = previous
+    self.current = current
+    self.overlap = overlap if overlap is not None else self.DEFAULT_OVERLAP
+    self.state = self.State.STAGED
+    self.staged_ts = now or Timestamp.now()
+    self.promoted_ts = None
+
+  def __str__(self) -> str:
+    return f"peer #{self.current.id} [{self.state.name}]"
+
+  @property
+  def active(self) -> WireGuardInterfacePeerConfig:
+    if self.state == self.State.STAGED:
+      return self.previous
+    return self.current
+
+  @property
+  def peer_entries(self) -> list[WireGuardInterfacePeerConfig]:
+    if self.state == self.State.STAGED:
+      return [
+        self._with_allowed(self.previous, self.current.allowed),
+        self._with_allowed(self.current),
+      ]
+    elif self.state == self.State.PROMOTED:
+      return [self.current, self._with_allowed(self.previous)]
+    else:
+      return [self.current]
+
+  @staticmethod
+  def _with_allowed(
+    peer: WireGuardInterfacePeerConfig, allowed: list[str] | None = None
+  ) -> WireGuardInterfacePeerConfig:
+    return WireGuardInterfacePeerConfig(
+      id=peer.id,
+      pubkey=peer.pubkey,
+      psk=peer.psk,
+      address=peer.address,
+      allowed=allowed,
+      endpoint=peer.endpoint,
+      keepalive=peer.keepalive,
+    )
+
+  def update(self, handshakes: Mapping[str, Timestamp], now: Timestamp | None = None) -> bool:
+    now = now or Timestamp.now()
+    if self.state == self.State.STAGED:
+      handshake = handshakes.get(self.current.pubkey)
+      if handshake is None or handshake.from_epoch() <= 0:
+        return False
+      self.state = self.State.PROMOTED
+      self.promoted_ts = now
+      return True
+    elif self.state == self.State.PROMOTED:
+      if now.subtract(self.promoted_ts).total_seconds() < self.overlap:
+        return False
+      self.state = self.State.RETIRED
+      return True
+    return False
+
+
 class WireGuardInterface:
   def __init__(self, config: WireGuardConfig):
     self.config = config
     self.log = log.sublogger(self.config.intf.name)
     self.created = False
     self.up = False
+    self.rotations: dict[int, WireGuardKeyRotation] = {}
+    # Last known address of the peers' endpoints, by public key
+    self._endpoints: dict[str, str] | None = None
 
   def __eq__(self, other: object) -> bool:
     if not isinstance(other, WireGuardInterface):
@@ -346,19 +436,56 @@ class WireGuardInterface:
     self.created = False
     self.log.activity("deleted")
 
-  def bring_up(self, root: Path | None = None):
+  @property
+  def peer_entries(self) -> list[WireGuardInterfacePeerConfig]:
+    return [
+      entry
+      for peer in self.config.peers
+      for rotation in [self.rotations.get(peer.id)]
+      for entry in (rotation.peer_entries if rotation else [peer])
+    ]
+
+  @property
+  def template_args(self) -> tuple[str, dict]:
+    template, ctx = self.config.template_args
+    ctx["peers"] = [p.serialize() for p in self.peer_entries]
+    return (template, ctx)
+
+  def render_config(self) -> str:
+    return Templates.render(*self.template_args)
+
+  def _write_config(self, root: Path | None = None) -> Path:
     try:
       if root is None:
         # Generate a temporary file with wg configuration
-        tmp_file_h = NamedTemporaryFile(prefix=f"{self.config.intf.name}-", suffix="-wgconf")
-        wg_config = Path(tmp_file_h.name)
+        self._config_file_h = NamedTemporaryFile(
+          prefix=f"{self.config.intf.name}-", suffix="-wgconf"
+        )
+        wg_config = Path(self._config_file_h.name)
       else:
         wg_config = root / f"{self.config.intf.name}.conf"
-      Templates.generate(wg_config, *self.config.template_args, mode=0o600)
+      Templates.generate(wg_config, *self.template_args, mode=0o600)
+      return wg_config
     except Exception:
       raise WireGuardError(
         f"failed to generate configuration for wireguard interface: {self.config.intf.name}"
       )
+
+  def sync(self, root: Path | None = None) -> None:
+    # Apply the whole configuration with a single "wg syncconf...",
+    # which only changes the peers that differ, without disrupting the others.
+    wg_config = self._write_config(root)
+    try:
+      self.log.debug("configuring WireGuard")
+      exec_command(["wg", "syncconf", self.config.intf.name, wg_config])
+    except Exception:
+      raise WireGuardError(
+        f"failed to set wireguard configuration on interface: {self.config.intf.name}"
+      )
+    # WireGuard resolved the endpoints again
+    self._endpoints = None
+
+  def bring_up(self, root: Path | None = None):
     # Disable and reset interface
     try:
       self.log.debug("making sure interface is disabled")
@@ -389,14 +516,8 @@ class WireGuardInterface:
       raise WireGuardError(
         f"failed to configure address on wireguard interface: {self.config.intf.name}, {self.config.intf.address}/{self.config.intf.netmask}"
       )
-    # Set wireguard configuration with "wg setconf..."
-    try:
-      self.log.debug("configuring WireGuard")
-      exec_command(["wg", "setconf", self.config.intf.name, wg_config])
-    except Exception:
-      raise WireGuardError(
-        f"failed to set wireguard configuration on interface: {self.config.intf.name}"
-      )
+    # Set wireguard configuration with "wg syncconf..."
+    self.sync(root=root)
     # Activate interface with "ip link set up dev..."
     try:
       self.log.debug("enabling interface")
@@ -411,6 +532,97 @@ class WireGuardInterface:
     self.up = True
     self.log.activity("up [{}/{}]", self.config.intf.address, self.config.intf.netmask)
 
+  def update_peers(
+    self,
+    previous: "WireGuardInterface | None" = None,
+    root: Path | None = None,
+    overlap: int | None = None,
+  ) -> None:
+    # Peers whose public key changed since the previous configuration
+    # of the interface are rotated, all other changes are applied in place.
+    if previous is not None:
+      previous_peers = {p.id: p for p in previous.config.peers}
+      self.rotations = {}
+      for peer in self.config.peers:
+        prev_rotation = previous.rotations.get(peer.id)
+        if prev_rotation is not None and prev_rotation.current.pubkey == peer.pubkey:
+          # Keep rotating to the same key
+          prev_rotation.current = peer
+          self.rotations[peer.id] = prev_rotation
+          continue
+        prev_peer = prev_rotation.active if prev_rotation else previous_peers.get(peer.id)
+        if prev_peer is None or prev_peer.pubkey == peer.pubkey:
+          continue
+        rotation = WireGuardKeyRotation(prev_peer, peer, overlap=overlap)
+        self.rotations[peer.id] = rotation
+        self.log.activity("key rotation started: {}", rotation)
+    self.sync(root=root)
+    self.log.activity("peers updated [{}]", len(self.config.peers))
+
+  def update_rotations(self, root: Path | None = None, now: Timestamp | None = None) -> None:
+    if not self.rotations:
+      return
+    handshakes = self._list_handshakes()
+    changed = False
+    for rotation in self.rotations.values():
+      if rotation.update(handshakes, now=now):
+        self.log.activity("key rotation updated: {}", rotation)
+        changed = True
+    if not changed:
+      return
+    self.sync(root=root)
+    for peer_id, rotation in list(self.rotations.items()):
+      if rotation.state == WireGuardKeyRotation.State.RETIRED:
+        del self.rotations[peer_id]
+
+  def update_endpoints(self, resolv_cache: ResolverCache | None = None) -> bool:
+    # WireGuard only resolves the hostname of an endpoint when the configuration
+    # is applied, so peers with a dynamic address must be updated explicitly.
+    if not self.up:
+      return False
+    hostnames = {}
+    for peer in self.peer_entries:
+      if not peer.endpoint:
+        continue
+      host, _, port = peer.endpoint.rpartition(":")
+      try:
+        ipaddress.ip_address(host)
+        continue
+      except ValueError:
+        hostnames[peer.pubkey] = (host, port)
+    if not hostnames:
+      return False
+    # Called from a separate thread, while sync() might reset the cache
+    endpoints = self._endpoints
+    if endpoints is None:
+      endpoints = self._endpoints = {
+        pubkey: str(endpoint["address"]) for pubkey, endpoint in self._list_endpoints().items()
+      }
+    changed = False
+    for pubkey, (host, port) in hostnames.items():
+      address = ipv4_resolve_hostname(host, resolv_cache=resolv_cache)
+      if address is None or str(address) == endpoints.get(pubkey):
+        continue
+      result = exec_command(
+        ["wg", "set", self.config.intf.name, "peer", pubkey, "endpoint", f"{address}:{port}"],
+        capture_output=True,
+        noexcept=True,
+      )
+      if result.returncode != 0:
+        # Keep the previous endpoint, and try again on the next update
+        self.log.warning(
+          "failed to update endpoint: {} → {}:{}: {}",
+          host,
+          address,
+          port,
+          result.stderr.decode().strip(),
+        )
+        continue
+      endpoints[pubkey] = str(address)
+      self.log.activity("endpoint updated: {} → {}:{}", host, address, port)
+      changed = True
+    return changed
+
   def tear_down(self, ignore_errors: bool = False):
     # Disable interface with "ip link set down dev..."
     try:
@@ -506,55 +718,6 @@ class WireGuardInterface:
     ips = self._list_allowed_ips()
     return ips.get(peer.pubkey, set())
 
-  def _update_allowed_ips(
-    self, peer: WireGuardInterfacePeerConfig, allowed_ips: Iterable[ipaddress.IPv4Network]
-  ) -> None:
-    # sort ips for tidyness in `wg show`'s output
-    allowed_ips_str = sorted(map(str, allowed_ips))
-    try:
-      self.log.debug("setting allowed IPs for peer #{}", peer.id)
-      exec_command(
-        [
-          "wg",
-          "set",
-          self.config.intf.name,
-          "peer",
-          peer.pubkey,
-          "allowed-ips",
-          ",".join(allowed_ips_str),
-        ]
-      )
-      self.log.activity("allowed #{} = [{}]", peer.id, ", ".join(allowed_ips_str))
-    except Exception:
-      raise WireGuardError(f"failed to set allowed peers on interface: {self.config.intf.name}")
-    # allowed_ips_set = self._list_allowed_ips_peer(peer)
-    # if allowed_ips ^ allowed_ips_set:
-    #   # TODO(asorbini) do something with the knowledge that the
-    #   # list of allowed peers contains unexpected addresses
-    #   pass
-
-  def allow_ips_for_peer(self, peer_i: int, addresses: Sequence[ipaddress.IPv4Network]) -> None:
-    # addr = ipaddress.ip_network(addr)
-    peer = self.config.peers[peer_i]
-    allowed_ips_nic = set(self._list_allowed_ips_peer(peer))
-    not_yet_allowed = set(addresses) - allowed_ips_nic
-    if len(not_yet_allowed) > 0:
-      allowed_ips = {*allowed_ips_nic, *not_yet_allowed}
-      self._update_allowed_ips(peer, allowed_ips)
-    # allowed_ips_nic = self._list_allowed_ips_peer(peer)
-    # if addr not in allowed_ips_nic:
-    #   raise WireGuardError(f"failed to allow address on interface: {self.config.intf.name}, {addr}")
-
-  def disallow_ips_for_peer(self, peer_i: int, addresses: Sequence[ipaddress.IPv4Network]) -> None:
-    peer = self.config.peers[peer_i]
-    allowed_ips_nic = set(self._list_allowed_ips_peer(peer))
-    allowed = allowed_ips_nic - set(addresses)
-    if allowed != allowed_ips_nic:
-      self._update_allowed_ips(peer, allowed)
-    # allowed_ips_nic = self._list_allowed_ips_peer(peer)
-    # if addr in allowed_ips_nic:
-    #   raise WireGuardError(f"failed to disallow address on interface: {self.config.intf.name}, {addr}")
-
   # def peers(self) -> Sequence[str]:
   #   try:
   #     result = exec_command(
@@ -565,19 +728,16 @@ class WireGuardInterface:
   #   return list(filter(lambda v: len(v) > 0, result.stdout.decode("utf-8").split("\n")))
 
   def _map_peer_ids(self, input: Mapping[str, object]) -> Mapping[str, Mapping[int, object]]:
+    # Report the entry which carries each peer's traffic, and ignore the
+    # additional entries created for peers with an ongoing key rotation.
+    active = {
+      (self.rotations[p.id].active if p.id in self.rotations else p).pubkey: p
+      for p in self.config.peers
+    }
+    entries = {p.pubkey for p in self.peer_entries}
     return {
-      "peers": {
-        peer.id: v
-        for pubkey, v in input.items()
-        for peer in [next((p for p in self.config.peers if p.pubkey == pubkey), None)]
-        if peer is not None
-      },
-      "unknown_peers": {
-        pubkey: v
-        for pubkey, v in input.items()
-        for peer in [next((p for p in self.config.peers if p.pubkey == pubkey), None)]
-        if peer is None
-      },
+      "peers": {active[pubkey].id: v for pubkey, v in input.items() if pubkey in active},
+      "unknown_peers": {pubkey: v for pubkey, v in input.items() if pubkey not in entries},
     }
 
   def stat(self) -> dict:
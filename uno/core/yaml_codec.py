@@ -0,0 +1,103 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from typing import Callable, NamedTuple
+from pathlib import PurePath
+import ipaddress
+
+import yaml
+
+from .time import Timestamp
+
+
+class _PySafeDumper(yaml.SafeDumper):
+  pass
+
+
+# The "safe" representers only support YAML's standard types,
+# every other one must be registered explicitly (see add_representer())
+_DUMPERS: list[type[yaml.SafeDumper]] = [_PySafeDumper]
+
+if yaml.__with_libyaml__:
+
+  class _CSafeDumper(yaml.CSafeDumper):
+    pass
+
+  _DUMPERS.append(_CSafeDumper)
+
+
+class YamlCodec(NamedTuple):
+  """Load and dump YAML documents with a pair of "safe" loader and dumper classes."""
+
+  loader: type
+  dumper: type
+
+  @property
+  def libyaml(self) -> bool:
+    return self.loader is yaml.CSafeLoader
+
+  def load(self, val: str | bytes) -> object:
+    return yaml.load(val, Loader=self.loader)
+
+  def dump(self, val: object, **kwargs) -> str:
+    return yaml.dump(val, Dumper=self.dumper, **kwargs)
+
+  def open_loader(self, val: str | bytes) -> yaml.SafeLoader:
+    """Create a loader to inspect the nodes of a document (e.g. their position).
+    The caller must call dispose() on it once done."""
+    return self.loader(val)
+
+
+PYTHON_CODEC = YamlCodec(yaml.SafeLoader, _PySafeDumper)
+LIBYAML_CODEC = YamlCodec(yaml.CSafeLoader, _DUMPERS[-1]) if yaml.__with_libyaml__ else None
+# The libyaml bindings are much faster, but they are an optional part of PyYAML
+CODEC = LIBYAML_CODEC or PYTHON_CODEC
+
+
+def add_representer(
+  data_type: type, representer: Callable[[yaml.SafeDumper, object], yaml.Node], multi: bool = False
+) -> None:
+  """Register a representer for a type with every dumper."""
+  for dumper in _DUMPERS:
+    if multi:
+      dumper.add_multi_representer(data_type, representer)
+    else:
+      dumper.add_representer(data_type, representer)
+
+
+def _represent_str(dumper: yaml.SafeDumper, data: object) -> yaml.Node:
+  return dumper.represent_str(str(data))
+
+
+add_representer(Timestamp, _represent_str)
+add_representer(PurePath, _represent_str, multi=True)
+for _ip_type in (
+  ipaddress.IPv4Address,
+  ipaddress.IPv6Address,
+  ipaddress.IPv4Network,
+  ipaddress.IPv6Network,
+  ipaddress.IPv4Interface,
+  ipaddress.IPv6Interface,
+):
+  add_representer(_ip_type, _represent_str)
+add_representer(tuple, lambda dumper, data: dumper.represent_list(data))
+
+
+def yaml_load(val: str | bytes) -> object:
+  return CODEC.load(val)
+
+
+def yaml_dump(val: object, **kwargs) -> str:
+  return CODEC.dump(val, **kwargs)
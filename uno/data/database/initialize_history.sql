@@ -0,0 +1,27 @@
+-------------------------------------------------------------------------------
+-- generations --
+-------------------------------------------------------------------------------
+-- Every command which modified the registry
+CREATE TABLE IF NOT EXISTS generations (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  ts CHAR(22) NOT NULL,
+  command TEXT NOT NULL,
+  config_id CHAR(64) CHECK(config_id IS NULL OR length(config_id) == 64));
+
+
+-------------------------------------------------------------------------------
+-- generation_changes --
+-------------------------------------------------------------------------------
+-- The rows modified by a generation: "old" is NULL for inserted rows, "new"
+-- is NULL for deleted rows, otherwise both contain only the modified columns.
+CREATE TABLE IF NOT EXISTS generation_changes (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  generation INT NOT NULL,
+  tbl TEXT NOT NULL,
+  key TEXT NOT NULL,
+  old TEXT,
+  new TEXT,
+  FOREIGN KEY (generation) REFERENCES generations(id));
+
+CREATE INDEX IF NOT EXISTS generation_changes_by_generation
+  ON generation_changes(generation);
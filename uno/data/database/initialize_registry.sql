@@ -1,3 +1,7 @@
+-- Let the database file shrink when rows are deleted (e.g. by the retention
+-- of the agents' status history). Must precede the creation of any table.
+PRAGMA auto_vacuum = INCREMENTAL;
+
 -------------------------------------------------------------------------------
 -- next_id --
 -------------------------------------------------------------------------------
@@ -0,0 +1,9 @@
+-------------------------------------------------------------------------------
+-- secrets_key --
+-------------------------------------------------------------------------------
+-- The key which encrypts the secret columns (e.g. private keys), encrypted
+-- with a master key which is never stored in the database.
+CREATE TABLE IF NOT EXISTS secrets_key (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  master_key_id CHAR(16) NOT NULL,
+  wrapped_key BLOB NOT NULL);
@@ -0,0 +1,27 @@
+-------------------------------------------------------------------------------
+-- peers_vpn_samples --
+-------------------------------------------------------------------------------
+-- Downsampled history of peers_vpn_status: every VPN interface of a peer has
+-- a fixed number of slots, which are reused as new samples are recorded.
+CREATE TABLE IF NOT EXISTS peers_vpn_samples (
+  peer INT NOT NULL,
+  intf CHAR(15) NOT NULL,
+  slot INT NOT NULL,
+  ts CHAR(22) NOT NULL,
+  online BOOL NOT NULL,
+  recv INT NOT NULL,
+  send INT NOT NULL,
+  PRIMARY KEY(peer, intf, slot)) WITHOUT ROWID;
+
+
+-------------------------------------------------------------------------------
+-- peers_lan_samples --
+-------------------------------------------------------------------------------
+-- Downsampled history of peers_lan_status.
+CREATE TABLE IF NOT EXISTS peers_lan_samples (
+  peer INT NOT NULL,
+  lan TEXT NOT NULL,
+  slot INT NOT NULL,
+  ts CHAR(22) NOT NULL,
+  reachable BOOL NOT NULL,
+  PRIMARY KEY(peer, lan, slot)) WITHOUT ROWID;
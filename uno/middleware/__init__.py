@@ -1,5 +1,6 @@
 from .condition import Condition
 from .handle import Handle
+from .samples import DataSample, LanSite, UvnInfo, CellInfo, AgentConfigChunk, coalesce_samples
 from .participant import Participant
 from .events import ParticipantEventsListener
 from .middleware import Middleware
@@ -7,6 +8,12 @@ from .middleware import Middleware
 __all__ = [
   Condition,
   Handle,
+  DataSample,
+  LanSite,
+  UvnInfo,
+  CellInfo,
+  AgentConfigChunk,
+  coalesce_samples,
   Participant,
   ParticipantEventsListener,
   Middleware,
@@ -30,7 +30,8 @@ from uno.registry.lan_descriptor import LanDescriptor
 from uno.registry.key_id import KeyId
 from uno.core.render import Templates
 
-from uno.middleware import Participant
+from uno.middleware import Participant, DataSample, LanSite, UvnInfo, CellInfo, AgentConfigChunk
+from uno.middleware.package_transfer import split_package
 
 from .connext_condition import ConnextCondition
 from .connext_handle import ConnextHandle
@@ -62,7 +63,7 @@ class ConnextParticipant(Participant):
   TOPIC_TYPES = {
     UvnTopic.UVN_ID: "uno::UvnInfo",
     UvnTopic.CELL_ID: "uno::CellInfo",
-    UvnTopic.BACKBONE: "uno::AgentConfig",
+    UvnTopic.BACKBONE: "uno::AgentConfigChunk",
   }
 
   REGISTERED_TYPES = {
@@ -85,6 +86,7 @@ class ConnextParticipant(Participant):
     self._user_conditions = []
     self._readers = {}
     self._writers = {}
+    self._published_chunks: dict[tuple[str, int], int] = {}
 
   @cached_property
   def rti_license(self) -> Path:
@@ -98,14 +100,29 @@ class ConnextParticipant(Participant):
     writer.write(sample)
 
   def cell_agent_config(self, uvn: Uvn, cell_id: int, registry_id: str, package: Path) -> None:
-    sample = dds.DynamicData(self._types[self.TOPIC_TYPES[UvnTopic.BACKBONE]])
-    sample["cell.n"] = cell_id
-    sample["cell.uvn"] = uvn.name
-    sample["registry_id"] = registry_id
-    with package.open("rb") as input:
-      sample["package"] = input.read()
     writer = self._writers[UvnTopic.BACKBONE]
-    writer.write(sample)
+    count = 0
+    for chunk in split_package(package, uvn=uvn.name, cell=cell_id, registry_id=registry_id):
+      sample = dds.DynamicData(self._types[self.TOPIC_TYPES[UvnTopic.BACKBONE]])
+      sample["cell.n"] = chunk.cell
+      sample["cell.uvn"] = chunk.uvn
+      sample["seq"] = chunk.seq
+      sample["count"] = chunk.count
+      sample["registry_id"] = chunk.registry_id
+      sample["digest"] = chunk.digest
+      sample["size"] = chunk.size
+      sample["data"] = chunk.data
+      writer.write(sample)
+      count = chunk.count
+    # Dispose the chunks of a previous (larger) package, so that they
+    # are not delivered to late-joining agents.
+    for seq in range(count, self._published_chunks.get((uvn.name, cell_id), 0)):
+      key = dds.DynamicData(self._types[self.TOPIC_TYPES[UvnTopic.BACKBONE]])
+      key["cell.n"] = cell_id
+      key["cell.uvn"] = uvn.name
+      key["seq"] = seq
+      writer.dispose_instance(writer.lookup_instance(key))
+    self._published_chunks[(uvn.name, cell_id)] = count
 
   def _lan_descriptor(self, net: LanDescriptor) -> dds.DynamicData:
     sample = dds.DynamicData(self._types["uno::NetworkInfo"])
@@ -143,84 +160,41 @@ class ConnextParticipant(Participant):
     writer = self._writers[UvnTopic.CELL_ID]
     writer.write(sample)
 
-  def _parse_data(self, topic: UvnTopic, data: object) -> dict:
-    """\
-UVN_ID:
-{
-  uvn: str,
-  registry_id: str
-}
-
-CELL_ID:
-{
-  uvn: str,
-  cell: int,
-  registry_id: str,
-  routed_networks: list[LanDescriptor],
-  known_networks: dict[LanDescriptor, bool]
-  ts_start: str,
-}
-
-BACKBONE:
-{
-  uvn: str,
-  cell: int,
-  registry_id: str,
-  package: bytes
-}
-"""
+  def _parse_data(self, topic: UvnTopic, data: object) -> UvnInfo | CellInfo | AgentConfigChunk:
     if topic == UvnTopic.UVN_ID:
-      return {
-        "uvn": data["name"],
-        "registry_id": data["registry_id"],
-      }
+      return UvnInfo(uvn=data["name"], registry_id=data["registry_id"])
     elif topic == UvnTopic.CELL_ID:
 
-      def _site_to_descriptor(site):
+      def _site(site) -> LanSite:
         subnet_addr = ipv4_from_bytes(site["subnet.address.value"])
         subnet_mask = site["subnet.mask"]
-        subnet = ipaddress.ip_network(f"{subnet_addr}/{subnet_mask}")
-        endpoint = ipv4_from_bytes(site["endpoint.value"])
-        gw = ipv4_from_bytes(site["gw.value"])
-        nic = site["nic"]
-        return {
-          "nic": {
-            "name": nic,
-            "address": endpoint,
-            "subnet": subnet,
-          },
-          "gw": gw,
-        }
-
-      def _site_to_lan_status(site, reachable):
-        return (
-          self.agent.new_child(LanDescriptor, _site_to_descriptor(site), save=False),
-          reachable,
+        return LanSite(
+          nic=site["nic"],
+          address=ipv4_from_bytes(site["endpoint.value"]),
+          subnet=ipaddress.ip_network(f"{subnet_addr}/{subnet_mask}"),
+          gw=ipv4_from_bytes(site["gw.value"]),
         )
 
-      routed_networks = [_site_to_descriptor(s) for s in data["routed_networks"]]
-      known_networks = dict(
-        (
-          *(_site_to_lan_status(s, False) for s in data["unreachable_networks"]),
-          *(_site_to_lan_status(s, True) for s in data["reachable_networks"]),
-        )
+      return CellInfo(
+        uvn=data["id.uvn"],
+        cell=data["id.n"],
+        registry_id=data["registry_id"],
+        routed_networks=tuple(map(_site, data["routed_networks"])),
+        reachable_networks=tuple(map(_site, data["reachable_networks"])),
+        unreachable_networks=tuple(map(_site, data["unreachable_networks"])),
+        ts_start=data["ts_start"],
       )
-
-      return {
-        "uvn": data["id.uvn"],
-        "cell": data["id.n"],
-        "registry_id": data["registry_id"],
-        "routed_networks": routed_networks,
-        "known_networks": known_networks,
-        "ts_start": data["ts_start"],
-      }
     elif topic == UvnTopic.BACKBONE:
-      return {
-        "uvn": data["cell.uvn"],
-        "cell": data["cell.n"],
-        "registry_id": data["registry_id"],
-        "package": data["package"],
-      }
+      return AgentConfigChunk(
+        uvn=data["cell.uvn"],
+        cell=data["cell.n"],
+        registry_id=data["registry_id"],
+        digest=data["digest"],
+        size=data["size"],
+        seq=data["seq"],
+        count=data["count"],
+        data=bytes(data["data"]),
+      )
 
   @cached_property
   def participant_xml_config(self) -> Path:
@@ -244,7 +218,7 @@ BACKBONE:
         "uvn": self.registry.uvn,
         "cell": None,
         "initial_peers": [f"[0]@{p}" for p in self.initial_peers],
-        "timing": self.registry.uvn.settings.timing_profile,
+        "timing": self.registry.uvn.timing,
         "license_file": self.rti_license.read_text(),
         "ca_cert": self.registry.id_db.backend.ca.cert,
         "perm_ca_cert": self.registry.id_db.backend.perm_ca.cert,
@@ -272,7 +246,7 @@ BACKBONE:
         "uvn": self.registry.uvn,
         "cell": self.owner,
         "initial_peers": [f"[0]@{p}" for p in self.initial_peers],
-        "timing": self.registry.uvn.settings.timing_profile,
+        "timing": self.registry.uvn.timing,
         "license_file": self.rti_license.read_text(),
         "ca_cert": self.registry.id_db.backend.ca.cert,
         "perm_ca_cert": self.registry.id_db.backend.perm_ca.cert,
@@ -395,22 +369,33 @@ BACKBONE:
         online_writers = [ConnextHandle(ih_dw) for ih_dw in reader.matched_publications]
         self.agent.on_remote_writers_status(topic, online_writers)
 
+    # Take all available samples before handing them to the agent, so that
+    # they can be processed (and stored) in a single batch
+    samples = []
     for topic, reader, query_cond in active_data:
       for s in reader.select().condition(query_cond).take():
         if s.info.valid:
-          data = self._parse_data(topic, s.data)
-          self.agent.on_data(
-            topic,
-            data,
-            instance=ConnextHandle(s.info.instance_handle),
-            writer=ConnextHandle(s.info.publication_handle),
+          samples.append(
+            DataSample(
+              topic=topic,
+              data=self._parse_data(topic, s.data),
+              instance=ConnextHandle(s.info.instance_handle),
+              writer=ConnextHandle(s.info.publication_handle),
+            )
           )
         elif (
           s.info.state.instance_state == dds.InstanceState.NOT_ALIVE_DISPOSED
           or s.info.state.instance_state == dds.InstanceState.NOT_ALIVE_NO_WRITERS
         ):
+          # Deliver pending samples first to preserve their order
+          if samples:
+            self.agent.on_data_batch(samples)
+            samples = []
           self.agent.on_instance_offline(topic, ConnextHandle(s.info.instance_handle))
 
+    if samples:
+      self.agent.on_data_batch(samples)
+
     for user_cond in active_user:
       self.agent.on_condition_active(user_cond)
 
@@ -16,6 +16,7 @@
 from ..registry.topic import UvnTopic
 from .condition import Condition
 from .handle import Handle
+from .samples import DataSample, UvnInfo, CellInfo, AgentConfigChunk
 
 
 class ParticipantEventsListener:
@@ -26,9 +27,18 @@ class ParticipantEventsListener:
     pass
 
   def on_data(
-    self, topic: UvnTopic, data: dict, instance: Handle | None = None, writer: Handle | None = None
+    self,
+    topic: UvnTopic,
+    data: UvnInfo | CellInfo | AgentConfigChunk,
+    instance: Handle | None = None,
+    writer: Handle | None = None,
   ) -> None:
     pass
 
+  def on_data_batch(self, samples: list[DataSample]) -> None:
+    """Handle all the samples received by the participant during one wakeup."""
+    for sample in samples:
+      self.on_data(sample.topic, sample.data, instance=sample.instance, writer=sample.writer)
+
   def on_condition_active(self, condition: Condition) -> None:
     pass
@@ -0,0 +1,385 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from typing import TYPE_CHECKING, Callable, NamedTuple
+from collections import Counter
+from pathlib import Path
+import heapq
+import random
+import time
+
+from ..core.data import yaml_load_inline
+from ..core.log import Logger
+from ..core.time import Timestamp
+from ..registry.cell import Cell
+from ..registry.lan_descriptor import LanDescriptor
+from ..registry.topic import UvnTopic
+from ..registry.uvn import Uvn
+from .condition import Condition
+from .events import ParticipantEventsListener
+from .handle import Handle
+from .middleware import Middleware
+from .participant import Participant
+from .samples import DataSample, UvnInfo, CellInfo, AgentConfigChunk
+
+if TYPE_CHECKING:
+  from ..registry.registry import Registry
+  from ..agent.agent import Agent
+
+log = Logger.sublogger("faults")
+
+
+class FaultDelay(NamedTuple):
+  """The distribution of the delay (in seconds) added to every sample."""
+
+  distribution: str = "constant"
+  # Constant delay, or lower bound of the delay
+  min: float = 0.0
+  # Upper bound of a uniform delay
+  max: float = 0.0
+  # Average delay added (on top of min) by an exponential distribution
+  mean: float = 0.0
+
+  DISTRIBUTIONS = ("constant", "uniform", "exponential")
+
+  @classmethod
+  def parse(cls, val: "float | int | dict | FaultDelay | None") -> "FaultDelay":
+    if val is None:
+      return cls()
+    elif isinstance(val, FaultDelay):
+      return val
+    elif isinstance(val, (int, float)):
+      return cls(min=float(val), max=float(val))
+    delay = cls(**val)
+    delay.validate()
+    return delay
+
+  def validate(self) -> None:
+    if self.distribution not in self.DISTRIBUTIONS:
+      raise ValueError("unknown delay distribution", self.distribution)
+    if self.min < 0 or self.mean < 0 or (self.distribution == "uniform" and self.max < self.min):
+      raise ValueError("invalid delay", self)
+
+  def sample(self, rng: random.Random) -> float:
+    if self.distribution == "uniform":
+      return rng.uniform(self.min, self.max)
+    elif self.distribution == "exponential" and self.mean > 0:
+      return self.min + rng.expovariate(1 / self.mean)
+    return self.min
+
+
+class TopicFaults(NamedTuple):
+  """The faults injected in the samples received on a topic."""
+
+  # Probability that a sample is lost
+  drop: float = 0.0
+  # Probability that a sample is delivered twice
+  duplicate: float = 0.0
+  # Delay added to every sample (and copy). Samples are reordered by random delays.
+  delay: FaultDelay = FaultDelay()
+  # Probability that the liveliness of the topic's remote writers
+  # is reported lost every time the participant is spun
+  liveliness_lost: float = 0.0
+  # Time (in seconds) before the writers are reported alive again
+  liveliness_duration: float = 1.0
+
+  @classmethod
+  def parse(cls, val: "dict | TopicFaults") -> "TopicFaults":
+    if isinstance(val, TopicFaults):
+      return val
+    faults = cls(**{**val, "delay": FaultDelay.parse(val.get("delay"))})
+    faults.validate()
+    return faults
+
+  def validate(self) -> None:
+    for name in ("drop", "duplicate", "liveliness_lost"):
+      val = getattr(self, name)
+      if not 0 <= val <= 1:
+        raise ValueError("fault probabilities must be between 0 and 1", name, val)
+    if self.liveliness_duration < 0:
+      raise ValueError("invalid liveliness duration", self.liveliness_duration)
+    self.delay.validate()
+
+
+class FaultPolicy(NamedTuple):
+  """The faults injected in the traffic received by a participant.
+
+  A policy is typically loaded from a YAML file, e.g.:
+
+    seed: 42
+    topics:
+      BACKBONE:
+        drop: 0.1
+        duplicate: 0.1
+        delay: {distribution: uniform, min: 0, max: 2}
+      CELL_ID:
+        delay: {distribution: exponential, mean: 0.5}
+        liveliness_lost: 0.01
+        liveliness_duration: 10
+
+  Every random decision is derived from the seed (and the participant's
+  owner), so a run can be replayed by using the same seed."""
+
+  seed: int = 0
+  topics: dict[UvnTopic, TopicFaults] = {}
+
+  @classmethod
+  def parse(cls, val: dict) -> "FaultPolicy":
+    return cls(
+      seed=int(val.get("seed", 0)),
+      topics={
+        UvnTopic[str(topic).upper()]: TopicFaults.parse(faults)
+        for topic, faults in (val.get("topics") or {}).items()
+      },
+    )
+
+  @classmethod
+  def load(cls, val: str | Path) -> "FaultPolicy":
+    """Load a policy from a YAML file, or from an inline YAML string."""
+    return cls.parse(yaml_load_inline(val) or {})
+
+
+class _FaultyListener(ParticipantEventsListener):
+  """Stand in for the agent of a wrapped participant, and forward every
+  event to the FaultyParticipant. Other attributes are read from the agent."""
+
+  def __init__(self, participant: "FaultyParticipant", agent: "Agent") -> None:
+    self._participant = participant
+    self._agent = agent
+
+  def __getattr__(self, name: str) -> object:
+    return getattr(self._agent, name)
+
+  def on_remote_writers_status(self, topic: UvnTopic, online_writers: list[Handle]) -> None:
+    self._participant._on_remote_writers_status(topic, online_writers)
+
+  def on_instance_offline(self, topic: UvnTopic, instance: Handle) -> None:
+    self._agent.on_instance_offline(topic, instance)
+
+  def on_data(
+    self,
+    topic: UvnTopic,
+    data: UvnInfo | CellInfo | AgentConfigChunk,
+    instance: Handle | None = None,
+    writer: Handle | None = None,
+  ) -> None:
+    self.on_data_batch([DataSample(topic, data, instance=instance, writer=writer)])
+
+  def on_data_batch(self, samples: list[DataSample]) -> None:
+    self._participant._on_data_batch(samples)
+
+  def on_condition_active(self, condition: Condition) -> None:
+    self._agent.on_condition_active(condition)
+
+
+class FaultyParticipant(Participant):
+  """Inject faults in the samples delivered to an agent by another participant.
+
+  Samples received by the wrapped participant are dropped, duplicated, and
+  delayed according to a FaultPolicy. Delayed samples are delivered by a later
+  call to spin(), so their delay is only as precise as the wrapped participant's
+  wakeups. The liveliness of the remote writers of a topic can also be reported
+  lost, for a while, as if the remote agents had stopped asserting it.
+
+  Samples written by the agent are passed on to the wrapped participant unchanged,
+  so faults are injected on the receiving side of every link."""
+
+  def __init__(
+    self,
+    *args,
+    inner: Callable[..., Participant],
+    policy: FaultPolicy,
+    **kwargs,
+  ) -> None:
+    super().__init__(*args, **kwargs)
+    self.policy = policy
+    self.rng = random.Random(f"{policy.seed}/{self.owner}")
+    self.clock: Callable[[], float] = time.monotonic
+    self.stats: Counter[str] = Counter()
+    self._pending: list[tuple[float, int, DataSample]] = []
+    self._seq = 0
+    self._online_writers: dict[UvnTopic, list[Handle]] = {}
+    self._instances: dict[UvnTopic, dict[Handle, Handle | None]] = {}
+    self._lost_liveliness: dict[UvnTopic, float] = {}
+    if self.agent is not None:
+      self.inner = inner(agent=_FaultyListener(self, self.agent))
+    else:
+      self.inner = inner(registry=self.registry, owner=self.owner)
+
+  def uvn_info(self, uvn: Uvn, registry_id: str) -> None:
+    self.inner.uvn_info(uvn, registry_id)
+
+  def cell_agent_config(self, uvn: Uvn, cell_id: int, registry_id: str, package: Path) -> None:
+    self.inner.cell_agent_config(uvn, cell_id, registry_id, package)
+
+  def cell_agent_status(
+    self,
+    uvn: Uvn,
+    cell_id: int,
+    registry_id: str,
+    ts_start: Timestamp | None = None,
+    lans: list[LanDescriptor] | None = None,
+    known_networks: dict[LanDescriptor, bool] | None = None,
+  ) -> None:
+    self.inner.cell_agent_status(
+      uvn, cell_id, registry_id, ts_start=ts_start, lans=lans, known_networks=known_networks
+    )
+
+  def start(self) -> None:
+    self.inner.start()
+
+  def stop(self) -> None:
+    self.inner.stop()
+    self._pending.clear()
+    self._lost_liveliness.clear()
+
+  def install(self) -> None:
+    self.inner.install()
+
+  def spin(self) -> bool:
+    done = self.inner.spin()
+    if not done:
+      self.inject()
+    return done
+
+  def inject(self) -> None:
+    """Deliver the delayed samples which are due, and update the writers' liveliness."""
+    now = self.clock()
+    self._restore_liveliness(now)
+    self._flush(now)
+    for topic, faults in self.policy.topics.items():
+      if (
+        faults.liveliness_lost > 0
+        and topic not in self._lost_liveliness
+        and self._online_writers.get(topic)
+        and self.rng.random() < faults.liveliness_lost
+      ):
+        self._lose_liveliness(topic, now + faults.liveliness_duration)
+
+  def _on_data_batch(self, samples: list[DataSample]) -> None:
+    now = self.clock()
+    for sample in samples:
+      self._instances.setdefault(sample.topic, {})[sample.instance] = sample.writer
+      faults = self.policy.topics.get(sample.topic)
+      if faults is None:
+        self._schedule(now, sample)
+        continue
+      if self.rng.random() < faults.drop:
+        self.stats["dropped"] += 1
+        continue
+      copies = 1
+      if self.rng.random() < faults.duplicate:
+        self.stats["duplicated"] += 1
+        copies = 2
+      for _ in range(copies):
+        delay = faults.delay.sample(self.rng)
+        if delay > 0:
+          self.stats["delayed"] += 1
+        self._schedule(now + delay, sample)
+    self._flush(now)
+
+  def _schedule(self, ts: float, sample: DataSample) -> None:
+    self._seq += 1
+    heapq.heappush(self._pending, (ts, self._seq, sample))
+
+  def _flush(self, now: float) -> None:
+    samples = []
+    while self._pending and self._pending[0][0] <= now:
+      samples.append(heapq.heappop(self._pending)[2])
+    if samples:
+      self.agent.on_data_batch(samples)
+
+  def _on_remote_writers_status(self, topic: UvnTopic, online_writers: list[Handle]) -> None:
+    self._online_writers[topic] = list(online_writers)
+    if topic in self._lost_liveliness:
+      # Reported once the liveliness is restored
+      return
+    self.agent.on_remote_writers_status(topic, online_writers)
+
+  def _lose_liveliness(self, topic: UvnTopic, restore_ts: float) -> None:
+    writers = set(self._online_writers[topic])
+    instances = [i for i, w in self._instances.get(topic, {}).items() if w in writers]
+    log.activity(
+      "liveliness LOST: {} ({} writers, {} instances)", topic.name, len(writers), len(instances)
+    )
+    self.stats["liveliness_lost"] += 1
+    self._lost_liveliness[topic] = restore_ts
+    for instance in instances:
+      self.agent.on_instance_offline(topic, instance)
+    self.agent.on_remote_writers_status(topic, [])
+
+  def _restore_liveliness(self, now: float) -> None:
+    for topic, restore_ts in list(self._lost_liveliness.items()):
+      if restore_ts > now:
+        continue
+      del self._lost_liveliness[topic]
+      log.activity("liveliness RESTORED: {}", topic.name)
+      self.agent.on_remote_writers_status(topic, self._online_writers.get(topic, []))
+
+
+class FaultInjectionMiddleware(Middleware):
+  """A middleware whose participants inject faults in the traffic of another one.
+
+  The wrapper is installed by Middleware.selected() when the
+  UNO_MIDDLEWARE_FAULTS variable contains a FaultPolicy (or the path
+  of a file which contains one)."""
+
+  INNER: type[Middleware] | None = None
+  POLICY: FaultPolicy | None = None
+  PARTICIPANT = FaultyParticipant
+
+  @classmethod
+  def wrap(cls, inner: type[Middleware], policy: FaultPolicy) -> type[Middleware]:
+    return type(
+      f"Faulty{inner.__qualname__}",
+      (cls,),
+      {
+        "INNER": inner,
+        "POLICY": policy,
+        "CONDITION": inner.CONDITION,
+        "plugin": getattr(inner, "plugin", None),
+      },
+    )
+
+  @classmethod
+  def install_instructions(cls) -> str | None:
+    return cls.INNER.install_instructions()
+
+  @classmethod
+  def supports_agent(cls, root: Path) -> bool:
+    return cls.INNER.supports_agent(root)
+
+  @classmethod
+  def install_cell_agent_package_files(cls, registry_root: Path, package_dir: Path) -> list[Path]:
+    return cls.INNER.install_cell_agent_package_files(registry_root, package_dir)
+
+  @classmethod
+  def configure_extracted_cell_agent_package(cls, extracted_package: Path) -> None:
+    cls.INNER.configure_extracted_cell_agent_package(extracted_package)
+
+  @classmethod
+  def participant(
+    cls,
+    agent: "Agent|None" = None,
+    registry: "Registry|None" = None,
+    owner: "Uvn|Cell|None" = None,
+  ) -> Participant:
+    return cls.PARTICIPANT(
+      agent=agent,
+      registry=registry,
+      owner=owner,
+      inner=cls.INNER.participant,
+      policy=cls.POLICY,
+    )
@@ -7,6 +7,9 @@ class Handle:
       return False
     return self.__value == other.__value
 
+  def __hash__(self) -> int:
+    return hash(str(self.__value))
+
   def __str__(self) -> str:
     return str(self.__value)
 
@@ -79,6 +79,12 @@ class Middleware:
           except Exception:
             middleware = Middleware
             middleware.plugin = None
+        faults = os.environ.get("UNO_MIDDLEWARE_FAULTS")
+        if faults:
+          from .fault_injection import FaultInjectionMiddleware, FaultPolicy
+
+          log.warning("injecting faults in middleware traffic: {}", faults)
+          middleware = FaultInjectionMiddleware.wrap(middleware, FaultPolicy.load(faults))
         return middleware
 
       _Instance = load()
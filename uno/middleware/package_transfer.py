@@ -0,0 +1,186 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from pathlib import Path
+from typing import Generator
+import hashlib
+import os
+import re
+import struct
+
+from ..core.log import Logger
+from .samples import AgentConfigChunk
+
+log = Logger.sublogger("package-transfer")
+
+# Small enough for a chunk to fit in a single UDP datagram,
+# so that packages don't require "large data" transport settings.
+CHUNK_SIZE = 32 * 1024
+
+_READ_SIZE = 1024 * 1024
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def file_digest(file: Path) -> str:
+  h = hashlib.sha256()
+  with file.open("rb") as input:
+    for block in iter(lambda: input.read(_READ_SIZE), b""):
+      h.update(block)
+  return h.hexdigest()
+
+
+def split_package(
+  package: Path,
+  uvn: str,
+  cell: int,
+  registry_id: str,
+  chunk_size: int = CHUNK_SIZE,
+) -> Generator[AgentConfigChunk, None, None]:
+  """Read a package from disk one chunk at a time."""
+  digest = file_digest(package)
+  size = package.stat().st_size
+  count = max(1, -(-size // chunk_size))
+  with package.open("rb") as input:
+    for seq in range(count):
+      yield AgentConfigChunk(
+        uvn=uvn,
+        cell=cell,
+        registry_id=registry_id,
+        digest=digest,
+        size=size,
+        seq=seq,
+        count=count,
+        data=input.read(chunk_size),
+      )
+
+
+class PackageTransfer:
+  """The reassembly state of a package, stored in a directory.
+
+  Chunks are written directly to their position in a partial file,
+  while the sequence numbers of the received ones are appended to
+  a journal, so that an interrupted transfer can be resumed."""
+
+  _SEQ = struct.Struct("!I")
+
+  def __init__(self, root: Path, digest: str, size: int, count: int) -> None:
+    self.digest = digest
+    self.size = size
+    self.count = count
+    self.partial = root / f"{digest}.part"
+    self.journal = root / f"{digest}.chunks"
+    self.received: set[int] = set()
+    if self.partial.is_file() and self.journal.is_file():
+      data = self.journal.read_bytes()
+      # Ignore a truncated record, left by an interrupted write
+      usable = len(data) - len(data) % self._SEQ.size
+      self.received = {seq for (seq,) in self._SEQ.iter_unpack(data[:usable])}
+      if self.received:
+        log.activity("resuming transfer {}: {}/{} chunks", digest, len(self.received), count)
+    else:
+      with self.partial.open("wb") as output:
+        output.truncate(size)
+      self.journal.write_bytes(b"")
+
+  @property
+  def missing(self) -> list[int]:
+    return [seq for seq in range(self.count) if seq not in self.received]
+
+  @property
+  def complete(self) -> bool:
+    return len(self.received) == self.count
+
+  def write(self, chunk: AgentConfigChunk, chunk_size: int) -> bool:
+    if chunk.seq in self.received:
+      return False
+    offset = chunk.seq * chunk_size
+    expected = min(chunk_size, self.size - offset)
+    if chunk.seq >= self.count or len(chunk.data) != expected:
+      log.warning("invalid chunk for {}: {}/{}", self.digest, chunk.seq, self.count)
+      return False
+    with self.partial.open("r+b") as output:
+      output.seek(offset)
+      output.write(chunk.data)
+    with self.journal.open("ab") as output:
+      output.write(self._SEQ.pack(chunk.seq))
+    self.received.add(chunk.seq)
+    return True
+
+  def delete(self) -> None:
+    self.partial.unlink(missing_ok=True)
+    self.journal.unlink(missing_ok=True)
+
+
+class PackageAssembler:
+  """Reassemble the packages received as a stream of chunks.
+
+  Chunks may be received in any order, and more than once. Completed
+  packages are verified against their digest before being returned."""
+
+  MAX_TRANSFERS = 2
+
+  def __init__(self, root: Path, chunk_size: int = CHUNK_SIZE) -> None:
+    self.root = root
+    self.chunk_size = chunk_size
+    self.transfers: dict[str, PackageTransfer] = {}
+    self.received: str | None = None
+
+  def receive(self, chunk: AgentConfigChunk) -> Path | None:
+    """Store a chunk, and return the package file once it is complete.
+
+    The caller is responsible for (re)moving the returned file."""
+    if not _DIGEST.match(chunk.digest):
+      # The digest is used to name files
+      log.warning("ignoring chunk with invalid digest: {}", chunk.digest)
+      return None
+    elif chunk.digest == self.received:
+      # Duplicate of a package that was already returned
+      return None
+    transfer = self.transfers.get(chunk.digest)
+    if transfer is None:
+      transfer = self._begin(chunk)
+    transfer.write(chunk, self.chunk_size)
+    if not transfer.complete:
+      return None
+    del self.transfers[chunk.digest]
+    if file_digest(transfer.partial) != chunk.digest:
+      log.error("discarding corrupted package: {}", chunk.digest)
+      transfer.delete()
+      return None
+    package = self.root / f"{chunk.digest}.pkg"
+    os.replace(transfer.partial, package)
+    transfer.delete()
+    self.received = chunk.digest
+    log.activity("package received: {} ({} bytes)", chunk.digest, transfer.size)
+    return package
+
+  def _begin(self, chunk: AgentConfigChunk) -> PackageTransfer:
+    self.root.mkdir(parents=True, exist_ok=True)
+    # Only keep the most recent transfers, since a newer package
+    # supersedes the ones that were still being received.
+    pending = sorted(
+      (f for f in self.root.glob("*.part") if f.stem != chunk.digest),
+      key=lambda f: f.stat().st_mtime,
+      reverse=True,
+    )
+    for partial in pending[self.MAX_TRANSFERS - 1 :]:
+      log.activity("dropping incomplete transfer: {}", partial.stem)
+      self.transfers.pop(partial.stem, None)
+      partial.unlink()
+      partial.with_suffix(".chunks").unlink(missing_ok=True)
+    transfer = PackageTransfer(self.root, chunk.digest, chunk.size, chunk.count)
+    self.transfers[chunk.digest] = transfer
+    return transfer
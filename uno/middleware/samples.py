@@ -0,0 +1,89 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from typing import Iterable, NamedTuple
+import ipaddress
+
+from ..registry.topic import UvnTopic
+from .handle import Handle
+
+
+class LanSite(NamedTuple):
+  """A LAN attached to a remote agent, as announced by the agent."""
+
+  nic: str
+  address: ipaddress.IPv4Address
+  subnet: ipaddress.IPv4Network
+  gw: ipaddress.IPv4Address
+
+  def serialize(self) -> dict:
+    """Return the configuration of an equivalent LanDescriptor."""
+    return {
+      "nic": {
+        "name": self.nic,
+        "address": self.address,
+        "subnet": self.subnet,
+      },
+      "gw": self.gw,
+    }
+
+
+class UvnInfo(NamedTuple):
+  uvn: str
+  registry_id: str
+
+
+class CellInfo(NamedTuple):
+  uvn: str
+  cell: int
+  registry_id: str
+  routed_networks: tuple[LanSite, ...]
+  reachable_networks: tuple[LanSite, ...]
+  unreachable_networks: tuple[LanSite, ...]
+  ts_start: int | str | None
+
+
+class AgentConfigChunk(NamedTuple):
+  """A fragment of the package with a cell agent's configuration."""
+
+  uvn: str
+  cell: int
+  registry_id: str
+  digest: str
+  size: int
+  seq: int
+  count: int
+  data: bytes
+
+
+class DataSample(NamedTuple):
+  topic: UvnTopic
+  data: UvnInfo | CellInfo | AgentConfigChunk
+  instance: Handle | None = None
+  writer: Handle | None = None
+
+
+def coalesce_samples(samples: Iterable[DataSample]) -> list[DataSample]:
+  """Keep only the latest sample of every instance.
+
+  Samples are returned in the order in which the retained samples were received.
+  Samples without an instance are never coalesced."""
+  latest: dict[tuple[UvnTopic, Handle] | int, DataSample] = {}
+  for i, sample in enumerate(samples):
+    key = (sample.topic, sample.instance) if sample.instance is not None else i
+    # Remove the previous sample so that the latest one takes its place in the order
+    latest.pop(key, None)
+    latest[key] = sample
+  return list(latest.values())
@@ -0,0 +1,208 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from typing import Callable, NamedTuple
+from pathlib import PurePath
+import ipaddress
+import json
+
+from ..core.time import Timestamp
+from ..core.yaml_codec import yaml_dump, yaml_load
+
+try:
+  import msgpack
+except ImportError:
+  msgpack = None
+
+try:
+  import cbor2
+except ImportError:
+  cbor2 = None
+
+# Types stored as their string representation, like yaml_codec does
+_STR_TYPES = (
+  Timestamp,
+  PurePath,
+  ipaddress.IPv4Address,
+  ipaddress.IPv6Address,
+  ipaddress.IPv4Network,
+  ipaddress.IPv6Network,
+  ipaddress.IPv4Interface,
+  ipaddress.IPv6Interface,
+)
+
+
+def _str_default(val: object) -> str:
+  if isinstance(val, _STR_TYPES):
+    return str(val)
+  raise TypeError("cannot encode value", val.__class__.__qualname__)
+
+
+def _sorted_set(val: set | frozenset) -> list:
+  # Sets are stored sorted (like YAML does), so that the encoding
+  # of a value doesn't change unless the value does
+  try:
+    return sorted(val)
+  except TypeError:
+    return list(val)
+
+
+# JSON has no sets, nor non-string keys (which it would silently convert,
+# e.g. cell ids), so they are stored as single-key objects with a reserved key
+_JSON_SET = "\0set"
+_JSON_MAP = "\0map"
+
+
+def _to_json(val: object) -> object:
+  if isinstance(val, dict):
+    if all(isinstance(k, str) for k in val):
+      return {k: _to_json(v) for k, v in val.items()}
+    return {_JSON_MAP: [[k, _to_json(v)] for k, v in val.items()]}
+  elif isinstance(val, (list, tuple)):
+    return [_to_json(v) for v in val]
+  elif isinstance(val, (set, frozenset)):
+    return {_JSON_SET: [_to_json(v) for v in _sorted_set(val)]}
+  return val
+
+
+def _from_json(obj: dict) -> object:
+  if len(obj) == 1:
+    if _JSON_SET in obj:
+      return set(obj[_JSON_SET])
+    elif _JSON_MAP in obj:
+      return {k: v for k, v in obj[_JSON_MAP]}
+  return obj
+
+
+def _json_encode(val: object) -> bytes:
+  return json.dumps(
+    _to_json(val),
+    separators=(",", ":"),
+    ensure_ascii=False,
+    allow_nan=False,
+    default=_str_default,
+  ).encode()
+
+
+def _json_decode(val: bytes) -> object:
+  return json.loads(val, object_hook=_from_json)
+
+
+_MSGPACK_SET = 1
+
+
+def _msgpack_default(val: object) -> object:
+  if isinstance(val, (set, frozenset)):
+    return msgpack.ExtType(_MSGPACK_SET, _msgpack_encode(_sorted_set(val)))
+  return _str_default(val)
+
+
+def _msgpack_encode(val: object) -> bytes:
+  return msgpack.packb(val, use_bin_type=True, default=_msgpack_default)
+
+
+def _msgpack_ext(code: int, data: bytes) -> object:
+  if code == _MSGPACK_SET:
+    return set(_msgpack_decode(data))
+  return msgpack.ExtType(code, data)
+
+
+def _msgpack_decode(val: bytes) -> object:
+  return msgpack.unpackb(val, raw=False, strict_map_key=False, ext_hook=_msgpack_ext)
+
+
+def _cbor_strings(val: object) -> object:
+  # CBOR has tags for some of the string-like types (e.g. IP networks),
+  # which would be decoded as objects instead of strings
+  if isinstance(val, dict):
+    return {k: _cbor_strings(v) for k, v in val.items()}
+  elif isinstance(val, (list, tuple)):
+    return [_cbor_strings(v) for v in val]
+  elif isinstance(val, (set, frozenset)):
+    return {_cbor_strings(v) for v in val}
+  elif isinstance(val, _STR_TYPES):
+    return str(val)
+  return val
+
+
+def _cbor_encode(val: object) -> bytes:
+  # Canonical encoding sorts maps and sets
+  return cbor2.dumps(
+    _cbor_strings(val), canonical=True, default=lambda encoder, v: encoder.encode(_str_default(v))
+  )
+
+
+class ColumnCodec(NamedTuple):
+  """Encode the structured fields of a database object to a binary column value.
+
+  Every value starts with the codec's tag, so that rows written
+  with different codecs can be stored in the same table."""
+
+  name: str
+  tag: bytes
+  encode: Callable[[object], bytes]
+  decode: Callable[[bytes], object]
+
+  def dump(self, val: object) -> bytes:
+    return self.tag + self.encode(val)
+
+
+JSON_CODEC = ColumnCodec("json", b"J", _json_encode, _json_decode)
+MSGPACK_CODEC = (
+  ColumnCodec("msgpack", b"M", _msgpack_encode, _msgpack_decode) if msgpack is not None else None
+)
+CBOR_CODEC = ColumnCodec("cbor", b"C", _cbor_encode, cbor2.loads) if cbor2 is not None else None
+
+CODECS: dict[str, ColumnCodec] = {
+  c.name: c for c in (MSGPACK_CODEC, CBOR_CODEC, JSON_CODEC) if c is not None
+}
+
+# msgpack and CBOR are optional dependencies, while compact JSON is always
+# available, so that a database can be read on any host (e.g. by the agents)
+DEFAULT_CODEC = JSON_CODEC
+
+_DECODERS: dict[int, Callable[[bytes], object]] = {c.tag[0]: c.decode for c in CODECS.values()}
+
+_OPTIONAL_TAGS = frozenset(c.tag for c in (MSGPACK_CODEC, CBOR_CODEC) if c is not None)
+
+
+def dump_column(val: object, codec: ColumnCodec | None = DEFAULT_CODEC) -> str | bytes:
+  """Encode a structured value with a codec, or as YAML text if it is None,
+  or if the codec cannot represent the value exactly."""
+  if codec is not None:
+    try:
+      return codec.dump(val)
+    except (TypeError, ValueError, OverflowError):
+      pass
+  return yaml_dump(val)
+
+
+def load_column(val: str | bytes) -> object:
+  """Decode a value stored by dump_column(), or by any previous version
+  (which always stored structured values as YAML text)."""
+  if not isinstance(val, bytes):
+    return yaml_load(val)
+  decode = _DECODERS.get(val[0]) if val else None
+  if decode is None:
+    raise ValueError("unknown column codec", val[:1])
+  return decode(val[1:])
+
+
+def portable_column(val: object) -> object:
+  """Re-encode a value stored by dump_column() with one of the optional
+  codecs as JSON, so that it can be decoded on hosts without them."""
+  if not isinstance(val, bytes) or val[:1] not in _OPTIONAL_TAGS:
+    return val
+  return dump_column(load_column(val), JSON_CODEC)
@@ -13,21 +13,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 ###############################################################################
-from typing import Generator, Iterable, Mapping
+from typing import Callable, Generator, Iterable, Mapping
 from pathlib import Path
 import sqlite3
 import json
 from importlib.resources import files, as_file
 import tempfile
 import contextlib
+import functools
 
 from collections import namedtuple
 
 from .versioned import Versioned
+from .column_codec import ColumnCodec, DEFAULT_CODEC, load_column, portable_column
+from .secret_box import MasterKey, MissingMasterKey, SecretBox
+from .identity_map import IdentityMap
+from .database_profiler import DatabaseProfiler, ProfiledConnection
 
 from ..data import database as db_data
-from ..core.exec import exec_command
 from ..core.log import Logger
+from ..core.metrics import Metrics
 
 from .database_object import (
   DatabaseObject,
@@ -40,10 +45,16 @@ from .database_object import (
 )
 
 
+@functools.lru_cache(maxsize=256)
+def _row_class(fields: tuple[str, ...]) -> type:
+  return namedtuple("Row", fields)
+
+
 def namedtuple_factory(cursor, row):
-  fields = [column[0] for column in cursor.description]
-  cls = namedtuple("Row", fields)
-  return cls._make(row)
+  # Row classes are cached by column signature, since creating
+  # a new namedtuple class for every row is expensive.
+  fields = tuple(column[0] for column in cursor.description)
+  return _row_class(fields)._make(row)
 
 
 # def adapt_timestamp(ts: Timestamp) -> str:
@@ -53,6 +64,15 @@ def namedtuple_factory(cursor, row):
 #   return Timestamp.parse(val.decode())
 
 
+# Callback invoked by the sqlite3 online backup API after every step,
+# with arguments (status, remaining pages, total pages).
+BackupProgress = Callable[[int, int, int], None]
+
+# Callback invoked by Database.export_tables after every exported table,
+# with arguments (table, number of exported records).
+ExportProgress = Callable[[str, int], None]
+
+
 def _get_sqlite3_thread_safety():
   # Mape value from SQLite's THREADSAFE to Python's DBAPI 2.0
   # threadsafety attribute.
@@ -82,6 +102,18 @@ class Database:
 
   THREAD_SAFE = _get_sqlite3_thread_safety()
 
+  # RETURNING clauses are supported since SQLite 3.35.0
+  UPDATE_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+  MAX_QUERY_PARAMS = 500
+
+  PREFETCH_RELATIONS = frozenset(["owner", "owned"])
+
+  # Codec used to store structured fields. Rows written by previous versions
+  # (or with another codec) are still decoded, and converted when saved again.
+  # None stores them as YAML text, like previous versions did.
+  COLUMN_CODEC: ColumnCodec | None = DEFAULT_CODEC
+
   def __init__(self, root: Path | None = None, create: bool = False) -> None:
     assert self.THREAD_SAFE
     if root is None:
@@ -91,7 +123,12 @@ class Database:
     self.root = root.resolve()
     self.log = Logger.sublogger(f"db<{Logger.format_dir(self.root)}>")
     self._cursor = None
-    self._cache = {}
+    self._cache: dict[str, IdentityMap] = {}
+    # Keys of cached objects (table, id) saved or loaded by the current
+    # transaction. They are evicted from the cache if the transaction fails.
+    self._tx_cached: set[tuple[str, object]] = set()
+    self._tx_depth = 0
+    self.column_codec = self.COLUMN_CODEC
     self.db_file = self.root / self.DB_NAME
     if not self.db_file.exists():
       if not create:
@@ -100,20 +137,39 @@ class Database:
       self.db_file.touch(mode=0o600)
     elif create:
       raise ValueError("directory already initialized", self.root)
+    self.profiler = DatabaseProfiler.current()
+    self.operation_time = Metrics.current().histogram(
+      "uno_db_operation_seconds",
+      "Duration of the database operations, by name.",
+      ["operation"],
+    )
     self._db = sqlite3.connect(
       self.db_file,
       isolation_level="DEFERRED",
       detect_types=sqlite3.PARSE_DECLTYPES,
       check_same_thread=False,
+      **({"factory": ProfiledConnection} if self.profiler is not None else {}),
     )
+    if self.profiler is not None:
+      self._db.profiler = self.profiler
     self._db.row_factory = namedtuple_factory
+    self._query_listeners: list[Callable[[str], None]] = []
 
     def _tracer(query) -> None:
       self.log.tracedbg("exec SQL:\n{}", query)
+      for listener in self._query_listeners:
+        listener(query)
 
     self._db.set_trace_callback(_tracer)
     if create:
       self.initialize()
+    # Decrypt the key of the secret columns, if the database has one
+    # (see encrypt_secrets()). The master key is not kept in memory.
+    try:
+      self.secrets = SecretBox.open(self._db)
+    except Exception:
+      self._db.close()
+      raise
     # sqlite3.register_adapter(Timestamp, adapt_timestamp)
     # sqlite3.register_converter("timestamp", convert_timestamp)
     # for t in [dict, list, set]:
@@ -125,12 +181,16 @@ class Database:
 
   def next_id(self, target: DatabaseObject | type[DatabaseObject]) -> int:
     table = self.SCHEMA.lookup_id_table_by_object(target)
-    next_id = (
-      self._db.execute("SELECT next FROM next_id WHERE target = ?", (table,)).fetchone().next
-    )
-    next_id += 1
-    self._db.execute("UPDATE next_id SET next = ? WHERE target = ?", (next_id, table))
-    return next_id
+    # Increment and read the counter with a single statement, so that the
+    # write lock is acquired before the value is read, and multiple
+    # processes sharing the database never allocate the same id.
+    if self.UPDATE_RETURNING:
+      (row,) = self._db.execute(
+        "UPDATE next_id SET next = next + 1 WHERE target = ? RETURNING next", (table,)
+      ).fetchall()
+      return row.next
+    self._db.execute("UPDATE next_id SET next = next + 1 WHERE target = ?", (table,))
+    return self._db.execute("SELECT next FROM next_id WHERE target = ?", (table,)).fetchone().next
 
   def initialize(self) -> None:
     for script in ["initialize_registry.sql", "initialize_agent.sql"]:
@@ -141,6 +201,177 @@ class Database:
   def close(self) -> None:
     self._db.close()
 
+  def _table_cache(self, table: str) -> IdentityMap:
+    cache = self._cache.get(table)
+    if cache is None:
+      cls = self.SCHEMA.lookup_object_by_table(table, required=False) or DatabaseObject
+      cache = self._cache[table] = IdentityMap(capacity=cls.DB_CACHE_SIZE)
+    return cache
+
+  def _cache_touched(self, table: str, obj_id: object) -> None:
+    if self._tx_depth > 0:
+      self._tx_cached.add((table, obj_id))
+
+  def cache_stats(self) -> dict[str, dict[str, int]]:
+    return {
+      table: {
+        "hits": cache.hits,
+        "misses": cache.misses,
+        "size": len(cache),
+        "retained": cache.retained,
+      }
+      for table, cache in sorted(self._cache.items())
+    }
+
+  def clear_cache(self) -> None:
+    for cache in self._cache.values():
+      cache.clear()
+
+  def secret_columns(self) -> dict[str, list[str]]:
+    """Return the columns of every table which store secret properties."""
+    result = {}
+    for cls in self.SCHEMA.objects():
+      columns = cls.SCHEMA.secret_properties & cls.SCHEMA.db_table_properties
+      if columns:
+        table = self.SCHEMA.lookup_table_by_object(cls)
+        result[table] = sorted({*result.get(table, []), *columns})
+    return result
+
+  def dump_secret(self, table: str, column: str, val: str) -> str | bytes:
+    if self.secrets is None:
+      return val
+    return self.secrets.encrypt(table, column, val)
+
+  def load_secret(self, table: str, column: str, val: bytes) -> str:
+    if self.secrets is None:
+      raise MissingMasterKey("encrypted value in a database without secrets key", table, column)
+    return self.secrets.decrypt(table, column, val)
+
+  @inject_transaction
+  def encrypt_secrets(
+    self,
+    master_key: MasterKey,
+    cursor: "Database.Cursor | None" = None,
+    do_in_transaction: TransactionHandler | None = None,
+  ) -> None:
+    """Encrypt the secret columns of an existing database in place.
+
+    Values saved afterwards are encrypted when they are stored,
+    and decrypted only when they are loaded."""
+    if self.secrets is not None:
+      raise ValueError("database secrets already encrypted", self.root)
+
+    def _encrypt() -> None:
+      secrets = SecretBox.create(cursor, master_key)
+      for table, columns in self.secret_columns().items():
+        count = 0
+        for row in cursor.execute(f"SELECT id, {', '.join(columns)} FROM {table}").fetchall():
+          values = {
+            c: secrets.encrypt(table, c, v)
+            for c in columns
+            for v in [getattr(row, c)]
+            if isinstance(v, str)
+          }
+          if values:
+            self.update_where(table, "id = ?", values, params=(row.id,), cursor=cursor)
+            count += 1
+        self.log.activity("encrypted {} {} records", count, table)
+      self.secrets = secrets
+
+    do_in_transaction(_encrypt)
+    self.log.warning("database secrets encrypted with {}", master_key)
+
+  def assert_secrets(self) -> None:
+    """Encrypt the secret columns if a master key is configured and they are
+    still stored in plaintext, e.g. in a new database, or in one extracted
+    from a package."""
+    if self.secrets is not None:
+      return
+    master_key = MasterKey.load()
+    if master_key is None:
+      return
+    self.encrypt_secrets(master_key)
+
+  @inject_transaction
+  def rotate_master_key(
+    self,
+    master_key: MasterKey,
+    cursor: "Database.Cursor | None" = None,
+    do_in_transaction: TransactionHandler | None = None,
+  ) -> None:
+    """Encrypt the key of the secret columns with a new master key.
+    The columns themselves are not modified."""
+    if self.secrets is None:
+      raise ValueError("database secrets not encrypted", self.root)
+    secrets = self.secrets.rewrap(master_key)
+    do_in_transaction(lambda: secrets.store(cursor))
+    self.secrets = secrets
+    self.log.warning("database secrets key encrypted with {}", master_key)
+
+  @contextlib.contextmanager
+  def count_queries(self) -> Generator[list[str], None, None]:
+    # Collect every SQL statement executed while the context is active
+    queries = []
+    self._query_listeners.append(queries.append)
+    try:
+      yield queries
+    finally:
+      self._query_listeners.remove(queries.append)
+
+  @contextlib.contextmanager
+  def operation(self, name: str) -> Generator[None, None, None]:
+    # Group all queries performed within the context for profiling
+    with self.operation_time.time(operation=name):
+      if self.profiler is None:
+        yield
+      else:
+        with self.profiler.operation(name):
+          yield
+
+  @contextlib.contextmanager
+  def _in_transaction(self, name: str = "transaction") -> Generator[None, None, None]:
+    self._tx_depth += 1
+    try:
+      if self._tx_depth > 1:
+        # Nested transactions become savepoints of the outermost one,
+        # so that they are committed (or rolled back) together with it.
+        with self.operation(name), self._savepoint(f"tx_{self._tx_depth}"):
+          yield
+      else:
+        with self.operation(name), self._db:
+          yield
+    except Exception:
+      # The transaction was rolled back, drop every object that it
+      # might have modified, so that it will be reloaded from the database.
+      for table, obj_id in self._tx_cached:
+        cached = self._cache.get(table)
+        if cached is not None and cached.pop(obj_id) is not None:
+          self.log.tracedbg("cache evict on rollback: {}({})", table, obj_id)
+      if self._tx_depth == 1:
+        self._tx_cached.clear()
+      raise
+    else:
+      if self._tx_depth == 1:
+        self._tx_cached.clear()
+    finally:
+      self._tx_depth -= 1
+
+  @contextlib.contextmanager
+  def _savepoint(self, name: str) -> Generator[None, None, None]:
+    if not self._db.in_transaction:
+      # Otherwise the savepoint would start (and its release commit)
+      # a transaction of its own
+      self._db.execute("BEGIN")
+    self._db.execute(f"SAVEPOINT {name}")
+    try:
+      yield
+    except Exception:
+      self._db.execute(f"ROLLBACK TO SAVEPOINT {name}")
+      self._db.execute(f"RELEASE SAVEPOINT {name}")
+      raise
+    else:
+      self._db.execute(f"RELEASE SAVEPOINT {name}")
+
   @inject_transaction
   def save(
     self,
@@ -203,9 +434,9 @@ class Database:
     cursor: "Database.Cursor | None" = None,
     do_in_transaction: TransactionHandler | None = None,
   ) -> list[DatabaseObject]:
-    def owner_str(tgt):
+    def owner_str(tgt, owner):
       if isinstance(tgt, OwnableDatabaseObject):
-        return f" (owner: {tgt.owner})"
+        return f" (owner: {owner if owner is not None else tgt._owner})"
       return ""
 
     def iter_query_targets() -> Generator[DatabaseObject, None, None]:
@@ -238,17 +469,23 @@ class Database:
                 tgt.loaded,
               )
               raise
-          if isinstance(tgt, OwnableDatabaseObject) and tgt.id:
-            owner = self.owner(tgt, cursor=cursor)
-          else:
-            owner = None
-          yield tgt, owner
+          yield tgt
         if validation_failed:
           raise RuntimeError("validation failed", validation_failed)
 
     def do_save():
       saved = []
-      query_targets = dict(iter_query_targets())
+      collected = list(dict.fromkeys(iter_query_targets()))
+      # Resolve the current owners of all targets with one query per owner table
+      current_owners = self._load_owners(
+        [tgt for tgt in collected if isinstance(tgt, OwnableDatabaseObject) and tgt.id],
+        cursor=cursor,
+      )
+      for tgt, owner in current_owners.items():
+        # Cache the owner, so that it won't be queried again by serialize()
+        if tgt._owner is None:
+          tgt.__dict__.setdefault("owner", owner)
+      query_targets = {tgt: current_owners.get(tgt) for tgt in collected}
       self.log.debug("save targets: {}", query_targets)
       for tgt, current_owner in query_targets.items():
         table = self.SCHEMA.lookup_table_by_object(tgt, required=False)
@@ -261,7 +498,7 @@ class Database:
             "inserting new" if create else "saving",
             tgt.__class__.__qualname__,
             tgt,
-            owner_str(tgt),
+            owner_str(tgt, current_owner),
           )
         else:
           logger("saving {}: {}", tgt.__class__.__qualname__, tgt)
@@ -269,7 +506,9 @@ class Database:
         if tgt.disposed:
           self.delete(tgt, cursor=cursor, do_in_transaction=lambda action: action())
         else:
-          tgt.save(cursor=cursor, create=create, import_record=import_record, public=public)
+          tgt.save(
+            cursor=cursor, create=create, import_record=import_record, public=public, target=self
+          )
           tgt.clear_changed()
           tgt.saved = True
           tgt.loaded = table is not None
@@ -280,7 +519,7 @@ class Database:
               "inserted" if create else "updated",
               tgt.__class__.__qualname__,
               tgt,
-              owner_str(tgt),
+              owner_str(tgt, current_owner),
             )
           else:
             logger_result("saved {}: {}", tgt.__class__.__qualname__, tgt)
@@ -318,7 +557,10 @@ class Database:
         # Check if records for the specified keys exist, and if so, delete them
         for key_fields in obj.DB_TABLE_KEYS:
           key_fields = sorted(key_fields)
-          key_params = [getattr(obj, f) for f in key_fields]
+          # Secret values are compared as stored (i.e. possibly encrypted)
+          key_params = [
+            fields[f] if f in obj.SCHEMA.secret_properties else getattr(obj, f) for f in key_fields
+          ]
           key_where = " AND ".join(f + " = ?" for f in key_fields)
           self.delete_where(table, where=key_where, params=key_params, cursor=cursor)
 
@@ -346,6 +588,7 @@ class Database:
         (*sorted_values, obj.id),
       )
     cursor.execute(*query)
+    self._cache_touched(table, obj.id)
     if not db_args["import_record"]:
       obj.reset_cached_properties()
 
@@ -449,6 +692,7 @@ class Database:
     owner: DatabaseObjectOwner | None = None,
     load_args: dict[str, object] | None = None,
     use_cache: bool = True,
+    prefetch: Iterable[str] | None = None,
     cursor: "Database.Cursor|None" = None,
   ) -> Generator[Versioned, None, None]:
     if cls is None:
@@ -460,12 +704,13 @@ class Database:
         raise TypeError(cls)
       table = self.SCHEMA.lookup_table_by_object(cls)
 
-    cache = self._cache[table] = self._cache.get(table, {})
+    cache = self._table_cache(table)
 
     def _check_cache(obj_id) -> Versioned | None:
       if not use_cache:
         return None
-      cached = cache.get(obj_id)
+      # Misses are recorded by deserialize()
+      cached = cache.get(obj_id, count_miss=False)
       if cached:
         self.log.tracedbg("cache hit {}: {}", cached.__class__.__qualname__, cached)
       return cached
@@ -528,7 +773,7 @@ class Database:
           query = (
             f"SELECT {table}.* FROM {table} "
             f"INNER JOIN {owner_table} "
-            f"ON {table}.id = {owner_table}.{owned_col}"
+            f"ON {table}.id = {owner_table}.{owned_col} "
             f"WHERE {owner_table}.{owner_col} = ?{where_expr}{join_order_by_clause}",
             (json.dumps(owner.object_id), *(params or [])),
           )
@@ -561,22 +806,168 @@ class Database:
 
     self.log.tracedbg("load targets: {}", load_targets)
 
-    for row in load_targets:
-      if isinstance(row, DatabaseObject):
-        yield row
-        continue
+    loaded = (
+      row
+      if isinstance(row, DatabaseObject)
+      else self._load_row(cls, row, owner=owner, load_args=load_args)
+      for row in load_targets
+    )
+    if not prefetch:
+      yield from loaded
+      return
 
-      serialized = row._asdict()
-      serialized["owner"] = owner
-      if load_args:
-        serialized.update(load_args)
+    loaded = list(loaded)
+    self.prefetch(loaded, prefetch, cursor=cursor)
+    yield from loaded
 
-      loaded, cached = cls.load(self, serialized)
-      if not cached:
-        loaded.saved = True
-        loaded.loaded = True
+  def _load_row(
+    self,
+    cls: type[DatabaseObject],
+    row: tuple,
+    owner: DatabaseObjectOwner | None = None,
+    load_args: dict[str, object] | None = None,
+  ) -> DatabaseObject:
+    serialized = row._asdict()
+    for k, v in serialized.items():
+      if SecretBox.encrypted(v):
+        serialized[k] = self.load_secret(self.SCHEMA.lookup_table_by_object(cls), k, v)
+      elif isinstance(v, bytes):
+        serialized[k] = load_column(v)
+    serialized["owner"] = owner
+    if load_args:
+      serialized.update(load_args)
+
+    loaded, cached = cls.load(self, serialized)
+    if not cached:
+      loaded.saved = True
+      loaded.loaded = True
+
+    return loaded
+
+  def _select_in(
+    self, cursor: "Database.Cursor", query: str, values: Iterable[object], suffix: str = ""
+  ) -> Generator[tuple, None, None]:
+    # Run a query with an "IN (...)" clause over the specified values,
+    # splitting them in chunks to stay within SQLite's parameters limit.
+    values = list(values)
+    for i in range(0, len(values), self.MAX_QUERY_PARAMS):
+      chunk = values[i : i + self.MAX_QUERY_PARAMS]
+      yield from cursor.execute(f"{query} IN ({', '.join('?' for _ in chunk)}){suffix}", chunk)
+
+  def _order_by_clause(self, cls: type[DatabaseObject]) -> str:
+    if not cls.DB_ORDER_BY:
+      return ""
+    return " ORDER BY " + ", ".join(
+      f"{col} {'ASC' if asc else 'DESC'}" for col, asc in cls.DB_ORDER_BY.items()
+    )
 
-      yield loaded
+  @inject_cursor
+  def prefetch(
+    self,
+    targets: Iterable[DatabaseObject],
+    relations: Iterable[str],
+    cursor: "Database.Cursor | None" = None,
+  ) -> None:
+    targets = list(targets)
+    relations = set(relations)
+    unknown = relations - self.PREFETCH_RELATIONS
+    if unknown:
+      raise ValueError("unsupported prefetch relations", sorted(unknown))
+    if "owner" in relations:
+      ownables = [t for t in targets if isinstance(t, OwnableDatabaseObject)]
+      for tgt, owner in self._load_owners(ownables, cursor=cursor).items():
+        if tgt._owner is None:
+          tgt.__dict__["owner"] = owner
+    if "owned" in relations:
+      owners = [t for t in targets if isinstance(t, DatabaseObjectOwner)]
+      for owner, owned in self._load_owned(owners, cursor=cursor).items():
+        owner.__dict__["owned"] = owned
+
+  @inject_cursor
+  def _load_owners(
+    self,
+    targets: Iterable[OwnableDatabaseObject],
+    cursor: "Database.Cursor | None" = None,
+  ) -> dict[OwnableDatabaseObject, DatabaseObjectOwner | None]:
+    targets = [t for t in targets if t.id is not None]
+    by_cls: dict[type[OwnableDatabaseObject], list[OwnableDatabaseObject]] = {}
+    for tgt in targets:
+      by_cls.setdefault(tgt.__class__, []).append(tgt)
+
+    # Read the owner ids of all targets, one query per owner table
+    owner_ids: dict[OwnableDatabaseObject, tuple[str, object]] = {}
+    for cls, cls_targets in by_cls.items():
+      searched_tables = set()
+      for owner_cls in cls.owner_types():
+        owner_table, owner_col, owned_col = self.SCHEMA.lookup_owner_table_by_object(
+          cls, owner_cls=owner_cls
+        )
+        if owner_table in searched_tables:
+          continue
+        searched_tables.add(owner_table)
+        pending = {t.id: t for t in cls_targets if t not in owner_ids}
+        if not pending:
+          break
+        for owned_id, owner_id in self._select_in(
+          cursor, f"SELECT {owned_col}, {owner_col} FROM {owner_table} WHERE {owned_col}", pending
+        ):
+          if owner_id is None:
+            continue
+          owner_ids[pending[owned_id]] = tuple(Versioned.json_load(owner_id))
+
+    # Load all owners, one query per table, skipping those already in memory
+    owners: dict[tuple[str, object], DatabaseObjectOwner] = {}
+    by_table: dict[str, set] = {}
+    for owner_table, owner_id in owner_ids.values():
+      cached = self._table_cache(owner_table).get(owner_id, count_miss=False)
+      if cached is not None:
+        owners[(owner_table, owner_id)] = cached
+      else:
+        by_table.setdefault(owner_table, set()).add(owner_id)
+    for owner_table, table_ids in by_table.items():
+      owner_cls = self.SCHEMA.lookup_object_by_table(owner_table)
+      for row in self._select_in(
+        cursor, f"SELECT * FROM {owner_table} WHERE id", sorted(table_ids)
+      ):
+        owners[(owner_table, row.id)] = self._load_row(owner_cls, row)
+
+    result = {tgt: owners.get(owner_ids.get(tgt)) for tgt in targets}
+    self.log.tracedbg("loaded owners: {}", result)
+    return result
+
+  @inject_cursor
+  def _load_owned(
+    self,
+    owners: Iterable[DatabaseObjectOwner],
+    cursor: "Database.Cursor | None" = None,
+  ) -> dict[DatabaseObjectOwner, set[OwnableDatabaseObject]]:
+    result = {owner: set() for owner in owners if owner.object_id is not None}
+    by_cls: dict[type[DatabaseObjectOwner], dict[str, DatabaseObjectOwner]] = {}
+    for owner in result:
+      by_cls.setdefault(owner.__class__, {})[Versioned.json_dump(owner.object_id)] = owner
+
+    for owner_cls, cls_owners in by_cls.items():
+      for owned_cls in owner_cls.owned_types():
+        table = self.SCHEMA.lookup_table_by_object(owned_cls)
+        owner_table, owner_col, _ = self.SCHEMA.lookup_owner_table_by_object(
+          owned_cls, owner_cls=owner_cls
+        )
+        if owner_table != table:
+          # Ownership stored in an external table, load each owner's objects
+          for owner in cls_owners.values():
+            result[owner].update(self.load(owned_cls, owner=owner, cursor=cursor))
+          continue
+        for row in self._select_in(
+          cursor,
+          f"SELECT * FROM {table} WHERE {owner_col}",
+          cls_owners,
+          suffix=self._order_by_clause(owned_cls),
+        ):
+          owner = cls_owners[getattr(row, owner_col)]
+          result[owner].add(self._load_row(owned_cls, row, owner=owner))
+
+    self.log.tracedbg("loaded owned objects: {}", result)
+    return result
 
   @inject_cursor
   def load_object_id(
@@ -618,8 +1009,11 @@ class Database:
           continue
         self._set_ownership(owner, [tgt], owned=False)
       for tgt in _query_targets():
-        table = self.SCHEMA.lookup_table_by_object(obj)
-        self._cache.pop(tgt.id, None)
+        table = self.SCHEMA.lookup_table_by_object(tgt, required=False)
+        if table is None:
+          # Transient objects are stored by their parent
+          continue
+        self._table_cache(table).pop(tgt.id)
         self._delete(
           table, f"DELETE FROM {table} WHERE id = ?", [tgt.id], tgt.__class__, cursor=cursor
         )
@@ -633,7 +1027,7 @@ class Database:
     cache = None
     cached = None
     if table is not None:
-      cache = self._cache[table] = self._cache.get(table, {})
+      cache = self._table_cache(table)
 
     if "id" in serialized and cache is not None and use_cache:
       cached = cache.get(serialized["id"])
@@ -666,7 +1060,8 @@ class Database:
       and cache is not None
       and cached is None
     ):
-      cache[loaded_id] = loaded
+      cache.put(loaded_id, loaded)
+      self._cache_touched(table, loaded_id)
       self.log.tracedbg("cached {}: {}", loaded.__class__.__qualname__, loaded)
 
     return loaded, cached is not None
@@ -818,6 +1213,7 @@ class Database:
     self,
     target: "Database",
     classes: Iterable[type[DatabaseObject]],
+    progress: ExportProgress | None = None,
     cursor: "Database.Cursor | None" = None,
     do_in_transaction: TransactionHandler | None = None,
   ) -> None:
@@ -836,29 +1232,28 @@ class Database:
           else []
         )
 
-        # Read table SQL definition
-        # l_cursor = self._db.cursor()
         t_cursor = target._db.cursor()
-        # table_sql_create = l_cursor.execute(
-        #   f"SELECT sql FROM sqlite_master WHERE type = ? and name = ?",
-        #   ("table", table)).fetchone().sql
 
         def _export_table(table) -> None:
           if table in already_exported:
             return
-          table_count = 0
           self.log.debug("exporting table {} to {}", table, target)
           query, params = exported_cls.importable_query(table)
           assert query is not None
-          for row in cursor.execute(query, params or tuple()):
-            self.log.debug("export record {}: {}", table, row)
-            t_cursor.execute(
-              f"INSERT INTO {table} ({', '.join(f for f in row._fields)}) VALUES ({', '.join('?' for _ in row._fields)})",
-              row,
+          rows = cursor.execute(query, params or tuple()).fetchall()
+          if rows:
+            # All rows share the same columns, so a single INSERT statement
+            # can be used to copy them in bulk.
+            fields = rows[0]._fields
+            # The target might be read on a host without the optional codecs
+            t_cursor.executemany(
+              f"INSERT INTO {table} ({', '.join(fields)}) VALUES ({', '.join('?' for _ in fields)})",
+              [tuple(map(portable_column, row)) for row in rows],
             )
-            table_count += 1
           already_exported.add(table)
-          self.log.activity("exported {} records for table {} to {}", table_count, table, target)
+          self.log.activity("exported {} records for table {} to {}", len(rows), table, target)
+          if progress is not None:
+            progress(table, len(rows))
 
         with target._db:
           _export_table(table)
@@ -873,16 +1268,37 @@ class Database:
   ) -> None:
     target.save_all(objects, import_record=True, public=public, force_insert=True)
 
+  def backup(self, target: Path, pages: int = -1, progress: BackupProgress | None = None) -> None:
+    # Use SQLite's online backup API, which produces a consistent
+    # snapshot even if other connections are writing to the database.
+    self.log.debug("backing up database to {}", target)
+    target_db = sqlite3.connect(target)
+    try:
+      self._db.backup(target_db, pages=pages, progress=progress)
+    finally:
+      target_db.close()
+    self.log.activity("database backed up to {}", target)
+
+  def restore(self, source: Path, pages: int = -1, progress: BackupProgress | None = None) -> None:
+    self.log.debug("restoring database from {}", source)
+    source_db = sqlite3.connect(source)
+    try:
+      source_db.backup(self._db, pages=pages, progress=progress)
+    finally:
+      source_db.close()
+    self.log.activity("database restored from {}", source)
+
   @inject_transaction
   def import_other(
     self,
     target: "Database",
+    progress: BackupProgress | None = None,
     cursor: "Database.Cursor|None" = None,
     do_in_transaction: TransactionHandler | None = None,
   ) -> None:
     # Make a backup of the current database
-    db_file_bkp = f"{self.db_file}.bkp"
-    exec_command(["cp", "-av", self.db_file, db_file_bkp])
+    db_file_bkp = Path(f"{self.db_file}.bkp")
+    self.backup(db_file_bkp, progress=progress)
 
     def _import() -> None:
       self.log.activity("importing database: {}", target)
@@ -910,9 +1326,11 @@ class Database:
     except Exception as e:
       # Restore backup
       self.log.debug("restoring database on error: {}", e)
-      result = exec_command(["cp", "-av", db_file_bkp, self.db_file], noexcept=True)
-      if result.returncode != 0:
+      try:
+        self.restore(db_file_bkp)
+      except sqlite3.Error as restore_e:
         self.log.error("failed to restore database backup: {}", db_file_bkp)
+        self.log.exception(restore_e)
       self.log.warning("database returned to previous state on error: {}", e)
       raise
 
@@ -920,7 +1338,7 @@ class Database:
   def transaction(self) -> Generator["Database.Cursor", None, None]:
     if self._cursor is None:
       self._cursor = self._db.cursor()
-    with self._db:
+    with self._in_transaction():
       yield self._cursor
 
   # def import_object(self, obj: DatabaseObject) -> None:
@@ -2,7 +2,8 @@ from functools import cached_property
 from typing import Generator, Callable, TYPE_CHECKING
 from functools import wraps
 from collections.abc import Iterable
-import yaml
+
+from ..core.yaml_codec import add_representer
 
 if TYPE_CHECKING:
   from .database import Database
@@ -191,7 +192,7 @@ class _OmittedValue:
     return "<omitted>"
 
 
-yaml.add_representer(_OmittedValue, lambda dumper, data: dumper.represent_none(None))
+add_representer(_OmittedValue, lambda dumper, data: dumper.represent_none(None))
 
 TransactionHandler = Callable[[Callable[[], None], None], None]
 
@@ -246,7 +247,7 @@ def _define_inject_transaction(
 
       def do_in_transaction(action: Callable[[], None]):
         db.log.tracedbg("transaction BEGIN")
-        with db._db:
+        with db._in_transaction(wrapped.__qualname__):
           res = action()
         db.log.tracedbg("transaction END")
         return res
@@ -278,6 +279,9 @@ class DatabaseObject:
   DB_TABLE_PROPERTIES: list[str] = []
   DB_TABLE_KEYS: list[str] = []
   DB_CACHED: bool = True
+  # Number of recently used objects which are always kept in memory by the
+  # database cache. Other objects are cached only while referenced elsewhere.
+  DB_CACHE_SIZE: int = 128
   DB_EXPORTABLE: bool = True
   DB_IMPORTABLE: bool = True
   DB_IMPORTABLE_WHERE: tuple[str, tuple] | None = None
@@ -0,0 +1,262 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from typing import Generator, TextIO
+import atexit
+import contextlib
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from ..core.log import Logger
+
+log = Logger.sublogger("db-profiler")
+
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_template(sql: str) -> str:
+  """Reduce an SQL statement to its "shape", by replacing literal
+  values with placeholders, and collapsing lists of placeholders."""
+  template = _STRING_LITERAL.sub("?", sql)
+  template = _NUMBER_LITERAL.sub("?", template)
+  template = _IN_LIST.sub("IN (...)", template)
+  return _WHITESPACE.sub(" ", template).strip()
+
+
+class StatementStats:
+  def __init__(self, template: str) -> None:
+    self.template = template
+    self.count = 0
+    self.rows = 0
+    self.latencies: list[float] = []
+
+  @property
+  def total_time(self) -> float:
+    return sum(self.latencies)
+
+  @property
+  def p95_time(self) -> float:
+    if not self.latencies:
+      return 0.0
+    ordered = sorted(self.latencies)
+    return ordered[max(0, math.ceil(len(ordered) * 0.95) - 1)]
+
+
+class RepeatedStatement:
+  def __init__(self, operation: str, template: str, count: int) -> None:
+    self.operation = operation
+    self.template = template
+    self.count = count
+
+  def __str__(self) -> str:
+    return f"{self.operation}: {self.count} x {self.template}"
+
+
+class DatabaseProfiler:
+  """Aggregate statistics about the SQL statements executed by Database objects.
+
+  The profiler is disabled by default. It can be enabled by setting
+  UNO_PROFILE_DB in the environment, or with `uno --profile-db`.
+
+  Statements are aggregated by "template" (see statement_template()).
+  SELECT statements repeated at least N_PLUS_ONE_MIN_REPEAT times within
+  the same logical operation (see operation()) are reported as probable
+  N+1 query patterns.
+  """
+
+  ENV_VAR = "UNO_PROFILE_DB"
+  N_PLUS_ONE_MIN_REPEAT = 10
+
+  _Instance: "DatabaseProfiler | None" = None
+
+  def __init__(self, n_plus_one_min_repeat: int | None = None) -> None:
+    self.n_plus_one_min_repeat = (
+      n_plus_one_min_repeat if n_plus_one_min_repeat is not None else self.N_PLUS_ONE_MIN_REPEAT
+    )
+    self.statements: dict[str, StatementStats] = {}
+    self.repeated: list[RepeatedStatement] = []
+    self._lock = threading.Lock()
+    self._local = threading.local()
+
+  @classmethod
+  def current(cls) -> "DatabaseProfiler | None":
+    if cls._Instance is None and os.environ.get(cls.ENV_VAR, "").lower() in ("1", "true", "yes"):
+      cls.enable()
+    return cls._Instance
+
+  @classmethod
+  def enable(cls, report_at_exit: bool = True) -> "DatabaseProfiler":
+    if cls._Instance is None:
+      cls._Instance = cls()
+      if report_at_exit:
+        atexit.register(cls._Instance.report)
+      log.activity("database profiler enabled")
+    return cls._Instance
+
+  @property
+  def _operations(self) -> list[tuple[str, dict[str, int]]]:
+    operations = getattr(self._local, "operations", None)
+    if operations is None:
+      operations = self._local.operations = []
+    return operations
+
+  @contextlib.contextmanager
+  def operation(self, name: str) -> Generator[None, None, None]:
+    operations = self._operations
+    # Nested operations are considered part of the outermost one
+    if operations:
+      yield
+      return
+    executed = {}
+    operations.append((name, executed))
+    try:
+      yield
+    finally:
+      operations.pop()
+      for template, count in executed.items():
+        if count < self.n_plus_one_min_repeat:
+          continue
+        repeated = RepeatedStatement(name, template, count)
+        with self._lock:
+          self.repeated.append(repeated)
+        log.warning("probable N+1 query pattern in {}", repeated)
+
+  def record(self, sql: str, elapsed: float) -> StatementStats:
+    template = statement_template(sql)
+    with self._lock:
+      stats = self.statements.get(template)
+      if stats is None:
+        stats = self.statements[template] = StatementStats(template)
+      stats.count += 1
+      stats.latencies.append(elapsed)
+    operations = self._operations
+    if operations and template[:6].upper() == "SELECT":
+      _, executed = operations[0]
+      executed[template] = executed.get(template, 0) + 1
+    return stats
+
+  def record_rows(self, stats: StatementStats, rows: int, elapsed: float) -> None:
+    with self._lock:
+      stats.rows += rows
+      if stats.latencies:
+        stats.latencies[-1] += elapsed
+
+  def report(self, output: TextIO | None = None) -> None:
+    from tabulate import tabulate
+
+    output = output or sys.stderr
+    with self._lock:
+      statements = sorted(self.statements.values(), key=lambda s: s.total_time, reverse=True)
+      repeated = list(self.repeated)
+    if not statements:
+      return
+    table = [
+      [
+        s.count,
+        f"{s.total_time * 1000:.3f}",
+        f"{s.p95_time * 1000:.3f}",
+        s.rows,
+        s.template,
+      ]
+      for s in statements
+    ]
+    print(
+      tabulate(
+        table,
+        headers=["Count", "Total (ms)", "p95 (ms)", "Rows", "Statement"],
+        tablefmt="rounded_outline",
+        maxcolwidths=[None, None, None, None, 80],
+      ),
+      file=output,
+    )
+    if repeated:
+      print(
+        tabulate(
+          [[r.operation, r.count, r.template] for r in repeated],
+          headers=["Operation", "Repeated", "Probable N+1 Statement"],
+          tablefmt="rounded_outline",
+          maxcolwidths=[None, None, 80],
+        ),
+        file=output,
+      )
+
+
+class ProfiledCursor(sqlite3.Cursor):
+  profiler: DatabaseProfiler
+
+  def execute(self, sql: str, parameters=()) -> "ProfiledCursor":
+    start = time.perf_counter()
+    try:
+      return super().execute(sql, parameters)
+    finally:
+      self._stats = self.connection.profiler.record(sql, time.perf_counter() - start)
+
+  def executemany(self, sql: str, seq_of_parameters) -> "ProfiledCursor":
+    start = time.perf_counter()
+    try:
+      return super().executemany(sql, seq_of_parameters)
+    finally:
+      self._stats = self.connection.profiler.record(sql, time.perf_counter() - start)
+
+  def _fetched(self, rows: int, start: float) -> None:
+    stats = getattr(self, "_stats", None)
+    if stats is not None:
+      self.connection.profiler.record_rows(stats, rows, time.perf_counter() - start)
+
+  def __next__(self):
+    start = time.perf_counter()
+    row = super().__next__()
+    self._fetched(1, start)
+    return row
+
+  def fetchone(self):
+    start = time.perf_counter()
+    row = super().fetchone()
+    self._fetched(0 if row is None else 1, start)
+    return row
+
+  def fetchmany(self, *a, **kw) -> list:
+    start = time.perf_counter()
+    rows = super().fetchmany(*a, **kw)
+    self._fetched(len(rows), start)
+    return rows
+
+  def fetchall(self) -> list:
+    start = time.perf_counter()
+    rows = super().fetchall()
+    self._fetched(len(rows), start)
+    return rows
+
+
+class ProfiledConnection(sqlite3.Connection):
+  profiler: DatabaseProfiler
+
+  def cursor(self, factory: type = ProfiledCursor) -> sqlite3.Cursor:
+    return super().cursor(factory)
+
+  def execute(self, sql: str, parameters=()) -> sqlite3.Cursor:
+    return self.cursor().execute(sql, parameters)
+
+  def executemany(self, sql: str, seq_of_parameters) -> sqlite3.Cursor:
+    return self.cursor().executemany(sql, seq_of_parameters)
@@ -16,9 +16,9 @@
 from pathlib import Path
 import tempfile
 import json
-import yaml
 
 from ..core.exec import exec_command
+from ..core.yaml_codec import yaml_load
 
 
 def ecc_encrypt(cert: Path, input: Path, output: Path) -> None:
@@ -114,7 +114,7 @@ def ecc_encrypt(cert: Path, input: Path, output: Path) -> None:
 
 def ecc_decrypt(key: Path, input: Path, output: Path) -> None:
   # Read input data from YAML
-  data = yaml.safe_load(input.read_text())
+  data = yaml_load(input.read_text())
 
   tmp_enc_h = tempfile.NamedTemporaryFile()
   tmp_enc = Path(tmp_enc_h.name)
@@ -0,0 +1,76 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from collections import OrderedDict
+import weakref
+
+
+class IdentityMap:
+  """Cache of loaded objects, indexed by their database id.
+
+  Objects are tracked with weak references, so that an object is returned
+  as long as some other component still holds it, but it doesn't remain in
+  memory only because it was loaded once. Optionally, up to `capacity` of the
+  most recently used objects are also retained with strong references.
+  """
+
+  def __init__(self, capacity: int = 0) -> None:
+    if capacity < 0:
+      raise ValueError("invalid cache capacity", capacity)
+    self.capacity = capacity
+    self.hits = 0
+    self.misses = 0
+    self._objects = weakref.WeakValueDictionary()
+    self._recent = OrderedDict()
+
+  def __len__(self) -> int:
+    return len(self._objects)
+
+  def __contains__(self, key: object) -> bool:
+    return key in self._objects
+
+  @property
+  def retained(self) -> int:
+    return len(self._recent)
+
+  def get(self, key: object, count_miss: bool = True) -> object | None:
+    obj = self._objects.get(key)
+    if obj is None:
+      if count_miss:
+        self.misses += 1
+      return None
+    self.hits += 1
+    self._retain(key, obj)
+    return obj
+
+  def put(self, key: object, obj: object) -> None:
+    self._objects[key] = obj
+    self._retain(key, obj)
+
+  def pop(self, key: object) -> object | None:
+    self._recent.pop(key, None)
+    return self._objects.pop(key, None)
+
+  def clear(self) -> None:
+    self._recent.clear()
+    self._objects.clear()
+
+  def _retain(self, key: object, obj: object) -> None:
+    if not self.capacity:
+      return
+    self._recent[key] = obj
+    self._recent.move_to_end(key)
+    while len(self._recent) > self.capacity:
+      self._recent.popitem(last=False)
@@ -14,7 +14,8 @@
 # limitations under the License.
 ###############################################################################
 from enum import Enum
-import yaml
+
+from ..core.yaml_codec import yaml_load
 
 from .cell import Cell
 from .uvn import Uvn
@@ -90,7 +91,7 @@ class KeyId:
     if key_info_end < 0 or key_info_start >= key_info_end:
       raise ValueError("invalid key description", key_desc)
     try:
-      key_info = yaml.safe_load(key_desc[key_info_start:key_info_end])
+      key_info = yaml_load(key_desc[key_info_start:key_info_end])
       return KeyId.deserialize(key_info)
     except Exception:
       raise ValueError("failed to parse key description", key_desc)
@@ -90,6 +90,29 @@ class Packager(Versioned):
         cls.log.exception(i)
       raise
 
+  @classmethod
+  def resign_package(cls, registry: "Registry", package: Path) -> None:
+    """Sign an existing package again with the registry's current serial.
+
+    The package is replaced rather than modified in place, since it might
+    be linked to the copy archived by the registry's history."""
+    cls.log.activity("sign package again: {}", package)
+    tmp_dir_h = tempfile.TemporaryDirectory()
+    tmp_dir = Path(tmp_dir_h.name)
+    if package.suffix == cls.PARTICLE_PACKAGE_EXT:
+      shutil.unpack_archive(package, tmp_dir)
+      registry.package_signer.resign(tmp_dir / package.stem)
+      package.unlink()
+      cls.mkarchive(package, base_dir=tmp_dir, format=package.suffix[1:])
+    else:
+      exec_command(["tar", "xJf", package.resolve()], cwd=tmp_dir)
+      registry.package_signer.resign(tmp_dir)
+      package.unlink()
+      cls.mkarchive(
+        package, base_dir=tmp_dir, files=[f for f in sorted(tmp_dir.rglob("*")) if f.is_file()]
+      )
+    cls.log.info("package signed again: {}", package)
+
   @classmethod
   def generate_cell_agent_package(cls, registry: "Registry", cell: Cell, output_dir: Path) -> None:
     # Check that the uvn has been deployed
@@ -131,6 +154,17 @@ class Packager(Versioned):
     db = registry.generate_cell_database(cell, root=tmp_dir)
     package_files.append(db.db_file)
 
+    # Sign the package's contents
+    package_files.extend(
+      registry.package_signer.sign(
+        tmp_dir,
+        package_files,
+        uvn=registry.uvn.name,
+        owner=cell.object_id,
+        config_id=registry.config_id,
+      )
+    )
+
     # Store all files in a single archive
     cls.mkarchive(agent_package, base_dir=tmp_dir, files=package_files)
 
@@ -266,6 +300,14 @@ class Packager(Versioned):
       },
     )
 
+    registry.package_signer.sign(
+      tmp_dir,
+      [f for f in tmp_dir.glob("**/*") if f.is_file()],
+      uvn=registry.uvn.name,
+      owner=particle.object_id,
+      config_id=registry.config_id,
+    )
+
     particle_archive = output_dir / particle_archive_name
     cls.mkarchive(
       particle_archive, base_dir=tmp_dir.parent, format=Path(particle_archive_name).suffix[1:]
@@ -0,0 +1,268 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from pathlib import Path, PurePosixPath
+from typing import Generator, Iterable, NamedTuple
+import hashlib
+import tarfile
+import tempfile
+import zipfile
+
+from ..core.exec import exec_command
+from ..core.log import Logger
+from ..core.yaml_codec import yaml_dump, yaml_load
+
+log = Logger.sublogger("package-signer")
+
+
+class InvalidPackage(Exception):
+  pass
+
+
+class PackageManifest(NamedTuple):
+  """The description of a package's contents, signed by the registry.
+
+  The serial is incremented every time the registry generates its packages,
+  so that an agent can reject packages older than the one it installed."""
+
+  uvn: str
+  owner: list
+  config_id: str
+  serial: int
+  files: dict[str, str]
+
+  FILENAME = "manifest.yaml"
+  SIGNATURE = "manifest.yaml.sig"
+  SIGNER = "package-signer.pem"
+
+  def dump(self) -> str:
+    return yaml_dump(self._asdict())
+
+  @classmethod
+  def load(cls, val: str | bytes) -> "PackageManifest":
+    try:
+      return cls(**yaml_load(val))
+    except Exception as e:
+      raise InvalidPackage("invalid manifest", e)
+
+  @classmethod
+  def installed(cls, root: Path) -> "PackageManifest | None":
+    manifest = root / cls.FILENAME
+    if not manifest.is_file():
+      return None
+    return cls.load(manifest.read_text())
+
+  @staticmethod
+  def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class PackageSigner:
+  """Sign the manifests of the packages generated by a registry,
+  with a key that never leaves the registry."""
+
+  def __init__(self, root: Path) -> None:
+    self.root = root
+
+  @property
+  def key(self) -> Path:
+    return self.root / "signer-key.pem"
+
+  @property
+  def pubkey(self) -> Path:
+    return self.root / "signer-pubkey.pem"
+
+  @property
+  def serial_file(self) -> Path:
+    return self.root / "serial"
+
+  @property
+  def initialized(self) -> bool:
+    return self.key.is_file()
+
+  @property
+  def serial(self) -> int:
+    return int(self.serial_file.read_text())
+
+  def init(self) -> None:
+    if self.initialized:
+      return
+    log.debug("initializing package signer: {}", self.root)
+    self.root.mkdir(parents=True, exist_ok=True, mode=0o700)
+    exec_command(
+      ["openssl", "ecparam", "-genkey", "-name", "secp384r1", "-noout", "-out", self.key]
+    )
+    self.key.chmod(0o600)
+    exec_command(["openssl", "ec", "-in", self.key, "-pubout", "-out", self.pubkey])
+    self.pubkey.chmod(0o644)
+    self.serial_file.write_text("0")
+    self.serial_file.chmod(0o600)
+    log.info("package signer created: {}", self.pubkey)
+
+  def next_serial(self) -> int:
+    serial = self.serial + 1
+    self.serial_file.write_text(str(serial))
+    return serial
+
+  def sign(
+    self, base_dir: Path, files: Iterable[Path], uvn: str, owner: tuple, config_id: str
+  ) -> list[Path]:
+    """Generate and sign the manifest of a package's files (which must be
+    in base_dir). Return the files that must be added to the package."""
+    manifest = PackageManifest(
+      uvn=uvn,
+      owner=list(owner),
+      config_id=config_id,
+      serial=self.serial,
+      files={
+        str(f.relative_to(base_dir)): PackageManifest.digest(f.read_bytes()) for f in sorted(files)
+      },
+    )
+    return self._sign(base_dir, manifest)
+
+  def resign(self, base_dir: Path) -> None:
+    """Sign the manifest of an (extracted) package again, with the current
+    serial, e.g. to deploy a package generated by a previous generation."""
+    manifest = PackageManifest.installed(base_dir)
+    if manifest is None:
+      raise InvalidPackage("package not signed", str(base_dir))
+    self._sign(base_dir, manifest._replace(serial=self.serial))
+
+  def _sign(self, base_dir: Path, manifest: PackageManifest) -> list[Path]:
+    manifest_file = base_dir / PackageManifest.FILENAME
+    manifest_file.write_text(manifest.dump())
+    signature = base_dir / PackageManifest.SIGNATURE
+    exec_command(
+      ["openssl", "dgst", "-sha384", "-sign", self.key, "-out", signature, manifest_file]
+    )
+    signer = base_dir / PackageManifest.SIGNER
+    signer.write_bytes(self.pubkey.read_bytes())
+    for f in (manifest_file, signature, signer):
+      f.chmod(0o644)
+    return [manifest_file, signature, signer]
+
+
+def _package_members(package: Path) -> Generator[tuple[PurePosixPath, bytes | None], None, None]:
+  # Return (path, contents) of every member in the archive, without extracting them.
+  # The contents are None for directories.
+  if package.suffix == ".zip":
+    with zipfile.ZipFile(package) as archive:
+      for info in archive.infolist():
+        path = PurePosixPath(info.filename)
+        yield (path, None if info.is_dir() else archive.read(info))
+    return
+  with tarfile.open(package, "r:*") as archive:
+    for info in archive:
+      path = PurePosixPath(info.name)
+      if info.isdir():
+        yield (path, None)
+      elif not info.isfile():
+        raise InvalidPackage("unexpected member type", info.name)
+      else:
+        yield (path, archive.extractfile(info).read())
+
+
+def _verify_signature(signer: bytes, manifest: bytes, signature: bytes) -> bool:
+  with tempfile.TemporaryDirectory() as tmp_dir_name:
+    tmp_dir = Path(tmp_dir_name)
+    for name, contents in (("signer", signer), ("manifest", manifest), ("signature", signature)):
+      (tmp_dir / name).write_bytes(contents)
+    result = exec_command(
+      [
+        "openssl",
+        "dgst",
+        "-sha384",
+        "-verify",
+        tmp_dir / "signer",
+        "-signature",
+        tmp_dir / "signature",
+        tmp_dir / "manifest",
+      ],
+      capture_output=True,
+      noexcept=True,
+    )
+    return result.returncode == 0
+
+
+def verify_package(package: Path, trusted: Path | None = None) -> PackageManifest:
+  """Check that a package was signed by the registry, and that its contents
+  match the signed manifest, without extracting it.
+
+  The signer is the one recorded by the agent installed in `trusted`,
+  if any, otherwise the package's own (i.e. when installing an agent for
+  the first time). In the former case, the package must also be
+  at least as recent as the installed one."""
+  members = {}
+  for path, contents in _package_members(package):
+    if path.is_absolute() or ".." in path.parts:
+      raise InvalidPackage("invalid member path", str(path))
+    if contents is not None:
+      members[path] = contents
+
+  # Manifests are at the root of cell agent packages, and in
+  # the (only) top-level directory of particle packages
+  manifest_path = min(
+    (p for p in members if p.name == PackageManifest.FILENAME),
+    key=lambda p: len(p.parts),
+    default=None,
+  )
+  if manifest_path is None:
+    raise InvalidPackage("package not signed", str(package))
+  base = manifest_path.parent
+  signature = members.get(base / PackageManifest.SIGNATURE)
+  if signature is None:
+    raise InvalidPackage("missing signature", str(package))
+
+  installed = None
+  signer = members.get(base / PackageManifest.SIGNER)
+  if trusted is not None and (trusted / PackageManifest.SIGNER).is_file():
+    signer = (trusted / PackageManifest.SIGNER).read_bytes()
+    installed = PackageManifest.installed(trusted)
+  if signer is None:
+    raise InvalidPackage("unknown signer", str(package))
+  if not _verify_signature(signer, members[manifest_path], signature):
+    raise InvalidPackage("invalid signature", str(package))
+  manifest = PackageManifest.load(members[manifest_path])
+
+  signed = {
+    base / PackageManifest.FILENAME,
+    base / PackageManifest.SIGNATURE,
+    base / PackageManifest.SIGNER,
+  }
+  contents = {}
+  for path, data in members.items():
+    if path in signed:
+      continue
+    if not path.is_relative_to(base):
+      raise InvalidPackage("unexpected file", str(path))
+    contents[str(path.relative_to(base))] = data
+  for path, data in contents.items():
+    expected = manifest.files.get(path)
+    if expected is None:
+      raise InvalidPackage("unexpected file", path)
+    if PackageManifest.digest(data) != expected:
+      raise InvalidPackage("file modified", path)
+  missing = set(manifest.files) - set(contents)
+  if missing:
+    raise InvalidPackage("missing files", sorted(missing))
+
+  if installed is not None:
+    if manifest.uvn != installed.uvn or manifest.owner != installed.owner:
+      raise InvalidPackage("package for a different agent", manifest.uvn, manifest.owner)
+    if manifest.serial < installed.serial:
+      raise InvalidPackage("package older than installed one", manifest.serial, installed.serial)
+
+  log.activity("package verified: {} (serial {})", package, manifest.serial)
+  return manifest
@@ -35,6 +35,7 @@ from .deployment_strategy import DeploymentStrategy
 from .vpn_keymat import CentralizedVpnKeyMaterial, P2pVpnKeyMaterial
 from .vpn_config import UvnVpnConfig
 from .id_db import IdentityDatabase
+from .package_signature import PackageSigner
 from .keys_backend_dds import DdsKeysBackend
 from .database import Database
 from .database_object import (
@@ -45,6 +46,8 @@ from .database_object import (
   TransactionHandler,
 )
 from .agent_config import AgentConfig
+from .registry_history import RegistryHistory
+from .registry_spec import SpecEntry, SpecError, check_spec
 from .package import Packager
 from .wg_key import WireGuardKeyPair, WireGuardPsk
 from .cloud import CloudProvider, CloudStorageFileType, CloudStorageFile
@@ -186,12 +189,12 @@ class Registry(Versioned):
     root_empty = next(root.glob("*"), None) is None
     if root.is_dir() and not root_empty:
       ask_yes_no(
-        f"{'='*80}"
+        f"{'=' * 80}"
         "\n"
         f"WARNING: target directory is not empty: {root}."
         "\n"
         "Existing files may be deleted/overwritten without notice.\n"
-        f"{'='*80}"
+        f"{'=' * 80}"
         "\n"
         "Continue with UVN creation anyway?"
       )
@@ -202,6 +205,24 @@ class Registry(Versioned):
         db_file.unlink()
 
     db = Database(root, create=True)
+    # Encrypt keys from the start if a master key is configured
+    db.assert_secrets()
+    with RegistryHistory(db, root).record(f"define uvn {name}"):
+      return cls._create(
+        db, name, owner_email, owner_name, owner_password, registry_config, uvn_spec
+      )
+
+  @classmethod
+  def _create(
+    cls,
+    db: Database,
+    name: str,
+    owner_email: str,
+    owner_name: str | None,
+    owner_password: str,
+    registry_config: dict,
+    uvn_spec: dict,
+  ) -> "Registry":
     owner = db.new(
       User,
       {
@@ -278,6 +299,10 @@ class Registry(Versioned):
   def root(self) -> Path:
     return self.db.root
 
+  @cached_property
+  def history(self) -> RegistryHistory:
+    return RegistryHistory(self.db, self.root, settings=lambda: self.uvn.settings.history)
+
   @property
   def cells_dir(self) -> Path:
     return self.root / "cells"
@@ -286,6 +311,11 @@ class Registry(Versioned):
   def particles_dir(self) -> Path:
     return self.root / "particles"
 
+  @cached_property
+  def package_signer(self) -> PackageSigner:
+    # Kept with the other keys (e.g. the certificate authorities), but never exported
+    return PackageSigner(self.id_db.backend.root / "package-signer")
+
   @cached_property
   def id_db(self) -> IdentityDatabase:
     backend = self.new_child(
@@ -512,12 +542,63 @@ class Registry(Versioned):
 
     return do_in_transaction(_define_uvn)
 
+  @disabled_if("readonly", error=True)
+  @inject_db_transaction
+  def define_entities(
+    self,
+    entries: list[SpecEntry],
+    source: str = "spec",
+    cursor: "Database.Cursor | None" = None,
+    do_in_transaction: TransactionHandler | None = None,
+  ) -> None:
+    """Add multiple users, cells, and particles to the UVN.
+
+    All entries are validated before the UVN is modified, and a SpecError
+    listing all the errors is raised if any of them is invalid.
+    Entries are added in a single transaction."""
+    users = {u.email: u for u in self.users.values()}
+    errors = check_spec(self.uvn, users, entries)
+    if errors:
+      raise SpecError(source, errors)
+
+    def _define():
+      for entry in (e for e in entries if e.kind == "users"):
+        cfg = entry.config
+        user = self.add_user(email=cfg["email"], password=cfg["password"], **cfg.get("config", {}))
+        users[user.email] = user
+      # Save changes at this point so we can look up users from the database
+      self.db.save(self, cursor=cursor)
+      for entry in (e for e in entries if e.kind == "cells"):
+        cfg = entry.config
+        _ = self.add_cell(
+          name=cfg["name"],
+          owner=users.get(cfg.get("owner")),
+          address=cfg.get("address"),
+          allowed_lans=cfg.get("allowed_lans"),
+          settings=cfg.get("settings"),
+          # Already checked for clashes together with all other cells
+          validate=False,
+          cursor=cursor,
+        )
+      for entry in (e for e in entries if e.kind == "particles"):
+        cfg = entry.config
+        _ = self.add_particle(
+          name=cfg["name"],
+          owner=users.get(cfg.get("owner")),
+          **cfg.get("config", {}),
+          cursor=cursor,
+        )
+
+    do_in_transaction(_define)
+    self.log.info("{} elements added to {}", len(entries), self.uvn)
+
   @disabled_if("readonly", error=True)
   @inject_db_transaction
   def add_cell(
     self,
     name: str,
     owner: User | None = None,
+    validate: bool = True,
     cursor: "Database.Cursor | None" = None,
     do_in_transaction: TransactionHandler | None = None,
     **cell_config,
@@ -536,6 +617,8 @@ class Registry(Versioned):
         owner=owner,
         cursor=cursor,
       )
+      if not validate:
+        return cell
       try:
         self.uvn.validate_cell(cell)
       except Exception:
@@ -853,6 +936,7 @@ class Registry(Versioned):
   def assert_keys(self) -> None:
     self.vpn_config.assert_keys()
     self.id_db.assert_keys()
+    self.package_signer.init()
 
   @disabled_if("readonly")
   @inject_db_transaction
@@ -912,6 +996,8 @@ class Registry(Versioned):
 
       Middleware.selected().configure_extracted_cell_agent_package(self.root)
 
+      # Agents reject packages older than the one they installed
+      self.package_signer.next_serial()
       if self.cells_dir.is_dir():
         exec_command(["rm", "-rfv", self.cells_dir])
       for cell in self.uvn.cells.values():
@@ -928,6 +1014,16 @@ class Registry(Versioned):
 
     return do_in_transaction(_generate_artifacts)
 
+  def resign_artifacts(self) -> None:
+    """Sign the packages again with a new serial, e.g. after restoring the
+    ones generated by a previous generation, since agents reject packages
+    older than the one they installed."""
+    self.package_signer.next_serial()
+    for package in sorted(self.cells_dir.glob(f"*{Packager.CELL_PACKAGE_EXT}")):
+      Packager.resign_package(self, package)
+    for package in sorted(self.particles_dir.glob(f"*{Packager.PARTICLE_PACKAGE_EXT}")):
+      Packager.resign_package(self, package)
+
   @cached_property
   def rekeyed_cells(self) -> set[Cell]:
     return {
@@ -0,0 +1,393 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from importlib.resources import files, as_file
+from pathlib import Path
+from typing import Callable, Generator, Iterable, NamedTuple
+import contextlib
+import json
+import os
+import shutil
+
+from ..core.log import Logger
+from ..core.time import Timestamp
+from ..data import database as db_data
+from .database import Database
+from .secret_box import SecretBox
+from .uvn_settings import HistorySettings
+
+log = Logger.sublogger("history")
+
+
+class Generation(NamedTuple):
+  id: int
+  ts: str
+  command: str
+  config_id: str | None
+  changes: int
+  archived: bool
+
+
+class RowChange(NamedTuple):
+  """The change of a database row between two generations.
+
+  `old` is None if the row was inserted, `new` is None if it was deleted,
+  otherwise both contain only the columns that were modified."""
+
+  table: str
+  key: tuple
+  old: dict | None
+  new: dict | None
+
+  def fields(self) -> Generator[tuple[str, object, object], None, None]:
+    """Return the (column, old value, new value) of every modified field."""
+    columns = self.new if self.old is None else self.old
+    for column in columns:
+      yield (
+        column,
+        None if self.old is None else self.old[column],
+        None if self.new is None else self.new[column],
+      )
+
+
+def _load_row(val: str) -> dict:
+  return {c: bytes.fromhex(v[0]) if isinstance(v, list) else v for c, v in json.loads(val).items()}
+
+
+def _dump_row(row: dict) -> str:
+  return json.dumps({c: [v.hex()] if isinstance(v, bytes) else v for c, v in row.items()})
+
+
+def merge_changes(changes: Iterable[RowChange]) -> list[RowChange]:
+  """Combine a sequence of changes into the equivalent list of changes,
+  with at most one change for every row."""
+  # (table, key) -> [existed before, exists after, old values, new values]
+  merged: dict[tuple[str, tuple], list] = {}
+  for change in changes:
+    state = merged.get((change.table, change.key))
+    if state is None:
+      state = merged[(change.table, change.key)] = [change.old is not None, False, {}, {}]
+    # Keep the earliest value of every column, and the latest one
+    for column, val in (change.old or {}).items():
+      state[2].setdefault(column, val)
+    if change.new is None:
+      state[3] = {}
+    elif change.old is None:
+      state[3] = dict(change.new)
+    else:
+      state[3].update(change.new)
+    state[1] = change.new is not None
+  result = []
+  for (table, key), (existed, exists, old, new) in merged.items():
+    if not existed and not exists:
+      continue
+    elif not existed:
+      result.append(RowChange(table, key, None, new))
+    elif not exists:
+      result.append(RowChange(table, key, old, None))
+    else:
+      changed = [c for c in old if c in new and old[c] != new[c]]
+      if changed:
+        result.append(
+          RowChange(table, key, {c: old[c] for c in changed}, {c: new[c] for c in changed})
+        )
+  return result
+
+
+class RegistryHistory:
+  """Record the changes made to the registry's database by every command,
+  and restore the state left by a previous command.
+
+  Changes are captured by temporary triggers, which are only active while
+  a generation is being recorded. At the end of a generation, the changes
+  are merged so that at most one (minimal) change is stored for every row.
+  The artifacts generated by a command (e.g. the cell agent packages) are
+  archived by hard-linking them, so that they can be restored unmodified."""
+
+  ARTIFACTS = ("cells", "particles")
+  ARCHIVE_DIR = "generations"
+  HISTORY_TABLES = ("generations", "generation_changes")
+  # Restoring a previous generation must not restore a previous master key
+  UNRECORDED_TABLES = (*HISTORY_TABLES, SecretBox.TABLE)
+
+  def __init__(
+    self,
+    db: Database,
+    root: Path,
+    settings: Callable[[], HistorySettings] | None = None,
+  ) -> None:
+    self.db = db
+    self.root = root
+    self.settings = settings
+    self._triggers = False
+
+  @property
+  def archive_dir(self) -> Path:
+    return self.root / self.ARCHIVE_DIR
+
+  @property
+  def initialized(self) -> bool:
+    return (
+      self.db._db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'generations'"
+      ).fetchone()
+      is not None
+    )
+
+  def initialize(self) -> None:
+    if self.initialized:
+      return
+    # Databases created by previous versions don't have the history tables
+    with as_file(files(db_data).joinpath("initialize_history.sql")) as sql:
+      self.db._db.executescript(sql.read_text())
+
+  def _create_triggers(self, cursor: Database.Cursor) -> None:
+    if self._triggers:
+      return
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS history_recording (generation INT)")
+    tables = [
+      row.name
+      for row in cursor.execute(
+        "SELECT name FROM main.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+      ).fetchall()
+      if row.name not in self.UNRECORDED_TABLES
+    ]
+    for table in tables:
+      info = cursor.execute(f'PRAGMA main.table_info("{table}")').fetchall()
+      columns = [c.name for c in info]
+      pk = [c.name for c in sorted((c for c in info if c.pk > 0), key=lambda c: c.pk)] or ["rowid"]
+
+      def _col(ref: str, c: str) -> str:
+        # JSON cannot hold binary values (see Database.COLUMN_CODEC), so they
+        # are recorded as their hex encoding, wrapped in a single-element array
+        return (
+          f'CASE typeof({ref}."{c}") WHEN \'blob\' THEN json_array(hex({ref}."{c}"))'
+          f' ELSE {ref}."{c}" END'
+        )
+
+      def _row(ref: str) -> str:
+        return "json_object(" + ", ".join(f"'{c}', {_col(ref, c)}" for c in columns) + ")"
+
+      def _key(ref: str) -> str:
+        return "json_array(" + ", ".join(f'{ref}."{c}"' for c in pk) + ")"
+
+      recording = "EXISTS (SELECT 1 FROM temp.history_recording)"
+      modified = " OR ".join(f'OLD."{c}" IS NOT NEW."{c}"' for c in columns)
+      for event, condition, key, old, new in [
+        ("INSERT", recording, _key("NEW"), "NULL", _row("NEW")),
+        ("UPDATE", f"{recording} AND ({modified})", _key("OLD"), _row("OLD"), _row("NEW")),
+        ("DELETE", recording, _key("OLD"), _row("OLD"), "NULL"),
+      ]:
+        cursor.execute(
+          f'CREATE TEMP TRIGGER IF NOT EXISTS "history_{table}_{event.lower()}"'
+          f' AFTER {event} ON main."{table}" WHEN {condition} BEGIN'
+          " INSERT INTO generation_changes (generation, tbl, key, old, new)"
+          f" SELECT generation, '{table}', {key}, {old}, {new} FROM temp.history_recording;"
+          " END"
+        )
+    self._triggers = True
+
+  @contextlib.contextmanager
+  def record(self, command: str) -> Generator[int, None, None]:
+    """Record all changes performed within the context as a new generation."""
+    self.initialize()
+    with self.db.transaction() as cursor:
+      self._create_triggers(cursor)
+      cursor.execute(
+        "INSERT INTO generations (ts, command) VALUES (?, ?)", (Timestamp.now().format(), command)
+      )
+      generation = cursor.lastrowid
+      cursor.execute("DELETE FROM temp.history_recording")
+      cursor.execute("INSERT INTO temp.history_recording (generation) VALUES (?)", (generation,))
+    try:
+      yield generation
+    finally:
+      # Changes committed before a failure are still recorded
+      with self.db.transaction() as cursor:
+        cursor.execute("DELETE FROM temp.history_recording")
+      self._complete(generation)
+
+  def _complete(self, generation: int) -> None:
+    with self.db.transaction() as cursor:
+      changes = merge_changes(self._load_changes(cursor, "generation = ?", (generation,)))
+      cursor.execute("DELETE FROM generation_changes WHERE generation = ?", (generation,))
+      if not changes:
+        cursor.execute("DELETE FROM generations WHERE id = ?", (generation,))
+        log.debug("nothing changed, generation discarded: {}", generation)
+        return
+      cursor.executemany(
+        "INSERT INTO generation_changes (generation, tbl, key, old, new) VALUES (?, ?, ?, ?, ?)",
+        [
+          (
+            generation,
+            c.table,
+            json.dumps(c.key),
+            None if c.old is None else _dump_row(c.old),
+            None if c.new is None else _dump_row(c.new),
+          )
+          for c in changes
+        ],
+      )
+      config_id = cursor.execute("SELECT config_id FROM registry WHERE id = 1").fetchone()
+      cursor.execute(
+        "UPDATE generations SET config_id = ? WHERE id = ?",
+        (config_id.config_id if config_id else None, generation),
+      )
+    self._archive(generation)
+    log.info("recorded generation {}: {} rows changed", generation, len(changes))
+    self.apply_retention()
+
+  def _archive(self, generation: int) -> None:
+    archive = self.archive_dir / str(generation)
+    if archive.exists():
+      # Left over by a registry previously created in the same directory
+      shutil.rmtree(archive)
+    archive.mkdir(parents=True, mode=0o700)
+    for name in self.ARTIFACTS:
+      artifacts = self.root / name
+      if artifacts.is_dir():
+        # Artifacts are never modified, only deleted and generated
+        # again, so they can be shared with the archive.
+        shutil.copytree(artifacts, archive / name, copy_function=os.link)
+
+  def apply_retention(self) -> None:
+    settings = self.settings() if self.settings is not None else None
+    if settings is None:
+      return
+    generations = [g.id for g in self.generations()]
+    expired = generations[: max(0, len(generations) - settings.max_generations)]
+    if expired:
+      with self.db.transaction() as cursor:
+        marks = ", ".join("?" for _ in expired)
+        cursor.execute(f"DELETE FROM generation_changes WHERE generation IN ({marks})", expired)
+        cursor.execute(f"DELETE FROM generations WHERE id IN ({marks})", expired)
+      log.activity("dropped {} expired generations", len(expired))
+    archived = generations[max(0, len(generations) - settings.max_archives) :]
+    if self.archive_dir.is_dir():
+      for archive in self.archive_dir.iterdir():
+        if not archive.name.isdigit() or int(archive.name) not in archived:
+          shutil.rmtree(archive)
+
+  def _load_changes(
+    self, cursor: Database.Cursor, where: str, params: tuple, reverse: bool = False
+  ) -> list[RowChange]:
+    return [
+      RowChange(
+        table=row.tbl,
+        key=tuple(json.loads(row.key)),
+        old=None if row.old is None else _load_row(row.old),
+        new=None if row.new is None else _load_row(row.new),
+      )
+      for row in cursor.execute(
+        "SELECT tbl, key, old, new FROM generation_changes"
+        f" WHERE {where} ORDER BY id {'DESC' if reverse else 'ASC'}",
+        params,
+      ).fetchall()
+    ]
+
+  def generations(self) -> list[Generation]:
+    if not self.initialized:
+      return []
+    return [
+      Generation(
+        id=row.id,
+        ts=row.ts,
+        command=row.command,
+        config_id=row.config_id,
+        changes=row.changes,
+        archived=(self.archive_dir / str(row.id)).is_dir(),
+      )
+      for row in self.db._db.execute(
+        "SELECT g.id, g.ts, g.command, g.config_id, count(c.id) AS changes"
+        " FROM generations g LEFT JOIN generation_changes c ON c.generation = g.id"
+        " GROUP BY g.id ORDER BY g.id"
+      ).fetchall()
+    ]
+
+  def _lookup(self, generation: int) -> Generation:
+    found = next((g for g in self.generations() if g.id == generation), None)
+    if found is None:
+      raise ValueError("unknown generation", generation)
+    return found
+
+  def diff(self, base: int, target: int) -> list[RowChange]:
+    """Return the changes required to go from the state after generation `base`
+    to the one after generation `target`."""
+    self._lookup(base)
+    self._lookup(target)
+    if base > target:
+      return [RowChange(c.table, c.key, c.new, c.old) for c in reversed(self.diff(target, base))]
+    with self.db.transaction() as cursor:
+      return merge_changes(
+        self._load_changes(cursor, "generation > ? AND generation <= ?", (base, target))
+      )
+
+  def encrypt_secrets(self, cursor: Database.Cursor) -> None:
+    """Encrypt the secret values recorded by previous generations,
+    after the database's secrets were encrypted (see Database.encrypt_secrets())."""
+    for table, columns in self.db.secret_columns().items():
+      for row in cursor.execute(
+        "SELECT id, old, new FROM generation_changes WHERE tbl = ?", (table,)
+      ).fetchall():
+        old, new = (None if v is None else _load_row(v) for v in (row.old, row.new))
+        encrypted = False
+        for values in (old, new):
+          for c in columns:
+            if values is not None and isinstance(values.get(c), str):
+              values[c] = self.db.dump_secret(table, c, values[c])
+              encrypted = True
+        if encrypted:
+          cursor.execute(
+            "UPDATE generation_changes SET old = ?, new = ? WHERE id = ?",
+            (*(None if v is None else _dump_row(v) for v in (old, new)), row.id),
+          )
+
+  def restore(self, generation: int) -> None:
+    """Revert the database to the state left by a generation, by undoing all
+    the following ones, and restore the artifacts that it generated.
+
+    If the artifacts were not archived, the caller must generate them again."""
+    self._lookup(generation)
+    with self.db.transaction() as cursor:
+      for change in self._load_changes(cursor, "generation > ?", (generation,), reverse=True):
+        self._undo(cursor, change)
+    self.db.clear_cache()
+    archive = self.archive_dir / str(generation)
+    for name in self.ARTIFACTS:
+      artifacts = self.root / name
+      if artifacts.is_dir():
+        shutil.rmtree(artifacts)
+      if (archive / name).is_dir():
+        shutil.copytree(archive / name, artifacts, copy_function=os.link)
+    log.warning("restored generation {}", generation)
+
+  def _undo(self, cursor: Database.Cursor, change: RowChange) -> None:
+    info = cursor.execute(f'PRAGMA main.table_info("{change.table}")').fetchall()
+    pk = [c.name for c in sorted((c for c in info if c.pk > 0), key=lambda c: c.pk)] or ["rowid"]
+    where = " AND ".join(f'"{c}" = ?' for c in pk)
+    if change.old is None:
+      cursor.execute(f'DELETE FROM "{change.table}" WHERE {where}', change.key)
+    elif change.new is None:
+      columns = ", ".join(f'"{c}"' for c in change.old)
+      marks = ", ".join("?" for _ in change.old)
+      cursor.execute(
+        f'INSERT INTO "{change.table}" ({columns}) VALUES ({marks})', tuple(change.old.values())
+      )
+    else:
+      values = ", ".join(f'"{c}" = ?' for c in change.old)
+      cursor.execute(
+        f'UPDATE "{change.table}" SET {values} WHERE {where}',
+        (*change.old.values(), *change.key),
+      )
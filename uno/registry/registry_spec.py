@@ -0,0 +1,223 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from pathlib import Path
+from typing import Iterable, NamedTuple
+import csv
+import io
+import ipaddress
+
+import yaml
+
+from ..core.yaml_codec import CODEC
+from .uvn import Uvn
+from .versioned import Versioned
+
+# The sections of a spec, in the order in which they must be defined
+SPEC_KINDS = ("users", "cells", "particles")
+
+SPEC_KEYS = {
+  "users": {"email", "password", "config"},
+  "cells": {"name", "owner", "address", "allowed_lans", "settings"},
+  "particles": {"name", "owner", "config"},
+}
+
+# Columns of a CSV spec, "kind" is one of "user", "cell", "particle"
+SPEC_CSV_COLUMNS = ("kind", "name", "email", "password", "owner", "address", "allowed_lans")
+
+
+class SpecEntry(NamedTuple):
+  """A user, cell, or particle to define, and its location in the spec."""
+
+  kind: str
+  line: int
+  config: dict
+
+
+class SpecError(ValueError):
+  def __init__(self, source: str, errors: list[tuple[int, str]]) -> None:
+    self.source = source
+    self.errors = errors
+    lines = "\n".join(f"  {source}:{line}: {msg}" for line, msg in errors)
+    super().__init__(f"{len(errors)} errors detected in {source}:\n{lines}")
+
+
+def load_spec(spec: Path) -> list[SpecEntry]:
+  """Read a YAML or CSV file containing the definitions of users, cells, and particles.
+
+  A YAML spec has the same format as the one accepted by `uno define uvn --spec`,
+  i.e. a dictionary with optional lists "users", "cells", and "particles".
+  The first row of a CSV spec must contain column names (see SPEC_CSV_COLUMNS)."""
+  text = spec.read_text()
+  if spec.suffix.lower() == ".csv":
+    return _load_csv(str(spec), text)
+  else:
+    return _load_yaml(str(spec), text)
+
+
+def _load_yaml(source: str, text: str) -> list[SpecEntry]:
+  loader = CODEC.open_loader(text)
+  try:
+    node = loader.get_single_node()
+    if node is None:
+      return []
+    spec = loader.construct_document(node)
+  except yaml.MarkedYAMLError as e:
+    line = e.problem_mark.line + 1 if e.problem_mark else 0
+    raise SpecError(source, [(line, f"invalid YAML: {e.problem}")])
+  finally:
+    loader.dispose()
+  if not isinstance(spec, dict):
+    raise SpecError(source, [(node.start_mark.line + 1, "expected a dictionary")])
+  errors = []
+  result = []
+  for key, val in node.value:
+    kind = key.value
+    if kind not in SPEC_KINDS:
+      errors.append((key.start_mark.line + 1, f"unknown section: {kind}"))
+      continue
+    if not isinstance(val, yaml.SequenceNode):
+      errors.append((val.start_mark.line + 1, f"expected a list of {kind}"))
+      continue
+    for item_node, item in zip(val.value, spec[kind]):
+      line = item_node.start_mark.line + 1
+      if not isinstance(item, dict):
+        errors.append((line, f"expected a dictionary for each of the {kind}"))
+        continue
+      result.append(SpecEntry(kind, line, item))
+  if errors:
+    raise SpecError(source, errors)
+  return result
+
+
+def _load_csv(source: str, text: str) -> list[SpecEntry]:
+  reader = csv.DictReader(io.StringIO(text))
+  unknown = set(reader.fieldnames or []) - set(SPEC_CSV_COLUMNS)
+  if unknown or "kind" not in (reader.fieldnames or []):
+    raise SpecError(
+      source, [(1, f"expected columns {', '.join(SPEC_CSV_COLUMNS)}, unknown: {sorted(unknown)}")]
+    )
+  errors = []
+  result = []
+  for row in reader:
+    line = reader.line_num
+    values = {k: v.strip() for k, v in row.items() if k is not None and v and v.strip()}
+    kind = f"{values.pop('kind', '')}s"
+    if kind not in SPEC_KINDS:
+      errors.append((line, f"unknown kind: {kind[:-1]}"))
+      continue
+    if kind == "users":
+      config = {k: values.pop(k) for k in ("email", "password") if k in values}
+      if "name" in values:
+        config["config"] = {"name": values.pop("name")}
+    else:
+      config = {k: values.pop(k) for k in ("name", "owner") if k in values}
+      if kind == "cells":
+        if "address" in values:
+          config["address"] = values.pop("address")
+        if "allowed_lans" in values:
+          config["allowed_lans"] = values.pop("allowed_lans").split()
+    if values:
+      errors.append((line, f"columns not supported by {kind}: {', '.join(sorted(values))}"))
+      continue
+    result.append(SpecEntry(kind, line, config))
+  if errors:
+    raise SpecError(source, errors)
+  return result
+
+
+def check_spec(
+  uvn: Uvn, users: Iterable[str], entries: Iterable[SpecEntry]
+) -> list[tuple[int, str]]:
+  """Check that the entries can be added to a UVN, and return every error detected.
+
+  Network clashes between all cells (existing and new) are detected with a single pass."""
+  errors = []
+  emails = set(users)
+  new_emails = set()
+  names = {
+    "cells": {c.name for c in uvn.all_cells.values()},
+    "particles": {p.name for p in uvn.all_particles.values()},
+  }
+  addresses = {c.address for c in uvn.all_cells.values() if c.address}
+  # (name, line) of every cell, and their networks
+  cell_networks = {(c.name, None): c.allowed_lans for c in uvn.all_cells.values()}
+
+  def _check_name(kind: str, line: int, name: object) -> bool:
+    if not name or not isinstance(name, str):
+      errors.append((line, f"invalid name: {name!r}"))
+    elif name.lower() in Versioned.RESERVED_KEYWORDS:
+      errors.append((line, f"'{name}' is a reserved keyword"))
+    elif name in names[kind]:
+      errors.append((line, f"{kind[:-1]} already defined: {name}"))
+    else:
+      names[kind].add(name)
+      return True
+    return False
+
+  for entry in entries:
+    unknown = set(entry.config) - SPEC_KEYS[entry.kind]
+    if unknown:
+      errors.append((entry.line, f"unknown {entry.kind[:-1]} keys: {', '.join(sorted(unknown))}"))
+      continue
+    if entry.kind == "users":
+      email = entry.config.get("email")
+      if not email or not isinstance(email, str):
+        errors.append((entry.line, f"invalid email: {email!r}"))
+      elif email in emails or email in new_emails:
+        errors.append((entry.line, f"user already defined: {email}"))
+      else:
+        new_emails.add(email)
+      if not entry.config.get("password"):
+        errors.append((entry.line, "no password specified"))
+      continue
+    # Users must be defined before the elements they own
+    owner = entry.config.get("owner")
+    if owner and owner not in emails and owner not in new_emails:
+      errors.append((entry.line, f"unknown owner: {owner}"))
+    if not _check_name(entry.kind, entry.line, entry.config.get("name")):
+      continue
+    if entry.kind != "cells":
+      continue
+    address = entry.config.get("address")
+    if address is not None:
+      if address in addresses:
+        errors.append((entry.line, f"address already in use: {address}"))
+      addresses.add(address)
+    try:
+      networks = {ipaddress.IPv4Network(n) for n in entry.config.get("allowed_lans") or []}
+    except ValueError as e:
+      errors.append((entry.line, f"invalid network: {e}"))
+      continue
+    if address is None:
+      try:
+        uvn.validate_private_cell(networks, entry.config["name"])
+      except ValueError as e:
+        errors.append((entry.line, e.args[0]))
+    cell_networks[(entry.config["name"], entry.line)] = networks
+
+  clashes = Uvn.detect_network_clashes(
+    records=cell_networks, get_networks=lambda c: cell_networks[c]
+  )
+  for matches in clashes.values():
+    for (name, line), net in matches:
+      if line is None:
+        # Existing cells were already validated
+        continue
+      for (other, _), other_net in matches:
+        if other != name and net.overlaps(other_net):
+          errors.append((line, f"network {net} of {name} clashes with {other_net} of {other}"))
+  # Clashes might have been detected more than once
+  return sorted(set(errors))
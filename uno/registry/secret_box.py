@@ -0,0 +1,199 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from importlib.resources import files, as_file
+from pathlib import Path
+import base64
+import binascii
+import hashlib
+import os
+import shutil
+import sqlite3
+
+from ..core.exec import exec_command
+from ..core.log import Logger
+from ..data import database as db_data
+
+try:
+  from cryptography.exceptions import InvalidTag
+  from cryptography.hazmat.primitives import hashes
+  from cryptography.hazmat.primitives.ciphers.aead import AESSIV
+  from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+except ImportError:
+  AESSIV = None
+
+log = Logger.sublogger("secrets")
+
+
+class MissingMasterKey(Exception):
+  pass
+
+
+class InvalidMasterKey(Exception):
+  pass
+
+
+class MasterKey:
+  """The key which encrypts the key of every database's SecretBox.
+
+  The master key is never stored in a database. It is read, as base64 text
+  (e.g. generated with `openssl rand -base64 32`), from the first of:
+  - the UNO_MASTER_KEY variable,
+  - the file specified by the UNO_MASTER_KEY_FILE variable,
+  - the "uno-master-key" user key in the kernel keyring
+    (e.g. added with `keyctl padd user uno-master-key @u`)."""
+
+  ENV_VAR = "UNO_MASTER_KEY"
+  FILE_VAR = "UNO_MASTER_KEY_FILE"
+  KEYRING_KEY = "uno-master-key"
+  MIN_LEN = 32
+
+  def __init__(self, value: bytes) -> None:
+    if AESSIV is None:
+      raise RuntimeError("cryptography is required to encrypt database secrets")
+    if len(value) < self.MIN_LEN:
+      raise ValueError("master key too short", len(value))
+    self._kek = _derive(value, b"uno secrets kek")
+    self.id = hashlib.sha256(_derive(value, b"uno secrets id")).hexdigest()[:16]
+
+  def __str__(self) -> str:
+    return f"master-key({self.id})"
+
+  @classmethod
+  def parse(cls, val: str | bytes) -> "MasterKey":
+    try:
+      return cls(base64.b64decode(val.strip(), validate=True))
+    except binascii.Error as e:
+      raise ValueError("invalid master key encoding", e)
+
+  @classmethod
+  def load_file(cls, key_file: Path) -> "MasterKey":
+    return cls.parse(key_file.read_bytes())
+
+  @classmethod
+  def load(cls) -> "MasterKey | None":
+    val = os.environ.get(cls.ENV_VAR)
+    if val:
+      return cls.parse(val)
+    key_file = os.environ.get(cls.FILE_VAR)
+    if key_file:
+      return cls.load_file(Path(key_file))
+    if shutil.which("keyctl") is None:
+      return None
+    result = exec_command(
+      ["keyctl", "pipe", f"%user:{cls.KEYRING_KEY}"], capture_output=True, noexcept=True
+    )
+    if result.returncode != 0:
+      return None
+    return cls.parse(result.stdout)
+
+  def wrap(self, key: bytes) -> bytes:
+    return AESSIV(self._kek).encrypt(key, [b"uno secrets key"])
+
+  def unwrap(self, wrapped: bytes) -> bytes:
+    try:
+      return AESSIV(self._kek).decrypt(wrapped, [b"uno secrets key"])
+    except InvalidTag:
+      raise InvalidMasterKey("failed to decrypt secrets key", self.id)
+
+
+def _derive(value: bytes, info: bytes) -> bytes:
+  return HKDF(algorithm=hashes.SHA256(), length=64, salt=None, info=info).derive(value)
+
+
+class SecretBox:
+  """Encrypt the secret columns (see Versioned.SECRET_PROPERTIES) of a database.
+
+  Every database has its own random key, stored in the database wrapped with
+  the master key, so that rotating the master key doesn't require encrypting
+  all values again. Values are encrypted deterministically (AES-SIV), bound
+  to their table and column, so that UNIQUE constraints and lookups by value
+  keep working on encrypted columns."""
+
+  TABLE = "secrets_key"
+  # Prefix of encrypted values, distinct from the tags of column codecs
+  TAG = b"X"
+
+  def __init__(self, key: bytes, master_key: MasterKey) -> None:
+    self._cipher = AESSIV(key)
+    self._key = key
+    self.master_key = master_key
+
+  @classmethod
+  def available(cls) -> bool:
+    return AESSIV is not None
+
+  @classmethod
+  def enabled(cls, db: sqlite3.Connection) -> bool:
+    return (
+      db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (cls.TABLE,)
+      ).fetchone()
+      is not None
+      and db.execute(f"SELECT id FROM {cls.TABLE}").fetchone() is not None
+    )
+
+  @classmethod
+  def open(cls, db: sqlite3.Connection, master_key: MasterKey | None = None) -> "SecretBox | None":
+    """Load the key of a database, if it has one, decrypting it
+    with the specified master key, or with the configured one."""
+    if not cls.enabled(db):
+      return None
+    if not cls.available():
+      raise MissingMasterKey("database secrets are encrypted, but cryptography is not available")
+    if master_key is None:
+      master_key = MasterKey.load()
+      if master_key is None:
+        raise MissingMasterKey("database secrets are encrypted, but no master key was configured")
+    master_key_id, wrapped = db.execute(
+      f"SELECT master_key_id, wrapped_key FROM {cls.TABLE}"
+    ).fetchone()
+    if master_key_id != master_key.id:
+      raise InvalidMasterKey("database encrypted with another master key", master_key_id)
+    return cls(master_key.unwrap(wrapped), master_key)
+
+  @classmethod
+  def create(cls, db: sqlite3.Connection, master_key: MasterKey) -> "SecretBox":
+    if not cls.available():
+      raise RuntimeError("cryptography is required to encrypt database secrets")
+    # Single statement, executescript() would commit the current transaction
+    with as_file(files(db_data).joinpath("initialize_secrets.sql")) as sql:
+      db.execute(sql.read_text())
+    box = cls(AESSIV.generate_key(512), master_key)
+    box.store(db)
+    log.info("created secrets key: {}", master_key)
+    return box
+
+  def store(self, db: sqlite3.Connection) -> None:
+    db.execute(
+      f"INSERT OR REPLACE INTO {self.TABLE} (id, master_key_id, wrapped_key) VALUES (1, ?, ?)",
+      (self.master_key.id, self.master_key.wrap(self._key)),
+    )
+
+  def rewrap(self, master_key: MasterKey) -> "SecretBox":
+    return SecretBox(self._key, master_key)
+
+  @classmethod
+  def encrypted(cls, val: object) -> bool:
+    return isinstance(val, bytes) and val[:1] == cls.TAG
+
+  def encrypt(self, table: str, column: str, val: str) -> bytes:
+    return self.TAG + self._cipher.encrypt(val.encode(), [f"{table}.{column}".encode()])
+
+  def decrypt(self, table: str, column: str, val: bytes) -> str:
+    try:
+      return self._cipher.decrypt(val[1:], [f"{table}.{column}".encode()]).decode()
+    except InvalidTag:
+      raise InvalidMasterKey("failed to decrypt value", table, column)
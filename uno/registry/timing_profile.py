@@ -14,89 +14,169 @@
 # limitations under the License.
 ###############################################################################
 from enum import Enum
+from typing import NamedTuple
+import math
 
+from .versioned import Versioned, prepare_enum
 
-class TimingProfile(Enum):
+
+class TimingPreset(Enum):
   DEFAULT = 0
   FAST = 1
+  AUTO = 2
 
   @staticmethod
-  def parse(val: str) -> "TimingProfile":
-    return TimingProfile[val.upper().replace("-", "_")]
+  def parse(val: str) -> "TimingPreset":
+    return TimingPreset[val.upper().replace("-", "_")]
 
-  @property
-  def participant_liveliness_lease_duration(self) -> int:
-    if self == TimingProfile.FAST:
-      return 5
-    else:
-      return 60
 
-  @property
-  def participant_liveliness_assert_period(self) -> int:
-    if self == TimingProfile.FAST:
-      return 2
-    else:
-      return 20
+class TimingParameters(NamedTuple):
+  """The timing parameters (in seconds) used by the services of a UVN."""
 
-  @property
-  def participant_liveliness_detection_period(self) -> int:
-    if self == TimingProfile.FAST:
-      return 6
-    else:
-      return 30
+  participant_liveliness_lease_duration: int
+  participant_liveliness_assert_period: int
+  participant_liveliness_detection_period: int
+  initial_participant_announcements: int
+  initial_participant_announcement_period: tuple[int, int]
+  ospf_dead_interval: int
+  ospf_hello_interval: int
+  ospf_retransmit_interval: int
+  tester_max_delay: int
+  max_service_trigger_delay: int
+  status_min_delay: int
 
-  @property
-  def initial_participant_announcements(self) -> int:
-    if self == TimingProfile.FAST:
-      return 60
-    else:
-      return 60
+  def validate(self) -> None:
+    for name, val in self._asdict().items():
+      for v in val if isinstance(val, tuple) else (val,):
+        if not isinstance(v, int) or v <= 0:
+          raise ValueError("timing parameters must be positive integers", name, val)
+    if self.participant_liveliness_assert_period >= self.participant_liveliness_lease_duration:
+      raise ValueError(
+        "liveliness must be asserted more often than the lease duration",
+        self.participant_liveliness_assert_period,
+        self.participant_liveliness_lease_duration,
+      )
+    if self.ospf_hello_interval >= self.ospf_dead_interval:
+      raise ValueError(
+        "OSPF hello interval must be shorter than the dead interval",
+        self.ospf_hello_interval,
+        self.ospf_dead_interval,
+      )
+    announcement_min, announcement_max = self.initial_participant_announcement_period
+    if announcement_min > announcement_max:
+      raise ValueError(
+        "invalid participant announcement period", self.initial_participant_announcement_period
+      )
 
-  @property
-  def initial_participant_announcement_period(self) -> tuple[int, int]:
-    if self == TimingProfile.FAST:
-      return (1, 5)
-    else:
-      return (3, 15)
 
-  @property
-  def ospf_dead_interval(self) -> int:
-    if self == TimingProfile.FAST:
-      return 5
-    else:
-      return 60
+PRESETS = {
+  TimingPreset.DEFAULT: TimingParameters(
+    participant_liveliness_lease_duration=60,
+    participant_liveliness_assert_period=20,
+    participant_liveliness_detection_period=30,
+    initial_participant_announcements=60,
+    initial_participant_announcement_period=(3, 15),
+    ospf_dead_interval=60,
+    ospf_hello_interval=15,
+    ospf_retransmit_interval=5,
+    tester_max_delay=3600,  # 1h
+    max_service_trigger_delay=3600,  # 1h
+    status_min_delay=30,
+  ),
+  TimingPreset.FAST: TimingParameters(
+    participant_liveliness_lease_duration=5,
+    participant_liveliness_assert_period=2,
+    participant_liveliness_detection_period=6,
+    initial_participant_announcements=60,
+    initial_participant_announcement_period=(1, 5),
+    ospf_dead_interval=5,
+    ospf_hello_interval=1,
+    ospf_retransmit_interval=2,
+    tester_max_delay=30,
+    max_service_trigger_delay=30,
+    status_min_delay=10,
+  ),
+}
 
-  @property
-  def ospf_hello_interval(self) -> int:
-    if self == TimingProfile.FAST:
-      return 1
-    else:
-      return 15
 
-  @property
-  def ospf_retransmit_interval(self) -> int:
-    if self == TimingProfile.FAST:
-      return 2
-    else:
-      return 5
+# The FAST preset is tuned for small UVNs on a local network
+AUTO_REFERENCE_CELLS = 3
+AUTO_REFERENCE_RTT = 10  # ms
+AUTO_DEFAULT_RTT = 50  # ms
 
-  @property
-  def tester_max_delay(self) -> int:
-    if self == TimingProfile.FAST:
-      return 30
-    else:
-      return 3600  # 1h
 
-  @property
-  def max_service_trigger_delay(self) -> int:
-    if self == TimingProfile.FAST:
-      return 30
-    else:
-      return 3600  # 1h
+def scale_timing(cells: int, rtt: float) -> TimingParameters:
+  """Compute timing parameters for a UVN with the specified number
+  of cells, and average round-trip time (in milliseconds) between them.
 
-  @property
-  def status_min_delay(self) -> int:
-    if self == TimingProfile.FAST:
-      return 10
+  Every period grows from its FAST value with the square root of the
+  number of cells (i.e. the routing and discovery traffic generated by
+  each cell) and linearly with the RTT, up to its DEFAULT value."""
+  factor = max(1.0, math.sqrt(cells / AUTO_REFERENCE_CELLS)) * max(1.0, rtt / AUTO_REFERENCE_RTT)
+  fast = PRESETS[TimingPreset.FAST]
+  default = PRESETS[TimingPreset.DEFAULT]
+
+  def _scale(fast_val: int, default_val: int) -> int:
+    low, high = sorted((fast_val, default_val))
+    return min(high, max(low, round(fast_val * factor)))
+
+  return TimingParameters(
+    *(
+      tuple(map(_scale, fast_val, default_val))
+      if isinstance(fast_val, tuple)
+      else _scale(fast_val, default_val)
+      for fast_val, default_val in zip(fast, default)
+    )
+  )
+
+
+class TimingProfile(Versioned):
+  """The timing parameters of a UVN, derived from a preset.
+
+  Every parameter can be overridden with a custom value. The AUTO preset
+  scales the parameters with the number of cells and with the expected
+  round-trip time (rtt, in milliseconds) between cells. The inputs are the
+  same for every agent since some timers (e.g. OSPF's) must match between
+  peers, so the rtt is not measured at runtime, but it can be set from the
+  latency reported by the agents (uno_lan_probe_seconds)."""
+
+  PARAMETERS = list(TimingParameters._fields)
+  PROPERTIES = [
+    "preset",
+    "rtt",
+    *PARAMETERS,
+  ]
+  EQ_PROPERTIES = PROPERTIES
+  INITIAL_PRESET = TimingPreset.DEFAULT
+
+  def prepare_preset(self, val: str | TimingPreset) -> TimingPreset:
+    return prepare_enum(self.db, TimingPreset, val)
+
+  def prepare_rtt(self, val: int | float | str) -> float:
+    val = float(val)
+    if val <= 0:
+      raise ValueError("invalid rtt", val)
+    return val
+
+  def prepare_initial_participant_announcement_period(
+    self, val: str | list[int] | tuple[int, int]
+  ) -> tuple[int, int]:
+    if isinstance(val, str):
+      val = self.yaml_load(val)
+    val = tuple(val)
+    if len(val) != 2:
+      raise ValueError("invalid participant announcement period", val)
+    return val
+
+  def resolve(self, cells: int = 1) -> TimingParameters:
+    if self.preset == TimingPreset.AUTO:
+      base = scale_timing(cells, self.rtt or AUTO_DEFAULT_RTT)
     else:
-      return 30
+      base = PRESETS[self.preset]
+    overrides = {p: v for p in self.PARAMETERS for v in [getattr(self, p)] if v is not None}
+    params = base._replace(**overrides)
+    params.validate()
+    return params
+
+  def _validate(self) -> None:
+    self.resolve()
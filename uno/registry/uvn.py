@@ -20,6 +20,7 @@ from functools import cached_property
 
 from .deployment import P2pLinksMap
 from .uvn_settings import UvnSettings
+from .timing_profile import TimingParameters
 from .user import User
 from .cell import Cell
 from .particle import Particle
@@ -196,6 +197,10 @@ class Uvn(Versioned, OwnableDatabaseObject, DatabaseObjectOwner):
     for p in self.all_particles.values():
       yield p
 
+  @property
+  def timing(self) -> TimingParameters:
+    return self.settings.timing_profile.resolve(cells=len(self.cells))
+
   def prepare_settings(self, val: str | dict | UvnSettings) -> UvnSettings:
     return self.new_child(UvnSettings, val)
 
@@ -221,11 +226,17 @@ class Uvn(Versioned, OwnableDatabaseObject, DatabaseObjectOwner):
       )
       if clashes:
         raise ClashingNetworksError(clashes)
-    elif cell.private:
+    if cell.private:
+      self.validate_private_cell(cell.allowed_lans, cell)
+
+  def validate_private_cell(
+    self, allowed_lans: Iterable[ipaddress.IPv4Network], cell: Cell | str
+  ) -> None:
+    if not allowed_lans:
       raise ValueError("private cells must have at least one network attached to them", cell)
 
     # Check that the UVN has an address if any cell is private
-    if cell.private and not self.address and self.settings.enable_root_vpn:
+    if not self.address and self.settings.enable_root_vpn:
       raise ValueError(
         "private cells require a registry address to support reconfiguration. "
         "Either make the cell public, assign a public address to the UVN, or disable the root VPN.",
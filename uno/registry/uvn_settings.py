@@ -15,7 +15,7 @@
 ###############################################################################
 from typing import Generator
 from .versioned import Versioned, prepare_enum
-from .timing_profile import TimingProfile
+from .timing_profile import TimingProfile, TimingPreset
 from .vpn_settings import RootVpnSettings, ParticlesVpnSettings, BackboneVpnSettings
 from .deployment_strategy import DeploymentStrategyKind
 
@@ -40,6 +40,54 @@ class DeploymentSettings(Versioned):
     return val
 
 
+class HistorySettings(Versioned):
+  PROPERTIES = [
+    "max_generations",
+    "max_archives",
+  ]
+  EQ_PROPERTIES = PROPERTIES
+  # Number of generations whose changes are kept in the database
+  INITIAL_MAX_GENERATIONS = 100
+  # Number of (most recent) generations whose artifacts are archived
+  INITIAL_MAX_ARCHIVES = 10
+
+  def prepare_max_generations(self, val: str | int) -> int:
+    val = int(val)
+    if val < 1:
+      raise ValueError("invalid max_generations", val)
+    return val
+
+  def prepare_max_archives(self, val: str | int) -> int:
+    val = int(val)
+    if val < 0:
+      raise ValueError("invalid max_archives", val)
+    return val
+
+
+class StatusHistorySettings(Versioned):
+  PROPERTIES = [
+    "resolution",
+    "samples",
+  ]
+  EQ_PROPERTIES = PROPERTIES
+  # Seconds between the samples of the agents' peers status
+  INITIAL_RESOLUTION = 300
+  # Number of samples kept for every VPN interface and LAN of a peer
+  INITIAL_SAMPLES = 2016
+
+  def prepare_resolution(self, val: str | int) -> int:
+    val = int(val)
+    if val < 1:
+      raise ValueError("invalid resolution", val)
+    return val
+
+  def prepare_samples(self, val: str | int) -> int:
+    val = int(val)
+    if val < 1:
+      raise ValueError("invalid samples", val)
+    return val
+
+
 class UvnSettings(Versioned):
   PROPERTIES = [
     "root_vpn",
@@ -51,9 +99,10 @@ class UvnSettings(Versioned):
     "enable_dds_security",
     "dds_domain",
     "deployment",
+    "history",
+    "status_history",
   ]
   EQ_PROPERTIES = PROPERTIES
-  INITIAL_TIMING_PROFILE = TimingProfile.DEFAULT
   INITIAL_ENABLE_PARTICLES_VPN = True
   INITIAL_ENABLE_ROOT_VPN = True
   INITIAL_ENABLE_DDS_SECURITY = False
@@ -65,6 +114,8 @@ class UvnSettings(Versioned):
   # INITIAL_DEPLOYMENT = lambda self: self.new_child(DeploymentSettings)
 
   def load_nested(self) -> None:
+    if self.timing_profile is None:
+      self.timing_profile = self.new_child(TimingProfile)
     if self.root_vpn is None:
       self.root_vpn = self.new_child(RootVpnSettings)
     if self.particles_vpn is None:
@@ -73,9 +124,19 @@ class UvnSettings(Versioned):
       self.backbone_vpn = self.new_child(BackboneVpnSettings)
     if self.deployment is None:
       self.deployment = self.new_child(DeploymentSettings)
+    if self.history is None:
+      self.history = self.new_child(HistorySettings)
+    if self.status_history is None:
+      self.status_history = self.new_child(StatusHistorySettings)
 
-  def prepare_timing_profile(self, val: str | TimingProfile) -> TimingProfile:
-    return prepare_enum(self.db, TimingProfile, val)
+  def prepare_timing_profile(self, val: str | dict | TimingProfile) -> TimingProfile:
+    if isinstance(val, str):
+      try:
+        # A preset name (as stored by previous versions)
+        val = {"preset": TimingPreset.parse(val)}
+      except KeyError:
+        pass
+    return self.new_child(TimingProfile, val)
 
   def prepare_root_vpn(self, val: str | dict | RootVpnSettings) -> RootVpnSettings:
     return self.new_child(RootVpnSettings, val)
@@ -90,9 +151,20 @@ class UvnSettings(Versioned):
     settings = self.new_child(DeploymentSettings, val)
     return settings
 
+  def prepare_history(self, val: str | dict | HistorySettings) -> HistorySettings:
+    return self.new_child(HistorySettings, val)
+
+  def prepare_status_history(
+    self, val: str | dict | StatusHistorySettings
+  ) -> StatusHistorySettings:
+    return self.new_child(StatusHistorySettings, val)
+
   @property
   def nested(self) -> Generator[Versioned, None, None]:
+    yield self.timing_profile
     yield self.root_vpn
     yield self.particles_vpn
     yield self.backbone_vpn
     yield self.deployment
+    yield self.history
+    yield self.status_history
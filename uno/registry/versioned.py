@@ -19,11 +19,12 @@ from typing import Iterable, Callable, Generator, Protocol, TYPE_CHECKING
 
 # from collections.abc import Mapping, KeysView, ItemsView, ValuesView
 from enum import Enum
-import yaml
 import json
 
 from ..core.time import Timestamp
 from ..core.log import Logger
+from ..core.yaml_codec import yaml_dump, yaml_load
+from .column_codec import dump_column
 
 from .database_object import (
   DatabaseObject,
@@ -590,6 +591,14 @@ class Versioned(DatabaseObject):
   def yaml_dump(cls, val: object, public: bool = False, json: bool = False) -> str:
     import json as json_lib
 
+    val = cls._dumpable(val, public=public)
+    if json:
+      return json_lib.dumps(val)
+    else:
+      return yaml_dump(val)
+
+  @classmethod
+  def _dumpable(cls, val: object, public: bool = False) -> object:
     if hasattr(val, "serialize") and callable(val.serialize):
       val = val.serialize(public=public)
     if public and isinstance(val, dict):
@@ -600,14 +609,11 @@ class Versioned(DatabaseObject):
       val = sorted(val)
     elif isinstance(val, dict):
       val = strip_unserializable(val)
-    if json:
-      return json_lib.dumps(val)
-    else:
-      return yaml.dump(val)
+    return val
 
   @classmethod
   def yaml_load(cls, val: str) -> object:
-    return yaml.safe_load(val)
+    return yaml_load(val)
 
   @classmethod
   def json_dump(cls, val: object, public: bool = False) -> str:
@@ -745,12 +751,19 @@ class Versioned(DatabaseObject):
     self.__update_hash__()
 
   def save(self, cursor: "Database.Cursor|None" = None, **db_args) -> None:
+    # The database which stores the record, which is not the object's
+    # one when exporting it (see Database.export_objects())
+    target = db_args.pop("target", None) or self.db
     if not self.SCHEMA.db_table_properties:
       return
 
+    table = self.db.SCHEMA.lookup_table_by_object(self, required=False)
+
     def _dump_field(prop, val, desc):
       if val is self.OMITTED:
         return None
+      elif isinstance(val, str) and prop in self.SCHEMA.secret_properties:
+        return target.dump_secret(table, prop, val)
       elif isinstance(val, self.db.DB_TYPES):
         return val
       elif isinstance(val, Path):
@@ -760,7 +773,7 @@ class Versioned(DatabaseObject):
       ):
         return self.json_dump(val)
       else:
-        return self.yaml_dump(val)
+        return dump_column(self._dumpable(val), target.column_codec)
 
     self.generation_ts = Timestamp.now().format()
     serialized = self.serialize(public=db_args["public"])
@@ -770,7 +783,6 @@ class Versioned(DatabaseObject):
       for ser_val in [serialized.get(prop)]
       for desc in [self.SCHEMA.descriptor(prop)]
     }
-    table = self.db.SCHEMA.lookup_table_by_object(self, required=False)
     if table and fields:
       self.db.create_or_update(self, fields=fields, cursor=cursor, table=table, **db_args)
 
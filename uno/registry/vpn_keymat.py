@@ -14,6 +14,7 @@
 # limitations under the License.
 ###############################################################################
 from typing import Iterable, Generator, Callable, TYPE_CHECKING
+import functools
 import json
 
 from ..core.paired_map import PairedValuesMap
@@ -30,6 +31,13 @@ class MissingKeyMaterial(Exception):
   pass
 
 
+@functools.lru_cache(maxsize=4096)
+def _parse_pair(pair_str: str) -> tuple:
+  # Key ids embed the pair as JSON (see VpnKeysMap.key_id()), and the
+  # same ids are parsed again every time a map is loaded
+  return tuple(json.loads(pair_str))
+
+
 class VpnKeysMap(Versioned, PairedValuesMap):
   PROPERTIES = [
     "prefix",
@@ -93,7 +101,7 @@ class VpnKeysMap(Versioned, PairedValuesMap):
         else:
           pair_str = key_id
           key_id = None
-        pair = tuple(json.loads(pair_str))
+        pair = _parse_pair(pair_str)
         self.load_key(loaded, pair, key, key_id or None)
       return loaded
 
@@ -140,7 +148,7 @@ class VpnKeysMap(Versioned, PairedValuesMap):
     #     yield key
 
   def key_id(self, pair: tuple, extra: str | None = None) -> str:
-    return f"{self.prefix}:{json.dumps(pair)}{':'+extra if extra else ''}"
+    return f"{self.prefix}:{json.dumps(pair)}{':' + extra if extra else ''}"
 
   def save(self, cursor: "Database.Cursor | None" = None, **db_args) -> None:
     # Changed keys were already returned by a "collect_changes()"
@@ -2,6 +2,7 @@ from .host_role import HostRole
 from .host import Host
 from .network import Network
 from .experiment import Experiment
+from .experiment_backend import ExperimentBackend
 from .experiment_view import ExperimentView
 
 __all__ = [
@@ -9,5 +10,6 @@ __all__ = [
   Host,
   Network,
   Experiment,
+  ExperimentBackend,
   ExperimentView,
 ]
@@ -0,0 +1,7 @@
+from .docker_backend import DockerExperimentBackend
+from .netns_backend import NetnsExperimentBackend
+
+__all__ = [
+  DockerExperimentBackend,
+  NetnsExperimentBackend,
+]
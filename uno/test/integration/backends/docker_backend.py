@@ -0,0 +1,273 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from typing import TYPE_CHECKING
+from pathlib import Path
+import os
+import shutil
+import subprocess
+
+from uno.core.exec import exec_command
+
+from ..experiment_backend import ExperimentBackend
+from ..host_role import HostRole
+
+if TYPE_CHECKING:
+  from ..host import Host
+  from ..network import Network
+
+
+class DockerExperimentBackend(ExperimentBackend):
+  """Run every host in a Docker container, attached to Docker bridge networks."""
+
+  Id = "docker"
+
+  @classmethod
+  def available(cls) -> bool:
+    return shutil.which("docker") is not None
+
+  def create_network(self, network: "Network") -> None:
+    # Make sure the network doesn't exist then create it
+    self.delete_network(network, ignore_errors=True)
+    exec_command(
+      [
+        "docker",
+        "network",
+        "create",
+        "--driver",
+        "bridge",
+        f"--subnet={network.subnet}",
+        "-o",
+        f"com.docker.network.bridge.enable_ip_masquerade={'true' if network.masquerade_docker else 'false'}",
+        "-o",
+        f"com.docker.network.bridge.name=br_{network.name}",
+        network.name,
+      ]
+    )
+
+  def delete_network(self, network: "Network", ignore_errors: bool = False) -> None:
+    exec_command(["docker", "network", "rm", network.name], noexcept=ignore_errors)
+
+  def create_host(self, host: "Host") -> None:
+    experiment = self.experiment
+    interactive = experiment.config.get("interactive", False)
+    verbose_flag = host.log.verbose_flag
+    exec_command(
+      [
+        "docker",
+        "create",
+        *(["-ti"] if interactive else []),
+        "--init",
+        "--name",
+        host.container_name,
+        "--hostname",
+        host.hostname,
+        "--net",
+        host.default_network.name,
+        "--ip",
+        str(host.default_address),
+        "--privileged",
+        "-e",
+        "UNO_TEST_RUNNER=y",
+        "-v",
+        f"{experiment.root}:{experiment.RunnerRoot}",
+        "-v",
+        f"{experiment.test_dir}:{experiment.RunnerTestDir}",
+        *(
+          ["-v", f"{host.experiment_uvn_dir}:{experiment.RunnerRegistryRoot}"]
+          if host.role in (HostRole.REGISTRY, HostRole.CELL)
+          else []
+        ),
+        *(["-v", f"{host.cell_package}:/package.uvn-agent"] if host.role == HostRole.CELL else []),
+        *(
+          ["-v", f"{experiment.RtiLicenseFile}:/rti_license.dat"]
+          if experiment.RtiLicenseFile
+          else ["-e", "RTI_LICENSE_FILE="]
+        ),
+        *(
+          [
+            "-v",
+            f"{experiment.UnoDir}:{experiment.RunnerUnoDir}",
+          ]
+          if experiment.Dev
+          else []
+        ),
+        *(
+          [
+            "-e",
+            f"UNO_MIDDLEWARE={experiment.UnoMiddlewareEnv}",
+          ]
+          if experiment.UnoMiddlewareEnv
+          else []
+        ),
+        *(["-e", f"VERBOSITY={host.log.LevelEnv}"] if host.log.LevelEnv else []),
+        *(["-e", "DEBUG=y"] if host.log.DEBUG else []),
+        host.image,
+        experiment.RunnerScript,
+        "host",
+        experiment.test_case.name,
+        host.container_name,
+        *([verbose_flag] if verbose_flag else []),
+      ]
+    )
+    for adj_net in host.adjacent_networks:
+      adj_net_addr = host.networks[adj_net]
+      exec_command(
+        [
+          "docker",
+          "network",
+          "connect",
+          "--ip",
+          str(adj_net_addr),
+          adj_net.name,
+          host.container_name,
+        ]
+      )
+
+  def start_host(self, host: "Host") -> subprocess.Popen:
+    return subprocess.Popen(["docker", "start", host.container_name])
+
+  def stop_host(self, host: "Host") -> subprocess.Popen:
+    return subprocess.Popen(
+      [
+        "docker",
+        "stop",
+        "-s",
+        "SIGINT",
+        "-t",
+        str(self.experiment.config["container_stop_timeout"]),
+        host.container_name,
+      ]
+    )
+
+  def wait_stop_host(self, host: "Host", stop_process: subprocess.Popen) -> None:
+    rc = stop_process.wait(self.experiment.config["container_stop_timeout"])
+    assert rc == 0, f"failed to stop docker container: {host.container_name}"
+
+  def delete_host(self, host: "Host", ignore_errors: bool = False) -> None:
+    exec_command(
+      [
+        "docker",
+        "rm",
+        "-f",
+        host.container_name,
+      ],
+      noexcept=ignore_errors,
+    )
+
+  def host_logs_cmd(self, host: "Host", follow: bool = False) -> list[str | Path]:
+    return ["docker", "logs", *(["-f"] if follow else []), host.container_name]
+
+  def host_exec_cmd(
+    self,
+    host: "Host",
+    *args,
+    user: str | None = None,
+    interactive: bool = False,
+    terminal: bool = False,
+  ) -> list[str | Path]:
+    return [
+      "docker",
+      "exec",
+      *(["-u", user] if user else []),
+      *(["-i"] if interactive else []),
+      *(["-t"] if terminal else []),
+      host.container_name,
+      *args,
+    ]
+
+  def uno_cmd(self, *args) -> list[str | Path]:
+    experiment = self.experiment
+    verbose_flag = experiment.log.verbose_flag
+    return [
+      "docker",
+      "run",
+      "--rm",
+      *(["-ti"] if experiment.config["interactive"] else []),
+      "--init",
+      "-v",
+      f"{experiment.root}:{experiment.RunnerRoot}",
+      "-v",
+      f"{experiment.test_dir}:{experiment.RunnerTestDir}",
+      "-v",
+      f"{experiment.registry_root}:{experiment.RunnerRegistryRoot}",
+      *(
+        [
+          "-v",
+          f"{experiment.UnoDir}:{experiment.RunnerUnoDir}",
+        ]
+        if experiment.Dev
+        else []
+      ),
+      *(
+        [
+          "-e",
+          f"UNO_MIDDLEWARE={experiment.UnoMiddlewareEnv}",
+        ]
+        if experiment.UnoMiddlewareEnv
+        else []
+      ),
+      *(
+        [
+          "-e",
+          f"DEBUG={experiment.log.DEBUG}",
+        ]
+        if experiment.log.DEBUG
+        else []
+      ),
+      *(
+        [
+          "-v",
+          f"{experiment.RtiLicenseFile}:/rti_license.dat",
+        ]
+        if experiment.RtiLicenseFile
+        else ["-e", "RTI_LICENSE_FILE="]
+      ),
+      "-e",
+      f"VERBOSITY={experiment.log.level.name}",
+      experiment.TestImage,
+      *self.UnoCommand,
+      *args,
+      *([verbose_flag] if verbose_flag else []),
+    ]
+
+  def active_hosts(self) -> list[str]:
+    result = exec_command(
+      [f"docker ps -a --format {{{{.Names}}}} | grep '^{self.experiment.name}-' || true"],
+      shell=True,
+      capture_output=True,
+    ).stdout
+    if not result:
+      return []
+    return list(filter(len, result.decode().split("\n")))
+
+  def wipe_hosts(self, hosts: list[str], ignore_errors: bool = False) -> None:
+    exec_command(["docker", "rm", "-f", *hosts], noexcept=ignore_errors)
+
+  def fix_root_permissions(self) -> None:
+    experiment = self.experiment
+    dirs = {experiment.root: experiment.RunnerRoot, experiment.test_dir: experiment.RunnerTestDir}
+    exec_command(
+      [
+        "docker",
+        "run",
+        "--rm",
+        *(tkn for hvol, vol in dirs.items() for tkn in ("-v", f"{hvol}:{vol}")),
+        experiment.TestImage,
+        "fix-file-ownership",
+        f"{os.getuid()}:{os.getgid()}",
+        *dirs.values(),
+      ]
+    )
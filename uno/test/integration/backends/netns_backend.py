@@ -0,0 +1,355 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from typing import TYPE_CHECKING
+from pathlib import Path
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+
+from uno.core.exec import exec_command
+
+from ..experiment_backend import ExperimentBackend
+from ..host_role import HostRole
+
+if TYPE_CHECKING:
+  from ..host import Host
+  from ..network import Network
+
+
+def _uno_command() -> list[str | Path]:
+  # Use the uno script installed with the current interpreter (e.g. in a virtual
+  # environment), since it might not be in the PATH of the user running the tests.
+  script = Path(sys.executable).parent / "uno"
+  if script.exists():
+    return [script]
+  return ["uno"]
+
+
+class NetnsExperimentBackend(ExperimentBackend):
+  """Run every host as a set of processes in a dedicated Linux network namespace.
+
+  The bridge of every network is created in a "switch" namespace shared by the
+  whole experiment, and hosts are attached to it with a veth pair. The bridge
+  holds the network's gateway address, like a Docker network, but it doesn't
+  forward any traffic (so networks are only connected by the experiment's routers,
+  and they don't have access to the outside world).
+
+  Commands are executed in a private mount (and UTS) namespace, where the same
+  directories mounted by the Docker backend are bind-mounted, together with
+  a per-host /run and /etc/hosts. The rest of the filesystem is shared with
+  the system, which must provide the tools used by the tests (e.g. wg-quick,
+  iptables, sshd, and a "uno" user with an SSH key authorized to log in to itself).
+
+  Hosts require no image or container, so an experiment only needs root privileges
+  to create the namespaces, and it uses the local copy of uno."""
+
+  Id = "netns"
+  RequiredTools = ("ip", "unshare", "runuser", "iptables", "wg")
+  UnoCommand = _uno_command()
+  PackageFile = Path("/package.uvn-agent")
+
+  def __init__(self, *args, **kwargs) -> None:
+    super().__init__(*args, **kwargs)
+    self.runners: dict[str, subprocess.Popen] = {}
+
+  @classmethod
+  def available(cls) -> bool:
+    return os.geteuid() == 0 and all(shutil.which(t) for t in cls.RequiredTools)
+
+  @property
+  def switch_netns(self) -> str:
+    return f"{self.experiment.name}-switch"
+
+  def host_dir(self, host: "Host") -> Path:
+    return self.experiment.test_dir / "netns" / host.container_name
+
+  def runner_log(self, host: "Host") -> Path:
+    return self.host_dir(host) / "runner.log"
+
+  def _netns_exists(self, netns: str) -> bool:
+    return (Path("/run/netns") / netns).exists()
+
+  def _mounts(self, host: "Host | None") -> dict[Path, Path]:
+    # Mount point -> mounted file, for a host or (if None) for the registry
+    experiment = self.experiment
+    mounts = {
+      experiment.RunnerRoot: experiment.root,
+      experiment.RunnerTestDir: experiment.test_dir,
+    }
+    if host is None:
+      mounts[experiment.RunnerRegistryRoot] = experiment.registry_root
+      return mounts
+    if host.role in (HostRole.REGISTRY, HostRole.CELL):
+      mounts[experiment.RunnerRegistryRoot] = host.experiment_uvn_dir
+    if host.role == HostRole.CELL:
+      mounts[self.PackageFile] = host.cell_package
+    mounts[Path("/run")] = self.host_dir(host) / "run"
+    mounts[Path("/etc/hosts")] = self.host_dir(host) / "hosts"
+    return mounts
+
+  def _create_mount_points(self) -> None:
+    # The mount points must exist on the system's filesystem
+    for mount_point in (
+      self.experiment.RunnerRoot,
+      self.experiment.RunnerTestDir,
+      self.experiment.RunnerRegistryRoot,
+    ):
+      mount_point.mkdir(exist_ok=True)
+    self.PackageFile.touch(exist_ok=True)
+
+  def _env(self) -> list[str]:
+    python_path = [str(self.experiment.UnoDir)]
+    if os.environ.get("PYTHONPATH"):
+      python_path.append(os.environ["PYTHONPATH"])
+    return [
+      "env",
+      # The external test directory is only used by the process running the experiment
+      "-u",
+      "TEST_DIR",
+      "UNO_TEST_RUNNER=y",
+      f"TEST_BACKEND={self.Id}",
+      f"PYTHONPATH={':'.join(python_path)}",
+      *([f"VERBOSITY={self.log.LevelEnv}"] if self.log.LevelEnv else []),
+    ]
+
+  def _isolated_cmd(
+    self, host: "Host | None", *args, user: str | None = None, cwd: Path | None = None
+  ) -> list[str | Path]:
+    script = [
+      *(
+        f"mount --bind {shlex.quote(str(src))} {shlex.quote(str(dst))}"
+        for dst, src in self._mounts(host).items()
+      ),
+      *([f"hostname {shlex.quote(host.hostname)}"] if host is not None else []),
+      *([f"cd {shlex.quote(str(cwd))}"] if cwd is not None else []),
+      'exec "$@"',
+    ]
+    return [
+      *(["ip", "netns", "exec", host.container_name] if host is not None else []),
+      "unshare",
+      "--mount",
+      "--propagation",
+      "private",
+      *(["--uts"] if host is not None else []),
+      "sh",
+      "-ec",
+      "\n".join(script),
+      "sh",
+      *self._env(),
+      *(["runuser", "-u", user, "--"] if user else []),
+      *args,
+    ]
+
+  def create_network(self, network: "Network") -> None:
+    self.delete_network(network, ignore_errors=True)
+    if not self._netns_exists(self.switch_netns):
+      exec_command(["ip", "netns", "add", self.switch_netns])
+      # Like Docker's isolation rules, prevent traffic between networks
+      exec_command(
+        ["ip", "netns", "exec", self.switch_netns, "sysctl", "-q", "-w", "net.ipv4.ip_forward=0"]
+      )
+    bridge = f"br_{network.name}"
+    exec_command(["ip", "-n", self.switch_netns, "link", "add", bridge, "type", "bridge"])
+    exec_command(
+      [
+        "ip",
+        "-n",
+        self.switch_netns,
+        "addr",
+        "add",
+        f"{network.default_router}/{network.subnet.prefixlen}",
+        "dev",
+        bridge,
+      ]
+    )
+    exec_command(["ip", "-n", self.switch_netns, "link", "set", bridge, "up"])
+    if network.masquerade_docker:
+      self.log.debug("network {} has no access to the outside world", network)
+
+  def delete_network(self, network: "Network", ignore_errors: bool = False) -> None:
+    if not self._netns_exists(self.switch_netns):
+      if not ignore_errors:
+        raise RuntimeError("network not found", network)
+      return
+    exec_command(
+      ["ip", "-n", self.switch_netns, "link", "del", f"br_{network.name}"],
+      noexcept=ignore_errors,
+    )
+    bridges = exec_command(
+      ["ip", "-n", self.switch_netns, "-o", "link", "show", "type", "bridge"],
+      capture_output=True,
+    ).stdout
+    if not bridges.strip():
+      exec_command(["ip", "netns", "delete", self.switch_netns])
+
+  def create_host(self, host: "Host") -> None:
+    host_dir = self.host_dir(host)
+    if host_dir.exists():
+      shutil.rmtree(host_dir)
+    (host_dir / "run").mkdir(parents=True)
+    (host_dir / "hosts").write_text(
+      f"127.0.0.1\tlocalhost\n{host.default_address}\t{host.hostname}\n"
+    )
+    self.runner_log(host).touch()
+    self._create_mount_points()
+
+    netns = host.container_name
+    host_i = self.experiment.hosts.index(host)
+    exec_command(["ip", "netns", "add", netns])
+    exec_command(["ip", "-n", netns, "link", "set", "lo", "up"])
+    # Interfaces are named and attached in the same order used by Docker
+    for i, net in enumerate([host.default_network, *host.adjacent_networks]):
+      nic = f"eth{i}"
+      peer = f"h{host_i}e{i}"
+      exec_command(
+        [
+          *("ip", "link", "add", nic, "netns", netns, "type", "veth"),
+          *("peer", "name", peer, "netns", self.switch_netns),
+        ]
+      )
+      exec_command(
+        ["ip", "-n", self.switch_netns, "link", "set", peer, "master", f"br_{net.name}", "up"]
+      )
+      exec_command(
+        [
+          "ip",
+          "-n",
+          netns,
+          "addr",
+          "add",
+          f"{host.networks[net]}/{net.subnet.prefixlen}",
+          "dev",
+          nic,
+        ]
+      )
+      exec_command(["ip", "-n", netns, "link", "set", nic, "up"])
+    exec_command(
+      [
+        "ip",
+        "-n",
+        netns,
+        "route",
+        "add",
+        "default",
+        "via",
+        str(host.default_network.default_router),
+      ]
+    )
+    # Like in the test image, the kernel is expected to forward packets
+    exec_command(["ip", "netns", "exec", netns, "sysctl", "-q", "-w", "net.ipv4.ip_forward=1"])
+
+  def start_host(self, host: "Host") -> subprocess.Popen:
+    verbose_flag = host.log.verbose_flag
+    with self.runner_log(host).open("ab") as output:
+      runner = subprocess.Popen(
+        self._isolated_cmd(
+          host,
+          sys.executable,
+          "-m",
+          "uno.test.integration.runner",
+          "host",
+          self.experiment.test_case.name,
+          host.container_name,
+          *([verbose_flag] if verbose_flag else []),
+        ),
+        stdout=output,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+      )
+    self.runners[host.container_name] = runner
+    return runner
+
+  def stop_host(self, host: "Host") -> subprocess.Popen | None:
+    runner = self.runners.get(host.container_name)
+    if runner is not None and runner.poll() is None:
+      runner.send_signal(signal.SIGINT)
+    return runner
+
+  def wait_stop_host(self, host: "Host", stop_process: subprocess.Popen | None) -> None:
+    if stop_process is None:
+      return
+    try:
+      rc = stop_process.wait(self.experiment.config["container_stop_timeout"])
+    except subprocess.TimeoutExpired:
+      stop_process.kill()
+      raise
+    finally:
+      self.runners.pop(host.container_name, None)
+    assert rc == 0, f"failed to stop host: {host.container_name}"
+
+  def _kill_processes(self, netns: str) -> None:
+    pids = exec_command(["ip", "netns", "pids", netns], capture_output=True, noexcept=True).stdout
+    for pid in (pids or b"").decode().split():
+      try:
+        os.kill(int(pid), signal.SIGKILL)
+      except ProcessLookupError:
+        pass
+
+  def delete_host(self, host: "Host", ignore_errors: bool = False) -> None:
+    runner = self.runners.pop(host.container_name, None)
+    if runner is not None and runner.poll() is None:
+      runner.kill()
+    self.wipe_hosts([host.container_name], ignore_errors=ignore_errors)
+
+  def host_logs_cmd(self, host: "Host", follow: bool = False) -> list[str | Path]:
+    return ["tail", *(["-f"] if follow else ["-n", "+1"]), self.runner_log(host)]
+
+  def host_exec_cmd(
+    self,
+    host: "Host",
+    *args,
+    user: str | None = None,
+    interactive: bool = False,
+    terminal: bool = False,
+  ) -> list[str | Path]:
+    # Processes always inherit the caller's stdin and terminal
+    return self._isolated_cmd(host, *args, user=user)
+
+  def uno_cmd(self, *args) -> list[str | Path]:
+    self._create_mount_points()
+    # Docker creates missing volume directories automatically
+    self.experiment.registry_root.mkdir(parents=True, exist_ok=True)
+    verbose_flag = self.log.verbose_flag
+    return self._isolated_cmd(
+      None,
+      *self.UnoCommand,
+      *args,
+      *([verbose_flag] if verbose_flag else []),
+      cwd=self.experiment.RunnerRegistryRoot,
+    )
+
+  def active_hosts(self) -> list[str]:
+    result = exec_command(["ip", "netns", "list"], capture_output=True).stdout
+    return [
+      netns
+      for line in (result or b"").decode().split("\n")
+      if line
+      # Lines have format "NAME (id: N)"
+      for netns in [line.split(" ")[0]]
+      if netns.startswith(f"{self.experiment.name}-")
+    ]
+
+  def wipe_hosts(self, hosts: list[str], ignore_errors: bool = False) -> None:
+    for netns in hosts:
+      if not self._netns_exists(netns):
+        if not ignore_errors:
+          raise RuntimeError("host not found", netns)
+        continue
+      self._kill_processes(netns)
+      exec_command(["ip", "netns", "delete", netns], noexcept=ignore_errors)
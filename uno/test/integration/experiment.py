@@ -21,19 +21,22 @@ import os
 from functools import cached_property
 import contextlib
 import subprocess
+import time
 from typing import Protocol
 import pprint
-import yaml
 
 from uno.core.exec import exec_command
 from uno.core.log import Logger
 from uno.core.time import Timer
+from uno.core.yaml_codec import yaml_dump
 from uno.registry.registry import Registry
 from uno.middleware import Middleware
 
 from .network import Network
 from .host import Host
 from .host_role import HostRole
+from .experiment_backend import ExperimentBackend
+from . import backends  # noqa: F401
 
 import uno
 
@@ -86,12 +89,23 @@ class Experiment:
   RunnerRoot = Path("/experiment")
   RunnerRegistryRoot = Path("/uvn")
   RunnerUnoDir = Path("/uno")
+  # Backends on which experiments are run (see ExperimentBackend),
+  # experiments are defined on the first one unless otherwise specified.
+  Backends = [b for b in os.environ.get("TEST_BACKEND", "docker,netns").split(",") if b]
+  Backend = Backends[0]
 
   @classmethod
   def as_fixture(
-    cls, loader: ExperimentLoader, **experiment_args
+    cls, loader: ExperimentLoader, backend: str | None = None, **experiment_args
   ) -> Generator["Experiment", None, None]:
-    e = loader(**experiment_args)
+    # Test cases define their experiments without specifying a backend
+    default_backend = Experiment.Backend
+    if backend is not None:
+      Experiment.Backend = backend
+    try:
+      e = loader(**experiment_args)
+    finally:
+      Experiment.Backend = default_backend
     if not e:
       yield None
     else:
@@ -107,6 +121,7 @@ class Experiment:
     config: dict | None = None,
     test_dir: Path | None = None,
     requires_agents: bool = False,
+    backend: str | None = None,
   ) -> "Experiment | None":
     # Make sure the test case file is an absolute path
     test_case = test_case.resolve()
@@ -160,6 +175,7 @@ class Experiment:
       root=root,
       config=config,
       test_dir=test_dir,
+      backend=backend or cls.Backend,
     )
     experiment.__test_dir_tmp = test_dir_tmp
     if not experiment.InsideTestRunner:
@@ -209,6 +225,7 @@ class Experiment:
     root: Path,
     config: dict,
     test_dir: Path,
+    backend: str = "docker",
   ) -> None:
     self.test_case = test_case
     self.name = name
@@ -221,6 +238,9 @@ class Experiment:
     self.transit_networks: list[Network] = []
     self.hosts: list[Host] = []
     self.log = Logger.sublogger(name)
+    self.backend = ExperimentBackend.load(backend, self)
+    # Time spent creating and starting all hosts
+    self.setup_time: float | None = None
     self.define_networks_and_hosts()
 
   @property
@@ -252,6 +272,7 @@ class Experiment:
     return next((h for h in self.hosts if h.role == HostRole.REGISTRY), None)
 
   def log_configuration(self) -> None:
+    self.log.info("experiment backend: {}", self.backend)
     self.log.info("experiment configuration: {}", pprint.pformat(self.config))
     self.log.info(
       "{} experiment private networks: {}",
@@ -316,7 +337,7 @@ class Experiment:
 
   def define_uvn_from_config(self, name: str, uvn_spec: dict) -> None:
     uvn_spec_f = self.test_dir / "uvn_spec.yaml"
-    uvn_spec_f.write_text(yaml.safe_dump(uvn_spec))
+    uvn_spec_f.write_text(yaml_dump(uvn_spec))
     self.uno(
       "define",
       "uvn",
@@ -328,8 +349,13 @@ class Experiment:
   @contextlib.contextmanager
   def begin(self) -> "Generator[Experiment, None, None]":
     try:
+      setup_start = time.monotonic()
       self.create()
       self.start()
+      self.setup_time = time.monotonic() - setup_start
+      self.log.info(
+        "{} hosts set up on {} in {}s", len(self.hosts), self.backend, f"{self.setup_time:.1f}"
+      )
       yield self
     finally:
       KEEP_DOCKER = os.environ.get("KEEP_DOCKER", False)
@@ -361,78 +387,11 @@ class Experiment:
     self.log.info("created {} networks and {} containers", len(self.networks), len(self.hosts))
 
   def fix_root_permissions(self) -> None:
-    dirs = {self.root: self.RunnerRoot, self.test_dir: self.RunnerTestDir}
-    exec_command(
-      [
-        "docker",
-        "run",
-        "--rm",
-        *(tkn for hvol, vol in dirs.items() for tkn in ("-v", f"{hvol}:{vol}")),
-        self.TestImage,
-        "fix-file-ownership",
-        f"{os.getuid()}:{os.getgid()}",
-        *dirs.values(),
-      ]
-    )
+    self.backend.fix_root_permissions()
 
   def uno(self, *args, **exec_args):
-    verbose_flag = Logger.verbose_flag
     try:
-      return exec_command(
-        [
-          "docker",
-          "run",
-          "--rm",
-          *(["-ti"] if self.config["interactive"] else []),
-          "--init",
-          "-v",
-          f"{self.root}:{self.RunnerRoot}",
-          "-v",
-          f"{self.test_dir}:{self.RunnerTestDir}",
-          "-v",
-          f"{self.registry_root}:{self.RunnerRegistryRoot}",
-          *(
-            [
-              "-v",
-              f"{self.UnoDir}:{self.RunnerUnoDir}",
-            ]
-            if self.Dev
-            else []
-          ),
-          *(
-            [
-              "-e",
-              f"UNO_MIDDLEWARE={self.UnoMiddlewareEnv}",
-            ]
-            if self.UnoMiddlewareEnv
-            else []
-          ),
-          *(
-            [
-              "-e",
-              f"DEBUG={self.log.DEBUG}",
-            ]
-            if self.log.DEBUG
-            else []
-          ),
-          *(
-            [
-              "-v",
-              f"{self.RtiLicenseFile}:/rti_license.dat",
-            ]
-            if self.RtiLicenseFile
-            else ["-e", "RTI_LICENSE_FILE="]
-          ),
-          "-e",
-          f"VERBOSITY={self.log.level.name}",
-          self.TestImage,
-          "uno",
-          *args,
-          *([verbose_flag] if verbose_flag else []),
-        ],
-        debug=True,
-        **exec_args,
-      )
+      return exec_command(self.backend.uno_cmd(*args), debug=True, **exec_args)
     finally:
       self.fix_root_permissions()
 
@@ -460,14 +419,7 @@ class Experiment:
 
   @property
   def active_containers(self) -> list[str]:
-    result = exec_command(
-      ["docker ps -a --format {{.Names}} | grep " f"'^{self.name}-' || true"],
-      shell=True,
-      capture_output=True,
-    ).stdout
-    if not result:
-      return []
-    return list(filter(len, result.decode().split("\n")))
+    return self.backend.active_hosts()
 
   def wipe_containers(self) -> None:
     existing_containers = self.active_containers
@@ -476,7 +428,7 @@ class Experiment:
     self.log.warning(
       "wiping stale {} containers: {}", len(existing_containers), existing_containers
     )
-    exec_command(["docker", "rm", "-f", *existing_containers])
+    self.backend.wipe_hosts(existing_containers)
 
   def define_network(
     self,
@@ -496,7 +448,7 @@ class Experiment:
       net_set = self.public_networks
       name_prefix = "publan"
     net_i = len(net_set)
-    name = f"{name_prefix}{net_i+1}"
+    name = f"{name_prefix}{net_i + 1}"
     net = Network(
       experiment=self,
       name=name,
@@ -0,0 +1,112 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from typing import TYPE_CHECKING
+from pathlib import Path
+import subprocess
+
+if TYPE_CHECKING:
+  from .experiment import Experiment
+  from .host import Host
+  from .network import Network
+
+_Registered = {}
+
+
+class ExperimentBackend:
+  """Create the networks and hosts of an Experiment, and run commands on them.
+
+  Every host must see the same filesystem layout (e.g. the experiment's
+  directories mounted at Experiment.RunnerRoot and Experiment.RunnerTestDir),
+  regardless of the backend."""
+
+  Id: str = None
+  # Command used to invoke uno on a host
+  UnoCommand: list[str | Path] = ["uno"]
+
+  def __init__(self, experiment: "Experiment") -> None:
+    self.experiment = experiment
+    self.log = experiment.log
+
+  def __init_subclass__(cls) -> None:
+    if cls.Id is not None:
+      _Registered[cls.Id.lower()] = cls
+
+  def __str__(self) -> str:
+    return self.Id
+
+  @classmethod
+  def lookup(cls, id: str) -> type["ExperimentBackend"]:
+    return _Registered[id.lower()]
+
+  @classmethod
+  def load(cls, id: str, experiment: "Experiment") -> "ExperimentBackend":
+    return cls.lookup(id)(experiment)
+
+  @classmethod
+  def available(cls) -> bool:
+    """Check whether the backend can be used on the current system."""
+    raise NotImplementedError()
+
+  def create_network(self, network: "Network") -> None:
+    raise NotImplementedError()
+
+  def delete_network(self, network: "Network", ignore_errors: bool = False) -> None:
+    raise NotImplementedError()
+
+  def create_host(self, host: "Host") -> None:
+    raise NotImplementedError()
+
+  def start_host(self, host: "Host") -> subprocess.Popen:
+    raise NotImplementedError()
+
+  def stop_host(self, host: "Host") -> subprocess.Popen:
+    raise NotImplementedError()
+
+  def wait_stop_host(self, host: "Host", stop_process: subprocess.Popen) -> None:
+    raise NotImplementedError()
+
+  def delete_host(self, host: "Host", ignore_errors: bool = False) -> None:
+    raise NotImplementedError()
+
+  def host_logs_cmd(self, host: "Host", follow: bool = False) -> list[str | Path]:
+    """Return a command which prints the output of a host's runner process."""
+    raise NotImplementedError()
+
+  def host_exec_cmd(
+    self,
+    host: "Host",
+    *args,
+    user: str | None = None,
+    interactive: bool = False,
+    terminal: bool = False,
+  ) -> list[str | Path]:
+    """Return the command to execute a command on a host."""
+    raise NotImplementedError()
+
+  def uno_cmd(self, *args) -> list[str | Path]:
+    """Return the command to run uno on the experiment's registry, outside of the hosts."""
+    raise NotImplementedError()
+
+  def active_hosts(self) -> list[str]:
+    """Return the names of the hosts of the experiment that currently exist,
+    including any left over by a previous run."""
+    raise NotImplementedError()
+
+  def wipe_hosts(self, hosts: list[str], ignore_errors: bool = False) -> None:
+    raise NotImplementedError()
+
+  def fix_root_permissions(self) -> None:
+    pass
@@ -236,9 +236,9 @@ class Host:
     unexpected_lans = self.cell_reachable_networks - expected_lans
     if missing_lans:
       self.log.warning("not routed to {} lans: {}", len(missing_lans), missing_lans)
-    assert (
-      len(unexpected_lans) == 0
-    ), f"{len(unexpected_lans)} unexpected reachable network: {unexpected_lans}"
+    assert len(unexpected_lans) == 0, (
+      f"{len(unexpected_lans)} unexpected reachable network: {unexpected_lans}"
+    )
     return expected_lans == self.cell_reachable_networks
 
   def particle_file(self, cell: Cell, ext: str = ".conf") -> tuple[Path, Path]:
@@ -322,85 +322,11 @@ class Host:
         shutil.rmtree(self.experiment_uvn_dir)
       shutil.copytree(self.experiment.registry.root, self.experiment_uvn_dir)
 
-    interactive = self.experiment.config.get("interactive", False)
-
-    verbose_flag = self.log.verbose_flag
-
-    exec_command(
-      [
-        "docker",
-        "create",
-        *(["-ti"] if interactive else []),
-        "--init",
-        "--name",
-        self.container_name,
-        "--hostname",
-        self.hostname,
-        "--net",
-        self.default_network.name,
-        "--ip",
-        str(self.default_address),
-        "--privileged",
-        "-e",
-        "UNO_TEST_RUNNER=y",
-        "-v",
-        f"{self.experiment.root}:{self.experiment.RunnerRoot}",
-        "-v",
-        f"{self.experiment.test_dir}:{self.experiment.RunnerTestDir}",
-        *(
-          ["-v", f"{self.experiment_uvn_dir}:{self.experiment.RunnerRegistryRoot}"]
-          if self.role in (HostRole.REGISTRY, HostRole.CELL)
-          else []
-        ),
-        *(["-v", f"{self.cell_package}:/package.uvn-agent"] if self.role == HostRole.CELL else []),
-        *(
-          ["-v", f"{self.experiment.RtiLicenseFile}:/rti_license.dat"]
-          if self.experiment.RtiLicenseFile
-          else ["-e", "RTI_LICENSE_FILE="]
-        ),
-        *(
-          [
-            "-v",
-            f"{self.experiment.UnoDir}:{self.experiment.RunnerUnoDir}",
-          ]
-          if self.experiment.Dev
-          else []
-        ),
-        *(
-          [
-            "-e",
-            f"UNO_MIDDLEWARE={self.experiment.UnoMiddlewareEnv}",
-          ]
-          if self.experiment.UnoMiddlewareEnv
-          else []
-        ),
-        *(["-e", f"VERBOSITY={self.log.LevelEnv}"] if self.log.LevelEnv else []),
-        *(["-e", "DEBUG=y"] if self.log.DEBUG else []),
-        self.image,
-        self.experiment.RunnerScript,
-        "host",
-        self.experiment.test_case.name,
-        self.container_name,
-        *([verbose_flag] if verbose_flag else []),
-      ]
-    )
-    for adj_net in self.adjacent_networks:
-      adj_net_addr = self.networks[adj_net]
-      exec_command(
-        [
-          "docker",
-          "network",
-          "connect",
-          "--ip",
-          str(adj_net_addr),
-          adj_net.name,
-          self.container_name,
-        ]
-      )
+    self.experiment.backend.create_host(self)
 
   def start(self, wait: bool = False) -> subprocess.Popen:
     self.log.info("starting container")
-    result = subprocess.Popen(["docker", "start", self.container_name])
+    result = self.experiment.backend.start_host(self)
     if wait:
       self.wait_ready()
       self.log.activity("started")
@@ -425,43 +351,24 @@ class Host:
           file=sys.stderr,
         )
 
-      result = exec_command(["docker", "logs", self.container_name], capture_output=True)
+      result = exec_command(self.experiment.backend.host_logs_cmd(self), capture_output=True)
       _print("stdout", result.stdout)
       _print("stderr", result.stderr)
     if self.experiment.ExternalTestDir:
       output_file = self.test_dir / "container.log"
-      exec_command(["docker", "logs", self.container_name], output_file=output_file)
+      exec_command(self.experiment.backend.host_logs_cmd(self), output_file=output_file)
       self.log.debug("generated host logs: {}", output_file)
 
   def stop(self) -> subprocess.Popen:
     self.print_logs()
     self.log.debug("stopping container")
-    return subprocess.Popen(
-      [
-        "docker",
-        "stop",
-        "-s",
-        "SIGINT",
-        "-t",
-        str(self.experiment.config["container_stop_timeout"]),
-        self.container_name,
-      ]
-    )
+    return self.experiment.backend.stop_host(self)
 
   def wait_stop(self, stop_process: subprocess.Popen) -> None:
-    rc = stop_process.wait(self.experiment.config["container_stop_timeout"])
-    assert rc == 0, f"failed to stop docker container: {self.container_name}"
+    self.experiment.backend.wait_stop_host(self, stop_process)
 
   def delete(self, ignore_errors: bool = False) -> None:
-    exec_command(
-      [
-        "docker",
-        "rm",
-        "-f",
-        self.container_name,
-      ],
-      noexcept=ignore_errors,
-    )
+    self.experiment.backend.delete_host(self, ignore_errors=ignore_errors)
 
   def install_default_route(self, dev: str, route: ipaddress.IPv4Address) -> None:
     exec_command(["ip", "route", "delete", "default"])
@@ -669,25 +576,12 @@ class Host:
       except KeyboardInterrupt:
         self.log.error("SIGINT detected")
 
-  def _docker_exec_cmd(
-    self, *args, user: str | None = None, interactive: bool = False, terminal: bool = False
-  ) -> list[str | Path]:
-    return [
-      "docker",
-      "exec",
-      *(["-u", user] if user else []),
-      *(["-i"] if interactive else []),
-      *(["-t"] if terminal else []),
-      self.container_name,
-      *args,
-    ]
-
   def exec(self, *args, user: str | None = None, **exec_args):
     if self.experiment.InsideTestRunner:
       cmd = args
       assert user is None
     else:
-      cmd = self._docker_exec_cmd(*args, user=user)
+      cmd = self.experiment.backend.host_exec_cmd(self, *args, user=user)
     return exec_command(cmd, **exec_args)
 
   def popen(
@@ -706,13 +600,13 @@ class Host:
       cmd = args
       assert user is None
     else:
-      cmd = self._docker_exec_cmd(*args, user=user)
+      cmd = self.experiment.backend.host_exec_cmd(self, *args, user=user)
     return subprocess.Popen(cmd, **popen_args)
 
   def uno(self, *args, user: str | None = None, popen: bool = False, **exec_args):
     verbose_flag = self.log.verbose_flag
     uno_cmd = [
-      "uno",
+      *self.experiment.backend.UnoCommand,
       *args,
       "-r",
       self.container_uvn_dir,
@@ -17,7 +17,6 @@ from typing import TYPE_CHECKING
 from pathlib import Path
 import ipaddress
 
-from uno.core.exec import exec_command
 from uno.registry.cell import Cell
 from uno.registry.particle import Particle
 
@@ -119,26 +118,10 @@ class Network:
     return addr
 
   def create(self) -> None:
-    # Make sure the network doesn't exist then create it
-    self.delete(ignore_errors=True)
-    exec_command(
-      [
-        "docker",
-        "network",
-        "create",
-        "--driver",
-        "bridge",
-        f"--subnet={self.subnet}",
-        "-o",
-        f"com.docker.network.bridge.enable_ip_masquerade={'true' if self.masquerade_docker else 'false'}",
-        "-o",
-        f"com.docker.network.bridge.name=br_{self.name}",
-        self.name,
-      ]
-    )
+    self.experiment.backend.create_network(self)
 
   def delete(self, ignore_errors: bool = False) -> None:
-    exec_command(["docker", "network", "rm", self.name], noexcept=ignore_errors)
+    self.experiment.backend.delete_network(self, ignore_errors=ignore_errors)
 
   def define_router(
     self,
@@ -34,9 +34,12 @@ class PaneType(Enum):
 class WindowActions:
   @classmethod
   def pane_command(cls, pane_type: PaneType, host: Host) -> list[str]:
+    backend = host.experiment.backend
     return {
-      PaneType.CONTAINER_LOGS: ["docker", "logs", "-f", host.container_name],
-      PaneType.CONTAINER_SHELL: ["docker", "exec", "-ti", host.container_name, "bash"],
+      PaneType.CONTAINER_LOGS: backend.host_logs_cmd(host, follow=True),
+      PaneType.CONTAINER_SHELL: backend.host_exec_cmd(
+        host, "bash", interactive=True, terminal=True
+      ),
     }[pane_type]
 
 
@@ -0,0 +1,17 @@
+from .sim_network import SimNetwork, SimLink, SimRoute
+from .sim_host import SimHost
+from .sim_middleware import SimCondition, SimParticipant, SimMiddleware
+from .simulation import Simulation, SimNode, SimReport
+
+__all__ = [
+  Simulation,
+  SimNode,
+  SimReport,
+  SimNetwork,
+  SimLink,
+  SimRoute,
+  SimHost,
+  SimCondition,
+  SimParticipant,
+  SimMiddleware,
+]
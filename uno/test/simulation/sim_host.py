@@ -0,0 +1,114 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from typing import TYPE_CHECKING
+from pathlib import Path
+import ipaddress
+import json
+import subprocess
+
+from uno.core.exec import Executor, SubprocessExecutor
+
+if TYPE_CHECKING:
+  from .simulation import SimNode
+
+
+class SimHost(Executor):
+  """Run the commands of the agent of a simulated node.
+
+  The host has one interface on each LAN of the node, and ping reaches a LAN
+  if its cell can be reached over the simulated network. Other network
+  commands (e.g. to configure WireGuard or iptables) have no effect, while
+  file manipulation commands (e.g. to extract a package) are executed."""
+
+  NIC_PREFIX = "eth"
+  SIMULATED_COMMANDS = (
+    "wg",
+    "ip",
+    "iptables",
+    "iptables-save",
+    "iptables-restore",
+    "vtysh",
+    "sysctl",
+    "service",
+    "chown",
+  )
+
+  def __init__(self, node: "SimNode") -> None:
+    super().__init__()
+    self.node = node
+    self.real = SubprocessExecutor()
+
+  @staticmethod
+  def lan_address(lan: ipaddress.IPv4Network) -> ipaddress.IPv4Address:
+    return lan.network_address + 2
+
+  @staticmethod
+  def lan_gateway(lan: ipaddress.IPv4Network) -> ipaddress.IPv4Address:
+    return lan.network_address + 1
+
+  def _execute(self, cmd_args, **kwargs) -> subprocess.CompletedProcess:
+    args = list(map(str, cmd_args))
+    result = self._simulate(args)
+    if result is None:
+      return self.real.execute(args, **kwargs)
+    if kwargs["check"] and result.returncode != 0:
+      raise subprocess.CalledProcessError(result.returncode, args, result.stdout, result.stderr)
+    output_file: Path | None = kwargs["output_file"]
+    if output_file is not None:
+      output_file.write_bytes(result.stdout)
+    return result
+
+  def _simulate(self, args: list[str]) -> subprocess.CompletedProcess | None:
+    if args[:3] == ["ip", "-j", "address"]:
+      return self._result(
+        args,
+        json.dumps(
+          [
+            {
+              "ifname": f"{self.NIC_PREFIX}{i}",
+              "operstate": "UP",
+              "link_type": "ether",
+              "addr_info": [
+                {"family": "inet", "local": str(self.lan_address(lan)), "prefixlen": lan.prefixlen}
+              ],
+            }
+            for i, lan in enumerate(self.node.lans)
+          ]
+        ),
+      )
+    elif args[:3] == ["ip", "route", "get"]:
+      # Every destination is reached through the gateway of the first LAN
+      target = ipaddress.ip_address(args[3])
+      lan = next((lan for lan in self.node.lans if target in lan), None)
+      if lan is None and self.node.lans:
+        lan = self.node.lans[0]
+      if lan is None:
+        return self._result(args, "", returncode=2)
+      nic = f"{self.NIC_PREFIX}{self.node.lans.index(lan)}"
+      return self._result(
+        args, f"{target} via {self.lan_gateway(lan)} dev {nic} src {self.lan_address(lan)}\n"
+      )
+    elif args[0] == "ping":
+      count = int(args[args.index("-c") + 1]) if "-c" in args else 1
+      reachable = self.node.sim.ping(self.node, ipaddress.ip_address(args[-1]), count)
+      return self._result(args, "", returncode=0 if reachable else 1)
+    elif args[0] in self.SIMULATED_COMMANDS:
+      return self._result(args, "")
+    return None
+
+  @staticmethod
+  def _result(args: list[str], stdout: str, returncode: int = 0) -> subprocess.CompletedProcess:
+    return subprocess.CompletedProcess(args, returncode, stdout=stdout.encode(), stderr=b"")
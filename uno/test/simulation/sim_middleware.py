@@ -0,0 +1,110 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from typing import TYPE_CHECKING, Callable
+from pathlib import Path
+
+from uno.core.time import Timestamp
+from uno.middleware import Condition, Middleware, Participant, LanSite, UvnInfo, CellInfo
+from uno.middleware.package_transfer import split_package
+from uno.registry.lan_descriptor import LanDescriptor
+from uno.registry.topic import UvnTopic
+from uno.registry.uvn import Uvn
+
+if TYPE_CHECKING:
+  from .simulation import SimNode
+
+
+class SimCondition(Condition):
+  """A condition which notifies a listener (i.e. the Simulation) when triggered."""
+
+  def __init__(self) -> None:
+    self._trigger_value = False
+    self.listener: Callable[["SimCondition"], None] | None = None
+
+  @property
+  def trigger_value(self) -> bool:
+    return self._trigger_value
+
+  @trigger_value.setter
+  def trigger_value(self, val: bool) -> None:
+    self._trigger_value = val
+    if val and self.listener is not None:
+      self.listener(self)
+
+
+class SimParticipant(Participant):
+  """Publish the samples written by an agent on the network of a Simulation.
+
+  Samples are delivered to the agent by the Simulation, which takes
+  the place of the participant's spin()."""
+
+  def __init__(self, *args, node: "SimNode", **kwargs) -> None:
+    super().__init__(*args, **kwargs)
+    self.node = node
+
+  @staticmethod
+  def _lan_site(lan: LanDescriptor) -> LanSite:
+    return LanSite(nic=lan.nic.name, address=lan.nic.address, subnet=lan.nic.subnet, gw=lan.gw)
+
+  def uvn_info(self, uvn: Uvn, registry_id: str) -> None:
+    self.node.publish(UvnTopic.UVN_ID, uvn.name, UvnInfo(uvn=uvn.name, registry_id=registry_id))
+
+  def cell_agent_config(self, uvn: Uvn, cell_id: int, registry_id: str, package: Path) -> None:
+    # Chunks are only delivered to the target cell, like with a content-filtered reader
+    for chunk in split_package(package, uvn=uvn.name, cell=cell_id, registry_id=registry_id):
+      self.node.publish(UvnTopic.BACKBONE, (cell_id, chunk.seq), chunk, target=cell_id)
+
+  def cell_agent_status(
+    self,
+    uvn: Uvn,
+    cell_id: int,
+    registry_id: str,
+    ts_start: Timestamp | None = None,
+    lans: list[LanDescriptor] | None = None,
+    known_networks: dict[LanDescriptor, bool] | None = None,
+  ) -> None:
+    known_networks = known_networks or {}
+    self.node.publish(
+      UvnTopic.CELL_ID,
+      cell_id,
+      CellInfo(
+        uvn=uvn.name,
+        cell=cell_id,
+        registry_id=registry_id,
+        routed_networks=tuple(map(self._lan_site, lans or [])),
+        reachable_networks=tuple(
+          self._lan_site(lan) for lan, reachable in known_networks.items() if reachable
+        ),
+        unreachable_networks=tuple(
+          self._lan_site(lan) for lan, reachable in known_networks.items() if not reachable
+        ),
+        ts_start=ts_start.from_epoch() if ts_start is not None else None,
+      ),
+    )
+
+  def start(self) -> None:
+    pass
+
+  def stop(self) -> None:
+    pass
+
+  def spin(self) -> bool:
+    raise NotImplementedError("simulated agents are driven by the Simulation")
+
+
+class SimMiddleware(Middleware):
+  CONDITION = SimCondition
+  PARTICIPANT = SimParticipant
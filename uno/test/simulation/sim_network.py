@@ -0,0 +1,137 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from typing import NamedTuple
+from collections import deque
+
+# Id of the registry's node (cells use their own id)
+REGISTRY_NODE = 0
+
+
+class SimLink:
+  """A WireGuard tunnel between two nodes: the root VPN link between
+  the registry and a cell, or a backbone link between two cells."""
+
+  def __init__(self, a: int, b: int, latency: float, loss: float) -> None:
+    self.nodes = frozenset((a, b))
+    self.latency = latency
+    self.loss = loss
+    self.up = True
+
+  @property
+  def backbone(self) -> bool:
+    return REGISTRY_NODE not in self.nodes
+
+  def __str__(self) -> str:
+    a, b = sorted(self.nodes)
+    return f"{a}<->{b}"
+
+  def __repr__(self) -> str:
+    return f"{self.__class__.__qualname__}({self})"
+
+
+class SimRoute(NamedTuple):
+  """The one-way latency of the route between two nodes, and the probability
+  that a packet sent along it is delivered."""
+
+  latency: float
+  delivery: float
+
+
+class SimNetwork:
+  """The links between the nodes of a Simulation, and the routes between them.
+
+  A link carries traffic only while it is up and both of its nodes are running.
+  The registry only reaches the cells over their root VPN links. Cells reach
+  each other directly over their backbone links, and over the routes computed
+  by the last call to converge(), like they would after OSPF detected the
+  latest change in the backbone. A route stops working as soon as one of its
+  links goes down, until a new one is computed."""
+
+  def __init__(self) -> None:
+    self.links: dict[frozenset[int], SimLink] = {}
+    self.running: set[int] = set()
+    self._adjacent: dict[int, set[int]] = {}
+    self._converged: dict[int, set[int]] = {}
+    self._routes: dict[int, dict[int, SimRoute]] = {}
+
+  def add_link(self, a: int, b: int, latency: float, loss: float = 0.0) -> SimLink:
+    link = SimLink(a, b, latency, loss)
+    self.links[link.nodes] = link
+    self._adjacent.setdefault(a, set()).add(b)
+    self._adjacent.setdefault(b, set()).add(a)
+    self.changed()
+    return link
+
+  def link(self, a: int, b: int) -> SimLink:
+    return self.links[frozenset((a, b))]
+
+  def connected(self, a: int, b: int) -> bool:
+    link = self.links.get(frozenset((a, b)))
+    return link is not None and link.up and a in self.running and b in self.running
+
+  def changed(self) -> None:
+    self._routes.clear()
+
+  def converge(self) -> None:
+    self._converged = {
+      n: {p for p in peers if p != REGISTRY_NODE and self.connected(n, p)}
+      for n, peers in self._adjacent.items()
+      if n != REGISTRY_NODE
+    }
+    self.changed()
+
+  def routes(self, src: int) -> dict[int, SimRoute]:
+    routes = self._routes.get(src)
+    if routes is None:
+      routes = self._routes[src] = self._compute_routes(src)
+    return routes
+
+  def _compute_routes(self, src: int) -> dict[int, SimRoute]:
+    if src not in self.running:
+      return {}
+
+    def _hop(route: SimRoute, link: SimLink) -> SimRoute:
+      return SimRoute(route.latency + link.latency, route.delivery * (1 - link.loss))
+
+    local = SimRoute(0.0, 1.0)
+    if src == REGISTRY_NODE:
+      return {
+        peer: _hop(local, self.link(src, peer))
+        for peer in self._adjacent.get(src, ())
+        if self.connected(src, peer)
+      }
+
+    routes = {src: local}
+    # Follow the shortest paths computed on convergence, as long as their links still work
+    visited = {src}
+    queue = deque([src])
+    while queue:
+      node = queue.popleft()
+      for peer in sorted(self._converged.get(node, ())):
+        if peer in visited:
+          continue
+        visited.add(peer)
+        if node in routes and self.connected(node, peer):
+          routes[peer] = _hop(routes[node], self.link(node, peer))
+        queue.append(peer)
+    # Directly connected peers are always reachable
+    for peer in self._adjacent.get(src, ()):
+      if self.connected(src, peer):
+        direct = _hop(local, self.link(src, peer))
+        if peer not in routes or routes[peer].latency > direct.latency:
+          routes[peer] = direct
+    del routes[src]
+    return routes
@@ -0,0 +1,631 @@
+###############################################################################
+# Copyright 2020-2024 Andrea Sorbini
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###############################################################################
+from typing import Callable, Iterable, NamedTuple
+from collections import Counter
+from pathlib import Path
+import contextlib
+import heapq
+import ipaddress
+import random
+import time
+
+from uno.agent.agent import Agent
+from uno.agent.systemd_service import SystemdService
+from uno.core.exec import Executor
+from uno.core.log import Logger
+from uno.middleware import DataSample, Handle, middleware
+from uno.registry.keys_backend_dds import DdsKeysBackend
+from uno.registry.package import Packager
+from uno.registry.registry import Registry
+from uno.registry.timing_profile import TimingParameters
+from uno.registry.topic import UvnTopic
+
+from .sim_host import SimHost
+from .sim_middleware import SimCondition, SimMiddleware, SimParticipant
+from .sim_network import REGISTRY_NODE, SimLink, SimNetwork, SimRoute
+
+
+class SimReport(NamedTuple):
+  """The outcome of a call to Simulation.run()."""
+
+  # Whether the exit condition was reached
+  reached: bool
+  # Virtual time elapsed (in seconds)
+  elapsed: float
+  # Number of samples sent on each topic, including retransmissions
+  messages: dict[str, int]
+  # Number of samples delivered to an agent
+  deliveries: int
+  # Number of events processed
+  events: int
+  # Real time spent running the simulation (in seconds)
+  wall_time: float
+
+  @property
+  def total_messages(self) -> int:
+    return sum(self.messages.values())
+
+  def __str__(self) -> str:
+    messages = ", ".join(f"{t}={c}" for t, c in sorted(self.messages.items()))
+    return (
+      f"{'reached' if self.reached else 'NOT reached'} after {self.elapsed:.1f}s"
+      f" ({self.events} events, {self.total_messages} messages [{messages}],"
+      f" {self.deliveries} deliveries, {self.wall_time:.1f}s real time)"
+    )
+
+
+class SimNode:
+  """A simulated host running the agent of the registry (with id 0) or of a cell."""
+
+  def __init__(
+    self, sim: "Simulation", id: int, name: str, root: Path, lans: list[ipaddress.IPv4Network]
+  ) -> None:
+    self.sim = sim
+    self.id = id
+    self.name = name
+    self.root = root
+    self.lans = lans
+    self.host = SimHost(self)
+    self.agent: Agent | None = None
+    self.running = False
+    # Incremented every time the agent is started or stopped, to discard stale events
+    self.generation = 0
+    self.matched: set[int] = set()
+    # Latest sample written on every instance: (topic, key) -> (data, target node)
+    self.samples: dict[tuple[UvnTopic, object], tuple[object, int | None]] = {}
+    self.inbox: list[DataSample] = []
+    self.contexts: contextlib.ExitStack | None = None
+    self.tester_busy = False
+    self.tester_timer = 0
+    topics = DdsKeysBackend.REGISTRY_TOPICS if id == REGISTRY_NODE else DdsKeysBackend.CELL_TOPICS
+    self.writer_topics: list[UvnTopic] = topics["published"]
+    self.reader_topics: list[UvnTopic] = topics["subscribed"]
+
+  def __str__(self) -> str:
+    return self.name
+
+  def __repr__(self) -> str:
+    return f"{self.__class__.__qualname__}({self.name})"
+
+  @property
+  def is_registry(self) -> bool:
+    return self.id == REGISTRY_NODE
+
+  def writer(self, topic: UvnTopic) -> Handle:
+    return Handle(f"{self.name}/{topic.name}")
+
+  def instance(self, topic: UvnTopic, key: object) -> Handle:
+    return Handle(f"{self.name}/{topic.name}/{key}")
+
+  def publish(self, topic: UvnTopic, key: object, data: object, target: int | None = None) -> None:
+    self.sim._publish(self, topic, key, data, target)
+
+  def call(self, fn: Callable, *args):
+    """Invoke one of the agent's handlers on the node's host."""
+    with Executor.use(self.host):
+      result = fn(*args)
+    self.sim._after_call(self)
+    return result
+
+
+class Simulation:
+  """Run the agents of a UVN against a simulated network, in virtual time.
+
+  Every agent is a real Agent, installed from the registry's packages, which
+  processes data with its usual handlers (on_data_batch(), UvnPeersList, and
+  UvnPeersTester), while its participant, its WireGuard links, its routes, and
+  its host's network commands are simulated. The agents' other services are
+  never started, and received configurations are not applied.
+
+  Events are processed in order of their virtual time, so a scenario runs in
+  as much real time as its agents take to process their updates. That grows
+  faster than quadratically with the number of cells, since every cell sends
+  its status (which lists every LAN) to every other cell whenever it changes:
+  starting a UVN takes about 3s with 10 cells, and 35s with 20.
+
+  Timers (e.g. liveliness leases, OSPF intervals, LAN probes) follow the
+  UVN's timing parameters, while the latency and loss of every link can be
+  changed with Simulation.network."""
+
+  REGISTRY_NAME = "registry"
+
+  def __init__(
+    self,
+    registry_root: Path,
+    root: Path,
+    latency: float = 0.005,
+    loss: float = 0.0,
+    repair_delay: float = 1.0,
+    seed: int = 0,
+  ) -> None:
+    self.registry_root = registry_root
+    self.root = root
+    self.latency = latency
+    self.loss = loss
+    # Delay before a lost (or unroutable) sample is sent again
+    self.repair_delay = repair_delay
+    self.rng = random.Random(seed)
+    self.log = Logger.sublogger("sim")
+    self.network = SimNetwork()
+    self.nodes: dict[int, SimNode] = {}
+    self.timing: TimingParameters | None = None
+    self.now = 0.0
+    self.events = 0
+    self.deliveries = 0
+    self.messages: Counter[str] = Counter()
+    self._queue: list[tuple[float, int, Callable, tuple]] = []
+    self._seq = 0
+    self._lan_owners: dict[ipaddress.IPv4Address, int | None] = {}
+    self._matches_pending = False
+    self._pending_match: set[tuple[int, int]] = set()
+    self._pending_unmatch: set[tuple[int, int]] = set()
+    # Nodes writing and reading every topic
+    self._writers: dict[UvnTopic, set[int]] = {}
+    self._readers: dict[UvnTopic, set[int]] = {}
+    self._exit_stack: contextlib.ExitStack | None = None
+
+  def __enter__(self) -> "Simulation":
+    self._exit_stack = contextlib.ExitStack()
+    self._exit_stack.enter_context(self._globals())
+    self._exit_stack.callback(self._stop_all)
+    self._load()
+    return self
+
+  def __exit__(self, *exc) -> None:
+    stack = self._exit_stack
+    self._exit_stack = None
+    stack.close()
+
+  @contextlib.contextmanager
+  def _globals(self):
+    prev_middleware = middleware._Instance
+    prev_marker_dir = SystemdService.STATIC_SERVICES_MARKER_DIR
+    middleware._Instance = SimMiddleware
+    SystemdService.STATIC_SERVICES_MARKER_DIR = self.root / "services"
+    try:
+      yield
+    finally:
+      middleware._Instance = prev_middleware
+      SystemdService.STATIC_SERVICES_MARKER_DIR = prev_marker_dir
+
+  def _load(self) -> None:
+    registry = Registry.open(self.registry_root, readonly=True)
+    try:
+      self.timing = registry.uvn.timing
+      self._add_node(REGISTRY_NODE, self.REGISTRY_NAME, self.registry_root, [])
+      packages = {}
+      for cell in sorted(registry.uvn.cells.values(), key=lambda c: c.id):
+        self._add_node(cell.id, cell.name, self.root / cell.name, list(cell.allowed_lans))
+        packages[cell.id] = self.registry_root / "cells" / Packager.cell_archive_file(cell)
+        self.network.add_link(REGISTRY_NODE, cell.id, self.latency, self.loss)
+      for peer_a, peer_a_cfg in registry.deployment.peers.items():
+        for peer_b in peer_a_cfg["peers"]:
+          if peer_a < peer_b:
+            self.network.add_link(peer_a, peer_b, self.latency, self.loss)
+    finally:
+      registry.db.close()
+
+    for cell_id, package in packages.items():
+      node = self.nodes[cell_id]
+      if node.root.is_dir():
+        continue
+      node.root.mkdir(parents=True)
+      with Executor.use(node.host):
+        agent = Agent.install_package(package, node.root)
+      agent.db.close()
+    self.log.info(
+      "loaded {} cells, {} links: {}",
+      len(self.nodes) - 1,
+      len(self.network.links),
+      sorted(map(str, self.network.links.values())),
+    )
+
+  def _add_node(self, id: int, name: str, root: Path, lans: list[ipaddress.IPv4Network]) -> SimNode:
+    node = self.nodes[id] = SimNode(self, id, name, root, lans)
+    for topic in node.writer_topics:
+      self._writers.setdefault(topic, set()).add(id)
+    for topic in node.reader_topics:
+      self._readers.setdefault(topic, set()).add(id)
+    return node
+
+  ###########################################################################
+  # Scenario API
+  ###########################################################################
+  @property
+  def registry(self) -> SimNode:
+    return self.nodes[REGISTRY_NODE]
+
+  @property
+  def cells(self) -> list[SimNode]:
+    return [n for n in self.nodes.values() if not n.is_registry]
+
+  def node(self, node: "str | int | SimNode") -> SimNode:
+    if isinstance(node, SimNode):
+      return node
+    elif isinstance(node, int):
+      return self.nodes[node]
+    return next(n for n in self.nodes.values() if n.name == node)
+
+  @property
+  def consistent(self) -> bool:
+    """Check the condition waited for by the registry's spin_until_consistent()."""
+    registry = self.registry
+    return (
+      registry.running
+      and registry.agent.peers.status_consistent_config_uvn
+      and registry.agent.peers.status_fully_routed_uvn
+    )
+
+  def start(self, *nodes: "str | int | SimNode") -> None:
+    for node in nodes:
+      self._start(self.node(node))
+
+  def stop(self, *nodes: "str | int | SimNode", graceful: bool = True) -> None:
+    """Stop the agent of some nodes. If not graceful, the agent's peers only
+    detect it after their liveliness lease expires."""
+    for node in nodes:
+      self._stop(self.node(node), graceful=graceful)
+
+  def fail_link(self, a: "str | int | SimNode", b: "str | int | SimNode") -> SimLink:
+    return self._set_link(self.network.link(self.node(a).id, self.node(b).id), False)
+
+  def restore_link(self, a: "str | int | SimNode", b: "str | int | SimNode") -> SimLink:
+    return self._set_link(self.network.link(self.node(a).id, self.node(b).id), True)
+
+  def partition(self, nodes: Iterable["str | int | SimNode"]) -> list[SimLink]:
+    """Fail every backbone link between some cells and the rest of the UVN."""
+    group = {self.node(n).id for n in nodes}
+    return [
+      self._set_link(link, False)
+      for link in self.network.links.values()
+      if link.backbone and link.up and len(link.nodes & group) == 1
+    ]
+
+  def heal(self) -> list[SimLink]:
+    return [self._set_link(link, True) for link in self.network.links.values() if not link.up]
+
+  def run(self, duration: float, until: Callable[[], bool] | None = None) -> SimReport:
+    """Process events until a condition is reached, or for the specified (virtual) time."""
+    start = self.now
+    wall_start = time.perf_counter()
+    messages = Counter(self.messages)
+    deliveries = self.deliveries
+    events = self.events
+    end = start + duration
+    reached = until is not None and until()
+    while not reached and self._queue and self._queue[0][0] <= end:
+      self.now, _, fn, args = heapq.heappop(self._queue)
+      fn(*args)
+      self.events += 1
+      reached = until is not None and until()
+    if not reached:
+      self.now = end
+    return SimReport(
+      reached=reached or until is None,
+      elapsed=self.now - start,
+      messages=dict(self.messages - messages),
+      deliveries=self.deliveries - deliveries,
+      events=self.events - events,
+      wall_time=time.perf_counter() - wall_start,
+    )
+
+  def run_until_consistent(self, max_time: float) -> SimReport:
+    report = self.run(max_time, until=lambda: self.consistent)
+    self.log.info("[{}] consistency {}", f"{self.now:.1f}", report)
+    return report
+
+  ###########################################################################
+  # Event handling
+  ###########################################################################
+  def schedule(self, delay: float, fn: Callable, *args) -> None:
+    self._seq += 1
+    heapq.heappush(self._queue, (self.now + delay, self._seq, fn, args))
+
+  def _after_call(self, node: SimNode) -> None:
+    if node.is_registry or not node.running:
+      return
+    if node.agent.peers_tester._triggered and not node.tester_busy:
+      self._start_tester(node)
+
+  def _start(self, node: SimNode) -> None:
+    if node.running:
+      return
+    # Make sure peers forgot the node's previous instance
+    for peer_id in list(node.matched):
+      self._unmatch(node.id, peer_id, force=True)
+    node.generation += 1
+    node.samples.clear()
+    node.inbox.clear()
+    with Executor.use(node.host):
+      agent = Agent.open(node.root)
+    agent.participant = SimParticipant(agent=agent, node=node)
+    generation = node.generation
+    for svc in agent.services:
+      svc.updated_condition.listener = lambda c, node=node: self.schedule(
+        0, self._condition_active, node, generation, c
+      )
+    node.agent = agent
+    node.running = True
+    self.network.running.add(node.id)
+    self._topology_changed(failure=False)
+    self.log.activity("[{}] starting: {}", f"{self.now:.1f}", node)
+    node.contexts = contextlib.ExitStack()
+    node.call(node.contexts.enter_context, agent._on_started())
+    if not node.is_registry:
+      # The tester's thread is simulated by the Simulation
+      agent.peers_tester._service_active = True
+      self._schedule_tester(node)
+
+  def _stop(self, node: SimNode, graceful: bool) -> None:
+    if not node.running:
+      return
+    self.log.activity("[{}] stopping: {}", f"{self.now:.1f}", node)
+    agent = node.agent
+    try:
+      node.call(node.contexts.close)
+    finally:
+      agent.peers_tester._service_active = False
+      node.contexts = None
+      node.running = False
+      node.generation += 1
+      node.tester_busy = False
+      node.agent = None
+      agent.db.close()
+      self.network.running.discard(node.id)
+      self._topology_changed(failure=True)
+    if graceful:
+      # Remote readers are notified when the writers are deleted
+      for peer_id in node.matched:
+        self.schedule(self.latency, self._unmatch, node.id, peer_id, True)
+
+  def _stop_all(self) -> None:
+    for node in self.nodes.values():
+      self._stop(node, graceful=True)
+
+  def _set_link(self, link: SimLink, up: bool) -> SimLink:
+    if link.up != up:
+      link.up = up
+      self.log.activity("[{}] link {}: {}", f"{self.now:.1f}", "UP" if up else "DOWN", link)
+      self._topology_changed(failure=not up)
+    return link
+
+  def _topology_changed(self, failure: bool) -> None:
+    self.network.changed()
+    # Routes are recomputed once OSPF detects the change
+    self.schedule(
+      self.timing.ospf_dead_interval if failure else self.timing.ospf_hello_interval,
+      self._converge,
+    )
+    self._update_matches_later()
+
+  def _converge(self) -> None:
+    self.network.converge()
+    self._update_matches_later()
+
+  def _condition_active(self, node: SimNode, generation: int, condition: SimCondition) -> None:
+    if node.generation != generation:
+      return
+    condition.trigger_value = False
+    node.call(node.agent.on_condition_active, condition)
+
+  ###########################################################################
+  # Simulated UvnPeersTester thread
+  ###########################################################################
+  def _schedule_tester(self, node: SimNode) -> None:
+    node.tester_timer += 1
+    self.schedule(
+      self.timing.tester_max_delay,
+      self._periodic_tester,
+      node,
+      node.generation,
+      node.tester_timer,
+    )
+
+  def _periodic_tester(self, node: SimNode, generation: int, timer: int) -> None:
+    if node.generation != generation or node.tester_timer != timer or node.tester_busy:
+      return
+    self._start_tester(node)
+
+  def _start_tester(self, node: SimNode) -> None:
+    tester = node.agent.peers_tester
+    with tester._state_lock:
+      tester._triggered = False
+    tester._trigger_sem.acquire(blocking=False)
+    node.tester_busy = True
+    node.tester_timer += 1
+    self.schedule(self._tester_duration(node), self._run_tester, node, node.generation)
+
+  def _tester_duration(self, node: SimNode) -> float:
+    # Probes are run in sequence, and they last until the last reply,
+    # or until the deadline if the LAN is unreachable
+    tester = node.agent.peers_tester
+    routes = self.network.routes(node.id)
+    duration = 0.0
+    for peer in tester.tested_peers:
+      for lan in peer.routed_networks:
+        owner = self.lan_owner(lan.gw)
+        route = SimRoute(0.0, 1.0) if owner == node.id else routes.get(owner)
+        if route is None:
+          duration += tester.ping_len
+        else:
+          duration += tester.ping_count - 1 + 2 * route.latency
+    return duration
+
+  def _run_tester(self, node: SimNode, generation: int) -> None:
+    if node.generation != generation:
+      return
+    node.call(node.agent.peers_tester._handle_trigger)
+    node.tester_busy = False
+    if node.agent.peers_tester._triggered:
+      self._start_tester(node)
+    else:
+      self._schedule_tester(node)
+
+  def lan_owner(self, address: ipaddress.IPv4Address) -> int | None:
+    owner = self._lan_owners.get(address, False)
+    if owner is False:
+      owner = self._lan_owners[address] = next(
+        (n.id for n in self.nodes.values() for lan in n.lans if address in lan), None
+      )
+    return owner
+
+  def ping(self, node: SimNode, address: ipaddress.IPv4Address, count: int) -> bool:
+    owner = self.lan_owner(address)
+    if owner is None:
+      return False
+    elif owner == node.id:
+      return True
+    route = self.network.routes(node.id).get(owner)
+    if route is None:
+      return False
+    return any(self.rng.random() < route.delivery**2 for _ in range(count))
+
+  ###########################################################################
+  # Simulated DDS
+  ###########################################################################
+  def _update_matches_later(self) -> None:
+    if self._matches_pending:
+      return
+    self._matches_pending = True
+    self.schedule(0, self._update_matches)
+
+  def _update_matches(self) -> None:
+    # Participants discover each other once they can communicate, and they
+    # detect that a remote participant is gone when its liveliness lease expires.
+    # Every pair is handled by the node with the lower id, and only nodes which
+    # share a topic ever match, so each node only compares the peers it can
+    # reach with the ones it matched.
+    self._matches_pending = False
+    discovery_delay = self.timing.initial_participant_announcement_period[0]
+    for a in self.nodes.values():
+      routes = self.network.routes(a.id) if a.running else {}
+      reachable = self._topic_peers(a).intersection(routes)
+      for b_id in sorted(reachable - a.matched):
+        pair = (a.id, b_id)
+        if b_id > a.id and pair not in self._pending_match:
+          self._pending_match.add(pair)
+          self.schedule(discovery_delay + routes[b_id].latency, self._match, *pair)
+      for b_id in sorted(a.matched - reachable):
+        pair = (a.id, b_id)
+        if b_id > a.id and pair not in self._pending_unmatch:
+          self._pending_unmatch.add(pair)
+          self.schedule(
+            self.timing.participant_liveliness_lease_duration, self._unmatch, *pair, False
+          )
+
+  def _topic_peers(self, node: SimNode) -> set[int]:
+    """Return the nodes which read a topic written by a node, or vice versa."""
+    peers = set().union(
+      *(self._readers.get(t, ()) for t in node.writer_topics),
+      *(self._writers.get(t, ()) for t in node.reader_topics),
+    )
+    peers.discard(node.id)
+    return peers
+
+  def _match(self, a_id: int, b_id: int) -> None:
+    self._pending_match.discard((a_id, b_id))
+    a = self.nodes[a_id]
+    b = self.nodes[b_id]
+    if b_id in a.matched or not (a.running and b.running):
+      return
+    if b_id not in self.network.routes(a_id):
+      return
+    a.matched.add(b_id)
+    b.matched.add(a_id)
+    # Deliver the latest samples to the new (late-joining) readers
+    for src, dst in ((a, b), (b, a)):
+      for (topic, key), (data, target) in list(src.samples.items()):
+        self._send(src, dst, topic, key, data, target)
+    for node in (a, b):
+      self._writers_status(node)
+
+  def _unmatch(self, a_id: int, b_id: int, force: bool = False) -> None:
+    pair = (min(a_id, b_id), max(a_id, b_id))
+    self._pending_unmatch.discard(pair)
+    a = self.nodes[a_id]
+    b = self.nodes[b_id]
+    if b_id not in a.matched:
+      return
+    if not force and a.running and b.running and b_id in self.network.routes(a_id):
+      return
+    a.matched.discard(b_id)
+    b.matched.discard(a_id)
+    for src, dst in ((a, b), (b, a)):
+      if not dst.running:
+        continue
+      for topic, key in list(src.samples):
+        if topic in dst.reader_topics:
+          dst.call(dst.agent.on_instance_offline, topic, src.instance(topic, key))
+      self._writers_status(dst)
+
+  def _writers_status(self, node: SimNode) -> None:
+    if not node.running:
+      return
+    for topic in node.reader_topics:
+      online_writers = [
+        peer.writer(topic)
+        for peer_id in sorted(node.matched)
+        for peer in [self.nodes[peer_id]]
+        if topic in peer.writer_topics
+      ]
+      node.call(node.agent.on_remote_writers_status, topic, online_writers)
+
+  def _publish(
+    self, node: SimNode, topic: UvnTopic, key: object, data: object, target: int | None
+  ) -> None:
+    node.samples[(topic, key)] = (data, target)
+    for peer_id in sorted(node.matched):
+      self._send(node, self.nodes[peer_id], topic, key, data, target)
+
+  def _send(
+    self,
+    src: SimNode,
+    dst: SimNode,
+    topic: UvnTopic,
+    key: object,
+    data: object,
+    target: int | None,
+  ) -> None:
+    if (target is not None and target != dst.id) or topic not in dst.reader_topics:
+      return
+    if not (src.running and dst.running and dst.id in src.matched):
+      return
+    # Only the latest sample of every instance is repaired
+    if src.samples.get((topic, key), (None, None))[0] is not data:
+      return
+    self.messages[topic.name] += 1
+    route = self.network.routes(src.id).get(dst.id)
+    if route is None or self.rng.random() >= route.delivery:
+      self.schedule(self.repair_delay, self._send, src, dst, topic, key, data, target)
+      return
+    sample = DataSample(topic, data, instance=src.instance(topic, key), writer=src.writer(topic))
+    self.schedule(route.latency, self._deliver, src, dst, sample)
+
+  def _deliver(self, src: SimNode, dst: SimNode, sample: DataSample) -> None:
+    if not dst.running or src.id not in dst.matched:
+      return
+    self.deliveries += 1
+    dst.inbox.append(sample)
+    if len(dst.inbox) == 1:
+      # Samples received at the same time are processed in a single batch
+      self.schedule(0, self._receive, dst, dst.generation)
+
+  def _receive(self, node: SimNode, generation: int) -> None:
+    if node.generation != generation:
+      return
+    samples = node.inbox
+    node.inbox = []
+    node.call(node.agent.on_data_batch, samples)